@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+
+"""
+Airspace and obstacle lookup from local GeoJSON data
+
+Derives the location-dependent DroneOperation fields (airspace_class,
+is_airport_surface_area, is_within_400ft_of_structure and
+operating_altitude_above_structure) from latitude, longitude and
+altitude instead of having every caller supply them.
+
+GeoJSON conventions:
+- Polygon/MultiPolygon features with an "airspace_class" property are
+  airspace volumes, optionally bounded by "floor" and "ceiling" (feet
+  above ground); "surface_area": true marks an airport surface area.
+- Point/MultiPoint features with a "height" property (feet above ground)
+  are structures.
+
+Features are bucketed into a coarse grid at load time. A lookup resolves
+its fine grid cell to the features that can affect it (polygons whose
+bounding box overlaps the cell, structures within 400 feet of it) and
+keeps recently used cells in a bounded LRU cache.
+"""
+
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from collections import OrderedDict
+from dataclasses import replace
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from drone_attributes import OPERATION_ATTRIBUTES
+
+FEET_PER_DEGREE = 364000.0  # one degree of latitude
+STRUCTURE_RADIUS = 400.0  # feet
+DEFAULT_AIRSPACE_CLASS = "G"
+# Most restrictive first; a point inside several volumes gets the first
+CLASS_PRECEDENCE = {"A": 0, "B": 1, "C": 2, "D": 3, "E": 4, "G": 5}
+
+COARSE_CELL = 1.0  # degrees
+DEFAULT_CELL = 0.01  # degrees, about 0.6 nautical miles
+DEFAULT_CACHE_CELLS = 4096
+
+LOCATION_FIELDS = ("airspace_class", "is_airport_surface_area",
+                   "is_within_400ft_of_structure", "operating_altitude_above_structure")
+
+
+class AirspaceDataError(ValueError):
+    """Raised for GeoJSON that does not follow the conventions above"""
+
+
+class LocationAttributes(NamedTuple):
+    airspace_class: str
+    is_airport_surface_area: bool
+    is_within_400ft_of_structure: bool
+    operating_altitude_above_structure: float  # 0.0 when no structure is within 400 feet
+
+
+class _Volume(NamedTuple):
+    airspace_class: str
+    surface_area: bool
+    floor: float
+    ceiling: float
+    polygons: List[List[List[Tuple[float, float]]]]  # polygons of rings of (lon, lat), outer ring first
+    bbox: Tuple[float, float, float, float]  # min lon, min lat, max lon, max lat
+
+
+class _Structure(NamedTuple):
+    longitude: float
+    latitude: float
+    height: float
+
+
+def _in_ring(lon: float, lat: float, ring: Sequence[Tuple[float, float]]) -> bool:
+    """Even-odd ray casting"""
+    inside = False
+    x1, y1 = ring[-1]
+    for x2, y2 in ring:
+        if (y1 > lat) != (y2 > lat) and lon < x1 + (lat - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+        x1, y1 = x2, y2
+    return inside
+
+
+def _in_volume(volume: _Volume, lon: float, lat: float) -> bool:
+    min_lon, min_lat, max_lon, max_lat = volume.bbox
+    if not (min_lon <= lon <= max_lon and min_lat <= lat <= max_lat):
+        return False
+    for rings in volume.polygons:
+        if _in_ring(lon, lat, rings[0]) and not any(_in_ring(lon, lat, hole) for hole in rings[1:]):
+            return True
+    return False
+
+
+def _distance_feet(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
+    """Equirectangular distance, accurate to well under a foot at 400 feet"""
+    dx = (lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    return math.hypot(dx, lat2 - lat1) * FEET_PER_DEGREE
+
+
+class AirspaceIndex:
+    """
+    In-memory grid index over airspace volumes and structures
+
+    Thread-safe for lookups; load all data before sharing an index
+    between threads.
+    """
+
+    def __init__(self, cell_size: float = DEFAULT_CELL, cache_cells: int = DEFAULT_CACHE_CELLS):
+        self.cell_size = cell_size
+        self.cache_cells = cache_cells
+        self.volumes: List[_Volume] = []
+        self.structures: List[_Structure] = []
+        self._coarse_volumes: Dict[Tuple[int, int], List[int]] = {}
+        self._coarse_structures: Dict[Tuple[int, int], List[int]] = {}
+        self._cells: "OrderedDict[Tuple[int, int], Tuple[List[_Volume], List[_Structure]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @classmethod
+    def from_geojson(cls, *paths: str, **kwargs) -> "AirspaceIndex":
+        index = cls(**kwargs)
+        for path in paths:
+            with open(path) as f:
+                index.add_geojson(json.load(f))
+        return index
+
+    def add_geojson(self, data: Dict[str, Any]):
+        """Add the features of a GeoJSON FeatureCollection or Feature"""
+        features = data.get("features", [data]) if data.get("type") == "FeatureCollection" else [data]
+        for feature in features:
+            geometry = feature.get("geometry") or {}
+            properties = feature.get("properties") or {}
+            kind = geometry.get("type")
+            coordinates = geometry.get("coordinates")
+            try:
+                if kind in ("Polygon", "MultiPolygon") and "airspace_class" in properties:
+                    polygons = [coordinates] if kind == "Polygon" else coordinates
+                    self._add_volume(properties, polygons)
+                elif kind in ("Point", "MultiPoint") and "height" in properties:
+                    points = [coordinates] if kind == "Point" else coordinates
+                    for lon, lat, *_ in points:
+                        self._add_structure(_Structure(float(lon), float(lat), float(properties["height"])))
+            except (TypeError, ValueError) as e:
+                raise AirspaceDataError(f"Invalid {kind} feature {properties}: {e}")
+        with self._lock:
+            self._cells.clear()
+
+    def _add_volume(self, properties: Dict[str, Any], polygons):
+        airspace_class = str(properties["airspace_class"]).upper()
+        if airspace_class not in CLASS_PRECEDENCE:
+            raise ValueError(f"unknown airspace class {airspace_class!r}")
+        rings = [[[(float(p[0]), float(p[1])) for p in ring] for ring in polygon] for polygon in polygons]
+        outer = [point for polygon in rings for point in polygon[0]]
+        if not outer:
+            raise ValueError("empty polygon")
+        bbox = (min(p[0] for p in outer), min(p[1] for p in outer),
+                max(p[0] for p in outer), max(p[1] for p in outer))
+        volume = _Volume(airspace_class, bool(properties.get("surface_area", False)),
+                         float(properties.get("floor", 0.0)), float(properties.get("ceiling", math.inf)),
+                         rings, bbox)
+        self.volumes.append(volume)
+        for key in self._coarse_range(bbox):
+            self._coarse_volumes.setdefault(key, []).append(len(self.volumes) - 1)
+
+    def _add_structure(self, structure: _Structure):
+        self.structures.append(structure)
+        key = (math.floor(structure.longitude / COARSE_CELL), math.floor(structure.latitude / COARSE_CELL))
+        self._coarse_structures.setdefault(key, []).append(len(self.structures) - 1)
+
+    @staticmethod
+    def _coarse_range(bbox):
+        min_lon, min_lat, max_lon, max_lat = bbox
+        for x in range(math.floor(min_lon / COARSE_CELL), math.floor(max_lon / COARSE_CELL) + 1):
+            for y in range(math.floor(min_lat / COARSE_CELL), math.floor(max_lat / COARSE_CELL) + 1):
+                yield x, y
+
+    def cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return math.floor(longitude / self.cell_size), math.floor(latitude / self.cell_size)
+
+    def _candidates(self, cell: Tuple[int, int]) -> Tuple[List[_Volume], List[_Structure]]:
+        """Features that can affect a point in the cell, through the LRU cache"""
+        with self._lock:
+            candidates = self._cells.get(cell)
+            if candidates is not None:
+                self._cells.move_to_end(cell)
+                self.cache_hits += 1
+                return candidates
+
+        x, y = cell
+        min_lon, min_lat = x * self.cell_size, y * self.cell_size
+        max_lon, max_lat = min_lon + self.cell_size, min_lat + self.cell_size
+        volume_ids = set()
+        for key in self._coarse_range((min_lon, min_lat, max_lon, max_lat)):
+            volume_ids.update(self._coarse_volumes.get(key, ()))
+        volumes = [volume for volume in (self.volumes[i] for i in sorted(volume_ids))
+                   if volume.bbox[0] <= max_lon and volume.bbox[2] >= min_lon
+                   and volume.bbox[1] <= max_lat and volume.bbox[3] >= min_lat]
+
+        # Structures within STRUCTURE_RADIUS of the cell's edges
+        margin_lat = STRUCTURE_RADIUS / FEET_PER_DEGREE
+        margin_lon = margin_lat / max(math.cos(math.radians(max(abs(min_lat), abs(max_lat)))), 1e-6)
+        near = (min_lon - margin_lon, min_lat - margin_lat, max_lon + margin_lon, max_lat + margin_lat)
+        structure_ids = set()
+        for key in self._coarse_range(near):
+            structure_ids.update(self._coarse_structures.get(key, ()))
+        structures = [s for s in (self.structures[i] for i in sorted(structure_ids))
+                      if near[0] <= s.longitude <= near[2] and near[1] <= s.latitude <= near[3]]
+
+        candidates = (volumes, structures)
+        with self._lock:
+            self.cache_misses += 1
+            self._cells[cell] = candidates
+            while len(self._cells) > self.cache_cells:
+                self._cells.popitem(last=False)
+        return candidates
+
+    def _resolve(self, candidates, latitude: float, longitude: float, altitude: float) -> LocationAttributes:
+        volumes, structures = candidates
+        airspace_class = DEFAULT_AIRSPACE_CLASS
+        surface_area = False
+        for volume in volumes:
+            if volume.floor <= altitude <= volume.ceiling and _in_volume(volume, longitude, latitude):
+                if CLASS_PRECEDENCE[volume.airspace_class] < CLASS_PRECEDENCE[airspace_class]:
+                    airspace_class = volume.airspace_class
+                surface_area = surface_area or volume.surface_area
+
+        tallest = None
+        for structure in structures:
+            if _distance_feet(longitude, latitude, structure.longitude, structure.latitude) <= STRUCTURE_RADIUS:
+                if tallest is None or structure.height > tallest:
+                    tallest = structure.height
+        above_structure = altitude - tallest if tallest is not None else 0.0
+        return LocationAttributes(airspace_class, surface_area, tallest is not None, above_structure)
+
+    def lookup(self, latitude: float, longitude: float, altitude: float = 0.0) -> LocationAttributes:
+        """Location attributes at one point; altitude in feet above ground"""
+        return self._resolve(self._candidates(self.cell(latitude, longitude)), latitude, longitude, altitude)
+
+    def lookup_many(self, points: Iterable[Tuple[float, float, float]]) -> List[LocationAttributes]:
+        """
+        Location attributes for many (latitude, longitude, altitude)
+        points, in input order; each cell is resolved once per batch
+        """
+        points = list(points)
+        by_cell: Dict[Tuple[int, int], List[int]] = {}
+        for i, (latitude, longitude, _) in enumerate(points):
+            by_cell.setdefault(self.cell(latitude, longitude), []).append(i)
+
+        results: List[Optional[LocationAttributes]] = [None] * len(points)
+        for cell, indices in by_cell.items():
+            candidates = self._candidates(cell)
+            for i in indices:
+                results[i] = self._resolve(candidates, *points[i])
+        return results
+
+
+def locate_operation(index: AirspaceIndex, operation, latitude: float, longitude: float):
+    """Copy of a DroneOperation with its location fields derived from the index"""
+    location = index.lookup(latitude, longitude, operation.operating_altitude)
+    return replace(operation, **location._asdict())
+
+
+_LOCATION_ATTRIBUTES = {field_name: (category, attr_id)
+                        for field_name, category, attr_id, _ in OPERATION_ATTRIBUTES
+                        if field_name in LOCATION_FIELDS}
+
+
+def locate_attributes(attributes: Dict[str, Dict[str, Any]], location: LocationAttributes) -> Dict[str, Dict[str, Any]]:
+    """
+    Set the location fields in a {category: {attribute_id: value}} dict,
+    as passed to FileBasedPDP.evaluate_attributes; modifies and returns it
+    """
+    for field_name, value in location._asdict().items():
+        category, attr_id = _LOCATION_ATTRIBUTES[field_name]
+        attributes.setdefault(category, {})[attr_id] = value
+    return attributes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Look up airspace and structure attributes from GeoJSON data')
+    parser.add_argument('geojson', nargs='+', type=str, help='GeoJSON files with airspace volumes and structures')
+    parser.add_argument('--lat', type=float, help='Latitude of the point to look up')
+    parser.add_argument('--lon', type=float, help='Longitude of the point to look up')
+    parser.add_argument('--alt', type=float, default=0.0, help='Altitude above ground in feet')
+    parser.add_argument('--cell-size', type=float, default=DEFAULT_CELL, help='Grid cell size in degrees')
+    parser.add_argument('--benchmark', type=int, default=0,
+                        help='Time batch lookups of this many random points within the data bounds')
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        index = AirspaceIndex.from_geojson(*args.geojson, cell_size=args.cell_size)
+    except (OSError, ValueError) as e:
+        print(f"Error loading airspace data: {e}")
+        sys.exit(1)
+    print(f"Loaded {len(index.volumes)} airspace volumes and {len(index.structures)} structures "
+          f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    if args.lat is not None and args.lon is not None:
+        print(json.dumps(index.lookup(args.lat, args.lon, args.alt)._asdict(), indent=2))
+
+    if args.benchmark:
+        bounds = [volume.bbox for volume in index.volumes] or [(-1.0, -1.0, 1.0, 1.0)]
+        min_lon, min_lat = min(b[0] for b in bounds), min(b[1] for b in bounds)
+        max_lon, max_lat = max(b[2] for b in bounds), max(b[3] for b in bounds)
+        rng = random.Random(0)
+        points = [(rng.uniform(min_lat, max_lat), rng.uniform(min_lon, max_lon), rng.uniform(0.0, 500.0))
+                  for _ in range(args.benchmark)]
+        for label in ("cold", "warm"):
+            start = time.perf_counter()
+            index.lookup_many(points)
+            elapsed = time.perf_counter() - start
+            print(f"{label}: {args.benchmark} lookups in {elapsed * 1000:.1f} ms "
+                  f"({elapsed / args.benchmark * 1e6:.1f} us each)")
+        print(f"Cell cache: {index.cache_hits} hits, {index.cache_misses} misses")
+
+
+if __name__ == "__main__":
+    main()
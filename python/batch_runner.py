@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+
+"""
+Parallel batch evaluation of drone operations across worker processes
+
+A JSONL input (one operation per line, either the DroneOperation fields
+or an object with an "operation" member as in example_operations.json)
+is split into byte ranges; each worker process loads the policy once,
+reads and evaluates its own ranges, and writes one uint32 result per
+input line into a shared memory block at that line's index. No
+operation or result dict crosses a process boundary, and the results
+come back in input order whichever worker finishes first.
+
+Results are codes: with the direct engine the bitmask of violated rules
+(bit i for DIRECT_RULES[i], 0 for an approved operation), with the pdp
+engine an index into DECISIONS. INVALID marks a line that is not a
+valid operation.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+from array import array
+from dataclasses import asdict
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from decision_journal import RULE_IDS, violation_mask
+from differential_check import generate_operation
+from direct_faa_rules import FAADroneRulesEvaluator
+from drone_attributes import operation_to_attributes
+from drone_operation import FIELD_TYPES, DroneOperation
+from file_based_pdp import FileBasedPDP
+from incremental_evaluation import coerce_field
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLICY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../policies/FAADroneRules.xml")
+DEFAULT_CHUNK_ROWS = 20000
+
+ENGINES = ("direct", "pdp")
+DECISIONS = ("Permit", "Deny", "NotApplicable", "Indeterminate")
+INVALID = 0xFFFFFFFF
+
+
+def parse_operation(data: Dict[str, Any]) -> DroneOperation:
+    """
+    DroneOperation from a decoded input line; fields DroneOperation does
+    not have (pilot_id, latitude, ...) are ignored
+
+    Raises ValueError for a missing field or a value that does not convert.
+    """
+    data = data.get("operation", data)
+    try:
+        return DroneOperation(**{name: coerce_field(name, value) for name, value in data.items()
+                                 if name in FIELD_TYPES})
+    except TypeError as e:
+        raise ValueError(str(e))
+
+
+# Per-process engine and shared result block, created by the pool initializer
+_evaluate = None
+_results: Optional[SharedMemory] = None
+
+
+def _init_worker(engine: str, policy_file: str, decision_table_file: Optional[str], results_name: str):
+    """Pool initializer: load the policy once per worker process"""
+    global _evaluate, _results
+    logging.getLogger("file_based_pdp").setLevel(logging.ERROR)
+    _evaluate = _engine(engine, policy_file, decision_table_file)
+    _results = SharedMemory(name=results_name)
+
+
+def _engine(engine: str, policy_file: str, decision_table_file: Optional[str]):
+    """Function from a DroneOperation to its result code"""
+    if engine == "direct":
+        evaluate_rules = FAADroneRulesEvaluator().evaluate_rules
+        return lambda operation: violation_mask(evaluate_rules(operation))
+
+    pdp = FileBasedPDP(policy_file, decision_table_file=decision_table_file)
+    codes = {decision: code for code, decision in enumerate(DECISIONS)}
+    return lambda operation: codes[pdp.evaluate_attributes(operation_to_attributes(operation))]
+
+
+def _evaluate_lines(lines: Iterable[bytes], first_row: int) -> array:
+    codes = array('I')
+    for row, line in enumerate(lines, first_row):
+        try:
+            codes.append(_evaluate(parse_operation(json.loads(line))))
+        except (ValueError, TypeError, AttributeError) as e:
+            # json.JSONDecodeError is a ValueError; a blank line is invalid too
+            logger.warning(f"Line {row + 1}: {e}")
+            codes.append(INVALID)
+    return codes
+
+
+def _store(first_row: int, codes: array) -> int:
+    view = _results.buf.cast('I')
+    try:
+        view[first_row:first_row + len(codes)] = codes
+    finally:
+        view.release()
+    return len(codes)
+
+
+def _run_file_chunk(task: Tuple[str, int, int, int]) -> int:
+    """Evaluate the lines in one byte range of the input file"""
+    path, start, end, first_row = task
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return _store(first_row, _evaluate_lines(data.splitlines(), first_row))
+
+
+def _run_items_chunk(task: Tuple[List[Dict[str, Any]], int]) -> int:
+    """Evaluate one chunk of an in-memory list of operation dicts"""
+    items, first_row = task
+    codes = array('I')
+    for row, item in enumerate(items, first_row):
+        try:
+            codes.append(_evaluate(item if isinstance(item, DroneOperation) else parse_operation(item)))
+        except (ValueError, TypeError, AttributeError) as e:
+            logger.warning(f"Item {row}: {e}")
+            codes.append(INVALID)
+    return _store(first_row, codes)
+
+
+def split_file(path: str, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Tuple[int, List[Tuple[str, int, int, int]]]:
+    """
+    Number of lines of a JSONL file and its (path, start, end, first_row)
+    byte-range tasks of `chunk_rows` lines each
+    """
+    tasks = []
+    rows = start = offset = first_row = 0
+    with open(path, "rb") as f:
+        for line in f:
+            offset += len(line)
+            rows += 1
+            if rows - first_row == chunk_rows:
+                tasks.append((path, start, offset, first_row))
+                start, first_row = offset, rows
+    if rows > first_row:
+        tasks.append((path, start, offset, first_row))
+    return rows, tasks
+
+
+def _run(function, tasks: List[tuple], rows: int, engine: str, workers: Optional[int],
+         policy_file: str, decision_table_file: Optional[str]) -> array:
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {', '.join(ENGINES)}")
+    codes = array('I')
+    if rows == 0:
+        return codes
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if engine == "pdp" and decision_table_file:
+        # Build the table file once here rather than racing in every worker
+        FileBasedPDP(policy_file, decision_table_file=decision_table_file)
+
+    results = SharedMemory(create=True, size=rows * codes.itemsize)
+    try:
+        with Pool(processes=workers, initializer=_init_worker,
+                  initargs=(engine, policy_file, decision_table_file, results.name)) as pool:
+            done = sum(pool.imap_unordered(function, tasks))
+        if done != rows:
+            raise RuntimeError(f"Evaluated {done} of {rows} rows")
+        codes.frombytes(results.buf[:rows * codes.itemsize])
+    finally:
+        results.close()
+        results.unlink()
+    return codes
+
+
+def run_file(path: str, engine: str = "direct", workers: Optional[int] = None,
+             chunk_rows: int = DEFAULT_CHUNK_ROWS, policy_file: str = DEFAULT_POLICY_FILE,
+             decision_table_file: Optional[str] = None) -> array:
+    """
+    Result codes of every line of a JSONL file, in line order
+
+    With the pdp engine and a decision_table_file, workers memory-map
+    one shared decision table instead of interpreting the policy.
+    """
+    rows, tasks = split_file(path, chunk_rows)
+    return _run(_run_file_chunk, tasks, rows, engine, workers, policy_file, decision_table_file)
+
+
+def run_items(items: List[Any], engine: str = "direct", workers: Optional[int] = None,
+              chunk_rows: int = DEFAULT_CHUNK_ROWS, policy_file: str = DEFAULT_POLICY_FILE,
+              decision_table_file: Optional[str] = None) -> array:
+    """Result codes of a list of operation dicts or DroneOperations, in order"""
+    tasks = [(items[i:i + chunk_rows], i) for i in range(0, len(items), chunk_rows)]
+    return _run(_run_items_chunk, tasks, len(items), engine, workers, policy_file, decision_table_file)
+
+
+def decode(code: int, engine: str = "direct") -> Dict[str, Any]:
+    """Result dict of one code: decision, and for the direct engine the violated rules"""
+    if code == INVALID:
+        return {"decision": "Invalid"}
+    if engine == "pdp":
+        return {"decision": DECISIONS[code]}
+    return {"decision": "Deny" if code else "Permit",
+            "violations": [rule_id for i, rule_id in enumerate(RULE_IDS) if code >> i & 1]}
+
+
+def write_results(codes: array, path: str, engine: str = "direct"):
+    """Write one JSON result per line, in input order"""
+    with open(path, "w") as f:
+        for code in codes:
+            f.write(json.dumps(decode(code, engine)) + "\n")
+
+
+def summarize(codes: array, engine: str = "direct") -> Dict[str, int]:
+    """Count of each decision and, for the direct engine, of each violated rule"""
+    counts: Dict[str, int] = {}
+    for code in set(codes):
+        occurrences = codes.count(code)
+        result = decode(code, engine)
+        counts[result["decision"]] = counts.get(result["decision"], 0) + occurrences
+        for rule_id in result.get("violations", ()):
+            counts[rule_id] = counts.get(rule_id, 0) + occurrences
+    return counts
+
+
+def _write_generated(path: str, count: int, seed: int = 0):
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        for _ in range(count):
+            f.write(json.dumps(asdict(generate_operation(rng))) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate a JSONL file of drone operations across worker processes')
+    parser.add_argument('input', type=str, nargs='?', help='JSONL file, one operation per line')
+    parser.add_argument('--engine', choices=ENGINES, default='direct', help='Evaluator to run')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help='Lines per worker task')
+    parser.add_argument('--policy-file', type=str, default=DEFAULT_POLICY_FILE, help='XACML policy file or policy directory (pdp engine)')
+    parser.add_argument('--decision-table-file', type=str, help='Shared decision table file (pdp engine)')
+    parser.add_argument('--output', type=str, help='Write one JSON result per input line to this file')
+    parser.add_argument('--benchmark', type=int, metavar='COUNT',
+                        help='Evaluate COUNT generated operations with 1 worker up to --workers')
+
+    args = parser.parse_args()
+
+    if args.benchmark:
+        workers = args.workers or os.cpu_count() or 1
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "operations.jsonl")
+            _write_generated(path, args.benchmark)
+            baseline = None
+            for count in sorted({1, *range(2, workers + 1, 2), workers}):
+                start = time.perf_counter()
+                run_file(path, args.engine, count, args.chunk_rows, args.policy_file, args.decision_table_file)
+                rate = args.benchmark / (time.perf_counter() - start)
+                baseline = baseline or rate
+                print(f"{count:3} workers: {rate:10.0f} operations/s ({rate / baseline:.2f}x)")
+        return
+
+    if not args.input:
+        parser.error("an input file or --benchmark is required")
+
+    start = time.perf_counter()
+    codes = run_file(args.input, args.engine, args.workers, args.chunk_rows, args.policy_file,
+                     args.decision_table_file)
+    elapsed = time.perf_counter() - start
+    print(f"Evaluated {len(codes)} operations in {elapsed:.1f}s ({len(codes) / max(elapsed, 1e-9):.0f} ops/s)")
+    for name, count in sorted(summarize(codes, args.engine).items(), key=lambda item: -item[1]):
+        print(f"  {name:35} {count:10}")
+    if args.output:
+        write_results(codes, args.output, args.engine)
+        print(f"Results written to {args.output}")
+
+    sys.exit(1 if INVALID in codes else 0)
+
+
+if __name__ == "__main__":
+    main()
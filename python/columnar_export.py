@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+
+"""
+Columnar export of the decision journal for analytics
+
+export_journal streams decisions from a decision journal into one NumPy
+.npy file per column: the operation's attributes, one boolean column per
+rule (True if violated), the violation bitmask and the decision. Rows
+are written in chunks, so memory stays bounded however many decisions
+are exported. Strings are dictionary-encoded as uint32 codes; the
+categories are listed in manifest.json.
+
+The files are standard .npy (numpy.load, or numpy.load(mmap_mode='r')
+for large exports) but are written and read here with the standard
+library only. ColumnStore memory-maps them and evaluates filters and
+violation counts column-at-a-time:
+
+    store = ColumnStore("export")
+    night = store.equals("time_of_day", "night")
+    store.violation_counts(night)     # {rule_id: count}
+"""
+
+import os
+import ast
+import sys
+import json
+import mmap
+import time
+import struct
+import argparse
+from array import array
+from typing import Any, Dict, Iterable
+
+from decision_journal import RULE_IDS, JournalRecord, scan_journal
+from drone_operation import FIELD_TYPES
+
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+DEFAULT_CHUNK_ROWS = 65536
+
+# Column kinds: NumPy dtype descr and array typecode
+FLOAT = ("<f8", "d")
+BOOL = ("|b1", "B")
+CODE = ("<u4", "I")
+MASK = ("<u4", "I")
+
+OPERATION_COLUMNS = {name: BOOL if field_type in (bool, "bool") else FLOAT if field_type in (float, "float") else CODE
+                     for name, field_type in FIELD_TYPES.items()}
+
+
+def _npy_header(descr: str, rows: int) -> bytes:
+    # Sized for the largest row count so the header can be rewritten in place
+    text = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (descr, rows)
+    width = len("{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (descr, 10 ** 15))
+    text = text.ljust(width)
+    padding = 64 - (len(NPY_MAGIC) + 2 + len(text) + 1) % 64
+    header = (text + " " * (padding % 64) + "\n").encode("latin1")
+    return NPY_MAGIC + struct.pack("<H", len(header)) + header
+
+
+class _NpyWriter:
+    """One .npy column written in chunks; the shape is filled in by close()"""
+
+    def __init__(self, path: str, kind):
+        self.descr, self.typecode = kind
+        self.file = open(path, "wb")
+        self.file.write(_npy_header(self.descr, 0))
+        self.rows = 0
+
+    def write(self, values: array):
+        values.tofile(self.file)
+        self.rows += len(values)
+
+    def close(self):
+        self.file.seek(0)
+        self.file.write(_npy_header(self.descr, self.rows))
+        self.file.close()
+
+
+def export_journal(journal_directory: str, output_directory: str, chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                   **filters) -> int:
+    """
+    Export decisions matching scan_journal `filters` (start, end,
+    drone_id, rule_id, approved); returns the number of rows
+    """
+    return export_records(scan_journal(journal_directory, **filters), output_directory, chunk_rows)
+
+
+def export_records(records: Iterable[JournalRecord], output_directory: str,
+                   chunk_rows: int = DEFAULT_CHUNK_ROWS) -> int:
+    """Export journal records to a column directory; returns the number of rows"""
+    os.makedirs(output_directory, exist_ok=True)
+    columns = {"timestamp": FLOAT, "drone_id": CODE, "policy_hash": CODE, "approved": BOOL, "violations": MASK}
+    columns.update(OPERATION_COLUMNS)
+    columns.update({f"violated.{rule_id}": BOOL for rule_id in RULE_IDS})
+    writers = {name: _NpyWriter(os.path.join(output_directory, f"{name}.npy"), kind) for name, kind in columns.items()}
+    categories: Dict[str, Dict[str, int]] = {name: {} for name, kind in columns.items() if kind is CODE}
+    rule_bits = {rule_id: 1 << i for i, rule_id in enumerate(RULE_IDS)}
+    buffers = {name: array(kind[1]) for name, kind in columns.items()}
+
+    def code(name: str, value: str) -> int:
+        codes = categories[name]
+        value_code = codes.get(value)
+        if value_code is None:
+            value_code = codes[value] = len(codes)
+        return value_code
+
+    def flush():
+        for name, buffer in buffers.items():
+            writers[name].write(buffer)
+            buffers[name] = array(columns[name][1])
+
+    rows = 0
+    pending = 0
+    for record in records:
+        mask = 0
+        for rule_id in record.violations:
+            mask |= rule_bits[rule_id]
+        buffers["timestamp"].append(record.timestamp)
+        buffers["drone_id"].append(code("drone_id", record.drone_id))
+        buffers["policy_hash"].append(code("policy_hash", record.policy_hash))
+        buffers["approved"].append(not mask)
+        buffers["violations"].append(mask)
+        for name, value in record.attributes.items():
+            kind = OPERATION_COLUMNS[name]
+            buffers[name].append(code(name, value) if kind is CODE else value)
+        for rule_id, bit in rule_bits.items():
+            buffers[f"violated.{rule_id}"].append(bool(mask & bit))
+        rows += 1
+        pending += 1
+        if pending >= chunk_rows:
+            flush()
+            pending = 0
+    flush()
+    for writer in writers.values():
+        writer.close()
+
+    manifest = {
+        "rows": rows,
+        "rules": RULE_IDS,
+        "columns": {name: {"dtype": kind[0], **({"categories": list(categories[name])} if kind is CODE else {})}
+                    for name, kind in columns.items()},
+    }
+    with open(os.path.join(output_directory, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return rows
+
+
+def read_npy(path: str) -> memoryview:
+    """Memory-mapped data of a one-dimensional .npy file written by export_records"""
+    with open(path, "rb") as f:
+        if f.read(len(NPY_MAGIC)) != NPY_MAGIC:
+            raise ValueError(f"{path} is not a version 1.0 .npy file")
+        header_length = struct.unpack("<H", f.read(2))[0]
+        header = ast.literal_eval(f.read(header_length).decode("latin1"))
+        offset = len(NPY_MAGIC) + 2 + header_length
+        size = os.fstat(f.fileno()).st_size
+        if size == offset:
+            return memoryview(b"")
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    typecode = {"<f8": "d", "|b1": "B", "<u4": "I"}[header["descr"]]
+    return memoryview(mapped)[offset:].cast(typecode)
+
+
+class Mask:
+    """
+    Row selection: one byte per row (0 or 1) held as a Python int, so
+    & | ~ and count() run over whole columns in C
+    """
+
+    __slots__ = ("bits", "rows")
+
+    def __init__(self, flags: bytes, rows: int = None):
+        self.bits = int.from_bytes(flags, "little") if isinstance(flags, (bytes, bytearray)) else flags
+        self.rows = len(flags) if rows is None else rows
+
+    def __and__(self, other: "Mask") -> "Mask":
+        return Mask(self.bits & other.bits, self.rows)
+
+    def __or__(self, other: "Mask") -> "Mask":
+        return Mask(self.bits | other.bits, self.rows)
+
+    def __invert__(self) -> "Mask":
+        return Mask(self.bits ^ int.from_bytes(b"\x01" * self.rows, "little"), self.rows)
+
+    def count(self) -> int:
+        return self.bits.bit_count()
+
+
+class ColumnStore:
+    """Read-only, memory-mapped access to an exported column directory"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        self.rows = self.manifest["rows"]
+        self.rules = self.manifest["rules"]
+        self._columns: Dict[str, memoryview] = {}
+
+    def column(self, name: str) -> memoryview:
+        if name not in self.manifest["columns"]:
+            raise KeyError(f"No column {name!r}")
+        if name not in self._columns:
+            self._columns[name] = read_npy(os.path.join(self.directory, f"{name}.npy"))
+        return self._columns[name]
+
+    def all(self) -> Mask:
+        return Mask(b"\x01" * self.rows)
+
+    def flag(self, name: str) -> Mask:
+        """Rows where a boolean column is True"""
+        return Mask(self.column(name).tobytes(), self.rows)
+
+    def equals(self, name: str, value: Any) -> Mask:
+        """Rows where a column equals `value` (a string for dictionary-encoded columns)"""
+        categories = self.manifest["columns"][name].get("categories")
+        if categories is not None:
+            if value not in categories:
+                return Mask(0, self.rows)
+            value = categories.index(value)
+        elif self.manifest["columns"][name]["dtype"] == "<f8":
+            value = float(value)
+        return Mask(bytes(map(value.__eq__, self.column(name))), self.rows)
+
+    def compare(self, name: str, op: str, value: float) -> Mask:
+        """Rows where `column op value` holds, op one of < <= > >= == !="""
+        # Evaluated as `value reflected-op column` so the bound method runs in C
+        reflected = {"<": "__gt__", "<=": "__ge__", ">": "__lt__", ">=": "__le__", "==": "__eq__", "!=": "__ne__"}
+        return Mask(bytes(map(getattr(float(value), reflected[op]), self.column(name))), self.rows)
+
+    def violation_counts(self, mask: Mask = None) -> Dict[str, int]:
+        """Number of selected rows violating each rule"""
+        return {rule_id: (self.flag(f"violated.{rule_id}") & mask).count() if mask is not None
+                else self.column(f"violated.{rule_id}").tobytes().count(1)
+                for rule_id in self.rules}
+
+    def where(self, conditions: Dict[str, Any]) -> Mask:
+        """
+        Conjunction of conditions {column: value}; a value may be
+        "op number" (e.g. "> 400") for numeric columns
+        """
+        mask = self.all()
+        for name, value in conditions.items():
+            kind = self.manifest["columns"][name]["dtype"]
+            if kind == "|b1":
+                selected = self.flag(name)
+                mask &= selected if str(value).lower() in ("true", "1") else ~selected
+            elif kind == "<f8":
+                op, _, number = str(value).strip().partition(" ")
+                mask &= self.compare(name, op, float(number)) if number else self.compare(name, "==", float(op))
+            else:
+                mask &= self.equals(name, value)
+        return mask
+
+
+def _parse_condition(text: str):
+    for op in ("<=", ">=", "!=", "==", "<", ">", "="):
+        name, found, value = text.partition(op)
+        if found:
+            return name.strip(), f"{op} {value.strip()}" if op not in ("=", "==") else value.strip()
+    raise argparse.ArgumentTypeError(f"Expected column=value or column<op>number, got {text!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the decision journal to columns and query them')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export = commands.add_parser('export', help='Export journal decisions to a column directory')
+    export.add_argument('journal', type=str, help='Decision journal directory')
+    export.add_argument('output', type=str, help='Output directory for the .npy columns')
+    export.add_argument('--start', type=float, help='Start timestamp (inclusive, seconds since the epoch)')
+    export.add_argument('--end', type=float, help='End timestamp (exclusive)')
+    export.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help='Rows buffered per write')
+
+    query = commands.add_parser('query', help='Violation counts of the rows matching conditions')
+    query.add_argument('directory', type=str, help='Column directory written by export')
+    query.add_argument('--where', type=_parse_condition, action='append', default=[],
+                       help='Condition such as time_of_day=night or operating_altitude>400 (repeatable)')
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == 'export':
+        rows = export_journal(args.journal, args.output, args.chunk_rows, start=args.start, end=args.end)
+        print(f"Exported {rows} decisions in {time.perf_counter() - start:.1f} s")
+        return
+
+    store = ColumnStore(args.directory)
+    try:
+        mask = store.where(dict(args.where))
+    except (KeyError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    selected = mask.count()
+    counts = store.violation_counts(mask)
+    elapsed = time.perf_counter() - start
+    print(f"{selected} of {store.rows} decisions selected, "
+          f"{selected - (mask & store.flag('approved')).count()} denied ({elapsed * 1000:.1f} ms)")
+    for rule_id, count in sorted(counts.items(), key=lambda item: -item[1]):
+        if count:
+            print(f"  {rule_id:35} {count:10} {count / selected * 100 if selected else 0:6.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+"""
+XACML 3.0 rule and policy combining algorithms
+
+Each algorithm combines the decisions of a policy's rules, or of a policy
+set's policies, in order. The decisions are consumed lazily and the
+algorithm returns as soon as the ones left cannot change the result, so
+rules and policies after that point are never evaluated.
+
+Decisions are "Permit", "Deny", "NotApplicable", None (a Target that did
+not match, NotApplicable to every algorithm but only-one-applicable) and
+the extended Indeterminates of XACML 3.0: "Indeterminate{P}",
+"Indeterminate{D}" and "Indeterminate{DP}", the decisions an
+Indeterminate could have been. A rule's Indeterminate is the one of its
+Effect. Policies and policy sets return a plain "Indeterminate", which
+counts as "Indeterminate{DP}" when they are combined.
+
+Algorithms are registered by their short id (the last component of the
+URN), so the XACML 1.0, 1.1 and 3.0 identifiers of an algorithm share one
+implementation; register_combining_algorithm adds others.
+"""
+
+from typing import Callable, Dict, Iterable, NamedTuple, Optional
+
+PERMIT = "Permit"
+DENY = "Deny"
+NOT_APPLICABLE = "NotApplicable"
+INDETERMINATE = "Indeterminate"
+INDETERMINATE_P = "Indeterminate{P}"
+INDETERMINATE_D = "Indeterminate{D}"
+INDETERMINATE_DP = "Indeterminate{DP}"
+
+
+class CombiningAlgorithm(NamedTuple):
+    """A registered combining algorithm"""
+    name: str
+    combine: Callable[[Iterable[Optional[str]]], str]
+    # Evaluation order is part of the semantics; when False, FileBasedPDP
+    # may evaluate rules and policies in any order
+    ordered: bool
+    # The decision that ends evaluation early, if there is one
+    stops_on: Optional[str]
+    # Usable as a rule combining algorithm, not only for policies
+    rules: bool
+
+
+_ALGORITHMS: Dict[str, CombiningAlgorithm] = {}
+# Lookups by full id, as FileBasedPDP makes one per policy evaluation
+_BY_ID: Dict[str, Optional[CombiningAlgorithm]] = {}
+
+
+def register_combining_algorithm(name: str, combine: Callable, ordered: bool = True,
+                                 stops_on: Optional[str] = None, rules: bool = True):
+    """Register (or replace) a combining algorithm under its short id"""
+    _ALGORITHMS[name] = CombiningAlgorithm(name, combine, ordered, stops_on, rules)
+    _BY_ID.clear()
+
+
+def lookup_combining_algorithm(algorithm_id: str) -> Optional[CombiningAlgorithm]:
+    """The algorithm for a combining algorithm URN or short id, None if unknown"""
+    try:
+        return _BY_ID[algorithm_id]
+    except KeyError:
+        algorithm = _BY_ID[algorithm_id] = _ALGORITHMS.get((algorithm_id or "").split(':')[-1])
+        return algorithm
+
+
+def combining_algorithm_names(rules: bool = False):
+    """Short ids of the registered algorithms, those usable for rules only if `rules`"""
+    return {name for name, algorithm in _ALGORITHMS.items() if algorithm.rules or not rules}
+
+
+def plain_decision(decision: str) -> str:
+    """An extended Indeterminate as the plain "Indeterminate" decision"""
+    return INDETERMINATE if decision.startswith(INDETERMINATE) else decision
+
+
+def _overrides(overriding: str, indeterminate_overriding: str, other: str, indeterminate_other: str):
+    """deny-overrides (overriding Deny) or permit-overrides (overriding Permit)"""
+    def combine(decisions):
+        error = error_overriding = error_other = found_other = False
+        for decision in decisions:
+            if decision == overriding:
+                return overriding
+            if decision == other:
+                found_other = True
+            elif decision == indeterminate_overriding:
+                error_overriding = True
+            elif decision == indeterminate_other:
+                error_other = True
+            elif decision is not None and decision.startswith(INDETERMINATE):
+                error = True
+        if error or error_overriding and (error_other or found_other):
+            return INDETERMINATE_DP
+        if error_overriding:
+            return indeterminate_overriding
+        if found_other:
+            return other
+        if error_other:
+            return indeterminate_other
+        return NOT_APPLICABLE
+    return combine
+
+
+def _unless(winning: str, default: str):
+    """deny-unless-permit (winning Permit) or permit-unless-deny (winning Deny)"""
+    def combine(decisions):
+        for decision in decisions:
+            if decision == winning:
+                return winning
+        return default
+    return combine
+
+
+def _first_applicable(decisions):
+    for decision in decisions:
+        if decision is not None and decision != NOT_APPLICABLE:
+            return decision
+    return NOT_APPLICABLE
+
+
+def _only_one_applicable(decisions):
+    # Applicable means the Target matched: a policy that evaluates to
+    # NotApplicable still counts
+    found = None
+    for decision in decisions:
+        if decision is None:
+            continue
+        if found is not None or decision.startswith(INDETERMINATE):
+            return INDETERMINATE_DP
+        found = decision
+    return NOT_APPLICABLE if found is None else found
+
+
+register_combining_algorithm('deny-overrides', _overrides(DENY, INDETERMINATE_D, PERMIT, INDETERMINATE_P),
+                             ordered=False, stops_on=DENY)
+register_combining_algorithm('ordered-deny-overrides', _overrides(DENY, INDETERMINATE_D, PERMIT, INDETERMINATE_P),
+                             stops_on=DENY)
+register_combining_algorithm('permit-overrides', _overrides(PERMIT, INDETERMINATE_P, DENY, INDETERMINATE_D),
+                             ordered=False, stops_on=PERMIT)
+register_combining_algorithm('ordered-permit-overrides', _overrides(PERMIT, INDETERMINATE_P, DENY, INDETERMINATE_D),
+                             stops_on=PERMIT)
+register_combining_algorithm('deny-unless-permit', _unless(PERMIT, DENY), ordered=False, stops_on=PERMIT)
+register_combining_algorithm('permit-unless-deny', _unless(DENY, PERMIT), ordered=False, stops_on=DENY)
+register_combining_algorithm('first-applicable', _first_applicable)
+register_combining_algorithm('only-one-applicable', _only_one_applicable, ordered=False, rules=False)
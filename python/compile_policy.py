@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+"""
+compile-policy: validate a XACML policy file and emit a compiled artifact
+
+    python compile_policy.py ../policies/FAADroneRules.xml -o FAADroneRules.xpc
+
+The artifact (see policy_artifact.py) is versioned and checksummed, and
+FileBasedPDP loads it directly without parsing any XML. Validation fails
+the build for anything FileBasedPDP would otherwise only discover on the
+first request, such as functions missing from its function library
+(xacml_functions.py) or called with the wrong arguments.
+"""
+
+import os
+import re
+import sys
+import time
+import hashlib
+import argparse
+from datetime import datetime, timezone
+from typing import List, Tuple
+
+from policy_compiler import (Apply, AttributeValue, PolicyCompileError, PolicyReference, PolicySet,
+                             compile_policy, iter_expressions, short_id)
+from policy_artifact import write_artifact, read_artifact
+from file_based_pdp import FileBasedPDP
+from combining_algorithms import lookup_combining_algorithm
+from decision_table import PolicyAnalysisError
+from policy_analysis import analyze_policy, format_finding
+from xacml_functions import FunctionCompileError, compile_condition, compile_expression, compile_target
+
+ARTIFACT_EXTENSION = ".xpc"
+
+
+def _validate_target(target: tuple, where: str, errors: List[str]):
+    try:
+        compile_target(target)
+    except FunctionCompileError as e:
+        errors.append(f"{where}: {e}")
+    for any_of in target:
+        for all_of in any_of:
+            for match in all_of:
+                if short_id(match.function_id or "").endswith('regexp-match'):
+                    _validate_regex(match.value.value, where, errors)
+
+
+def _validate_regex(pattern, where: str, errors: List[str]):
+    try:
+        re.compile(pattern)
+    except (re.error, TypeError) as e:
+        errors.append(f"{where}: invalid regular expression {pattern!r}: {e}")
+
+
+def _validate_condition(condition, where: str, errors: List[str]):
+    try:
+        compile_condition(condition)
+    except FunctionCompileError as e:
+        errors.append(f"{where}: {e}")
+    for expression in iter_expressions(condition):
+        if isinstance(expression, Apply) and short_id(expression.function_id or "").endswith('regexp-match') \
+                and expression.arguments and isinstance(expression.arguments[0], AttributeValue):
+            _validate_regex(expression.arguments[0].value, where, errors)
+
+
+def _validate_result_expressions(node, where: str, errors: List[str]):
+    for kind, expressions in (("Obligation", node.obligations), ("Advice", node.advice)):
+        for expression in expressions:
+            expression_id, decision = expression[0], expression[1]
+            expression_where = f"{where}: {kind} {expression_id}"
+            if not expression_id:
+                errors.append(f"{where}: {kind} without {kind}Id")
+            if decision not in ("Permit", "Deny"):
+                attribute = "FulfillOn" if kind == "Obligation" else "AppliesTo"
+                errors.append(f"{expression_where}: invalid {attribute} {decision!r}")
+            for assignment in expression.assignments:
+                if not assignment.attribute_id:
+                    errors.append(f"{expression_where}: AttributeAssignmentExpression without AttributeId")
+                try:
+                    compile_expression(assignment.expression)
+                except FunctionCompileError as e:
+                    errors.append(f"{expression_where}: {e}")
+
+
+def validate_policy(policy_set: PolicySet) -> Tuple[List[str], List[str]]:
+    """
+    Check a compiled policy set against what FileBasedPDP implements
+
+    Returns (errors, warnings). Errors are constructs FileBasedPDP would
+    evaluate incorrectly; warnings are ones it approximates.
+    """
+    errors = []
+    warnings = []
+
+    def check_policy_set(entry: PolicySet):
+        where = entry.policy_set_id or "<PolicySet without PolicySetId>"
+        if lookup_combining_algorithm(entry.policy_combining_alg) is None:
+            errors.append(f"{where}: unsupported policy combining algorithm {entry.policy_combining_alg}")
+        _validate_target(entry.target, where, errors)
+        _validate_result_expressions(entry, where, errors)
+        for child in entry.policies:
+            if isinstance(child, PolicyReference):
+                warnings.append(f"{where}: {child.reference_id} is only resolved when the policy is loaded "
+                                f"from a policy directory, and is Indeterminate otherwise")
+            elif isinstance(child, PolicySet):
+                check_policy_set(child)
+            else:
+                check_policy(child)
+
+    def check_policy(policy):
+        where = policy.policy_id or "<Policy without PolicyId>"
+        if not policy.policy_id:
+            errors.append(f"{where}: missing PolicyId")
+        algorithm = lookup_combining_algorithm(policy.rule_combining_alg)
+        if algorithm is None or not algorithm.rules:
+            errors.append(f"{where}: unsupported rule combining algorithm {policy.rule_combining_alg}")
+        if not policy.rules:
+            warnings.append(f"{where}: policy has no rules")
+        _validate_target(policy.target, where, errors)
+        _validate_result_expressions(policy, where, errors)
+
+        rule_ids = set()
+        for rule in policy.rules:
+            rule_where = f"{where}/{rule.rule_id}"
+            if not rule.rule_id:
+                errors.append(f"{rule_where}: missing RuleId")
+            elif rule.rule_id in rule_ids:
+                errors.append(f"{rule_where}: duplicate RuleId")
+            rule_ids.add(rule.rule_id)
+            if rule.effect not in ("Permit", "Deny"):
+                errors.append(f"{rule_where}: invalid Effect {rule.effect!r}")
+            _validate_target(rule.target, rule_where, errors)
+            if rule.condition is not None:
+                _validate_condition(rule.condition, rule_where, errors)
+            _validate_result_expressions(rule, rule_where, errors)
+
+    check_policy_set(policy_set)
+    return errors, warnings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Validate a XACML policy and compile it into a binary artifact')
+    parser.add_argument('policy_file', type=str, help='Path to the XACML policy file')
+    parser.add_argument('-o', '--output', type=str,
+                        help=f'Artifact path (default: policy file with {ARTIFACT_EXTENSION} extension)')
+    parser.add_argument('--check', action='store_true', help='Only validate, do not write an artifact')
+    parser.add_argument('--allow-unsupported', action='store_true',
+                        help='Write the artifact even if validation reports errors')
+    parser.add_argument('--analyze', action='store_true',
+                        help='Also report unreachable and shadowed rules, conflicts and gaps (policy_analysis.py)')
+
+    args = parser.parse_args()
+
+    try:
+        with open(args.policy_file, 'rb') as f:
+            source = f.read()
+        policy_set = compile_policy(args.policy_file)
+    except (OSError, PolicyCompileError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        sys.exit(2)
+    except Exception as e:
+        print(f"error: cannot parse {args.policy_file}: {e}", file=sys.stderr)
+        sys.exit(2)
+
+    errors, warnings = validate_policy(policy_set)
+    for warning in warnings:
+        print(f"warning: {warning}", file=sys.stderr)
+    for error in errors:
+        print(f"error: {error}", file=sys.stderr)
+
+    if args.analyze and not errors:
+        try:
+            for finding in analyze_policy(FileBasedPDP(args.policy_file)):
+                print(f"analysis: {format_finding(finding, max_regions=0)[0]}", file=sys.stderr)
+        except PolicyAnalysisError as e:
+            print(f"analysis: skipped, {e}", file=sys.stderr)
+
+    if errors and not args.allow_unsupported:
+        print(f"{len(errors)} error(s), no artifact written", file=sys.stderr)
+        sys.exit(1)
+    if args.check:
+        print(f"{args.policy_file}: {len(errors)} error(s), {len(warnings)} warning(s)")
+        sys.exit(1 if errors else 0)
+
+    output = args.output or os.path.splitext(args.policy_file)[0] + ARTIFACT_EXTENSION
+    write_artifact(output, policy_set, {
+        "source": os.path.basename(args.policy_file),
+        "source_sha256": hashlib.sha256(source).hexdigest(),
+        "policy_set_id": policy_set.policy_set_id,
+        "compiled_at": datetime.now(timezone.utc).isoformat(),
+    })
+
+    # Report how long FileBasedPDP will take to load it
+    start = time.perf_counter()
+    read_artifact(output)
+    load_us = (time.perf_counter() - start) * 1e6
+    print(f"Wrote {output} ({os.path.getsize(output)} bytes, loads in {load_us:.0f} us)")
+
+
+if __name__ == "__main__":
+    main()
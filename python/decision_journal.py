@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+
+"""
+Append-only decision journal
+
+Every evaluation is stored as one fixed-size binary record: timestamp,
+drone id, policy hash, violation bitmask (bit i is DIRECT_RULES[i]) and
+the operation's attribute vector (booleans packed into one bitmask,
+numbers as doubles, strings as indexes into the segment's string table).
+
+Appends are buffered and written by a background thread in blocks, one
+fsync per block (group commit). A block header carries the block's time
+range, the union of its violation bitmasks and the strings it adds to
+the table, so scans skip blocks that cannot match. Segments rotate by
+size or age; a sealed segment is gzip-compressed and named after the
+time range it covers, so scans skip whole segments too.
+
+Segment layout:
+    b"DJSEG1\\n", u32 header length, JSON header (field layout, rule ids)
+    blocks: BLOCK_HEADER, JSON list of new strings, records
+"""
+
+import os
+import zlib
+import gzip
+import json
+import time
+import struct
+import shutil
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from direct_faa_rules import DIRECT_RULES
+from drone_operation import BOOL_FIELDS, FLOAT_FIELDS, STRING_FIELDS, DroneOperation
+
+SEGMENT_MAGIC = b"DJSEG1\n"
+BLOCK_MAGIC = b"DJB1"
+# magic, record count, min timestamp, max timestamp, violation union, strings length, records length, crc32
+BLOCK_HEADER = struct.Struct("<4sIddIIII")
+OPEN_SUFFIX = ".open"
+SEALED_SUFFIX = ".dj.gz"
+
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+DEFAULT_SEGMENT_SECONDS = 24 * 3600
+DEFAULT_FLUSH_INTERVAL = 0.05  # seconds
+DEFAULT_BATCH_SIZE = 4096
+
+RULE_IDS = [rule.rule_id for rule in DIRECT_RULES]
+
+
+def ruleset_hash() -> str:
+    """Hash of the rule implementation, recorded with every decision"""
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "direct_faa_rules.py"), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def violation_mask(outcomes: List[Optional[str]]) -> int:
+    """Bitmask of the violated rules, from FAADroneRulesEvaluator.evaluate_rules outcomes"""
+    mask = 0
+    for i, outcome in enumerate(outcomes):
+        if outcome is not None:
+            mask |= 1 << i
+    return mask
+
+
+def _record_struct(layout: Dict[str, List[str]]) -> struct.Struct:
+    # timestamp, drone id, policy hash, violations, booleans, strings, numbers
+    return struct.Struct("<dIIII" + "I" * len(layout["strings"]) + "d" * len(layout["floats"]))
+
+
+class JournalRecord(NamedTuple):
+    timestamp: float
+    drone_id: str
+    policy_hash: str
+    violations: Tuple[str, ...]  # rule ids
+    attributes: Dict[str, Any]  # DroneOperation fields
+
+    @property
+    def approved(self) -> bool:
+        return not self.violations
+
+    @property
+    def operation(self) -> DroneOperation:
+        return DroneOperation(**self.attributes)
+
+
+class _Segment:
+    """The open segment being appended to"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.layout = {"bools": BOOL_FIELDS, "floats": FLOAT_FIELDS, "strings": STRING_FIELDS, "rules": RULE_IDS}
+        self.record = _record_struct(self.layout)
+        self.strings: Dict[str, int] = {}
+        self.created = time.time()
+        self.first_timestamp = None
+        self.last_timestamp = None
+        header = json.dumps(dict(self.layout, created=self.created)).encode()
+        self.file = open(path, "xb")
+        self.file.write(SEGMENT_MAGIC + struct.pack("<I", len(header)) + header)
+        self.size = self.file.tell()
+
+    def write_block(self, entries: List[tuple]):
+        new_strings = []
+        strings = self.strings
+
+        def index(value: str) -> int:
+            i = strings.get(value)
+            if i is None:
+                i = strings[value] = len(strings)
+                new_strings.append(value)
+            return i
+
+        pack = self.record.pack
+        union = 0
+        records = []
+        for timestamp, drone_id, policy_hash, violations, bools, string_values, numbers in entries:
+            union |= violations
+            records.append(pack(timestamp, index(drone_id), index(policy_hash), violations, bools,
+                                *map(index, string_values), *numbers))
+        records = b"".join(records)
+        string_bytes = json.dumps(new_strings).encode()
+        timestamps = [entry[0] for entry in entries]
+        header = BLOCK_HEADER.pack(BLOCK_MAGIC, len(entries), min(timestamps), max(timestamps), union,
+                                   len(string_bytes), len(records), zlib.crc32(string_bytes + records))
+        self.file.write(header + string_bytes + records)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.size += len(header) + len(string_bytes) + len(records)
+        if self.first_timestamp is None:
+            self.first_timestamp = min(timestamps)
+        self.last_timestamp = max(max(timestamps), self.last_timestamp or 0.0)
+
+
+def _read_exact(f, size: int) -> Optional[bytes]:
+    data = f.read(size)
+    return data if len(data) == size else None
+
+
+def _open_segment_file(path: str):
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+def _read_blocks(path: str) -> Iterator[Tuple[Dict[str, Any], tuple, List[str], bytes, int]]:
+    """
+    (layout, block header, new strings, records, end offset) of each
+    complete block; stops at a torn or corrupt tail
+    """
+    with _open_segment_file(path) as f:
+        if _read_exact(f, len(SEGMENT_MAGIC)) != SEGMENT_MAGIC:
+            raise ValueError(f"{path} is not a decision journal segment")
+        length = struct.unpack("<I", _read_exact(f, 4))[0]
+        layout = json.loads(_read_exact(f, length))
+        offset = len(SEGMENT_MAGIC) + 4 + length
+        while True:
+            raw_header = _read_exact(f, BLOCK_HEADER.size)
+            if raw_header is None:
+                return
+            header = BLOCK_HEADER.unpack(raw_header)
+            magic, _, _, _, _, strings_length, records_length, crc = header
+            body = _read_exact(f, strings_length + records_length) if magic == BLOCK_MAGIC else None
+            if body is None or zlib.crc32(body) != crc:
+                return
+            offset += BLOCK_HEADER.size + len(body)
+            yield layout, header, json.loads(body[:strings_length]), body[strings_length:], offset
+
+
+def _segment_range(name: str) -> Optional[Tuple[float, float]]:
+    """(first, last) timestamps from a sealed segment's name"""
+    if not name.endswith(SEALED_SUFFIX):
+        return None
+    _, first, last = name[:-len(SEALED_SUFFIX)].split("-")
+    return int(first) / 1000.0, int(last) / 1000.0
+
+
+def scan_journal(directory: str, start: float = None, end: float = None, drone_id: str = None,
+                 rule_id: str = None, approved: bool = None) -> Iterator[JournalRecord]:
+    """
+    Records with start <= timestamp < end, optionally only those of one
+    drone, violating one rule, or approved/denied; in write order per segment
+    """
+    start = -float("inf") if start is None else start
+    end = float("inf") if end is None else end
+    names = sorted(name for name in os.listdir(directory) if name.endswith((SEALED_SUFFIX, OPEN_SUFFIX)))
+    for name in names:
+        segment_range = _segment_range(name)
+        if segment_range is not None and (segment_range[1] < start or segment_range[0] >= end):
+            continue
+        yield from _scan_segment(os.path.join(directory, name), start, end, drone_id, rule_id, approved)
+
+
+def _scan_segment(path, start, end, drone_id, rule_id, approved) -> Iterator[JournalRecord]:
+    strings: List[str] = []
+    string_index: Dict[str, int] = {}
+    record = None
+    rule_bit = None
+    bool_cache: Dict[int, Dict[str, bool]] = {}
+    rule_cache: Dict[int, Tuple[str, ...]] = {}
+    for layout, header, new_strings, records, _ in _read_blocks(path):
+        for value in new_strings:
+            string_index[value] = len(strings)
+            strings.append(value)
+        if record is None:
+            record = _record_struct(layout)
+            rules = layout["rules"]
+            if rule_id is not None:
+                if rule_id not in rules:
+                    return
+                rule_bit = 1 << rules.index(rule_id)
+        _, _, min_timestamp, max_timestamp, union, _, _, _ = header
+        if max_timestamp < start or min_timestamp >= end:
+            continue
+        if rule_bit is not None and not union & rule_bit:
+            continue
+        if approved is False and not union:
+            continue
+        drone_index = string_index.get(drone_id)
+        if drone_id is not None and drone_index is None:
+            continue
+
+        bools, floats, string_fields, rules = layout["bools"], layout["floats"], layout["strings"], layout["rules"]
+        string_end = 5 + len(string_fields)
+        for values in record.iter_unpack(records):
+            timestamp, drone, policy, violations, bitmask = values[:5]
+            if not start <= timestamp < end:
+                continue
+            if drone_id is not None and drone != drone_index:
+                continue
+            if rule_bit is not None and not violations & rule_bit:
+                continue
+            if approved is not None and approved != (violations == 0):
+                continue
+            # Few distinct bitmasks occur; decode each once
+            flags = bool_cache.get(bitmask)
+            if flags is None:
+                flags = bool_cache[bitmask] = {name: bool(bitmask >> i & 1) for i, name in enumerate(bools)}
+            violated = rule_cache.get(violations)
+            if violated is None:
+                violated = rule_cache[violations] = tuple(rule for i, rule in enumerate(rules) if violations >> i & 1)
+            attributes = dict(flags)
+            attributes.update(zip(string_fields, map(strings.__getitem__, values[5:string_end])))
+            attributes.update(zip(floats, values[string_end:]))
+            yield JournalRecord(timestamp, strings[drone], strings[policy], violated, attributes)
+
+
+def seal_segment(path: str) -> str:
+    """
+    Truncate an open segment after its last complete block, compress it
+    and name it after its time range; returns the sealed path (or None
+    for a segment without records, which is removed)
+    """
+    first, last, valid_end = None, None, None
+    for _, header, _, _, offset in _read_blocks(path):
+        first = header[2] if first is None else min(first, header[2])
+        last = header[3] if last is None else max(last, header[3])
+        valid_end = offset
+    if first is None:
+        os.remove(path)
+        return None
+
+    with open(path, "r+b") as f:
+        f.truncate(valid_end)
+    first_ms, last_ms = int(first * 1000), int(last * 1000) + 1
+    sealed = os.path.join(os.path.dirname(path), f"journal-{first_ms:015d}-{last_ms:015d}{SEALED_SUFFIX}")
+    while os.path.exists(sealed):
+        last_ms += 1
+        sealed = os.path.join(os.path.dirname(path), f"journal-{first_ms:015d}-{last_ms:015d}{SEALED_SUFFIX}")
+    with open(path, "rb") as source, gzip.open(sealed + ".tmp", "wb") as target:
+        shutil.copyfileobj(source, target)
+    with open(sealed + ".tmp", "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(sealed + ".tmp", sealed)
+    os.remove(path)
+    return sealed
+
+
+class DecisionJournal:
+    """
+    Writer for a journal directory
+
+    append() only buffers; a background thread writes and fsyncs the
+    buffer every `flush_interval` seconds or `batch_size` records.
+    append(wait=True) and flush() block until the record is durable.
+    Open segments left by a crashed writer are sealed at startup.
+
+    If writing fails (a full disk, say) the writer stops and append(),
+    flush() and close() raise its error; records not yet durable are
+    lost, and the open segment is left for the next startup to seal.
+    """
+
+    def __init__(self, directory: str, max_segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+                 max_segment_seconds: float = DEFAULT_SEGMENT_SECONDS, flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 batch_size: int = DEFAULT_BATCH_SIZE, policy_hash: str = None):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_seconds = max_segment_seconds
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.policy_hash = policy_hash or ruleset_hash()
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if name.endswith(OPEN_SUFFIX):
+                seal_segment(os.path.join(directory, name))
+
+        self._segment: Optional[_Segment] = None
+        self._pending: List[tuple] = []
+        self._appended = 0  # sequence number of the last appended record
+        self._durable = 0  # sequence number of the last fsynced record
+        self._closed = False
+        self._error: Optional[BaseException] = None  # the writer's failure, raised to callers
+        self._condition = threading.Condition()
+        self._writer = threading.Thread(target=self._run, name="decision-journal", daemon=True)
+        self._writer.start()
+
+    def append(self, operation: DroneOperation, outcomes: List[Optional[str]], drone_id: str = "",
+               timestamp: float = None, policy_hash: str = None, wait: bool = False):
+        """Record one evaluation: its operation and FAADroneRulesEvaluator.evaluate_rules outcomes"""
+        bools = 0
+        for i, name in enumerate(BOOL_FIELDS):
+            if getattr(operation, name):
+                bools |= 1 << i
+        entry = (time.time() if timestamp is None else timestamp, drone_id or "", policy_hash or self.policy_hash,
+                 violation_mask(outcomes), bools,
+                 tuple(str(getattr(operation, name)) for name in STRING_FIELDS),
+                 tuple(float(getattr(operation, name)) for name in FLOAT_FIELDS))
+        with self._condition:
+            if self._error is not None:
+                raise self._error
+            if self._closed:
+                raise ValueError("Decision journal is closed")
+            self._pending.append(entry)
+            self._appended += 1
+            sequence = self._appended
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify_all()
+            if wait:
+                self._wait_durable(sequence)
+
+    def flush(self):
+        """Block until every appended record is durable"""
+        with self._condition:
+            self._wait_durable(self._appended)
+
+    def _wait_durable(self, sequence: int):
+        """Wait, holding the condition, until record `sequence` is durable or the writer failed"""
+        self._condition.notify_all()
+        while self._durable < sequence and self._error is None:
+            self._condition.wait()
+        if self._durable < sequence:
+            raise self._error
+
+    def close(self):
+        """Flush, stop the writer and seal the open segment"""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._writer.join()
+        if self._segment is not None:
+            self._segment.file.close()
+            if self._error is None:
+                seal_segment(self._segment.path)
+            self._segment = None
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def scan(self, **filters) -> Iterator[JournalRecord]:
+        """scan_journal over this journal's directory; call flush() first to include buffered records"""
+        return scan_journal(self.directory, **filters)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._pending and not self._closed:
+                    self._condition.wait(self.flush_interval)
+                entries, self._pending = self._pending, []
+                sequence = self._appended
+                closed = self._closed
+            if entries:
+                try:
+                    self._write(entries)
+                except Exception as e:
+                    with self._condition:
+                        self._error = e
+                        self._condition.notify_all()
+                    return
+            with self._condition:
+                self._durable = sequence
+                self._condition.notify_all()
+            if closed and not entries:
+                return
+
+    def _write(self, entries: List[tuple]):
+        segment = self._segment
+        if segment is not None and (segment.size >= self.max_segment_bytes
+                                    or time.time() - segment.created >= self.max_segment_seconds):
+            segment.file.close()
+            seal_segment(segment.path)
+            segment = None
+        if segment is None:
+            path = os.path.join(self.directory, f"journal-{int(time.time() * 1000):015d}{OPEN_SUFFIX}")
+            while os.path.exists(path):
+                path = path[:-len(OPEN_SUFFIX)] + "0" + OPEN_SUFFIX
+            segment = self._segment = _Segment(path)
+        segment.write_block(entries)
+
+
+def _parse_time(value: str) -> float:
+    when = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return when.timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query the decision journal')
+    parser.add_argument('directory', type=str, help='Journal directory')
+    parser.add_argument('--start', type=str, help='ISO 8601 start time (inclusive, UTC if no offset)')
+    parser.add_argument('--end', type=str, help='ISO 8601 end time (exclusive)')
+    parser.add_argument('--drone', type=str, help='Only decisions for this drone id')
+    parser.add_argument('--rule', type=str, choices=RULE_IDS, help='Only decisions violating this rule')
+    parser.add_argument('--denied', action='store_true', help='Only denied operations')
+    parser.add_argument('--count', action='store_true', help='Print the number of matching records only')
+    parser.add_argument('--limit', type=int, default=50, help='Maximum records to print')
+    parser.add_argument('--benchmark', type=int, default=0,
+                        help='Append this many random decisions to the journal first and time appends and scans')
+
+    args = parser.parse_args()
+
+    if args.benchmark:
+        import random
+        from differential_check import generate_operation
+        from direct_faa_rules import FAADroneRulesEvaluator
+        rng = random.Random(0)
+        evaluator = FAADroneRulesEvaluator()
+        operations = [generate_operation(rng) for _ in range(min(args.benchmark, 10000))]
+        outcomes = [evaluator.evaluate_rules(operation) for operation in operations]
+        with DecisionJournal(args.directory) as journal:
+            start = time.perf_counter()
+            for i in range(args.benchmark):
+                journal.append(operations[i % len(operations)], outcomes[i % len(operations)], f"drone-{i % 500}")
+            appended = time.perf_counter() - start
+            journal.flush()
+            flushed = time.perf_counter() - start
+        print(f"Appended {args.benchmark} decisions: {appended / args.benchmark * 1e6:.2f} us per append, "
+              f"durable after {flushed * 1000:.1f} ms")
+        size = sum(os.path.getsize(os.path.join(args.directory, name)) for name in os.listdir(args.directory))
+        print(f"Journal size: {size} bytes ({size / args.benchmark:.1f} bytes per decision)")
+
+    filters = {
+        "start": _parse_time(args.start) if args.start else None,
+        "end": _parse_time(args.end) if args.end else None,
+        "drone_id": args.drone,
+        "rule_id": args.rule,
+        "approved": False if args.denied else None,
+    }
+    start = time.perf_counter()
+    if args.count or args.benchmark:
+        count = sum(1 for _ in scan_journal(args.directory, **filters))
+        print(f"{count} matching decisions (scanned in {(time.perf_counter() - start) * 1000:.1f} ms)")
+        return
+
+    for i, record in enumerate(scan_journal(args.directory, **filters)):
+        if i >= args.limit:
+            print("...")
+            break
+        when = datetime.fromtimestamp(record.timestamp, timezone.utc).isoformat()
+        status = "APPROVED" if record.approved else "DENIED " + ", ".join(record.violations)
+        print(f"{when} {record.drone_id or '-'} [{record.policy_hash}] {status}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,705 @@
+#!/usr/bin/env python3
+
+"""
+Exhaustive decision-table precomputation for FAADroneRules-style policies
+
+Every attribute the compiled policy references is discretized into the
+equivalence classes the policy can tell apart: booleans into true/false,
+numbers into the intervals between the thresholds they are compared
+against (0.55 lb, 87 kt, 400 ft, 3 mi, 2000 ft, 500 ft) and strings into
+the groups of values that satisfy the same string-equal/regexp tests.
+The decision for every combination of classes is precomputed into one
+dense byte array, so evaluating a request is one index computation plus
+one array lookup.
+
+Policies that share no attributes are tabulated separately with the
+interpreted FileBasedPDP and then combined into the full table with
+bytes.translate, which keeps building a table of millions of cells fast.
+"""
+
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+import random
+import hashlib
+import logging
+import argparse
+import itertools
+import operator
+from bisect import bisect_left, bisect_right
+from typing import Dict, Any, List, Tuple
+
+from policy_compiler import Apply, AttributeDesignator, AttributeValue, Policy, short_id
+from drone_attributes import OPERATION_ATTRIBUTES
+from xacml_functions import SIMPLE_CHARACTER_CLASS, regexp_match
+
+logger = logging.getLogger(__name__)
+
+DECISIONS = ("NotApplicable", "Permit", "Deny", "Indeterminate")
+DECISION_CODES = {decision: code for code, decision in enumerate(DECISIONS)}
+
+NUMERIC_FUNCTIONS = {
+    'double-less-than': lambda value, literal: value < literal,
+    'double-less-than-or-equal': lambda value, literal: value <= literal,
+    'double-greater-than': lambda value, literal: value > literal,
+    'double-greater-than-or-equal': lambda value, literal: value >= literal,
+    'integer-less-than': lambda value, literal: value < literal,
+    'integer-less-than-or-equal': lambda value, literal: value <= literal,
+    'integer-greater-than': lambda value, literal: value > literal,
+    'integer-greater-than-or-equal': lambda value, literal: value >= literal,
+}
+
+# Comparison functions the discretization understands, with the same
+# semantics as FileBasedPDP (request value on the left, literal on the right)
+PREDICATE_FUNCTIONS = dict(NUMERIC_FUNCTIONS, **{
+    'boolean-equal': lambda value, literal: literal == value,
+    'string-equal': lambda value, literal: literal == str(value),
+    'string-regexp-match': lambda value, literal: regexp_match(literal, str(value)),
+})
+
+LOGICAL_FUNCTIONS = ('and', 'or', 'not', 'n-of')
+
+# String value that stands for "anything not mentioned in the policy"
+OTHER_STRING = "\uffff"
+
+# Request strings the policy does not name whose class is remembered per
+# axis, bounding the memory arbitrary request values can take
+UNNAMED_VALUES_KEPT = 1024
+
+# Policy-level combining state, per policy combining algorithm:
+#   (code for each policy decision, combine(earlier, later), final decision per state)
+# State 0 always means "no applicable policy yet" and is the identity.
+# These mirror combining_algorithms.py, where a policy's Indeterminate
+# counts as Indeterminate{DP}.
+_PERMIT_OVERRIDES = (
+    lambda decision: {"Permit": 1, "Deny": 2, "Indeterminate": 3}.get(decision, 0),
+    lambda a, b: 1 if 1 in (a, b) else max(a, b),
+    ("NotApplicable", "Permit", "Deny", "Indeterminate"),
+)
+_DENY_OVERRIDES = (
+    lambda decision: {"Permit": 1, "Deny": 2, "Indeterminate": 3}.get(decision, 0),
+    lambda a, b: 2 if 2 in (a, b) else max(a, b),
+    ("NotApplicable", "Permit", "Deny", "Indeterminate"),
+)
+_FIRST_APPLICABLE = (
+    lambda decision: {"Permit": 1, "Deny": 2, "Indeterminate": 3}.get(decision, 0),
+    lambda a, b: a if a else b,
+    ("NotApplicable", "Permit", "Deny", "Indeterminate"),
+)
+_DENY_UNLESS_PERMIT = (
+    lambda decision: 1 if decision == "Permit" else 0,
+    max,
+    ("Deny", "Permit"),
+)
+_PERMIT_UNLESS_DENY = (
+    lambda decision: 1 if decision == "Deny" else 0,
+    max,
+    ("Permit", "Deny"),
+)
+# A policy whose Target matched is applicable even if it is NotApplicable (3)
+_ONLY_ONE_APPLICABLE = (
+    lambda decision: 0 if decision is None else {"Permit": 1, "Deny": 2, "NotApplicable": 3}.get(decision, 4),
+    lambda a, b: b if not a else (a if not b else 4),
+    ("NotApplicable", "Permit", "Deny", "NotApplicable", "Indeterminate"),
+)
+POLICY_COMBINERS = {
+    'ordered-permit-overrides': _PERMIT_OVERRIDES,
+    'permit-overrides': _PERMIT_OVERRIDES,
+    'ordered-deny-overrides': _DENY_OVERRIDES,
+    'deny-overrides': _DENY_OVERRIDES,
+    'first-applicable': _FIRST_APPLICABLE,
+    'deny-unless-permit': _DENY_UNLESS_PERMIT,
+    'permit-unless-deny': _PERMIT_UNLESS_DENY,
+    'only-one-applicable': _ONLY_ONE_APPLICABLE,
+}
+ORDER_INDEPENDENT_COMBINERS = tuple(name for name in POLICY_COMBINERS if name != 'first-applicable')
+
+# Binary table file: header, JSON metadata, then the raw table starting on
+# a page boundary so it can be memory-mapped and shared between processes
+TABLE_FILE_MAGIC = b"FAADTBL\0"
+TABLE_FILE_VERSION = 1
+TABLE_FILE_HEADER = struct.Struct("<8sHHIQQ")  # magic, version, reserved, metadata length, table offset, table length
+# Version of the evaluation semantics tables are built with, part of the
+# policy checksum: bump it when a change to FileBasedPDP or the combining
+# algorithms can change decisions, so tables built before are rebuilt
+TABLE_ENGINE_VERSION = 2
+
+
+class PolicyAnalysisError(Exception):
+    """Raised when a policy cannot be discretized into a decision table"""
+
+
+class AttributeAxis:
+    """
+    One attribute of the decision table and its equivalence classes
+
+    `classify(value)` maps a request value to its class index.
+    """
+
+    def __init__(self, category: str, attribute_id: str, data_type: str,
+                 predicates: List[Tuple[str, Any]]):
+        self.category = category
+        self.attribute_id = attribute_id
+        self.data_type = data_type
+        self.predicates = sorted(set(predicates), key=repr)
+        self.thresholds = []
+        self.fine_to_class = []
+        self.value_classes = {}
+        self.signature_classes = {}
+
+        if data_type == 'boolean':
+            self.representatives = [False, True]
+        elif data_type in ('double', 'integer'):
+            self._discretize_numeric()
+        else:
+            self._discretize_string()
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return (self.category, self.attribute_id)
+
+    @property
+    def class_count(self) -> int:
+        return len(self.representatives)
+
+    def signature(self, value) -> Tuple[bool, ...]:
+        """Outcome of every policy predicate on this attribute for a value"""
+        return tuple(PREDICATE_FUNCTIONS[function](value, literal) for function, literal in self.predicates)
+
+    def _discretize_numeric(self):
+        # Fine intervals: below the first threshold, each threshold itself
+        # and the gaps between and above them
+        self.thresholds = sorted({literal for _, literal in self.predicates})
+        fine_values = []
+        previous = None
+        for threshold in self.thresholds:
+            fine_values.append(threshold - 1.0 if previous is None else (previous + threshold) / 2)
+            fine_values.append(threshold)
+            previous = threshold
+        fine_values.append(previous + 1.0 if previous is not None else 0.0)
+
+        # Merge fine intervals no predicate can tell apart
+        self.representatives = []
+        for value in fine_values:
+            signature = self.signature(value)
+            if signature not in self.signature_classes:
+                self.signature_classes[signature] = len(self.representatives)
+                self.representatives.append(value)
+            self.fine_to_class.append(self.signature_classes[signature])
+
+    def _discretize_string(self):
+        candidates = []
+        for function, literal in self.predicates:
+            match = SIMPLE_CHARACTER_CLASS.match(literal) if function == 'string-regexp-match' else None
+            if match:
+                candidates.extend(match.group(1))
+            elif function == 'string-equal':
+                candidates.append(literal)
+        candidates.append(OTHER_STRING)
+
+        self.representatives = []
+        for value in candidates:
+            signature = self.signature(value)
+            if signature not in self.signature_classes:
+                self.signature_classes[signature] = len(self.representatives)
+                self.representatives.append(value)
+            self.value_classes.setdefault(value, self.signature_classes[signature])
+
+    def classify(self, value) -> int:
+        """Class index of a request value; ValueError if the table has no class for it"""
+        if self.data_type == 'boolean':
+            if value is True or value is False:
+                return 1 if value else 0
+            raise ValueError(f"No decision-table class for {self.attribute_id}={value!r}")
+
+        if self.data_type in ('double', 'integer'):
+            thresholds = self.thresholds
+            i = bisect_left(thresholds, value)
+            if i < len(thresholds) and thresholds[i] == value:
+                return self.fine_to_class[2 * i + 1]
+            return self.fine_to_class[2 * i]
+
+        if type(value) in (list, tuple):
+            raise ValueError(f"No decision-table class for a bag of {self.attribute_id} values")
+        value = str(value)
+        cls = self.value_classes.get(value)
+        if cls is None:
+            # Values the policy never names explicitly can still match a regex
+            cls = self.signature_classes.get(self.signature(value))
+            if cls is None:
+                raise ValueError(f"No decision-table class for {self.attribute_id}={value!r}")
+        return cls
+
+
+class _ValueOffsets(dict):
+    """
+    Value -> class index times stride for the values of a string or
+    boolean axis known at build time; other values are classified by the
+    axis (a regex may still match them), raising ValueError if none fits,
+    and remembered up to `limit` of them
+    """
+    __slots__ = ("classify", "stride", "limit")
+
+    def __init__(self, offsets: Dict[Any, int], classify, stride: int, limit: int):
+        super().__init__(offsets)
+        self.classify = classify
+        self.stride = stride
+        self.limit = len(offsets) + limit
+
+    def __missing__(self, value):
+        offset = self.classify(value) * self.stride
+        if type(value) is str and len(self) < self.limit:
+            self[value] = offset
+        return offset
+
+
+def _index_function(axes: List[AttributeAxis], strides: List[int], values: List[str],
+                    namespace: Dict[str, Any], result: str = "{}"):
+    """
+    A function computing the cell index (wrapped in `result`) as one
+    expression, with no Python call per axis
+
+    `values[i]` is the expression for axis i's request value in terms of
+    the function's argument `r`, over names bound in `namespace`. A numeric
+    value's fine interval is bisect_left + bisect_right over the
+    thresholds (below t0, t0, between t0 and t1, t1, ...); string and
+    boolean values are looked up in a _ValueOffsets.
+    """
+    namespace = dict(namespace, bisect_left=bisect_left, bisect_right=bisect_right)
+    terms = []
+    for i, (axis, stride, value) in enumerate(zip(axes, strides, values)):
+        if axis.data_type in ('double', 'integer'):
+            namespace[f"t{i}"] = axis.thresholds
+            namespace[f"f{i}"] = [cls * stride for cls in axis.fine_to_class]
+            terms.append(f"f{i}[bisect_left(t{i}, (x{i} := {value})) + bisect_right(t{i}, x{i})]")
+        else:
+            if axis.data_type == 'boolean':
+                offsets = {False: 0, True: stride}
+            else:
+                offsets = {value: cls * stride for value, cls in axis.value_classes.items()}
+            namespace[f"v{i}"] = _ValueOffsets(offsets, axis.classify, stride, UNNAMED_VALUES_KEPT)
+            terms.append(f"v{i}[{value}]")
+    return eval("lambda r: " + result.format(" + ".join(terms) or "0"), namespace)
+
+
+def _collect_predicates(expression, predicates: Dict[Tuple[str, str], List], where: str):
+    """Collect (function, literal) predicates per attribute from a condition"""
+    if isinstance(expression, Apply):
+        function = short_id(expression.function_id)
+        if function in LOGICAL_FUNCTIONS:
+            for argument in expression.arguments:
+                # The only literal of a logical function is the count of n-of
+                if not isinstance(argument, AttributeValue):
+                    _collect_predicates(argument, predicates, where)
+            return
+
+        designators = [a for a in expression.arguments if isinstance(a, AttributeDesignator)]
+        values = [a for a in expression.arguments if isinstance(a, AttributeValue)]
+        if function not in PREDICATE_FUNCTIONS or len(designators) != 1 or len(values) != 1 \
+                or len(expression.arguments) != 2:
+            raise PolicyAnalysisError(f"{where}: cannot discretize function {function}")
+        predicates.setdefault(designators[0].key, []).append((function, values[0].value, designators[0]))
+        return
+
+    raise PolicyAnalysisError(f"{where}: condition must be an Apply expression")
+
+
+def _collect_target_predicates(target: tuple, predicates: Dict[Tuple[str, str], List], where: str):
+    for any_of in target:
+        for all_of in any_of:
+            for match in all_of:
+                function = short_id(match.function_id)
+                if function not in ('string-equal', 'boolean-equal', 'string-regexp-match'):
+                    raise PolicyAnalysisError(f"{where}: cannot discretize match function {function}")
+                predicates.setdefault(match.designator.key, []).append(
+                    (function, match.value.value, match.designator))
+
+
+def policy_predicates(policy: Policy) -> Dict[Tuple[str, str], List]:
+    """All attribute predicates of a policy, keyed by (category, attribute id)"""
+    predicates = {}
+    _collect_target_predicates(policy.target, predicates, policy.policy_id)
+    for rule in policy.rules:
+        where = f"{policy.policy_id}/{rule.rule_id}"
+        _collect_target_predicates(rule.target, predicates, where)
+        if rule.condition is not None:
+            _collect_predicates(rule.condition, predicates, where)
+    return predicates
+
+
+def discretize_policies(policies) -> Tuple[List[Dict[Tuple[str, str], List]], Dict[Tuple[str, str], AttributeAxis]]:
+    """
+    Predicates of every policy, and one AttributeAxis per referenced
+    attribute with the classes all policies together can tell apart
+    """
+    predicates_per_policy = [policy_predicates(policy) for policy in policies]
+    all_predicates = {}
+    for predicates in predicates_per_policy:
+        for key, entries in predicates.items():
+            all_predicates.setdefault(key, []).extend(entries)
+    axes_by_key = {}
+    for key, entries in all_predicates.items():
+        data_type = entries[0][2].data_type
+        axes_by_key[key] = AttributeAxis(key[0], key[1], data_type,
+                                         [(function, literal) for function, literal, _ in entries])
+    return predicates_per_policy, axes_by_key
+
+
+def _group_policies(policy_keys: List[set], order_independent: bool) -> List[List[int]]:
+    """
+    Partition policies into groups that share no attributes
+
+    For order-dependent combining algorithms a group must also be a
+    contiguous run of policies, so the groups can be combined in order.
+    """
+    groups = []  # (policy indices, attribute keys)
+    for index, keys in enumerate(policy_keys):
+        overlapping = [i for i, (_, group_keys) in enumerate(groups) if group_keys & keys]
+        if not overlapping:
+            groups.append(([index], set(keys)))
+            continue
+
+        merge = overlapping if order_independent else list(range(overlapping[0], len(groups)))
+        indices, merged_keys = [index], set(keys)
+        for i in merge:
+            indices.extend(groups[i][0])
+            merged_keys |= groups[i][1]
+        for i in reversed(merge):
+            del groups[i]
+        groups.insert(merge[0], (sorted(indices), merged_keys))
+
+    return [indices for indices, _ in groups]
+
+
+class DecisionTable:
+    """
+    Dense precomputed decision table
+
+    `table[index]` is a code into DECISIONS; `index(attributes)` computes
+    the mixed-radix cell index from the class of every axis.
+    """
+
+    def __init__(self, axes: List[AttributeAxis], table, build_seconds: float = 0.0):
+        self.axes = axes
+        self.table = table
+        self.build_seconds = build_seconds
+        self.mapping = None  # mmap backing the table when loaded from a file
+
+        self.strides = []
+        stride = 1
+        for axis in reversed(axes):
+            self.strides.append(stride)
+            stride *= axis.class_count
+        self.strides.reverse()
+        if stride != len(table):
+            raise ValueError(f"Table has {len(table)} cells, axes describe {stride}")
+
+        # Request value expressions: attributes[category][attribute_id],
+        # with the keys bound as names
+        keys = {}
+        for i, axis in enumerate(axes):
+            keys[f"c{i}"], keys[f"k{i}"] = axis.key
+        attribute_values = [f"r[c{i}][k{i}]" for i in range(len(axes))]
+        self._index = _index_function(axes, self.strides, attribute_values, keys)
+        self._decide = _index_function(axes, self.strides, attribute_values,
+                                       dict(keys, DECISIONS=DECISIONS, table=table), "DECISIONS[table[{}]]")
+
+        # DroneOperation field for every axis, for decide_operation()
+        fields_by_key = {(category, attr_id): field_name
+                         for field_name, category, attr_id, _ in OPERATION_ATTRIBUTES}
+        if all(axis.key in fields_by_key for axis in axes):
+            getters = {f"g{i}": operator.attrgetter(fields_by_key[axis.key]) for i, axis in enumerate(axes)}
+            self._decide_operation = _index_function(axes, self.strides, [f"g{i}(r)" for i in range(len(axes))],
+                                                     dict(getters, DECISIONS=DECISIONS, table=table),
+                                                     "DECISIONS[table[{}]]")
+        else:
+            self._decide_operation = None
+
+    def index(self, attributes: Dict[str, Dict[str, Any]]) -> int:
+        """
+        Cell index for a {category: {attribute_id: value}} request
+
+        Raises KeyError if the request lacks an attribute the policy
+        references, ValueError for a value outside the table's classes and
+        TypeError for a numeric attribute given as a bag.
+        """
+        return self._index(attributes)
+
+    def decide(self, attributes: Dict[str, Dict[str, Any]]) -> str:
+        """Decision for a {category: {attribute_id: value}} request"""
+        return self._decide(attributes)
+
+    def decide_operation(self, operation) -> str:
+        """Decision for a DroneOperation, without building the attributes dict"""
+        if self._decide_operation is None:
+            raise ValueError("Policy references attributes that DroneOperation does not have")
+        return self._decide_operation(operation)
+
+    def stats(self) -> Dict[str, Any]:
+        """Size and build-time figures"""
+        return {
+            "axes": len(self.axes),
+            "cells": len(self.table),
+            "table_bytes": len(self.table),
+            "build_seconds": self.build_seconds,
+            "classes": {axis.attribute_id: axis.class_count for axis in self.axes},
+        }
+
+
+def build_decision_table(policy_set, pdp) -> DecisionTable:
+    """
+    Precompute the decision table of a compiled policy set
+
+    `pdp` is the interpreted FileBasedPDP for the same policy file; each
+    independent group of policies is tabulated by evaluating it on one
+    representative value per attribute class.
+    """
+    start = time.perf_counter()
+
+    combining_alg = short_id(policy_set.policy_combining_alg)
+    if combining_alg not in POLICY_COMBINERS:
+        raise PolicyAnalysisError(f"No decision-table combiner for {combining_alg}")
+    if policy_set.target:
+        raise PolicyAnalysisError("PolicySet targets are not supported")
+    if not all(isinstance(policy, Policy) for policy in policy_set.policies):
+        raise PolicyAnalysisError("Nested PolicySets are not supported")
+    policy_state, combine, final_decisions = POLICY_COMBINERS[combining_alg]
+
+    predicates_per_policy, axes_by_key = discretize_policies(policy_set.policies)
+    groups = _group_policies([set(p) for p in predicates_per_policy],
+                             combining_alg in ORDER_INDEPENDENT_COMBINERS)
+
+    # The interpreted path logs every policy and rule it evaluates
+    pdp_logger = logging.getLogger(type(pdp).__module__)
+    previous_level = pdp_logger.level
+    pdp_logger.setLevel(logging.ERROR)
+
+    axes = []
+    group_tables = []
+    try:
+        for group in groups:
+            group_keys = []
+            for policy_index in group:
+                for key in predicates_per_policy[policy_index]:
+                    if key not in group_keys:
+                        group_keys.append(key)
+            group_axes = [axes_by_key[key] for key in group_keys]
+            axes.extend(group_axes)
+
+            codes = bytearray()
+            for classes in itertools.product(*[range(axis.class_count) for axis in group_axes]):
+                attributes = {}
+                for axis, cls in zip(group_axes, classes):
+                    attributes.setdefault(axis.category, {})[axis.attribute_id] = axis.representatives[cls]
+                state = 0
+                for policy_index in group:
+                    state = combine(state, policy_state(pdp.evaluate_policy(policy_set.policies[policy_index],
+                                                                            attributes)))
+                codes.append(state)
+            group_tables.append(bytes(codes))
+    finally:
+        pdp_logger.setLevel(previous_level)
+
+    # Cross product of the group tables, last group varying fastest:
+    # new[i * len(table) + j] = combine(group[i], table[j])
+    state_count = len(final_decisions)
+    translations = [bytes(combine(a, b) if b < state_count else 0 for b in range(256))
+                    for a in range(state_count)]
+    table = group_tables[-1] if group_tables else bytes([0])
+    for codes in reversed(group_tables[:-1]):
+        table = b''.join(table.translate(translations[a]) for a in codes)
+
+    final = bytes(DECISION_CODES[final_decisions[b]] if b < state_count else 0 for b in range(256))
+    table = table.translate(final)
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Built decision table: {len(table)} cells over {len(axes)} attributes in {elapsed:.3f}s")
+    return DecisionTable(axes, table, elapsed)
+
+
+def policy_checksum(policy_file: str, root_policy_id: str = None) -> str:
+    """
+    SHA-256 of a policy file, or of the *.xml files of a policy directory
+    and their paths, with TABLE_ENGINE_VERSION and the root policy id;
+    used to detect stale table files
+    """
+    digest = hashlib.sha256(f"{TABLE_ENGINE_VERSION}\0{root_policy_id or ''}\0".encode('utf-8'))
+    if not os.path.isdir(policy_file):
+        with open(policy_file, 'rb') as f:
+            digest.update(f.read())
+        return digest.hexdigest()
+    for directory, subdirectories, files in os.walk(policy_file):
+        # The order PolicyDirectory reads them in
+        subdirectories.sort()
+        for name in sorted(files):
+            if name.endswith(".xml"):
+                path = os.path.join(directory, name)
+                with open(path, 'rb') as f:
+                    content = f.read()
+                digest.update(f"{os.path.relpath(path, policy_file)}\0{len(content)}\0".encode('utf-8'))
+                digest.update(content)
+    return digest.hexdigest()
+
+
+def save_decision_table(decision_table: DecisionTable, path: str, policy_sha256: str = None):
+    """
+    Serialize a decision table to a binary file
+
+    The axes are stored as their predicates (they are rebuilt from them on
+    load), the table as raw bytes. The file is written to a temporary name
+    and renamed, so concurrent readers never see a partial file.
+    """
+    metadata = json.dumps({
+        "policy_sha256": policy_sha256,
+        "build_seconds": decision_table.build_seconds,
+        "axes": [
+            {
+                "category": axis.category,
+                "attribute_id": axis.attribute_id,
+                "data_type": axis.data_type,
+                "predicates": [[function, literal] for function, literal in axis.predicates],
+            }
+            for axis in decision_table.axes
+        ],
+    }).encode('utf-8')
+
+    table_offset = TABLE_FILE_HEADER.size + len(metadata)
+    table_offset += -table_offset % mmap.PAGESIZE
+    header = TABLE_FILE_HEADER.pack(TABLE_FILE_MAGIC, TABLE_FILE_VERSION, 0, len(metadata),
+                                    table_offset, len(decision_table.table))
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(header)
+        f.write(metadata)
+        f.write(b"\0" * (table_offset - len(header) - len(metadata)))
+        f.write(decision_table.table)
+    os.replace(temp_path, path)
+    logger.info(f"Saved decision table to {path}")
+
+
+def load_decision_table(path: str, policy_sha256: str = None) -> DecisionTable:
+    """
+    Memory-map a decision table file read-only
+
+    Every process that loads the same file shares one physical copy of
+    the table through the page cache. If `policy_sha256` is given and does
+    not match the checksum recorded in the file, ValueError is raised.
+    """
+    with open(path, 'rb') as f:
+        # ValueError for an empty file
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        if len(mapped) < TABLE_FILE_HEADER.size:
+            raise ValueError(f"{path} is truncated")
+        magic, version, _, metadata_length, table_offset, table_length = \
+            TABLE_FILE_HEADER.unpack_from(mapped, 0)
+        if magic != TABLE_FILE_MAGIC:
+            raise ValueError(f"{path} is not a decision table file")
+        if version != TABLE_FILE_VERSION:
+            raise ValueError(f"Unsupported decision table file version {version}")
+        if table_offset + table_length > len(mapped) or TABLE_FILE_HEADER.size + metadata_length > table_offset:
+            raise ValueError(f"{path} is truncated")
+
+        metadata = json.loads(mapped[TABLE_FILE_HEADER.size:TABLE_FILE_HEADER.size + metadata_length])
+        if policy_sha256 is not None and metadata.get("policy_sha256") != policy_sha256:
+            raise ValueError(f"{path} was built from a different policy")
+
+        axes = [AttributeAxis(axis["category"], axis["attribute_id"], axis["data_type"],
+                              [tuple(predicate) for predicate in axis["predicates"]])
+                for axis in metadata["axes"]]
+        table = memoryview(mapped)[table_offset:table_offset + table_length]
+        decision_table = DecisionTable(axes, table, metadata["build_seconds"])
+    except (KeyError, TypeError, AttributeError) as e:
+        mapped.close()
+        raise ValueError(f"{path} has invalid metadata: {e}")
+    except ValueError:
+        mapped.close()
+        raise
+    # Keep the mapping alive as long as the table is in use
+    decision_table.mapping = mapped
+    return decision_table
+
+
+def verify_decision_table(decision_table: DecisionTable, pdp, operations) -> List[Tuple[Any, str, str]]:
+    """
+    Compare the table with the interpreted path on a set of operations
+
+    `pdp` must be a FileBasedPDP without a decision table. Returns the (operation, table decision, interpreted decision) mismatches.
+    """
+    from drone_attributes import operation_to_attributes
+
+    pdp_logger = logging.getLogger(type(pdp).__module__)
+    previous_level = pdp_logger.level
+    pdp_logger.setLevel(logging.ERROR)
+    mismatches = []
+    try:
+        for operation in operations:
+            attributes = operation_to_attributes(operation)
+            table_decision = decision_table.decide(attributes)
+            interpreted_decision = pdp.evaluate_attributes(attributes)
+            if table_decision != interpreted_decision:
+                mismatches.append((operation, table_decision, interpreted_decision))
+    finally:
+        pdp_logger.setLevel(previous_level)
+    return mismatches
+
+
+def main():
+    from file_based_pdp import FileBasedPDP
+    from differential_check import generate_operation
+    from drone_attributes import operation_to_attributes
+
+    parser = argparse.ArgumentParser(description='Build the FAA policy decision table and check it')
+    parser.add_argument('--policy-file', type=str,
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "../policies/FAADroneRules.xml"),
+                        help='Path to the XACML policy file')
+    parser.add_argument('--verify', type=int, default=100000,
+                        help='Number of random operations to check against the interpreted path')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--output', type=str, help='Save the table to this file for memory-mapped loading')
+
+    args = parser.parse_args()
+
+    logging.getLogger("file_based_pdp").setLevel(logging.ERROR)
+    pdp = FileBasedPDP(args.policy_file)
+    decision_table = build_decision_table(pdp.policy_set, pdp)
+    if args.output:
+        save_decision_table(decision_table, args.output, policy_checksum(args.policy_file))
+
+    stats = decision_table.stats()
+    print(f"Cells: {stats['cells']} ({stats['table_bytes'] / 1024 / 1024:.1f} MiB)")
+    print(f"Build time: {stats['build_seconds']:.3f}s")
+    for attribute_id, count in stats["classes"].items():
+        print(f"  {attribute_id}: {count} classes")
+
+    rng = random.Random(args.seed)
+    operations = [generate_operation(rng) for _ in range(args.verify)]
+    mismatches = verify_decision_table(decision_table, pdp, operations)
+    print(f"\nVerified {len(operations)} operations against the interpreted path: {len(mismatches)} mismatches")
+    for operation, table_decision, interpreted_decision in mismatches[:10]:
+        print(f"- table={table_decision} interpreted={interpreted_decision}: {operation}")
+
+    # Per-decision cost of both paths
+    sample = operations[:10000]
+    attributes_list = [operation_to_attributes(operation) for operation in sample]
+    start = time.perf_counter()
+    for attributes in attributes_list:
+        decision_table.decide(attributes)
+    table_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for attributes in attributes_list:
+        pdp.evaluate_attributes(attributes)
+    interpreted_seconds = time.perf_counter() - start
+    print(f"\nTable lookup: {table_seconds / len(sample) * 1e6:.2f} us/decision")
+    print(f"Interpreted:  {interpreted_seconds / len(sample) * 1e6:.2f} us/decision")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
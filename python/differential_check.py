@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+
+"""
+Differential equivalence checker between the direct FAA rules evaluator
+(direct_faa_rules.py) and the XACML policy engine (file_based_pdp.py)
+
+Generates large numbers of drone operations, biased towards the values
+right at and around every regulatory threshold, evaluates each one with
+both engines in a pool of worker processes and reports the disagreements
+as minimized counterexamples.
+"""
+
+import os
+import sys
+import math
+import time
+import random
+import logging
+import argparse
+from dataclasses import replace, fields
+from multiprocessing import Pool
+from typing import Dict, Any, List, Optional, Tuple
+
+from direct_faa_rules import FAADroneRulesEvaluator
+from drone_attributes import operation_to_attributes
+from drone_operation import DroneOperation
+from file_based_pdp import FileBasedPDP
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLICY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../policies/FAADroneRules.xml")
+
+DRONE_CATEGORIES = ["Category1", "Category2", "Category3", "Category4"]
+TIMES_OF_DAY = ["day", "night", "civil_twilight"]
+AIRSPACE_CLASSES = ["B", "C", "D", "E", "G"]
+
+# Numeric fields with the thresholds the rules compare them against and the
+# range random (non-boundary) values are drawn from
+NUMERIC_FIELDS = {
+    "drone_weight": ([0.55], (0.0, 60.0)),
+    "operating_altitude": ([400.0], (0.0, 1000.0)),
+    "operating_speed": ([87.0], (0.0, 150.0)),
+    "operating_altitude_above_structure": ([400.0], (0.0, 1000.0)),
+    "flight_visibility": ([3.0], (0.0, 10.0)),
+    "distance_from_clouds_horizontal": ([2000.0], (0.0, 5000.0)),
+    "distance_from_clouds_vertical": ([500.0], (0.0, 2000.0)),
+}
+
+# Fully compliant operation that counterexamples are shrunk towards
+BASELINE_OPERATION = DroneOperation(
+    drone_category="Category2",
+    drone_weight=1.5,
+    has_anti_collision_lighting=True,
+    has_remote_id=True,
+    time_of_day="day",
+    operating_over_people=False,
+    operating_altitude=200.0,
+    operating_speed=35.0,
+    airspace_class="G",
+    flight_visibility=5.0,
+    distance_from_clouds_horizontal=2500.0,
+    distance_from_clouds_vertical=600.0,
+    complies_with_kinetic_energy_limit=True,
+    pilot_has_night_training=True,
+    remote_pilot_certificate=True
+)
+
+BOOLEAN_FIELDS = [f.name for f in fields(DroneOperation) if f.type in (bool, "bool")]
+
+# Probability that a numeric field is drawn from its boundary values
+BOUNDARY_PROBABILITY = 0.5
+
+
+def boundary_values(threshold: float) -> List[float]:
+    """Values at and immediately around a threshold"""
+    return [
+        threshold,
+        math.nextafter(threshold, -math.inf),
+        math.nextafter(threshold, math.inf),
+        threshold - 1.0,
+        threshold + 1.0,
+        threshold - 0.01,
+        threshold + 0.01,
+    ]
+
+
+BOUNDARY_VALUES = {name: [v for t in thresholds for v in boundary_values(t) if v >= 0.0]
+                   for name, (thresholds, _) in NUMERIC_FIELDS.items()}
+
+
+def generate_operation(rng: random.Random) -> DroneOperation:
+    """Generate one random operation, biased towards threshold boundaries"""
+    values = {
+        "drone_category": rng.choice(DRONE_CATEGORIES),
+        "time_of_day": rng.choice(TIMES_OF_DAY),
+        "airspace_class": rng.choice(AIRSPACE_CLASSES),
+    }
+    for name in BOOLEAN_FIELDS:
+        values[name] = rng.random() < 0.5
+    for name, (_, (low, high)) in NUMERIC_FIELDS.items():
+        if rng.random() < BOUNDARY_PROBABILITY:
+            values[name] = rng.choice(BOUNDARY_VALUES[name])
+        else:
+            values[name] = round(rng.uniform(low, high), 2)
+    return DroneOperation(**values)
+
+
+class DifferentialChecker:
+    """Evaluates operations with both engines and shrinks disagreements"""
+
+    def __init__(self, policy_file: str):
+        self.direct = FAADroneRulesEvaluator()
+        self.pdp = FileBasedPDP(policy_file)
+
+    def decisions(self, operation: DroneOperation) -> Tuple[str, str]:
+        """Return (direct decision, PDP decision) for an operation"""
+        direct_decision = self.direct.evaluate_operation(operation)["raw_decision"]["decision"]
+        pdp_decision = self.pdp.evaluate_attributes(operation_to_attributes(operation))
+        return direct_decision, pdp_decision
+
+    def minimize(self, operation: DroneOperation) -> DroneOperation:
+        """
+        Shrink a counterexample towards BASELINE_OPERATION
+
+        Greedily resets each field to its baseline value and keeps the
+        reset whenever the engines still disagree, so the fields left
+        different from the baseline are the ones needed to trigger it.
+        """
+        current = operation
+        for f in fields(DroneOperation):
+            baseline_value = getattr(BASELINE_OPERATION, f.name)
+            if getattr(current, f.name) == baseline_value:
+                continue
+            candidate = replace(current, **{f.name: baseline_value})
+            direct_decision, pdp_decision = self.decisions(candidate)
+            if direct_decision != pdp_decision:
+                current = candidate
+        return current
+
+
+def describe_value(name: str, value: Any) -> str:
+    """
+    Describe a field value by the threshold interval it falls in
+
+    Numeric values are only meaningful relative to the thresholds, so
+    400.01 and 401.0 are both reported as "> 400.0".
+    """
+    if name not in NUMERIC_FIELDS:
+        return f"= {value!r}"
+    thresholds = NUMERIC_FIELDS[name][0]
+    for threshold in thresholds:
+        if value == threshold:
+            return f"== {threshold}"
+    below = [t for t in thresholds if value < t]
+    above = [t for t in thresholds if value > t]
+    if above and below:
+        return f"in ({max(above)}, {min(below)})"
+    if above:
+        return f"> {max(above)}"
+    return f"< {min(below)}"
+
+
+def counterexample_signature(operation: DroneOperation) -> Tuple[Tuple[str, str], ...]:
+    """Fields (and value intervals) in which an operation differs from the baseline"""
+    return tuple((f.name, describe_value(f.name, getattr(operation, f.name))) for f in fields(DroneOperation)
+                 if getattr(operation, f.name) != getattr(BASELINE_OPERATION, f.name))
+
+
+# Per-process checker, created once by the pool initializer
+_checker: Optional[DifferentialChecker] = None
+
+
+def _init_worker(policy_file: str):
+    """Pool initializer: load the policy once per worker process"""
+    global _checker
+    logging.getLogger("file_based_pdp").setLevel(logging.ERROR)
+    _checker = DifferentialChecker(policy_file)
+
+
+def _check_chunk(task: Tuple[int, int, int, int]) -> Dict[str, Any]:
+    """Generate and check one chunk of operations"""
+    seed, chunk_index, chunk_size, max_minimized = task
+    rng = random.Random(f"{seed}:{chunk_index}")
+    disagreements = 0
+    minimized_count = 0
+    counterexamples = {}
+
+    for _ in range(chunk_size):
+        operation = generate_operation(rng)
+        direct_decision, pdp_decision = _checker.decisions(operation)
+        if direct_decision == pdp_decision:
+            continue
+
+        disagreements += 1
+
+        # Minimizing costs one evaluation per field, so only the first
+        # disagreements of a chunk are shrunk; the rest are just counted
+        if minimized_count >= max_minimized:
+            continue
+        minimized_count += 1
+
+        minimized = _checker.minimize(operation)
+        signature = counterexample_signature(minimized)
+        if signature in counterexamples:
+            counterexamples[signature]["count"] += 1
+        else:
+            direct_decision, pdp_decision = _checker.decisions(minimized)
+            counterexamples[signature] = {
+                "count": 1,
+                "direct": direct_decision,
+                "pdp": pdp_decision,
+                "example": minimized,
+            }
+
+    return {
+        "checked": chunk_size,
+        "disagreements": disagreements,
+        "counterexamples": counterexamples,
+    }
+
+
+def run_differential_check(policy_file: str, total: int, workers: int = None,
+                           chunk_size: int = 10000, seed: int = 0,
+                           max_minimized: int = 100) -> Dict[str, Any]:
+    """
+    Check `total` generated operations across `workers` processes
+
+    Returns a summary dict with the number of operations checked, the
+    number of disagreements and the unique minimized counterexamples
+    keyed by their signature (fields that differ from the baseline).
+    At most `max_minimized` disagreements are minimized per chunk.
+    """
+    workers = workers or os.cpu_count() or 1
+    tasks = []
+    remaining = total
+    chunk_index = 0
+    while remaining > 0:
+        size = min(chunk_size, remaining)
+        tasks.append((seed, chunk_index, size, max_minimized))
+        remaining -= size
+        chunk_index += 1
+
+    summary = {"checked": 0, "disagreements": 0, "counterexamples": {}}
+    start = time.perf_counter()
+
+    with Pool(processes=workers, initializer=_init_worker, initargs=(policy_file,)) as pool:
+        for result in pool.imap_unordered(_check_chunk, tasks):
+            summary["checked"] += result["checked"]
+            summary["disagreements"] += result["disagreements"]
+            for signature, example in result["counterexamples"].items():
+                if signature in summary["counterexamples"]:
+                    summary["counterexamples"][signature]["count"] += example["count"]
+                else:
+                    summary["counterexamples"][signature] = example
+
+    summary["elapsed"] = time.perf_counter() - start
+    return summary
+
+
+def print_report(summary: Dict[str, Any], limit: int = 20):
+    """Print a human-readable differential report"""
+    print(f"Checked {summary['checked']} operations in {summary['elapsed']:.1f}s "
+          f"({summary['checked'] / max(summary['elapsed'], 1e-9):.0f} ops/s)")
+    print(f"Disagreements: {summary['disagreements']}")
+
+    if not summary["counterexamples"]:
+        print("Both engines agree on every generated operation")
+        return
+
+    examples = sorted(summary["counterexamples"].items(), key=lambda item: -item[1]["count"])
+    print(f"\nUnique minimized counterexamples: {len(examples)} (showing {min(limit, len(examples))})")
+    for signature, example in examples[:limit]:
+        print(f"\n- direct={example['direct']} pdp={example['pdp']} (seen {example['count']} times)")
+        if not signature:
+            print("    baseline operation")
+        for name, description in signature:
+            if name in NUMERIC_FIELDS:
+                description += f"  (e.g. {getattr(example['example'], name)!r})"
+            print(f"    {name} {description}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Differential check of the direct evaluator against the XACML PDP')
+    parser.add_argument('--policy-file', type=str, default=DEFAULT_POLICY_FILE, help='Path to the XACML policy file')
+    parser.add_argument('--count', type=int, default=1000000, help='Number of operations to generate')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='Operations per worker task')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--max-minimized', type=int, default=100, help='Disagreements minimized per chunk')
+    parser.add_argument('--limit', type=int, default=20, help='Maximum counterexamples to print')
+
+    args = parser.parse_args()
+
+    summary = run_differential_check(args.policy_file, args.count, args.workers, args.chunk_size,
+                                     args.seed, args.max_minimized)
+    print_report(summary, args.limit)
+
+    # Non-zero exit status when the engines disagree, for CI use
+    sys.exit(1 if summary["disagreements"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,105 @@
+from array import array
+from collections import namedtuple
+from operator import or_
 from dataclasses import dataclass
-from typing import Dict, Any, List, Optional
-
-@dataclass
-class DroneOperation:
-    """Represents a drone operation with all relevant attributes"""
-    # Drone characteristics
-    drone_category: str  # 'Category1', 'Category2', 'Category3', 'Category4'
-    drone_weight: float  # in pounds
-    has_anti_collision_lighting: bool
-    has_remote_id: bool
-    
-    # Operation details
-    time_of_day: str  # 'day', 'night', 'civil_twilight'
-    operating_over_people: bool
-    operating_altitude: float  # in feet
-    operating_speed: float  # in knots
-    
-    # Environment details
-    airspace_class: str  # 'B', 'C', 'D', 'E', 'G'
-    flight_visibility: float  # in statute miles
-    distance_from_clouds_horizontal: float  # in feet
-    distance_from_clouds_vertical: float  # in feet
-    
-    # Optional parameters (with default values)
-    has_airworthiness_certificate: bool = False
-    complies_with_kinetic_energy_limit: bool = False
-    has_exposed_rotating_parts: bool = False
-    is_within_400ft_of_structure: bool = False
-    operating_altitude_above_structure: float = 0.0  # in feet
-    is_airport_surface_area: bool = False
-    is_restricted_access_area: bool = False
-    people_are_participants: bool = False
-    people_under_cover: bool = False
-    pilot_has_night_training: bool = False
-    has_atc_authorization: bool = False
-    remote_pilot_certificate: bool = False
+from typing import Dict, Any, List, Optional, Tuple, Callable
+
+from drone_operation import BOOL_FIELDS, DroneOperation, OperationBatch
+
+@dataclass(frozen=True)
+class DirectRule:
+    """One FAA rule check and the DroneOperation fields it reads"""
+    rule_id: str
+    fields: Tuple[str, ...]
+    check: Callable[[DroneOperation], Optional[str]]  # violation message, or None if the rule is satisfied
+
+
+def _over_people_exempt(operation: DroneOperation) -> bool:
+    return any([
+        operation.people_are_participants,
+        operation.people_under_cover,
+        operation.drone_weight < 0.55,
+        (operation.drone_category == "Category2" and operation.complies_with_kinetic_energy_limit),
+        (operation.drone_category == "Category3" and operation.is_restricted_access_area),
+        (operation.drone_category == "Category4" and operation.has_airworthiness_certificate)
+    ])
+
+
+# Every rule, in the order its violation is reported
+DIRECT_RULES: List[DirectRule] = [
+    # Night operation rules
+    DirectRule("night-pilot-training", ("time_of_day", "pilot_has_night_training"),
+               lambda op: "Night operation requires pilot night training"
+               if op.time_of_day == "night" and not op.pilot_has_night_training else None),
+    DirectRule("night-lighting", ("time_of_day", "has_anti_collision_lighting"),
+               lambda op: "Night operation requires anti-collision lighting"
+               if op.time_of_day == "night" and not op.has_anti_collision_lighting else None),
+
+    # Civil twilight operation rules
+    DirectRule("civil-twilight-lighting", ("time_of_day", "has_anti_collision_lighting"),
+               lambda op: "Civil twilight operation requires anti-collision lighting"
+               if op.time_of_day == "civil_twilight" and not op.has_anti_collision_lighting else None),
+
+    # Operation over people rules
+    DirectRule("over-people", ("operating_over_people", "people_are_participants", "people_under_cover",
+                               "drone_weight", "drone_category", "complies_with_kinetic_energy_limit",
+                               "is_restricted_access_area", "has_airworthiness_certificate"),
+               lambda op: "Operation over people does not meet any exemption criteria"
+               if op.operating_over_people and not _over_people_exempt(op) else None),
+
+    # Airspace restrictions
+    DirectRule("class-bcd-airspace", ("airspace_class", "has_atc_authorization"),
+               lambda op: f"Operation in Class {op.airspace_class} airspace requires ATC authorization"
+               if op.airspace_class in ['B', 'C', 'D'] and not op.has_atc_authorization else None),
+    DirectRule("class-e-surface-area", ("airspace_class", "is_airport_surface_area", "has_atc_authorization"),
+               lambda op: "Operation in Class E airport surface area requires ATC authorization"
+               if op.airspace_class == 'E' and op.is_airport_surface_area and not op.has_atc_authorization
+               else None),
+
+    # Operating limitations
+    DirectRule("speed-limit", ("operating_speed",),
+               lambda op: f"Speed exceeds 87 knots limit (current: {op.operating_speed} knots)"
+               if op.operating_speed > 87 else None),
+    DirectRule("altitude-limit", ("operating_altitude", "is_within_400ft_of_structure"),
+               lambda op: f"Altitude exceeds 400 feet limit (current: {op.operating_altitude} feet)"
+               if op.operating_altitude > 400 and not op.is_within_400ft_of_structure else None),
+    DirectRule("structure-altitude-limit", ("is_within_400ft_of_structure", "operating_altitude_above_structure"),
+               lambda op: f"Altitude exceeds 400 feet above structure "
+                          f"(current: {op.operating_altitude_above_structure} feet)"
+               if op.is_within_400ft_of_structure and op.operating_altitude_above_structure > 400 else None),
+    DirectRule("visibility", ("flight_visibility",),
+               lambda op: f"Visibility below 3 statute miles (current: {op.flight_visibility} miles)"
+               if op.flight_visibility < 3 else None),
+    DirectRule("cloud-clearance-horizontal", ("distance_from_clouds_horizontal",),
+               lambda op: f"Horizontal distance from clouds below 2000 feet "
+                          f"(current: {op.distance_from_clouds_horizontal} feet)"
+               if op.distance_from_clouds_horizontal < 2000 else None),
+    DirectRule("cloud-clearance-vertical", ("distance_from_clouds_vertical",),
+               lambda op: f"Vertical distance from clouds below 500 feet "
+                          f"(current: {op.distance_from_clouds_vertical} feet)"
+               if op.distance_from_clouds_vertical < 500 else None),
+
+    # Remote ID requirement
+    DirectRule("remote-id", ("has_remote_id",),
+               lambda op: "Drone lacks required Remote ID capability" if not op.has_remote_id else None),
+
+    # Category-specific rules
+    DirectRule("category2-rotating-parts", ("drone_category", "has_exposed_rotating_parts"),
+               lambda op: "Category 2 drones must not have exposed rotating parts"
+               if op.drone_category == "Category2" and op.has_exposed_rotating_parts else None),
+    DirectRule("category4-airworthiness", ("drone_category", "has_airworthiness_certificate"),
+               lambda op: "Category 4 drones require an airworthiness certificate"
+               if op.drone_category == "Category4" and not op.has_airworthiness_certificate else None),
+]
+
+# Per rule, a record of just the fields it reads, for column-wise checks
+_ROW_TYPES = [namedtuple('Row', rule.fields) for rule in DIRECT_RULES]
+
+# DroneOperation field -> indices into DIRECT_RULES of the rules that read it
+RULE_DEPENDENCIES: Dict[str, List[int]] = {}
+for _index, _rule in enumerate(DIRECT_RULES):
+    for _field in _rule.fields:
+        RULE_DEPENDENCIES.setdefault(_field, []).append(_index)
 
 
 class FAADroneRulesEvaluator:
@@ -46,68 +111,65 @@ class FAADroneRulesEvaluator:
         
         Returns a dict with decision and details
         """
+        return self.result_from_outcomes(self.evaluate_rules(operation))
+    
+    def evaluate_rules(self, operation: DroneOperation) -> List[Optional[str]]:
+        """
+        Outcome of every rule in DIRECT_RULES: its violation message, or
+        None if the operation satisfies it
+        """
         # Check all FAA regulations directly
-        violations = []
-        
-        # Check night operation rules
-        if operation.time_of_day == "night":
-            if not operation.pilot_has_night_training:
-                violations.append("Night operation requires pilot night training")
-            if not operation.has_anti_collision_lighting:
-                violations.append("Night operation requires anti-collision lighting")
-        
-        # Check civil twilight operation rules
-        if operation.time_of_day == "civil_twilight" and not operation.has_anti_collision_lighting:
-            violations.append("Civil twilight operation requires anti-collision lighting")
-        
-        # Check operation over people rules
-        if operation.operating_over_people:
-            if not any([
-                operation.people_are_participants,
-                operation.people_under_cover,
-                operation.drone_weight < 0.55,
-                (operation.drone_category == "Category2" and operation.complies_with_kinetic_energy_limit),
-                (operation.drone_category == "Category3" and operation.is_restricted_access_area),
-                (operation.drone_category == "Category4" and operation.has_airworthiness_certificate)
-            ]):
-                violations.append("Operation over people does not meet any exemption criteria")
-        
-        # Check airspace restrictions
-        if operation.airspace_class in ['B', 'C', 'D'] and not operation.has_atc_authorization:
-            violations.append(f"Operation in Class {operation.airspace_class} airspace requires ATC authorization")
-        
-        if operation.airspace_class == 'E' and operation.is_airport_surface_area and not operation.has_atc_authorization:
-            violations.append("Operation in Class E airport surface area requires ATC authorization")
-        
-        # Check operating limitations
-        if operation.operating_speed > 87:
-            violations.append(f"Speed exceeds 87 knots limit (current: {operation.operating_speed} knots)")
-        
-        if operation.operating_altitude > 400 and not operation.is_within_400ft_of_structure:
-            violations.append(f"Altitude exceeds 400 feet limit (current: {operation.operating_altitude} feet)")
-        
-        if operation.is_within_400ft_of_structure and operation.operating_altitude_above_structure > 400:
-            violations.append(f"Altitude exceeds 400 feet above structure (current: {operation.operating_altitude_above_structure} feet)")
-        
-        if operation.flight_visibility < 3:
-            violations.append(f"Visibility below 3 statute miles (current: {operation.flight_visibility} miles)")
-        
-        if operation.distance_from_clouds_horizontal < 2000:
-            violations.append(f"Horizontal distance from clouds below 2000 feet (current: {operation.distance_from_clouds_horizontal} feet)")
-        
-        if operation.distance_from_clouds_vertical < 500:
-            violations.append(f"Vertical distance from clouds below 500 feet (current: {operation.distance_from_clouds_vertical} feet)")
-        
-        # Check Remote ID requirement
-        if not operation.has_remote_id:
-            violations.append("Drone lacks required Remote ID capability")
+        return [rule.check(operation) for rule in DIRECT_RULES]
+    
+    def evaluate_batch(self, batch: OperationBatch) -> array:
+        """
+        Bitmask of the violated rules of every operation in a batch (bit i
+        for DIRECT_RULES[i], 0 if the operation complies)
         
-        # Category-specific rules
-        if operation.drone_category == "Category2" and operation.has_exposed_rotating_parts:
-            violations.append("Category 2 drones must not have exposed rotating parts")
+        Works over the batch's columns: each rule is checked once per
+        distinct combination of the fields it reads, no DroneOperation is
+        built per row.
+        """
+        masks = [0] * len(batch)
+        columns = {}
+        for index, rule in enumerate(DIRECT_RULES):
+            for name in rule.fields:
+                if name not in columns:
+                    column = batch.column(name)
+                    # Boolean columns hold 0/1; the checks see real booleans
+                    columns[name] = list(map(bool, column)) if name in BOOL_FIELDS else column
+            row_type = _ROW_TYPES[index]
+            bit = 1 << index
+            if len(rule.fields) == 1:
+                keys = columns[rule.fields[0]]
+                bits = {key: bit if rule.check(row_type(key)) is not None else 0 for key in set(keys)}
+            else:
+                keys = list(zip(*(columns[name] for name in rule.fields)))
+                bits = {key: bit if rule.check(row_type._make(key)) is not None else 0 for key in set(keys)}
+            if any(bits.values()):
+                masks = list(map(or_, masks, map(bits.__getitem__, keys)))
+        return array('I', masks)
+    
+    def reevaluate_rules(self, operation: DroneOperation, outcomes: List[Optional[str]],
+                         changed_fields) -> Tuple[List[Optional[str]], List[str]]:
+        """
+        Update the outcomes of a previous evaluate_rules call after some
+        fields of the operation changed
         
-        if operation.drone_category == "Category4" and not operation.has_airworthiness_certificate:
-            violations.append("Category 4 drones require an airworthiness certificate")
+        Only the rules that read one of `changed_fields` are re-run.
+        Returns the new outcomes and the ids of the re-run rules.
+        """
+        indices = sorted({index for field_name in changed_fields for index in RULE_DEPENDENCIES.get(field_name, ())})
+        outcomes = list(outcomes)
+        for index in indices:
+            outcomes[index] = DIRECT_RULES[index].check(operation)
+        return outcomes, [DIRECT_RULES[index].rule_id for index in indices]
+    
+    def result_from_outcomes(self, outcomes: List[Optional[str]]) -> Dict[str, Any]:
+        """
+        Build the evaluate_operation result from rule outcomes
+        """
+        violations = [violation for violation in outcomes if violation is not None]
         
         # Determine result based on violations
         if violations:
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+"""
+Mapping between DroneOperation fields and the XACML attributes used by
+FAADroneRules.xml
+"""
+
+from typing import Dict, Any, List, Tuple
+
+SUBJECT_CATEGORY = "urn:oasis:names:tc:xacml:1.0:subject-category:access-subject"
+RESOURCE_CATEGORY = "urn:oasis:names:tc:xacml:3.0:attribute-category:resource"
+ACTION_CATEGORY = "urn:oasis:names:tc:xacml:3.0:attribute-category:action"
+ENVIRONMENT_CATEGORY = "urn:oasis:names:tc:xacml:3.0:attribute-category:environment"
+
+# Request attributes identifying the pilot and the aircraft, the keys for
+# attributes fetched from registries
+PILOT_ID_ATTRIBUTE = (SUBJECT_CATEGORY, "urn:oasis:names:tc:xacml:1.0:subject:subject-id")
+AIRCRAFT_ID_ATTRIBUTE = (RESOURCE_CATEGORY, "urn:oasis:names:tc:xacml:1.0:resource:resource-id")
+
+# (DroneOperation field, XACML category, XACML AttributeId, XML Schema data type)
+# Same attributes, in the same order, as the request built by FileBasedPDPWrapper
+OPERATION_ATTRIBUTES: List[Tuple[str, str, str, str]] = [
+    # Subject attributes (pilot)
+    ("pilot_has_night_training", SUBJECT_CATEGORY, "has-completed-night-training", "boolean"),
+    ("remote_pilot_certificate", SUBJECT_CATEGORY, "has-remote-pilot-certificate", "boolean"),
+
+    # Resource attributes (drone)
+    ("drone_category", RESOURCE_CATEGORY, "drone-category", "string"),
+    ("drone_weight", RESOURCE_CATEGORY, "drone-weight", "double"),
+    ("has_anti_collision_lighting", RESOURCE_CATEGORY, "has-anti-collision-lighting", "boolean"),
+    ("has_remote_id", RESOURCE_CATEGORY, "has-remote-id", "boolean"),
+    ("has_airworthiness_certificate", RESOURCE_CATEGORY, "has-airworthiness-certificate", "boolean"),
+    ("complies_with_kinetic_energy_limit", RESOURCE_CATEGORY, "complies-with-kinetic-energy-limit", "boolean"),
+    ("has_exposed_rotating_parts", RESOURCE_CATEGORY, "has-exposed-rotating-parts", "boolean"),
+    ("people_are_participants", RESOURCE_CATEGORY, "people-are-participants", "boolean"),
+    ("people_under_cover", RESOURCE_CATEGORY, "people-under-cover", "boolean"),
+    ("is_restricted_access_area", RESOURCE_CATEGORY, "is-restricted-access-area", "boolean"),
+
+    # Action attributes
+    ("operating_over_people", ACTION_CATEGORY, "is-operating-over-people", "boolean"),
+    ("operating_speed", ACTION_CATEGORY, "operating-speed", "double"),
+    ("operating_altitude", ACTION_CATEGORY, "operating-altitude", "double"),
+    ("operating_altitude_above_structure", ACTION_CATEGORY, "operating-altitude-above-structure", "double"),
+    ("has_atc_authorization", ACTION_CATEGORY, "has-atc-authorization", "boolean"),
+
+    # Environment attributes
+    ("time_of_day", ENVIRONMENT_CATEGORY, "time-of-day", "string"),
+    ("airspace_class", ENVIRONMENT_CATEGORY, "airspace-class", "string"),
+    ("is_airport_surface_area", ENVIRONMENT_CATEGORY, "is-airport-surface-area", "boolean"),
+    ("flight_visibility", ENVIRONMENT_CATEGORY, "flight-visibility", "double"),
+    ("distance_from_clouds_horizontal", ENVIRONMENT_CATEGORY, "distance-from-clouds-horizontal", "double"),
+    ("distance_from_clouds_vertical", ENVIRONMENT_CATEGORY, "distance-from-clouds-vertical", "double"),
+    ("is_within_400ft_of_structure", ENVIRONMENT_CATEGORY, "is-within-400ft-of-structure", "boolean"),
+]
+
+
+def operation_to_attributes(operation) -> Dict[str, Dict[str, Any]]:
+    """
+    Convert a DroneOperation into the {category: {attribute_id: value}} dict
+    that FileBasedPDP builds from a XACML request
+    """
+    attributes = {}
+    for field_name, category, attr_id, data_type in OPERATION_ATTRIBUTES:
+        value = getattr(operation, field_name)
+        if data_type == "double":
+            value = float(value)
+        elif data_type == "boolean":
+            value = bool(value)
+        attributes.setdefault(category, {})[attr_id] = value
+    return attributes
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+"""
+The drone operation model shared by every evaluator
+
+DroneOperation is one operation: a slotted dataclass, so instances carry
+no __dict__. Code treats operations as values and derives changed copies
+with dataclasses.replace.
+
+OperationBatch holds many operations column by column: one contiguous
+array of doubles per float field, one bit per row in a packed bitfield
+per boolean field and a one-byte dictionary code per row for each string
+field, about 70 bytes per operation against some 400 for a
+DroneOperation and its float objects. Conversion either way is
+column-at-a-time:
+
+    batch = OperationBatch.from_operations(operations)
+    batch.column("operating_altitude")   # array('d')
+    batch[i]                             # DroneOperation
+    batch.to_operations()
+"""
+
+from array import array
+from dataclasses import dataclass, fields
+from operator import attrgetter
+from typing import Any, Dict, Iterable, Iterator, List, Sequence
+
+
+@dataclass(slots=True)
+class DroneOperation:
+    """Represents a drone operation with all relevant attributes"""
+    # Drone characteristics
+    drone_category: str  # 'Category1', 'Category2', 'Category3', 'Category4'
+    drone_weight: float  # in pounds
+    has_anti_collision_lighting: bool
+    has_remote_id: bool
+
+    # Operation details
+    time_of_day: str  # 'day', 'night', 'civil_twilight'
+    operating_over_people: bool
+    operating_altitude: float  # in feet
+    operating_speed: float  # in knots
+
+    # Environment details
+    airspace_class: str  # 'B', 'C', 'D', 'E', 'G'
+    flight_visibility: float  # in statute miles
+    distance_from_clouds_horizontal: float  # in feet
+    distance_from_clouds_vertical: float  # in feet
+
+    # Optional parameters (with default values)
+    has_airworthiness_certificate: bool = False
+    complies_with_kinetic_energy_limit: bool = False
+    has_exposed_rotating_parts: bool = False
+    is_within_400ft_of_structure: bool = False
+    operating_altitude_above_structure: float = 0.0  # in feet
+    is_airport_surface_area: bool = False
+    is_restricted_access_area: bool = False
+    people_are_participants: bool = False
+    people_under_cover: bool = False
+    pilot_has_night_training: bool = False
+    has_atc_authorization: bool = False
+    remote_pilot_certificate: bool = False
+
+
+# Field name -> type, in declaration order
+FIELD_TYPES: Dict[str, Any] = {f.name: f.type for f in fields(DroneOperation)}
+BOOL_FIELDS = [name for name, field_type in FIELD_TYPES.items() if field_type in (bool, "bool")]
+FLOAT_FIELDS = [name for name, field_type in FIELD_TYPES.items() if field_type in (float, "float")]
+STRING_FIELDS = [name for name, field_type in FIELD_TYPES.items() if field_type in (str, "str")]
+
+# Byte -> its 8 bits as 8 bytes of 0/1 (least significant first), and back
+_UNPACK = [bytes((byte >> bit) & 1 for bit in range(8)) for byte in range(256)]
+_PACK = {bits: byte for byte, bits in enumerate(_UNPACK)}
+
+
+def _pack_bits(flags: bytes) -> bytearray:
+    """Pack one 0/1 byte per row into one bit per row"""
+    flags = bytes(flags) + bytes(-len(flags) % 8)
+    return bytearray(map(_PACK.__getitem__, (flags[i:i + 8] for i in range(0, len(flags), 8))))
+
+
+def _unpack_bits(packed: bytes, rows: int) -> bytes:
+    """One 0/1 byte per row from a packed bitfield"""
+    return b"".join(map(_UNPACK.__getitem__, packed))[:rows]
+
+
+class OperationBatch:
+    """
+    Many DroneOperations stored column by column
+
+    Rows are appended, never changed in place; build a new batch to
+    change operations.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.floats: Dict[str, array] = {name: array('d') for name in FLOAT_FIELDS}
+        self.bits: Dict[str, bytearray] = {name: bytearray() for name in BOOL_FIELDS}
+        self.codes: Dict[str, array] = {name: array('B') for name in STRING_FIELDS}
+        self.categories: Dict[str, List[str]] = {name: [] for name in STRING_FIELDS}
+        self._category_codes: Dict[str, Dict[str, int]] = {name: {} for name in STRING_FIELDS}
+
+    @classmethod
+    def from_operations(cls, operations: Iterable[DroneOperation]) -> "OperationBatch":
+        batch = cls()
+        batch.extend(operations)
+        return batch
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def _code(self, name: str, value: str) -> int:
+        codes = self._category_codes[name]
+        code = codes.get(value)
+        if code is None:
+            if len(codes) == 256:
+                raise ValueError(f"More than 256 distinct values of {name}")
+            code = codes[value] = len(codes)
+            self.categories[name].append(value)
+        return code
+
+    def append(self, operation: DroneOperation):
+        self.extend((operation,))
+
+    def extend(self, operations: Iterable[DroneOperation]):
+        """Append operations, converting them column by column"""
+        operations = operations if isinstance(operations, list) else list(operations)
+        if not operations:
+            return
+        for name in FLOAT_FIELDS:
+            self.floats[name].extend(map(float, map(attrgetter(name), operations)))
+        for name in STRING_FIELDS:
+            code = self._code
+            self.codes[name].extend([code(name, value) for value in map(attrgetter(name), operations)])
+        for name in BOOL_FIELDS:
+            flags = bytes(map(bool, map(attrgetter(name), operations)))
+            if self.rows % 8:
+                # Repack from the last, partly filled byte
+                flags = _unpack_bits(self.bits[name][-1:], self.rows % 8) + flags
+                del self.bits[name][-1:]
+            self.bits[name] += _pack_bits(flags)
+        self.rows += len(operations)
+
+    def column(self, name: str) -> Sequence:
+        """
+        All values of one field: an array('d') for a float field, bytes of
+        0/1 for a boolean field and a list of str for a string field
+        """
+        if name in self.floats:
+            return self.floats[name]
+        if name in self.bits:
+            return _unpack_bits(self.bits[name], self.rows)
+        return list(map(self.categories[name].__getitem__, self.codes[name]))
+
+    def __getitem__(self, index: int) -> DroneOperation:
+        if index < 0:
+            index += self.rows
+        if not 0 <= index < self.rows:
+            raise IndexError("OperationBatch index out of range")
+        byte, bit = divmod(index, 8)
+        values = {name: column[index] for name, column in self.floats.items()}
+        values.update((name, bool(packed[byte] >> bit & 1)) for name, packed in self.bits.items())
+        values.update((name, self.categories[name][codes[index]]) for name, codes in self.codes.items())
+        return DroneOperation(**values)
+
+    def __iter__(self) -> Iterator[DroneOperation]:
+        return iter(self.to_operations())
+
+    def to_operations(self) -> List[DroneOperation]:
+        """Every row as a DroneOperation, built from whole columns"""
+        columns = []
+        for name in FIELD_TYPES:
+            column = self.column(name)
+            columns.append(map(bool, column) if name in self.bits else column)
+        return list(map(DroneOperation, *columns))
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the column data"""
+        return (sum(len(column) * column.itemsize for column in self.floats.values())
+                + sum(len(packed) for packed in self.bits.values())
+                + sum(len(codes) for codes in self.codes.values()))
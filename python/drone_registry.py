@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+"""
+Pilot and aircraft registry in SQLite
+
+Fills the registry-backed DroneOperation fields (pilot_has_night_training,
+remote_pilot_certificate, has_remote_id, has_airworthiness_certificate)
+from a pilot id and an aircraft id instead of trusting self-reported
+values. Lookups go through a PolicyInformationPoint, so records are
+fetched with one query per chunk of ids and kept in its read-through
+cache; the same finders can be given to FileBasedPDP.
+"""
+
+import csv
+import sys
+import json
+import sqlite3
+import argparse
+from dataclasses import replace
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from drone_attributes import AIRCRAFT_ID_ATTRIBUTE, OPERATION_ATTRIBUTES, PILOT_ID_ATTRIBUTE
+from policy_information_point import DEFAULT_TTL, PolicyInformationPoint, SQLiteAttributeFinder
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pilots (
+    pilot_id TEXT PRIMARY KEY,
+    remote_pilot_certificate INTEGER NOT NULL DEFAULT 0,
+    night_training INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS aircraft (
+    aircraft_id TEXT PRIMARY KEY,
+    owner_pilot_id TEXT REFERENCES pilots (pilot_id),
+    has_remote_id INTEGER NOT NULL DEFAULT 0,
+    has_airworthiness_certificate INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS aircraft_owner ON aircraft (owner_pilot_id);
+"""
+
+# DroneOperation field -> registry column
+PILOT_FIELDS = {
+    "pilot_has_night_training": "night_training",
+    "remote_pilot_certificate": "remote_pilot_certificate",
+}
+AIRCRAFT_FIELDS = {
+    "has_remote_id": "has_remote_id",
+    "has_airworthiness_certificate": "has_airworthiness_certificate",
+}
+
+_ATTRIBUTES = {field_name: (category, attr_id, data_type)
+               for field_name, category, attr_id, data_type in OPERATION_ATTRIBUTES}
+
+
+class UnknownRecordError(KeyError):
+    """Raised for a pilot or aircraft id the registry has no record of"""
+
+
+def _finder(database: str, table: str, key_column: str, fields: Dict[str, str],
+            key: Tuple[str, str], ttl: float) -> SQLiteAttributeFinder:
+    category = _ATTRIBUTES[next(iter(fields))][0]
+    columns = {_ATTRIBUTES[field_name][1]: (column, _ATTRIBUTES[field_name][2])
+               for field_name, column in fields.items()}
+    return SQLiteAttributeFinder(database, table, key_column, category, columns, key, ttl=ttl, name=table)
+
+
+class DroneRegistry:
+    """
+    Pilot and aircraft records with a read-through cache
+
+    Records written through this object invalidate the cache; changes
+    made by other processes show up once cached records expire (`ttl`).
+    """
+
+    def __init__(self, database: str, ttl: float = DEFAULT_TTL):
+        self.database = database
+        with sqlite3.connect(database) as connection:
+            connection.executescript(SCHEMA)
+        self.pilot_finder = _finder(database, "pilots", "pilot_id", PILOT_FIELDS, PILOT_ID_ATTRIBUTE, ttl)
+        self.aircraft_finder = _finder(database, "aircraft", "aircraft_id", AIRCRAFT_FIELDS,
+                                       AIRCRAFT_ID_ATTRIBUTE, ttl)
+        self.pip = PolicyInformationPoint([self.pilot_finder, self.aircraft_finder])
+
+    def add_pilots(self, pilots: Iterable[Dict]):
+        """
+        Insert or replace pilot records (dicts with the pilots table's
+        columns); a missing flag is stored as false
+        """
+        self._upsert("pilots", ("pilot_id", "remote_pilot_certificate", "night_training"), pilots)
+        self.pip.invalidate(self.pilot_finder)
+
+    def add_aircraft(self, aircraft: Iterable[Dict]):
+        """
+        Insert or replace aircraft records (dicts with the aircraft table's
+        columns); a missing flag is stored as false
+        """
+        self._upsert("aircraft", ("aircraft_id", "owner_pilot_id", "has_remote_id",
+                                  "has_airworthiness_certificate"), aircraft)
+        self.pip.invalidate(self.aircraft_finder)
+
+    def _upsert(self, table: str, columns: Tuple[str, ...], records: Iterable[Dict]):
+        # Columns a record lacks (or leaves empty) take the schema default
+        # instead of an explicit NULL; records are grouped by the columns they have
+        rows: Dict[Tuple[str, ...], List[Tuple]] = {}
+        for record in records:
+            if record.get(columns[0]) is None:
+                raise ValueError(f"{table} record without {columns[0]}: {record}")
+            present = tuple(column for column in columns if record.get(column) is not None)
+            rows.setdefault(present, []).append(tuple(record[column] for column in present))
+        with sqlite3.connect(self.database) as connection:
+            for present, values in rows.items():
+                connection.executemany(f"INSERT OR REPLACE INTO {table} ({', '.join(present)}) "
+                                       f"VALUES ({', '.join('?' * len(present))})", values)
+
+    def _fields(self, finder: SQLiteAttributeFinder, fields: Dict[str, str],
+                records: Dict[str, Dict], record_id: str) -> Dict[str, bool]:
+        record = records.get(record_id)
+        if not record:
+            raise UnknownRecordError(f"No {finder.table} record for {record_id!r}")
+        return {field_name: record[_ATTRIBUTES[field_name][1]] for field_name in fields}
+
+    def lookup(self, pilot_id: Optional[str] = None, aircraft_id: Optional[str] = None) -> Dict[str, bool]:
+        """
+        Registry-backed DroneOperation fields for a pilot and/or an aircraft
+
+        Raises UnknownRecordError for an id without a record.
+        """
+        return self.lookup_many([(pilot_id, aircraft_id)])[0]
+
+    def lookup_many(self, ids: List[Tuple[Optional[str], Optional[str]]]) -> List[Dict[str, bool]]:
+        """
+        lookup for many (pilot_id, aircraft_id) pairs, prefetching all
+        uncached records with one query per table and chunk of ids
+        """
+        pilots = self.pip.fetch(self.pilot_finder, list({p for p, _ in ids if p is not None}))
+        aircraft = self.pip.fetch(self.aircraft_finder, list({a for _, a in ids if a is not None}))
+        results = []
+        for pilot_id, aircraft_id in ids:
+            values = {}
+            if pilot_id is not None:
+                values.update(self._fields(self.pilot_finder, PILOT_FIELDS, pilots, pilot_id))
+            if aircraft_id is not None:
+                values.update(self._fields(self.aircraft_finder, AIRCRAFT_FIELDS, aircraft, aircraft_id))
+            results.append(values)
+        return results
+
+    def fill_operation(self, operation, pilot_id: Optional[str] = None, aircraft_id: Optional[str] = None):
+        """Copy of a DroneOperation with the registry-backed fields looked up"""
+        return replace(operation, **self.lookup(pilot_id, aircraft_id))
+
+    def fill_operations(self, items: List[Tuple[object, Optional[str], Optional[str]]]) -> List:
+        """fill_operation for many (operation, pilot_id, aircraft_id) items, prefetched together"""
+        values = self.lookup_many([(pilot_id, aircraft_id) for _, pilot_id, aircraft_id in items])
+        return [replace(operation, **fields) for (operation, _, _), fields in zip(items, values)]
+
+
+def _read_csv(path: str) -> List[Dict]:
+    with open(path, newline='') as f:
+        return [{column: (value.strip().lower() in ('true', '1', 'yes')
+                          if column not in ('pilot_id', 'aircraft_id', 'owner_pilot_id') else value or None)
+                 for column, value in row.items()} for row in csv.DictReader(f)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage the pilot and aircraft registry')
+    parser.add_argument('database', type=str, help='SQLite registry file, created if missing')
+    parser.add_argument('--import-pilots', type=str, help='CSV file with pilot_id, remote_pilot_certificate, '
+                                                          'night_training columns')
+    parser.add_argument('--import-aircraft', type=str, help='CSV file with aircraft_id, owner_pilot_id, '
+                                                            'has_remote_id, has_airworthiness_certificate columns')
+    parser.add_argument('--pilot', type=str, help='Pilot id to look up')
+    parser.add_argument('--aircraft', type=str, help='Aircraft id to look up')
+
+    args = parser.parse_args()
+
+    registry = DroneRegistry(args.database)
+    if args.import_pilots:
+        pilots = _read_csv(args.import_pilots)
+        registry.add_pilots(pilots)
+        print(f"Imported {len(pilots)} pilots")
+    if args.import_aircraft:
+        aircraft = _read_csv(args.import_aircraft)
+        registry.add_aircraft(aircraft)
+        print(f"Imported {len(aircraft)} aircraft")
+
+    if args.pilot or args.aircraft:
+        try:
+            print(json.dumps(registry.lookup(args.pilot, args.aircraft), indent=2))
+        except UnknownRecordError as e:
+            print(f"Error: {e.args[0]}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
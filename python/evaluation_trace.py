@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+
+"""
+Explain mode: the full evaluation trace of one decision
+
+    python evaluation_trace.py operation.json
+    python evaluation_trace.py operation.json --json
+
+FileBasedPDP.explain() evaluates a request once more on a separate,
+instrumented path and records what led to the decision:
+
+- every Match of every Target with the request value it compared,
+- the value of every Condition sub-expression,
+- each rule and policy outcome in the order the combining algorithms
+  consumed them, and the ones they never evaluated,
+- the time each policy, rule and sub-expression took.
+
+The decision comes from the PDP's own Target and Condition evaluators and
+combining algorithms, so it is the one evaluate() returns; the decision
+table is not used. Sub-expressions are evaluated for the trace even where
+the evaluator short-circuits them. The regular evaluation path does no
+trace bookkeeping at all, so explain mode costs nothing while it is off.
+
+An explanation is a dict of plain JSON values, so it can be returned by
+the HTTP API as is; format_explanation() renders it as text.
+"""
+
+import os
+import json
+import argparse
+from time import perf_counter_ns
+from typing import Any, Dict, List
+
+from drone_attributes import operation_to_attributes
+from policy_compiler import Apply, AttributeDesignator, AttributeValue, Function, PolicyReference, PolicySet, short_id
+from policy_directory import PolicyReferenceError
+from xacml_functions import FunctionCompileError, Indeterminate, compile_expression, compile_match
+
+DEFAULT_POLICY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../policies/FAADroneRules.xml")
+
+
+def _jsonable(value):
+    if isinstance(value, (tuple, list)):
+        return [_jsonable(item) for item in value]
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def _outcome(outcome):
+    """A rule outcome as consumed by the combining algorithm, for the trace"""
+    if outcome is None:
+        return "NotApplicable"
+    return outcome if outcome == "Indeterminate" else bool(outcome)
+
+
+def _microseconds(nanoseconds: int) -> float:
+    return round(nanoseconds / 1000, 1)
+
+
+def _trace_match(match, attributes) -> Dict[str, Any]:
+    designator = match.designator
+    trace = {
+        "attribute": designator.attribute_id,
+        "function": short_id(match.function_id or ""),
+        "value": _jsonable(match.value.value),
+        "request_value": _jsonable(attributes.get(designator.category, {}).get(designator.attribute_id)),
+    }
+    try:
+        trace["result"] = compile_match(match)(attributes)
+    except (Indeterminate, FunctionCompileError) as e:
+        trace["result"] = "Indeterminate"
+        trace["error"] = str(e)
+    return trace
+
+
+def _trace_target(target: tuple, outcome, attributes) -> Dict[str, Any]:
+    """Each Match of a Target, by AnyOf and AllOf, and the Target's outcome"""
+    return {
+        "result": outcome,
+        "any_of": [[[_trace_match(match, attributes) for match in all_of] for all_of in any_of]
+                   for any_of in target],
+    }
+
+
+def trace_expression(expression, attributes) -> Dict[str, Any]:
+    """An expression's value and the trace of each of its arguments"""
+    if isinstance(expression, Function):
+        return {"function": short_id(expression.function_id)}
+    if isinstance(expression, AttributeValue):
+        return {"literal": _jsonable(expression.value)}
+    if isinstance(expression, Apply):
+        trace = {"expression": short_id(expression.function_id)}
+    elif isinstance(expression, AttributeDesignator):
+        trace = {"expression": expression.attribute_id}
+    else:
+        trace = {"expression": type(expression).__name__}
+
+    try:
+        evaluate = compile_expression(expression)
+        start = perf_counter_ns()
+        try:
+            trace["value"] = _jsonable(evaluate(attributes))
+        finally:
+            trace["elapsed_us"] = _microseconds(perf_counter_ns() - start)
+    except (Indeterminate, FunctionCompileError) as e:
+        trace["value"] = "Indeterminate"
+        trace["error"] = str(e)
+    if isinstance(expression, Apply):
+        trace["arguments"] = [trace_expression(argument, attributes) for argument in expression.arguments]
+    return trace
+
+
+def _trace_rule(rule, target, evaluated: bool, outcome, elapsed: int, attributes) -> Dict[str, Any]:
+    trace = {"rule_id": rule.rule_id, "effect": rule.effect, "evaluated": evaluated}
+    if not evaluated:
+        return trace
+    trace["outcome"] = _outcome(outcome)
+    trace["elapsed_us"] = _microseconds(elapsed)
+    matched = True
+    if target is not None:
+        try:
+            matched = bool(target(attributes))
+        except Indeterminate:
+            matched = "Indeterminate"
+        trace["target"] = _trace_target(rule.target, matched, attributes)
+    if rule.condition is not None and matched is True:
+        trace["condition"] = trace_expression(rule.condition, attributes)
+    return trace
+
+
+def _evaluate_policy(pdp, compiled, attributes):
+    """
+    (decision, target outcome, [(rule outcome, ns)] of the consumed rules,
+    ns) of one compiled policy, evaluated as FileBasedPDP does
+    """
+    policy, target, rules = compiled
+    consumed = []
+
+    def outcomes():
+        for rule, rule_target, condition in rules:
+            start = perf_counter_ns()
+            outcome = pdp._evaluate_rule(rule, rule_target, condition, attributes)
+            consumed.append((outcome, perf_counter_ns() - start))
+            yield rule, outcome
+
+    start = perf_counter_ns()
+    target_outcome = pdp._evaluate_target(policy, target, attributes)
+    if target_outcome is True:
+        decision = pdp.combine_rule_outcomes(policy, outcomes())
+    else:
+        decision = None if target_outcome is False else "Indeterminate"
+    return decision, target_outcome, consumed, perf_counter_ns() - start
+
+
+def _trace_policy(compiled, evaluation, attributes) -> Dict[str, Any]:
+    policy, _, rules = compiled
+    trace = {"policy_id": policy.policy_id, "rule_combining_alg": short_id(policy.rule_combining_alg or ""),
+             "evaluated": evaluation is not None}
+    if evaluation is None:
+        return trace
+    decision, target_outcome, consumed, elapsed = evaluation
+    rule_traces = []
+    for index, (rule, rule_target, _) in enumerate(rules):
+        outcome, rule_elapsed = consumed[index] if index < len(consumed) else (None, 0)
+        rule_traces.append(_trace_rule(rule, rule_target, index < len(consumed), outcome, rule_elapsed, attributes))
+    trace.update({
+        "decision": decision or "NotApplicable",
+        "elapsed_us": _microseconds(elapsed),
+        "target": _trace_target(policy.target, target_outcome, attributes),
+        "rules": rule_traces,
+    })
+    return trace
+
+
+def _evaluate_policy_set(pdp, node, attributes):
+    """
+    (decision, target outcome, [(child, evaluation)] of the consumed
+    children, ns) of one compiled policy set, evaluated as FileBasedPDP
+    does; a reference that cannot be resolved has its error as evaluation
+    """
+    policy_set, target, children = node
+    evaluations = []
+
+    def policy_decisions():
+        for child in children:
+            try:
+                child = pdp._resolve(child)
+            except PolicyReferenceError as e:
+                evaluations.append((child, e))
+                yield "Indeterminate"
+                continue
+            if type(child[0]) is PolicySet:
+                evaluation = _evaluate_policy_set(pdp, child, attributes)
+            else:
+                evaluation = _evaluate_policy(pdp, child, attributes)
+            evaluations.append((child, evaluation))
+            yield evaluation[0]
+
+    start = perf_counter_ns()
+    target_outcome = pdp._evaluate_target(policy_set, target, attributes)
+    if target_outcome is True:
+        if type(children) is not tuple:
+            children = children.candidates(attributes)
+        decision = pdp._combine_policy_decisions(policy_set.policy_combining_alg, policy_decisions())
+    else:
+        decision = None if target_outcome is False else "Indeterminate"
+    return decision, target_outcome, evaluations, perf_counter_ns() - start
+
+
+def _trace_child(child, evaluation, attributes) -> Dict[str, Any]:
+    if type(child[0]) is PolicyReference:
+        trace = {"reference": child[0].reference_id, "evaluated": evaluation is not None}
+        if evaluation is not None:
+            trace.update({"decision": "Indeterminate", "error": str(evaluation)})
+        return trace
+    trace_node = _trace_policy_set if type(child[0]) is PolicySet else _trace_policy
+    return trace_node(child, evaluation, attributes)
+
+
+def _trace_policy_set(node, evaluation, attributes) -> Dict[str, Any]:
+    policy_set, _, children = node
+    trace = {"policy_set_id": policy_set.policy_set_id,
+             "policy_combining_alg": short_id(policy_set.policy_combining_alg or ""),
+             "evaluated": evaluation is not None}
+    if evaluation is None:
+        return trace
+    decision, target_outcome, evaluations, elapsed = evaluation
+    # Evaluated children as resolved, then the rest; the children a
+    # policy directory's target index left out are not listed
+    policy_traces = [_trace_child(child, child_evaluation, attributes) for child, child_evaluation in evaluations]
+    if target_outcome is True:
+        if type(children) is not tuple:
+            children = children.candidates(attributes)
+        policy_traces.extend(_trace_child(child, None, attributes) for child in children[len(evaluations):])
+    trace.update({
+        "decision": decision or "NotApplicable",
+        "elapsed_us": _microseconds(elapsed),
+        "target": _trace_target(policy_set.target, target_outcome, attributes),
+        "policies": policy_traces,
+    })
+    return trace
+
+
+def explain(pdp, attributes: Dict[str, Dict[str, Any]], snapshot=None) -> Dict[str, Any]:
+    """
+    Decision for request attributes (already resolved by the PIP, if any)
+    with the trace of its evaluation, on the PDP's current snapshot
+
+    Nested policy sets appear among the policies with their own
+    policy_set_id, policy_combining_alg, target and policies. Policy
+    references appear as the policy or policy set they resolve to once
+    evaluated, and as {"reference", "evaluated"} otherwise; one that
+    cannot be resolved has its "error".
+    """
+    snapshot = snapshot or pdp.snapshot
+    evaluation = _evaluate_policy_set(pdp, snapshot.root, attributes)
+
+    # Traced once the decision is made, so the timings are the evaluation's alone
+    explanation = _trace_policy_set(snapshot.root, evaluation, attributes)
+    result = pdp._evaluate_result(snapshot, attributes)
+    explanation["obligations"] = [_directive(directive) for directive in result.obligations]
+    explanation["advice"] = [_directive(directive) for directive in result.advice]
+    return explanation
+
+
+def _directive(directive) -> Dict[str, Any]:
+    return {"id": directive.id, "policy_id": directive.policy_id, "rule_id": directive.rule_id,
+            "attributes": {name: _jsonable(value) for name, value in directive.attributes.items()}}
+
+
+def _format_value(value) -> str:
+    if isinstance(value, bool):
+        return str(value).lower()
+    return json.dumps(value) if isinstance(value, (list, str)) else str(value)
+
+
+def _format_target(target: Dict[str, Any], indent: str, lines: List[str]):
+    for any_of in target["any_of"]:
+        for all_of in any_of:
+            for match in all_of:
+                lines.append(f"{indent}match {match['function']}({_format_value(match['value'])}, "
+                             f"{match['attribute']}={_format_value(match['request_value'])}) "
+                             f"-> {_format_value(match['result'])}")
+
+
+def _format_expression(trace: Dict[str, Any], indent: str, lines: List[str]):
+    if "function" in trace:
+        lines.append(f"{indent}{trace['function']}")
+        return
+    if "literal" in trace:
+        lines.append(f"{indent}{_format_value(trace['literal'])}")
+        return
+    value = _format_value(trace["value"])
+    if "error" in trace:
+        value += f" ({trace['error']})"
+    lines.append(f"{indent}{trace['expression']} = {value}")
+    for argument in trace.get("arguments", ()):
+        _format_expression(argument, indent + "  ", lines)
+
+
+def _format_policy(policy: Dict[str, Any], indent: str, lines: List[str]):
+    lines.append(f"{indent}{policy['policy_id']} [{policy['rule_combining_alg']}]: " +
+                 (f"{policy['decision']} ({policy['elapsed_us']} us)" if policy["evaluated"] else "not evaluated"))
+    if not policy["evaluated"]:
+        return
+    _format_target(policy["target"], indent + "  ", lines)
+    if policy["target"]["result"] is not True:
+        return
+    for rule in policy["rules"]:
+        header = f"{indent}  {rule['rule_id']} ({rule['effect']}): "
+        if not rule["evaluated"]:
+            lines.append(header + "not evaluated")
+            continue
+        outcome = rule["outcome"]
+        if outcome is True:
+            outcome = rule["effect"]
+        elif outcome is False:
+            outcome = "condition false"
+        lines.append(header + f"{outcome} ({rule['elapsed_us']} us)")
+        if "target" in rule:
+            _format_target(rule["target"], indent + "    ", lines)
+        if "condition" in rule:
+            _format_expression(rule["condition"], indent + "    ", lines)
+
+
+def _format_policy_set(policy_set: Dict[str, Any], indent: str, lines: List[str]):
+    lines.append(f"{indent}{policy_set['policy_set_id']} [{policy_set['policy_combining_alg']}]: " +
+                 (f"{policy_set['decision']} ({policy_set['elapsed_us']} us)" if policy_set["evaluated"]
+                  else "not evaluated"))
+    if not policy_set["evaluated"]:
+        return
+    _format_target(policy_set["target"], indent + "  ", lines)
+    for child in policy_set["policies"]:
+        if "reference" in child:
+            lines.append(f"{indent}  {child['reference']}: " +
+                         (f"Indeterminate ({child['error']})" if child["evaluated"] else "not evaluated"))
+            continue
+        (_format_policy_set if "policy_set_id" in child else _format_policy)(child, indent + "  ", lines)
+
+
+def format_explanation(explanation: Dict[str, Any]) -> List[str]:
+    """An explanation as indented text lines"""
+    lines = []
+    _format_policy_set(explanation, "", lines)
+    for label, key in (("obligation", "obligations"), ("advice", "advice")):
+        for directive in explanation[key]:
+            values = ", ".join(f"{name}={_format_value(value)}" for name, value in directive["attributes"].items())
+            lines.append(f"  {label} {directive['id']}: {values}")
+    return lines
+
+
+def main():
+    # Imported here: file_based_pdp imports this module
+    from file_based_pdp import FileBasedPDP
+    from batch_runner import parse_operation
+
+    parser = argparse.ArgumentParser(description='Explain the decision for one drone operation')
+    parser.add_argument('operations', type=str,
+                        help='JSON file with the DroneOperation fields, or a list of them as in example_operations.json')
+    parser.add_argument('--policy-file', type=str, default=DEFAULT_POLICY_FILE, help='Path to the XACML policy file')
+    parser.add_argument('--json', action='store_true', help='Print the explanation as JSON')
+    args = parser.parse_args()
+
+    with open(args.operations) as f:
+        data = json.load(f)
+    pdp = FileBasedPDP(args.policy_file)
+    explanations = []
+    for index, item in enumerate(data if isinstance(data, list) else [data]):
+        explanation = pdp.explain(operation_to_attributes(parse_operation(item)))
+        explanations.append(explanation)
+        if not args.json:
+            if isinstance(data, list):
+                print(f"{item.get('name', f'Operation {index + 1}')}:")
+            print("\n".join(format_explanation(explanation)))
+    if args.json:
+        print(json.dumps(explanations if isinstance(data, list) else explanations[0], indent=2))
+
+
+if __name__ == "__main__":
+    main()
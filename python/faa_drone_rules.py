@@ -3,45 +3,9 @@ import sys
 import requests
 import json
 import xml.etree.ElementTree as ET
-from dataclasses import dataclass
 from typing import Dict, Any, List, Optional
 
-@dataclass
-class DroneOperation:
-    """Represents a drone operation with all relevant attributes"""
-    # Drone characteristics
-    drone_category: str  # 'Category1', 'Category2', 'Category3', 'Category4'
-    drone_weight: float  # in pounds
-    has_anti_collision_lighting: bool
-    has_remote_id: bool
-    has_airworthiness_certificate: bool = False
-    complies_with_kinetic_energy_limit: bool = False
-    has_exposed_rotating_parts: bool = False
-
-    # Operation details
-    time_of_day: str  # 'day', 'night', 'civil_twilight'
-    operating_over_people: bool
-    operating_altitude: float  # in feet
-    operating_speed: float  # in knots
-    is_within_400ft_of_structure: bool = False
-    operating_altitude_above_structure: float = 0.0  # in feet
-
-    # Environment details
-    airspace_class: str  # 'B', 'C', 'D', 'E', 'G'
-    is_airport_surface_area: bool = False
-    is_restricted_access_area: bool = False
-    flight_visibility: float  # in statute miles
-    distance_from_clouds_horizontal: float  # in feet
-    distance_from_clouds_vertical: float  # in feet
-    
-    # People details (if operating over people)
-    people_are_participants: bool = False
-    people_under_cover: bool = False
-    
-    # Pilot information
-    pilot_has_night_training: bool = False
-    has_atc_authorization: bool = False
-    remote_pilot_certificate: bool = False
+from drone_operation import DroneOperation
 
 
 class XACMLPolicyDecisionPoint:
@@ -1,8 +1,21 @@
 from flask import Flask, request, jsonify, render_template, send_file
-from direct_faa_rules import DroneOperation, FAADroneRulesEvaluator
+from direct_faa_rules import FAADroneRulesEvaluator
+from drone_operation import DroneOperation
+from incremental_evaluation import IncrementalEvaluator, UnknownHandleError
+from flight_plan import FlightPlan, evaluate_flight_plan
+from airspace_index import AirspaceIndex, locate_operation
+from drone_registry import DroneRegistry
+from decision_journal import DecisionJournal
+from drone_attributes import operation_to_attributes
+from file_based_pdp import FileBasedPDP
+from tenant_policies import TenantPolicyCache, UnknownTenantError
+from weather_provider import MetarFileSource, MetarServiceSource, WeatherProvider, WeatherUnavailable, load_stations
+import atexit
 import json
 import logging
 import os
+import time
+from dataclasses import asdict
 from datetime import datetime
 from reportlab.lib.pagesizes import letter
 from reportlab.lib import colors
@@ -25,6 +38,48 @@ logger = logging.getLogger("faa-rules-api")
 
 app = Flask(__name__)
 evaluator = FAADroneRulesEvaluator()
+incremental_evaluator = IncrementalEvaluator(evaluator)
+
+# Optional airspace/structure data (colon-separated GeoJSON paths); requests
+# with latitude and longitude then get their location fields derived from it
+airspace_paths = [path for path in os.environ.get('FAA_AIRSPACE_GEOJSON', '').split(os.pathsep) if path]
+airspace_index = AirspaceIndex.from_geojson(*airspace_paths) if airspace_paths else None
+
+# Optional pilot/aircraft registry; requests with pilot_id/aircraft_id then
+# get their certificate and equipment fields from it
+registry = DroneRegistry(os.environ['FAA_REGISTRY_DB']) if os.environ.get('FAA_REGISTRY_DB') else None
+
+# Optional METAR weather (station list plus files or a local service); requests
+# with latitude and longitude then get visibility and cloud distances from it
+weather_provider = None
+if os.environ.get('FAA_WEATHER_STATIONS'):
+    if os.environ.get('FAA_METAR_SERVICE'):
+        metar_source = MetarServiceSource(os.environ['FAA_METAR_SERVICE'])
+    else:
+        metar_source = MetarFileSource(*[path for path in os.environ.get('FAA_METAR_PATHS', '').split(os.pathsep) if path])
+    weather_provider = WeatherProvider(metar_source, load_stations(os.environ['FAA_WEATHER_STATIONS']))
+
+# Optional decision journal; every /api/evaluate and /api/evaluate/batch
+# decision is appended to it
+decision_journal = DecisionJournal(os.environ['FAA_JOURNAL_DIR']) if os.environ.get('FAA_JOURNAL_DIR') else None
+if decision_journal is not None:
+    atexit.register(decision_journal.close)
+
+# Optional XACML policy; requests with "explain": true then get the trace of
+# its evaluation (evaluation_trace.py) alongside the result
+explain_pdp = FileBasedPDP(os.environ['FAA_POLICY_FILE']) if os.environ.get('FAA_POLICY_FILE') else None
+
+# Optional per-tenant XACML policies (one file or policy directory per
+# tenant or jurisdiction, see tenant_policies.py); requests with a "tenant"
+# or "jurisdiction" are then decided by that tenant's policy. At most
+# FAA_TENANT_CACHE_SIZE policies stay compiled; the busiest tenants are
+# compiled again in the background when FAA_TENANT_WARM_UP lists them.
+tenant_policies = None
+if os.environ.get('FAA_TENANT_POLICY_DIR'):
+    tenant_policies = TenantPolicyCache(os.environ['FAA_TENANT_POLICY_DIR'],
+                                        int(os.environ.get('FAA_TENANT_CACHE_SIZE', 16)))
+    if os.environ.get('FAA_TENANT_WARM_UP'):
+        tenant_policies.warm_up([tenant for tenant in os.environ['FAA_TENANT_WARM_UP'].split(',') if tenant])
 
 # Create templates directory if it doesn't exist
 os.makedirs('templates', exist_ok=True)
@@ -239,7 +294,13 @@ with open('templates/index.html', 'w') as f:
     </div>
     
     <script>
-        function evaluateDrone() {
+        // Handle and form values of the last result, for what-if updates
+        let lastHandle = null;
+        let lastValues = null;
+        let requestInFlight = false;
+        let updatePending = false;
+        
+        function getFormData() {
             const form = document.getElementById('droneForm');
             const formData = new FormData(form);
             const data = {};
@@ -258,6 +319,38 @@ with open('templates/index.html', 'w') as f:
                 }
             }
             
+            return data;
+        }
+        
+        function showResult(result) {
+            const resultDiv = document.getElementById('result');
+            resultDiv.style.display = 'block';
+            
+            if (result.status === 'APPROVED') {
+                resultDiv.className = 'result approved';
+                resultDiv.innerHTML = `<h2>✅ APPROVED</h2><p>${result.details[0]}</p>`;
+            } else {
+                resultDiv.className = 'result denied';
+                let html = `<h2>❌ DENIED</h2><p>Your drone operation violates the following FAA rules:</p><ul>`;
+                for (const detail of result.details) {
+                    html += `<li>${detail}</li>`;
+                }
+                html += '</ul>';
+                resultDiv.innerHTML = html;
+            }
+        }
+        
+        function showError(error) {
+            console.error('Error:', error);
+            const resultDiv = document.getElementById('result');
+            resultDiv.style.display = 'block';
+            resultDiv.className = 'result denied';
+            resultDiv.innerHTML = `<h2>Error</h2><p>An error occurred: ${error.message}</p>`;
+        }
+        
+        function evaluateDrone() {
+            const data = getFormData();
+            
             fetch('/api/evaluate', {
                 method: 'POST',
                 headers: {
@@ -267,49 +360,77 @@ with open('templates/index.html', 'w') as f:
             })
             .then(response => response.json())
             .then(result => {
-                const resultDiv = document.getElementById('result');
-                resultDiv.style.display = 'block';
-                
-                if (result.status === 'APPROVED') {
-                    resultDiv.className = 'result approved';
-                    resultDiv.innerHTML = `<h2>✅ APPROVED</h2><p>${result.details[0]}</p>`;
-                } else {
-                    resultDiv.className = 'result denied';
-                    let html = `<h2>❌ DENIED</h2><p>Your drone operation violates the following FAA rules:</p><ul>`;
-                    for (const detail of result.details) {
-                        html += `<li>${detail}</li>`;
-                    }
-                    html += '</ul>';
-                    resultDiv.innerHTML = html;
-                }
+                lastHandle = result.handle || null;
+                lastValues = data;
+                showResult(result);
             })
-            .catch(error => {
-                console.error('Error:', error);
-                const resultDiv = document.getElementById('result');
-                resultDiv.style.display = 'block';
-                resultDiv.className = 'result denied';
-                resultDiv.innerHTML = `<h2>Error</h2><p>An error occurred: ${error.message}</p>`;
-            });
+            .catch(showError);
         }
         
-        function generateReport() {
-            const form = document.getElementById('droneForm');
-            const formData = new FormData(form);
-            const data = {};
+        // What-if mode: after the first evaluation every edit sends only the
+        // changed fields, and edits made while a request is running are
+        // coalesced into the next one
+        function updateWhatIf() {
+            if (lastHandle === null) {
+                return;
+            }
+            if (requestInFlight) {
+                updatePending = true;
+                return;
+            }
             
-            for (const [key, value] of formData.entries()) {
-                // Convert boolean strings to actual booleans
-                if (value === 'true' || value === 'false') {
-                    data[key] = value === 'true';
+            const data = getFormData();
+            const changes = {};
+            for (const key in data) {
+                if (data[key] !== lastValues[key]) {
+                    changes[key] = data[key];
                 }
-                // Convert numeric strings to numbers
-                else if (!isNaN(value) && value !== '') {
-                    data[key] = Number(value);
+            }
+            if (Object.keys(changes).length === 0) {
+                return;
+            }
+            
+            requestInFlight = true;
+            fetch('/api/evaluate/changes', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({handle: lastHandle, changes: changes}),
+            })
+            .then(response => {
+                if (response.status === 404) {
+                    // Handle expired on the server, start over with a full evaluation
+                    lastHandle = null;
+                    evaluateDrone();
+                    return null;
                 }
-                else {
-                    data[key] = value;
+                return response.json();
+            })
+            .then(result => {
+                // Incomplete input, e.g. an emptied number field, keeps the last result
+                if (result === null || result.status === 'ERROR') {
+                    return;
                 }
-            }
+                lastHandle = result.handle;
+                lastValues = data;
+                showResult(result);
+            })
+            .catch(showError)
+            .finally(() => {
+                requestInFlight = false;
+                if (updatePending) {
+                    updatePending = false;
+                    updateWhatIf();
+                }
+            });
+        }
+        
+        document.getElementById('droneForm').addEventListener('input', updateWhatIf);
+        document.getElementById('droneForm').addEventListener('change', updateWhatIf);
+        
+        function generateReport() {
+            const data = getFormData();
             
             fetch('/api/report', {
                 method: 'POST',
@@ -349,6 +470,95 @@ def index():
     """Render the web interface"""
     return render_template('index.html')
 
+# Request body keys that name something rather than give a field value
+IDENTIFIER_KEYS = ('pilot_id', 'aircraft_id', 'drone_id', 'tenant', 'jurisdiction')
+
+def operation_from_data(data):
+    """
+    Build a DroneOperation from a request body
+    
+    Location and weather fields are derived from latitude/longitude when
+    airspace data or weather stations are configured, and registry-backed fields are filled in by
+    evaluate_drone/evaluate_batch from pilot_id/aircraft_id.
+    """
+    # Convert boolean and numeric values; identifiers stay as sent
+    for key, value in data.items():
+        if isinstance(value, str) and key not in IDENTIFIER_KEYS:
+            if value.lower() == 'true':
+                data[key] = True
+            elif value.lower() == 'false':
+                data[key] = False
+            elif value.replace('.', '', 1).isdigit():
+                data[key] = float(value)
+    
+    if weather_provider is not None and data.get('latitude') is not None and data.get('longitude') is not None:
+        try:
+            data.update(weather_provider.weather(float(data['latitude']), float(data['longitude']),
+                                                 float(data.get('operating_altitude')), data.get('time') or time.time()))
+        except WeatherUnavailable as e:
+            # Fall back to the visibility and cloud distances in the request
+            logger.warning(f"Weather unavailable: {e}")
+    
+    operation = DroneOperation(
+        drone_category=data.get('drone_category'),
+        drone_weight=float(data.get('drone_weight')),
+        has_anti_collision_lighting=bool(data.get('has_anti_collision_lighting')),
+        has_remote_id=bool(data.get('has_remote_id')),
+        time_of_day=data.get('time_of_day'),
+        operating_over_people=bool(data.get('operating_over_people')),
+        operating_altitude=float(data.get('operating_altitude')),
+        operating_speed=float(data.get('operating_speed')),
+        airspace_class=data.get('airspace_class'),
+        flight_visibility=float(data.get('flight_visibility')),
+        distance_from_clouds_horizontal=float(data.get('distance_from_clouds_horizontal')),
+        distance_from_clouds_vertical=float(data.get('distance_from_clouds_vertical')),
+        # Optional parameters with default values
+        has_airworthiness_certificate=bool(data.get('has_airworthiness_certificate', False)),
+        complies_with_kinetic_energy_limit=bool(data.get('complies_with_kinetic_energy_limit', False)),
+        has_exposed_rotating_parts=bool(data.get('has_exposed_rotating_parts', False)),
+        is_within_400ft_of_structure=bool(data.get('is_within_400ft_of_structure', False)),
+        operating_altitude_above_structure=float(data.get('operating_altitude_above_structure', 0.0)),
+        is_airport_surface_area=bool(data.get('is_airport_surface_area', False)),
+        is_restricted_access_area=bool(data.get('is_restricted_access_area', False)),
+        people_are_participants=bool(data.get('people_are_participants', False)),
+        people_under_cover=bool(data.get('people_under_cover', False)),
+        pilot_has_night_training=bool(data.get('pilot_has_night_training', False)),
+        has_atc_authorization=bool(data.get('has_atc_authorization', False)),
+        remote_pilot_certificate=bool(data.get('remote_pilot_certificate', False))
+    )
+    
+    if airspace_index is not None and data.get('latitude') is not None and data.get('longitude') is not None:
+        operation = locate_operation(airspace_index, operation,
+                                     float(data['latitude']), float(data['longitude']))
+    return operation
+
+def request_tenant(data):
+    """The tenant or jurisdiction a request body names, or None"""
+    tenant = data.get('tenant') or data.get('jurisdiction')
+    return str(tenant) if tenant not in (None, '') else None
+
+def tenant_result(tenant, result):
+    """The response for a decision of a tenant's policy (a file_based_pdp.Result)"""
+    def directive(d):
+        return {"id": d.id, "policy_id": d.policy_id, "rule_id": d.rule_id,
+                "attributes": {name: list(value) if isinstance(value, tuple) else value
+                               for name, value in d.attributes.items()}}
+    return {
+        "status": "APPROVED" if result.decision == "Permit" else "DENIED",
+        "tenant": tenant,
+        "details": [d.attributes.get("message", d.id) for d in result.advice if result.decision == "Deny"],
+        "raw_decision": {
+            "decision": result.decision,
+            "obligations": [directive(d) for d in result.obligations],
+            "advice": [directive(d) for d in result.advice]
+        }
+    }
+
+def registry_ids(data):
+    """(pilot_id, aircraft_id) of a request body, as strings or None"""
+    return tuple(str(data[key]) if data.get(key) not in (None, '') else None
+                 for key in ('pilot_id', 'aircraft_id'))
+
 @app.route('/api/evaluate', methods=['POST'])
 def evaluate_drone():
     """API endpoint to evaluate drone operations"""
@@ -357,45 +567,12 @@ def evaluate_drone():
         data = request.json
         logger.info(f"Received evaluation request: {data}")
         
-        # Convert boolean and numeric values
-        for key, value in data.items():
-            if isinstance(value, str):
-                if value.lower() == 'true':
-                    data[key] = True
-                elif value.lower() == 'false':
-                    data[key] = False
-                elif value.replace('.', '', 1).isdigit():
-                    data[key] = float(value)
-        
         # Create DroneOperation object
         try:
-            operation = DroneOperation(
-                drone_category=data.get('drone_category'),
-                drone_weight=float(data.get('drone_weight')),
-                has_anti_collision_lighting=bool(data.get('has_anti_collision_lighting')),
-                has_remote_id=bool(data.get('has_remote_id')),
-                time_of_day=data.get('time_of_day'),
-                operating_over_people=bool(data.get('operating_over_people')),
-                operating_altitude=float(data.get('operating_altitude')),
-                operating_speed=float(data.get('operating_speed')),
-                airspace_class=data.get('airspace_class'),
-                flight_visibility=float(data.get('flight_visibility')),
-                distance_from_clouds_horizontal=float(data.get('distance_from_clouds_horizontal')),
-                distance_from_clouds_vertical=float(data.get('distance_from_clouds_vertical')),
-                # Optional parameters with default values
-                has_airworthiness_certificate=bool(data.get('has_airworthiness_certificate', False)),
-                complies_with_kinetic_energy_limit=bool(data.get('complies_with_kinetic_energy_limit', False)),
-                has_exposed_rotating_parts=bool(data.get('has_exposed_rotating_parts', False)),
-                is_within_400ft_of_structure=bool(data.get('is_within_400ft_of_structure', False)),
-                operating_altitude_above_structure=float(data.get('operating_altitude_above_structure', 0.0)),
-                is_airport_surface_area=bool(data.get('is_airport_surface_area', False)),
-                is_restricted_access_area=bool(data.get('is_restricted_access_area', False)),
-                people_are_participants=bool(data.get('people_are_participants', False)),
-                people_under_cover=bool(data.get('people_under_cover', False)),
-                pilot_has_night_training=bool(data.get('pilot_has_night_training', False)),
-                has_atc_authorization=bool(data.get('has_atc_authorization', False)),
-                remote_pilot_certificate=bool(data.get('remote_pilot_certificate', False))
-            )
+            operation = operation_from_data(data)
+            pilot_id, aircraft_id = registry_ids(data)
+            if registry is not None and (pilot_id or aircraft_id):
+                operation = registry.fill_operation(operation, pilot_id, aircraft_id)
         except Exception as e:
             logger.error(f"Error creating DroneOperation: {e}")
             return jsonify({
@@ -403,10 +580,132 @@ def evaluate_drone():
                 "message": f"Invalid operation data: {str(e)}"
             }), 400
         
-        # Evaluate operation
-        result = evaluator.evaluate_operation(operation)
+        tenant = request_tenant(data)
+        if tenant is not None:
+            return evaluate_tenant(tenant, operation, bool(data.get('explain')))
+        
+        if data.get('explain') and explain_pdp is None:
+            return jsonify({
+                "status": "ERROR",
+                "message": "Explain mode requires FAA_POLICY_FILE to be set"
+            }), 400
+        
+        # Evaluate operation; the result's handle allows follow-up what-if changes
+        result = incremental_evaluator.evaluate(operation)
         logger.info(f"Evaluation result: {result}")
+        if data.get('explain'):
+            result["explanation"] = explain_pdp.explain(operation_to_attributes(operation))
+        if decision_journal is not None:
+            decision_journal.append(*incremental_evaluator.evaluation(result["handle"]),
+                                    drone_id=aircraft_id or data.get('drone_id') or '')
+        
+        return jsonify(result)
+    
+    except Exception as e:
+        logger.exception(f"Error processing request: {e}")
+        return jsonify({
+            "status": "ERROR",
+            "message": str(e)
+        }), 500
+
+def evaluate_tenant(tenant, operation, explain=False):
+    """Response of /api/evaluate for a request naming a tenant"""
+    if tenant_policies is None:
+        return jsonify({
+            "status": "ERROR",
+            "message": "Tenant requests require FAA_TENANT_POLICY_DIR to be set"
+        }), 400
+    attributes = operation_to_attributes(operation)
+    try:
+        if explain:
+            explanation = tenant_policies.explain(tenant, attributes)
+            result = tenant_policies.pdp(tenant).evaluate_result(attributes)
+        else:
+            result = tenant_policies.evaluate_result(tenant, attributes)
+    except UnknownTenantError as e:
+        return jsonify({
+            "status": "ERROR",
+            "message": str(e)
+        }), 404
+    response = tenant_result(tenant, result)
+    if explain:
+        response["explanation"] = explanation
+    logger.info(f"Evaluation result for tenant {tenant}: {response['status']}")
+    return jsonify(response)
+
+@app.route('/api/evaluate/batch', methods=['POST'])
+def evaluate_batch():
+    """API endpoint to evaluate many drone operations in one request"""
+    try:
+        data = request.json or {}
+        items = data.get('operations') or []
+        logger.info(f"Received batch of {len(items)} operations")
+        
+        try:
+            operations = [operation_from_data(item) for item in items]
+            ids = [registry_ids(item) for item in items]
+            tenants = [request_tenant(item) for item in items]
+            if any(tenants):
+                if tenant_policies is None:
+                    raise ValueError("tenant requests require FAA_TENANT_POLICY_DIR to be set")
+                for tenant in set(filter(None, tenants)):
+                    tenant_policies.policy_path(tenant)
+            if registry is not None and any(pilot_id or aircraft_id for pilot_id, aircraft_id in ids):
+                # Registry records for the whole batch are prefetched together
+                operations = registry.fill_operations([(operation, pilot_id, aircraft_id)
+                                                       for operation, (pilot_id, aircraft_id) in zip(operations, ids)])
+        except Exception as e:
+            logger.error(f"Error creating DroneOperation: {e}")
+            return jsonify({
+                "status": "ERROR",
+                "message": f"Invalid operation data: {str(e)}"
+            }), 400
         
+        results = []
+        for item, operation, (_, aircraft_id), tenant in zip(items, operations, ids, tenants):
+            if tenant is not None:
+                results.append(tenant_result(tenant, tenant_policies.evaluate_result(
+                    tenant, operation_to_attributes(operation))))
+                continue
+            outcomes = evaluator.evaluate_rules(operation)
+            results.append(evaluator.result_from_outcomes(outcomes))
+            if decision_journal is not None:
+                decision_journal.append(operation, outcomes, drone_id=aircraft_id or item.get('drone_id') or '')
+        logger.info(f"Batch evaluated: {sum(r['status'] == 'APPROVED' for r in results)} of {len(results)} approved")
+        
+        return jsonify({"results": results})
+    
+    except Exception as e:
+        logger.exception(f"Error processing request: {e}")
+        return jsonify({
+            "status": "ERROR",
+            "message": str(e)
+        }), 500
+
+@app.route('/api/evaluate/changes', methods=['POST'])
+def evaluate_changes():
+    """API endpoint to re-evaluate a previous result with some fields changed"""
+    try:
+        data = request.json or {}
+        handle = data.get('handle')
+        changes = data.get('changes') or {}
+        logger.info(f"Received change request for {handle}: {changes}")
+        
+        try:
+            result = incremental_evaluator.evaluate_changes(handle, changes)
+        except UnknownHandleError:
+            return jsonify({
+                "status": "ERROR",
+                "message": "Unknown or expired result handle, evaluate the full operation"
+            }), 404
+        except (KeyError, ValueError) as e:
+            logger.error(f"Invalid changes: {e}")
+            return jsonify({
+                "status": "ERROR",
+                "message": f"Invalid changes: {str(e)}"
+            }), 400
+        
+        logger.info(f"Re-evaluated rules {result['reevaluated_rules']}: {result['status']}")
         return jsonify(result)
     
     except Exception as e:
@@ -416,6 +715,45 @@ def evaluate_drone():
             "message": str(e)
         }), 500
 
+@app.route('/api/evaluate/flight-plan', methods=['POST'])
+def evaluate_plan():
+    """API endpoint to evaluate every segment of a waypoint route in one request"""
+    try:
+        data = request.json or {}
+        waypoints = data.get('waypoints') or []
+        logger.info(f"Received flight plan with {len(waypoints)} waypoints")
+        
+        try:
+            plan = FlightPlan.from_request(data.get('operation') or {}, waypoints)
+        except (KeyError, ValueError) as e:
+            logger.error(f"Invalid flight plan: {e}")
+            return jsonify({
+                "status": "ERROR",
+                "message": f"Invalid flight plan: {str(e)}"
+            }), 400
+        
+        result = evaluate_flight_plan(plan)
+        logger.info(f"Flight plan result: {len(result.intervals)} violation intervals over {result.segment_count} segments")
+        
+        return jsonify(result.to_dict())
+    
+    except Exception as e:
+        logger.exception(f"Error processing request: {e}")
+        return jsonify({
+            "status": "ERROR",
+            "message": str(e)
+        }), 500
+
+@app.route('/api/tenants/metrics')
+def tenant_metrics():
+    """API endpoint with the per-tenant policy cache metrics"""
+    if tenant_policies is None:
+        return jsonify({
+            "status": "ERROR",
+            "message": "FAA_TENANT_POLICY_DIR is not set"
+        }), 404
+    return jsonify(tenant_policies.metrics())
+
 @app.route('/api/docs')
 def api_docs():
     """API documentation endpoint"""
@@ -452,24 +790,114 @@ def api_docs():
                     "people_under_cover": "boolean (optional)",
                     "pilot_has_night_training": "boolean (optional)",
                     "has_atc_authorization": "boolean (optional)",
-                    "remote_pilot_certificate": "boolean (optional)"
+                    "remote_pilot_certificate": "boolean (optional)",
+                    "latitude": "number (optional, degrees)",
+                    "longitude": "number (optional, degrees); with latitude and FAA_AIRSPACE_GEOJSON set, airspace_class, is_airport_surface_area, is_within_400ft_of_structure and operating_altitude_above_structure are derived from the airspace data",
+                    "time": "string (optional, ISO 8601, default now); with latitude, longitude and FAA_WEATHER_STATIONS set, flight_visibility and the cloud distances come from the nearest station's METAR at this time",
+                    "pilot_id": "string (optional); with FAA_REGISTRY_DB set, pilot_has_night_training and remote_pilot_certificate come from the registry",
+                    "aircraft_id": "string (optional); with FAA_REGISTRY_DB set, has_remote_id and has_airworthiness_certificate come from the registry",
+                    "drone_id": "string (optional), recorded in the decision journal when FAA_JOURNAL_DIR is set (default: aircraft_id)",
+                    "explain": "boolean (optional); with FAA_POLICY_FILE set, also return the trace of the XACML policy's evaluation",
+                    "tenant": "string (optional); with FAA_TENANT_POLICY_DIR set, the operation is decided by this tenant's XACML policy instead of the built-in rules, without a handle or a journal record",
+                    "jurisdiction": "string (optional), same as tenant"
                 },
                 "responses": {
                     "200": {
                         "status": "string (APPROVED or DENIED)",
                         "details": "array of strings with details",
-                        "raw_decision": "object with raw decision details"
+                        "raw_decision": "object with raw decision details",
+                        "handle": "string, result handle for /api/evaluate/changes",
+                        "explanation": "object (with explain): decision, per-policy and per-rule Target matches, Condition values, combining order and timings in microseconds",
+                        "tenant": "string (with tenant); raw_decision then holds the XACML decision, obligations and advice, and details the messages of the Deny advice"
                     },
                     "400": {
                         "status": "ERROR",
                         "message": "Error details"
                     },
+                    "404": {
+                        "status": "ERROR",
+                        "message": "Unknown tenant"
+                    },
                     "500": {
                         "status": "ERROR",
                         "message": "Error details"
                     }
                 }
             },
+            {
+                "path": "/api/evaluate/batch",
+                "method": "POST",
+                "description": "Evaluate many drone operations; registry records for the batch are fetched together",
+                "request_body": {
+                    "operations": "array of objects, same fields as /api/evaluate; each may name its own tenant"
+                },
+                "responses": {
+                    "200": {
+                        "results": "array of results as returned by /api/evaluate, without handles"
+                    },
+                    "400": {
+                        "status": "ERROR",
+                        "message": "Error details, including unknown pilot or aircraft ids and tenants"
+                    }
+                }
+            },
+            {
+                "path": "/api/tenants/metrics",
+                "method": "GET",
+                "description": "Per-tenant policy cache metrics, with FAA_TENANT_POLICY_DIR set",
+                "responses": {
+                    "200": {
+                        "max_entries": "number, compiled policies kept (FAA_TENANT_CACHE_SIZE)",
+                        "loaded": "array of the tenants whose policy is compiled, least recently used first",
+                        "tenants": "object, per tenant: requests, decisions by type, loads, evictions, load_seconds and mean_evaluation_us"
+                    },
+                    "404": {
+                        "status": "ERROR",
+                        "message": "FAA_TENANT_POLICY_DIR is not set"
+                    }
+                }
+            },
+            {
+                "path": "/api/evaluate/changes",
+                "method": "POST",
+                "description": "Re-evaluate a previous result with some fields changed; only the rules that depend on them are re-run",
+                "request_body": {
+                    "handle": "string, handle of a previous evaluation",
+                    "changes": "object with the changed fields, same names and types as /api/evaluate"
+                },
+                "responses": {
+                    "200": "Same as /api/evaluate, plus reevaluated_rules (array of rule ids)",
+                    "400": {
+                        "status": "ERROR",
+                        "message": "Error details"
+                    },
+                    "404": {
+                        "status": "ERROR",
+                        "message": "Unknown or expired result handle"
+                    }
+                }
+            },
+            {
+                "path": "/api/evaluate/flight-plan",
+                "method": "POST",
+                "description": "Evaluate every segment of a waypoint route; segment i runs from waypoint i to waypoint i + 1",
+                "request_body": {
+                    "operation": "object with the fields that stay fixed along the route, same names and types as /api/evaluate",
+                    "waypoints": "array of objects with the fields that change along the route; a missing field keeps the previous waypoint's value"
+                },
+                "responses": {
+                    "200": {
+                        "status": "string (APPROVED or DENIED)",
+                        "segment_count": "number",
+                        "first_violation": "object with the first violating segment, its rule ids and details, or null",
+                        "violation_intervals": "array of {rule_id, first_segment, last_segment, message}"
+                    },
+                    "400": {
+                        "status": "ERROR",
+                        "message": "Error details"
+                    }
+                }
+            },
             {
                 "path": "/api/report",
                 "method": "POST",
@@ -544,7 +972,7 @@ def generate_compliance_report(operation, result):
     elements.append(Paragraph("Drone Characteristics", styles['SectionHeader']))
     
     # Convert operation dataclass to dictionary
-    op_dict = operation.__dict__
+    op_dict = asdict(operation)
     
     drone_data = [
         ["Parameter", "Value"],
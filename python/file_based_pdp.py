@@ -1,41 +1,407 @@
 #!/usr/bin/env python3
 
 import os
+import copy
+import threading
 import xml.etree.ElementTree as ET
-from lxml import etree
-import re
 import logging
+from types import MappingProxyType
+from functools import partial
+from time import perf_counter_ns
+from typing import Any, Dict, Mapping, NamedTuple, Optional, Tuple
+
+from policy_compiler import ObligationExpression, PolicyReference, PolicySet, compile_policy, short_id
+from policy_artifact import is_artifact, read_artifact
+from xacml_functions import FunctionCompileError, Indeterminate, compile_condition, compile_expression, compile_target
+from decision_table import build_decision_table, load_decision_table, save_decision_table, policy_checksum
+from partial_evaluation import specialize_policy_set, unresolved_attributes
+from evaluation_trace import explain
+from policy_directory import PolicyDirectory, PolicyReferenceError
+from combining_algorithms import (INDETERMINATE, INDETERMINATE_D, INDETERMINATE_P, PERMIT,
+                                  lookup_combining_algorithm, plain_decision)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Python type of an assignment value -> XML Schema data type in a response
+_RESPONSE_DATA_TYPES = {bool: 'boolean', float: 'double', int: 'integer', str: 'string'}
+
+class Directive(NamedTuple):
+    """
+    An Obligation or Advice returned with a decision
+
+    `policy_id` and `rule_id` name where it was declared: policy_id is
+    the PolicyId, or the PolicySetId of a policy set's, and rule_id is
+    None unless a rule declared it;
+    `attributes` maps each assigned attribute id to its value, a tuple
+    when the expression returned several.
+    """
+    id: str
+    policy_id: Optional[str]
+    rule_id: Optional[str]
+    attributes: Dict[str, Any]
+
+class Result(NamedTuple):
+    """A decision with its Obligations and Advice"""
+    decision: str
+    obligations: Tuple[Directive, ...] = ()
+    advice: Tuple[Directive, ...] = ()
+
+class PolicySnapshot(NamedTuple):
+    """
+    Everything one loaded policy evaluates with; never modified after
+    construction, so any number of threads can evaluate against it
+    """
+    policy_set: Any
+    # Every Policy, nested PolicySets flattened, in evaluation order
+    policies: Tuple[Any, ...]
+    # Per policy: (policy, target, ((rule, target, condition), ...))
+    compiled: Tuple[tuple, ...]
+    # id(policy) -> entry of compiled
+    compiled_by_id: Mapping[int, tuple]
+    policy_combining_alg: str
+    decision_table: Optional[Any] = None
+    # id(rule, policy or policy set) -> its compiled Obligation and Advice
+    # expressions: ((is_obligation, id, applies_to, ((attribute_id, evaluator), ...)), ...)
+    expressions: Mapping[int, tuple] = MappingProxyType({})
+    # The policy set as evaluated: (policy_set, target, children), each
+    # child an entry of compiled, a nested policy set in the same form or
+    # (reference, None, resolve) for a PolicyReference, resolve()
+    # returning the referenced entry, compiled on first use. The children
+    # of a policy directory's top level are a policy_directory.TargetIndex.
+    root: tuple = ()
+    # The PolicyDirectory references are resolved from, if any
+    directory: Optional[Any] = None
+    # Decisions some Obligation or Advice in expressions applies to
+    expression_decisions: frozenset = frozenset()
+
+class _MappedTable(NamedTuple):
+    """A decision table mapped from a file before its policy is compiled"""
+    table: Any
+    checksum: str
+
 class FileBasedPDP:
     """
     A simplified file-based XACML Policy Decision Point
     This implementation uses a simplified approach to evaluate XACML policies
     without requiring a separate server
+    
+    Thread safety: evaluation is reentrant and takes no locks. All compiled
+    state lives in an immutable PolicySnapshot; each decision reads the
+    current snapshot once and uses only it and per-call locals. reload()
+    builds a new snapshot and swaps it in with a single assignment, so
+    decisions in progress finish on the policy they started with. The
+    one lock is taken to compile a policy deferred behind a mapped
+    decision table file, once, on the first request the table cannot
+    decide.
     """
     
-    def __init__(self, policy_file):
+    def __init__(self, policy_file, use_decision_table=False, decision_table_file=None, pip=None,
+                 root_policy_id=None):
         """
         Initialize with path to XACML policy file
+        
+        The path may also be a directory of policy files, opened as a
+        policy_directory.PolicyDirectory: its documents are compiled
+        when first evaluated, and PolicyIdReference and
+        PolicySetIdReference are resolved among them. With
+        root_policy_id, that PolicySet is the top-level policy; without
+        it, every document is, combined with deny-overrides. `policies`
+        then holds only the policies compiled up front.
+        
+        With a pip (policy_information_point.PolicyInformationPoint),
+        attributes missing from a request are fetched from its finders
+        when the policy reads them.
+        
+        With use_decision_table, every decision is precomputed into a
+        dense table at load time (see decision_table.py); requests the
+        table cannot represent fall back to the interpreted path.
+        
+        With decision_table_file, the table is memory-mapped from that
+        file so worker processes share one copy; the file is (re)built
+        if it is missing or was built from a different policy. A PDP
+        that maps an up-to-date file does not compile the policy until
+        a request falls back from the table, or until an attribute or
+        method that needs the compiled policy is used.
         """
         self.policy_file = policy_file
-        self._load_policy()
+        self.pip = pip
+        self.use_decision_table = use_decision_table
+        self.decision_table_file = decision_table_file
+        self.root_policy_id = root_policy_id
+        # Set on PDPs returned by specialize()
+        self.known_attributes = {}
+        self.unresolved_attributes = frozenset()
+        self._compile_lock = threading.Lock()
+        # A PolicySnapshot, or a _MappedTable until the policy is needed
+        self._current = self._load_snapshot()
+    
+    @property
+    def _snapshot(self):
+        snapshot = self._current
+        if type(snapshot) is PolicySnapshot:
+            return snapshot
+        with self._compile_lock:
+            if self._current is snapshot:
+                self._current = self._compile_deferred(snapshot)
+            return self._current
+    
+    @_snapshot.setter
+    def _snapshot(self, snapshot):
+        self._current = snapshot
+    
+    def _compile_deferred(self, mapped):
+        """The snapshot of a policy whose decision table was mapped without compiling it"""
+        logger.info(f"Compiling {self.policy_file} for requests outside the decision table")
+        snapshot = self._compile_snapshot()
+        if policy_checksum(self.policy_file, self.root_policy_id) != mapped.checksum:
+            # Changed since the table was mapped: decide by the policy as compiled
+            logger.warning(f"{self.policy_file} changed after {self.decision_table_file} was mapped, "
+                           f"not using the decision table")
+            return snapshot
+        return snapshot._replace(decision_table=mapped.table)
+    
+    @property
+    def snapshot(self):
+        """The PolicySnapshot decisions are currently made with"""
+        return self._snapshot
+    
+    @property
+    def policy_set(self):
+        return self._snapshot.policy_set
+    
+    @property
+    def policies(self):
+        return self._snapshot.policies
+    
+    @property
+    def decision_table(self):
+        current = self._current
+        return current.table if type(current) is _MappedTable else current.decision_table
+    
+    def reload(self):
+        """
+        Re-read the policy file (and rebuild or remap the decision table)
+        and switch to it atomically
+        """
+        self._snapshot = self._load_snapshot()
+    
+    def _load_snapshot(self):
+        """
+        Map an up-to-date decision table file, deferring the policy, or
+        load the policy and build its decision table
+        """
+        if self.decision_table_file:
+            mapped = self._map_decision_table()
+            if mapped is not None:
+                return mapped
         
-    def _load_policy(self):
+        snapshot = self._compile_snapshot()
+        if self.decision_table_file:
+            snapshot = snapshot._replace(decision_table=self._save_decision_table(snapshot))
+        elif self.use_decision_table:
+            snapshot = snapshot._replace(decision_table=self._build_decision_table(snapshot))
+        return snapshot
+    
+    def _compile_snapshot(self):
         """
-        Load and parse the XACML policy file
+        Load and compile the XACML policy file, or load a precompiled artifact
         """
         try:
             logger.info(f"Loading policy from {self.policy_file}")
-            self.policy_tree = ET.parse(self.policy_file)
-            self.policy_root = self.policy_tree.getroot()
+            directory = None
+            if os.path.isdir(self.policy_file):
+                directory = PolicyDirectory(self.policy_file, self.root_policy_id)
+                policy_set = directory.root_policy_set()
+                logger.info(f"Found {len(directory)} policy documents")
+            elif is_artifact(self.policy_file):
+                # Precompiled by compile_policy.py, no XML parsing needed
+                policy_set, _ = read_artifact(self.policy_file)
+            else:
+                policy_set = compile_policy(self.policy_file)
+            snapshot = self._build_snapshot(policy_set, directory)
             logger.info("Policy loaded successfully")
         except Exception as e:
             logger.error(f"Error loading policy: {e}")
             raise
+        return snapshot
+    
+    def _build_snapshot(self, policy_set, directory=None):
+        """
+        Compile a policy set, with its policies and nested policy sets, into
+        a PolicySnapshot; references are resolved from `directory` when
+        first evaluated
+        """
+        compiled = []
+        # Filled further as references are resolved
+        expressions = {}
+        resolved = {}
+        
+        def add_expressions(node, where):
+            if node.obligations or node.advice:
+                expressions[id(node)] = self._compile_result_expressions(node, where)
+        
+        def compile_child(child, eager=True):
+            if isinstance(child, PolicySet):
+                return compile_policy_set(child, eager)
+            if isinstance(child, PolicyReference):
+                if directory is None:
+                    logger.warning(f"{child.reference_id}: no policy directory to resolve the reference from, "
+                                   f"it evaluates to Indeterminate")
+                return (child, None, partial(resolve, child))
+            entry = self._compile_policy(child)
+            if eager:
+                compiled.append(entry)
+            add_expressions(child, child.policy_id)
+            for rule in child.rules:
+                add_expressions(rule, f"{child.policy_id}/{rule.rule_id}")
+            return entry
+        
+        def compile_policy_set(node, eager=True):
+            where = node.policy_set_id
+            if lookup_combining_algorithm(node.policy_combining_alg) is None:
+                logger.warning(f"{where}: unsupported policy combining algorithm {node.policy_combining_alg}, "
+                               f"the policy set evaluates to Indeterminate")
+            add_expressions(node, where)
+            children = tuple(compile_child(child, eager) for child in node.policies)
+            return (node, self._compile(compile_target, node.target, where), children)
+        
+        def resolve(reference):
+            # Two threads may both compile a document; either entry will do
+            entry = resolved.get(reference)
+            if entry is None:
+                if directory is None:
+                    raise PolicyReferenceError(f"No policy directory to resolve {reference.reference_id} from")
+                entry = resolved[reference] = compile_child(directory.load(reference), eager=False)
+            return entry
+        
+        root = compile_policy_set(policy_set)
+        if directory is not None:
+            index = directory.target_index(policy_set, root[2])
+            if index is not None:
+                root = (root[0], root[1], index)
+        return PolicySnapshot(policy_set, tuple(entry[0] for entry in compiled), tuple(compiled),
+                              MappingProxyType({id(entry[0]): entry for entry in compiled}),
+                              short_id(policy_set.policy_combining_alg),
+                              expressions=MappingProxyType(expressions), root=root, directory=directory,
+                              expression_decisions=frozenset(applies_to for node_expressions in expressions.values()
+                                                             for _, _, applies_to, _ in node_expressions))
+    
+    def specialize(self, known_attributes):
+        """
+        A PDP for requests that all carry `known_attributes`
+        ({category: {attribute_id: value}}), evaluating the residual of
+        the current policy after partial evaluation (partial_evaluation.py)
+        
+        Requests to it may leave out the known attributes unless
+        `unresolved_attributes` of the returned PDP lists some. It has no
+        decision table and does not follow reload().
+        """
+        snapshot = self._snapshot
+        policy_set = snapshot.policy_set
+        if snapshot.directory is not None:
+            # Partial evaluation needs the whole policy
+            policy_set = snapshot.directory.inline(policy_set)
+        residual = specialize_policy_set(policy_set, known_attributes)
+        pdp = self._with_snapshot(self._build_snapshot(residual))
+        pdp.known_attributes = known_attributes
+        pdp.unresolved_attributes = frozenset(unresolved_attributes(residual, known_attributes))
+        return pdp
+    
+    def optimize_order(self, requests):
+        """
+        Reorder rules and policies for the requests this PDP sees
+    
+        `requests` are representative request attributes. Under combining
+        algorithms that may evaluate in any order (ordered=False in
+        combining_algorithms.py) and stop on a decision, the rules and
+        policies that yield that decision most often per nanosecond of
+        evaluation go first; the ones that cannot yield it keep their
+        relative order after them. Decisions do not change, but where
+        several rules could have decided, which ones' Obligations and
+        Advice are returned may. The order lasts until reload(). The
+        top level of a policy directory keeps its order, and referenced
+        documents are evaluated but not reordered.
+    
+        Returns the reordered policy set.
+        """
+        if self.pip is not None:
+            requests = [self.pip.resolve(attributes) for attributes in requests]
+        snapshot = self._snapshot
+        policy_set = self._reordered_policy_set(snapshot.root, requests)
+        self._snapshot = self._build_snapshot(policy_set, snapshot.directory)._replace(
+            decision_table=snapshot.decision_table)
+        return policy_set
+    
+    def _reordered_policy_set(self, node, requests):
+        policy_set, _, children = node
+        if type(children) is not tuple:
+            return policy_set
+        policies = [self._reordered_policy_set(child, requests) if type(child[0]) is PolicySet
+                    else child[0] if type(child[0]) is PolicyReference
+                    else self._reordered_policy(child, requests) for child in children]
+        algorithm = lookup_combining_algorithm(policy_set.policy_combining_alg)
+        if algorithm is None or algorithm.ordered or algorithm.stops_on is None:
+            return policy_set._replace(policies=tuple(policies))
+    
+        stops_on = algorithm.stops_on
+        evaluators = []
+        for child in children:
+            evaluators.append((lambda attributes, child=child: self._evaluate_child(child, attributes),
+                               lambda decision: decision == stops_on))
+        order = _selectivity_order(evaluators, requests)
+        return policy_set._replace(policies=tuple(policies[index] for index in order))
+    
+    def _reordered_policy(self, compiled, requests):
+        policy, _, rules = compiled
+        algorithm = lookup_combining_algorithm(policy.rule_combining_alg)
+        if algorithm is None or algorithm.ordered or algorithm.stops_on is None:
+            return policy
+    
+        evaluators = []
+        for rule, target, condition in rules:
+            if rule.effect != algorithm.stops_on:
+                evaluators.append((None, None))
+                continue
+            evaluators.append((lambda attributes, rule=rule, target=target, condition=condition:
+                               self._evaluate_rule(rule, target, condition, attributes),
+                               lambda outcome: outcome is True))
+        order = _selectivity_order(evaluators, requests)
+        return policy._replace(rules=tuple(policy.rules[index] for index in order))
+    
+    def _with_snapshot(self, snapshot):
+        """A PDP evaluating with `snapshot`, used to build its decision table"""
+        pdp = copy.copy(self)
+        pdp._snapshot = snapshot
+        return pdp
+    
+    def _map_decision_table(self):
+        """
+        Memory-map the decision table file if it was built from the current
+        policy; None if it has to be rebuilt
+        """
+        try:
+            checksum = policy_checksum(self.policy_file, self.root_policy_id)
+            table = load_decision_table(self.decision_table_file, checksum)
+        except (OSError, ValueError) as e:
+            logger.info(f"Rebuilding decision table file {self.decision_table_file}: {e}")
+            return None
+        logger.info(f"Mapped decision table from {self.decision_table_file}")
+        return _MappedTable(table, checksum)
+    
+    def _save_decision_table(self, snapshot):
+        """Build the decision table into the decision table file and memory-map it"""
+        checksum = policy_checksum(self.policy_file, self.root_policy_id)
+        save_decision_table(self._build_decision_table(snapshot), self.decision_table_file, checksum)
+        return load_decision_table(self.decision_table_file, checksum)
+    
+    def _build_decision_table(self, snapshot):
+        # A policy directory is tabulated with its references inlined
+        policy_set = snapshot.policy_set
+        if snapshot.directory is not None:
+            policy_set = snapshot.directory.inline(policy_set)
+        return build_decision_table(policy_set, self._with_snapshot(snapshot))
     
     def evaluate(self, request_xml):
         """
@@ -43,27 +409,189 @@ class FileBasedPDP:
         Returns a simplified XACML response
         """
         try:
-            logger.info("Evaluating XACML request")
+            logger.debug("Evaluating XACML request")
             
             # Parse request XML
             request_root = ET.fromstring(request_xml)
             
             # Extract request attributes for easier access
             attributes = self._extract_attributes(request_root)
+            if self.pip is not None:
+                attributes = self.pip.resolve(attributes)
             
             # Simplified evaluation: check policies in order
-            decision = self._evaluate_policies(attributes)
+            result = self._evaluate_result(self._snapshot, attributes)
             
             # Create response XML
-            response_xml = self._create_response(decision)
+            response_xml = self._create_response(result.decision, result.obligations, result.advice)
             
-            logger.info(f"Evaluation complete, decision: {decision}")
+            logger.debug(f"Evaluation complete, decision: {result.decision}")
             return response_xml
         
         except Exception as e:
             logger.error(f"Error evaluating request: {e}")
             return self._create_response("Indeterminate")
     
+    def evaluate_attributes(self, attributes):
+        """
+        Evaluate already-extracted request attributes against the policy
+        
+        `attributes` has the same shape as `_extract_attributes` output:
+        {category: {attribute_id: value}}. Returns the decision string and
+        skips the XML request/response round trip.
+        """
+        if self.pip is not None:
+            attributes = self.pip.resolve(attributes)
+        try:
+            return self._decide(attributes)
+        except Exception as e:
+            logger.error(f"Error evaluating attributes: {e}")
+            return "Indeterminate"
+    
+    def evaluate_result(self, attributes):
+        """
+        Decision for request attributes with the Obligations and Advice
+        that go with it, as a Result
+        
+        Obligations and Advice are evaluated in the same pass over the
+        policy as the decision, from the policies whose decision is the
+        final one: the expressions of the policy itself (and of the policy
+        set) whose FulfillOn/AppliesTo is the decision, and those of its
+        rules that took part in it. A rule takes part when it yielded its
+        Effect, or - as an extension of XACML, where such expressions
+        never apply - when it applied but did not yield its Effect and the
+        decision is the opposite one; so the Deny Advice of a Permit rule
+        explains a Deny by the rule that failed.
+        
+        An obligation that evaluates to Indeterminate makes the decision
+        Indeterminate; an advice attribute that does is left out. With a
+        decision table (and no policy directory), the table decides and
+        the policy is walked only when Obligations or Advice may apply to
+        its decision.
+        """
+        if self.pip is not None:
+            attributes = self.pip.resolve(attributes)
+        try:
+            return self._evaluate_result(self._snapshot, attributes)
+        except Exception as e:
+            logger.error(f"Error evaluating attributes: {e}")
+            return Result("Indeterminate")
+    
+    def _evaluate_result(self, snapshot, attributes):
+        # A directory's expressions are only known once its references resolve
+        if snapshot.directory is None:
+            if not snapshot.expressions:
+                return Result(self._decide(attributes, snapshot))
+            if snapshot.decision_table is not None:
+                decision = self._decide(attributes, snapshot)
+                if decision not in snapshot.expression_decisions:
+                    return Result(decision)
+        
+        # Policies and policy sets in the order the combining algorithms
+        # consumed them: (policy, decision, consumed (rule, outcome) pairs)
+        # and (policy set, decision, its records)
+        records = []
+        decision = self._evaluate_policy_set(snapshot.root, attributes, records)
+        if decision not in ("Permit", "Deny"):
+            return Result(decision)
+        
+        obligations = []
+        advice = []
+        try:
+            self._fulfil_records(snapshot.policy_set, records, decision, snapshot.expressions, attributes,
+                                 obligations, advice)
+        except Indeterminate as e:
+            logger.debug(f"Obligation is Indeterminate: {e}")
+            return Result("Indeterminate")
+        return Result(decision, tuple(obligations), tuple(advice))
+    
+    def _fulfil_records(self, policy_set, records, decision, expressions, attributes, obligations, advice):
+        """Fulfil the expressions of a policy set that decided `decision` and of its parts that did"""
+        for node, node_decision, consumed in records:
+            if node_decision != decision:
+                continue
+            if isinstance(node, PolicySet):
+                self._fulfil_records(node, consumed, decision, expressions, attributes, obligations, advice)
+                continue
+            for rule, outcome in consumed:
+                if outcome is not None and (outcome is True) == (rule.effect == decision) \
+                        and id(rule) in expressions:
+                    self._fulfil(expressions[id(rule)], decision, node.policy_id, rule.rule_id,
+                                 attributes, obligations, advice)
+            if id(node) in expressions:
+                self._fulfil(expressions[id(node)], decision, node.policy_id, None, attributes, obligations, advice)
+        if id(policy_set) in expressions:
+            self._fulfil(expressions[id(policy_set)], decision, policy_set.policy_set_id, None,
+                         attributes, obligations, advice)
+    
+    def _fulfil(self, expressions, decision, policy_id, rule_id, attributes, obligations, advice):
+        """Evaluate the Obligation and Advice expressions that apply to a decision"""
+        for is_obligation, directive_id, applies_to, assignments in expressions:
+            if applies_to != decision:
+                continue
+            values = {}
+            for attribute_id, evaluate in assignments:
+                try:
+                    value = evaluate(attributes)
+                except Indeterminate as e:
+                    if is_obligation:
+                        raise
+                    logger.debug(f"Advice {directive_id} attribute {attribute_id} is Indeterminate: {e}")
+                    continue
+                if type(value) is tuple:
+                    # A bag: no value assigns nothing, one is assigned as is
+                    if not value:
+                        continue
+                    value = value[0] if len(value) == 1 else value
+                values[attribute_id] = value
+            (obligations if is_obligation else advice).append(Directive(directive_id, policy_id, rule_id, values))
+    
+    def explain(self, attributes):
+        """
+        Decision for request attributes with the trace of how it was made
+        (evaluation_trace.py): Target matches, Condition sub-expression
+        values, combining steps and timings, as a dict of JSON values
+        
+        The trace is recorded on a separate evaluation path; the other
+        evaluate methods do no trace bookkeeping.
+        """
+        if self.pip is not None:
+            attributes = self.pip.resolve(attributes)
+        return explain(self, attributes, self._snapshot)
+    
+    def evaluate_batch(self, requests):
+        """
+        Decisions for a list of request attribute dicts
+        
+        With a pip, each attribute finder is queried at most once for the
+        whole batch.
+        """
+        if self.pip is not None:
+            requests = self.pip.resolve_batch(requests)
+        decisions = []
+        for attributes in requests:
+            try:
+                decisions.append(self._decide(attributes))
+            except Exception as e:
+                logger.error(f"Error evaluating attributes: {e}")
+                decisions.append("Indeterminate")
+        return decisions
+    
+    def _decide(self, attributes, snapshot=None):
+        """
+        Decision from the decision table if enabled, else from the policies
+        """
+        current = snapshot or self._current
+        table = current.table if type(current) is _MappedTable else current.decision_table
+        if table is not None:
+            try:
+                return table.decide(attributes)
+            except (KeyError, ValueError, TypeError):
+                # Missing attribute, value outside the table's classes or a bag
+                pass
+        
+        return self._evaluate_policies(snapshot or self._snapshot, attributes)
+    
     def _extract_attributes(self, request_root):
         """
         Extract attributes from request XML for easier processing
@@ -81,9 +609,9 @@ class FileBasedPDP:
             for attr_elem in category_elem.findall('.//{*}Attribute'):
                 attr_id = attr_elem.get('AttributeId')
                 
-                # Get attribute value
-                value_elem = attr_elem.find('.//{*}AttributeValue')
-                if value_elem is not None:
+                # Get attribute values; several values form a bag
+                values = []
+                for value_elem in attr_elem.findall('.//{*}AttributeValue'):
                     data_type = value_elem.get('DataType').split('#')[-1]  # Get just the type name
                     value = value_elem.text
                     
@@ -92,478 +620,234 @@ class FileBasedPDP:
                         value = value.lower() == 'true'
                     elif data_type in ('integer', 'double'):
                         value = float(value)
-                        
-                    attributes[category][attr_id] = value
+                    
+                    values.append(value)
+                
+                if len(values) == 1:
+                    attributes[category][attr_id] = values[0]
+                elif values:
+                    attributes[category][attr_id] = values
         
         return attributes
     
-    def _evaluate_policies(self, attributes):
+    def _evaluate_policies(self, snapshot, attributes):
         """
         Evaluate policies in the policy set
         """
-        # Get policy combining algorithm from PolicySet
-        policy_combining_alg = self.policy_root.get('PolicyCombiningAlgId').split(':')[-1]
-        logger.debug(f"Policy combining algorithm: {policy_combining_alg}")
-        
-        # Get all policies in the policy set
-        policies = self.policy_root.findall('.//{*}Policy')
-        
-        # For deny-unless-permit combining algorithm (default fallback)
-        has_applicable_policy = False
-        final_decision = "Deny"
-        
-        for policy in policies:
-            policy_id = policy.get('PolicyId')
-            
-            # Check if policy applies based on Target
-            if self._policy_applies(policy, attributes):
-                logger.info(f"Evaluating policy: {policy_id}")
-                has_applicable_policy = True
-                
-                # Get rule combining algorithm for this policy
-                rule_combining_alg = policy.get('RuleCombiningAlgId').split(':')[-1]
-                
-                # Evaluate rules based on combining algorithm
-                if rule_combining_alg == 'deny-unless-permit':
-                    policy_decision = self._evaluate_deny_unless_permit(policy, attributes)
-                elif rule_combining_alg == 'first-applicable':
-                    policy_decision = self._evaluate_first_applicable(policy, attributes)
-                else:
-                    # Default to permit-overrides for other algorithms
-                    policy_decision = self._evaluate_permit_overrides(policy, attributes)
-                
-                # Apply policy combining algorithm
-                if policy_combining_alg == 'ordered-permit-overrides':
-                    if policy_decision == "Permit":
-                        return "Permit"
-                elif policy_combining_alg == 'permit-overrides':
-                    if policy_decision == "Permit":
-                        return "Permit"
-                elif policy_combining_alg == 'deny-overrides':
-                    if policy_decision == "Deny":
-                        return "Deny"
-                    elif policy_decision == "Permit" and final_decision != "Deny":
-                        final_decision = "Permit"
-                elif policy_combining_alg == 'first-applicable':
-                    if policy_decision in ("Permit", "Deny"):
-                        return policy_decision
-        
-        if not has_applicable_policy:
-            # If no policy applies, return NotApplicable
-            return "NotApplicable"
-        
-        return final_decision
-    
-    def _policy_applies(self, policy, attributes):
-        """
-        Check if policy applies based on Target match
-        """
-        target = policy.find('.//{*}Target')
-        
-        # If no Target, the policy applies to all requests
-        if target is None or len(list(target)) == 0:
-            return True
-        
-        # Check AnyOf elements
-        any_of_elements = target.findall('.//{*}AnyOf')
-        if not any_of_elements:
-            return True
-            
-        for any_of in any_of_elements:
-            any_match = False
-            
-            # Check AllOf elements (within AnyOf)
-            for all_of in any_of.findall('.//{*}AllOf'):
-                all_match = True
-                
-                # Check Match elements (within AllOf)
-                for match in all_of.findall('.//{*}Match'):
-                    match_id = match.get('MatchId').split(':')[-1]
-                    
-                    # Get attribute value from policy
-                    attr_value_elem = match.find('.//{*}AttributeValue')
-                    policy_value = attr_value_elem.text
-                    
-                    # Get attribute designator
-                    attr_desig = match.find('.//{*}AttributeDesignator')
-                    category = attr_desig.get('Category')
-                    attr_id = attr_desig.get('AttributeId')
-                    
-                    # Get request value
-                    if category in attributes and attr_id in attributes[category]:
-                        request_value = str(attributes[category][attr_id])
-                        
-                        # Perform match based on match type
-                        if match_id == 'string-equal':
-                            if policy_value != request_value:
-                                all_match = False
-                                break
-                        elif match_id == 'boolean-equal':
-                            if str(policy_value).lower() != str(request_value).lower():
-                                all_match = False
-                                break
-                        elif match_id == 'string-regexp-match':
-                            if not re.match(policy_value, request_value):
-                                all_match = False
-                                break
-                    else:
-                        # If attribute doesn't exist, no match
-                        all_match = False
-                        break
-                
-                if all_match:
-                    any_match = True
-                    break
-            
-            if not any_match:
-                return False
-        
-        return True
+        return self._evaluate_policy_set(snapshot.root, attributes)
     
-    def _evaluate_deny_unless_permit(self, policy, attributes):
+    def _evaluate_policy_set(self, node, attributes, records=None):
         """
-        Implementation of deny-unless-permit rule combining algorithm
+        Decision of a compiled policy set, None if its Target does not
+        match; with `records`, what was evaluated is appended to it (see
+        _evaluate_result)
         """
-        # Default is Deny unless a rule explicitly permits
-        found_applicable_rule = False
-        
-        for rule in policy.findall('.//{*}Rule'):
-            rule_id = rule.get('RuleId')
-            effect = rule.get('Effect')
-            
-            # Check if rule applies based on Target
-            if not self._rule_applies(rule, attributes):
+        policy_set, target, children = node
+        if target is not None:
+            target_outcome = self._evaluate_target(policy_set, target, attributes)
+            if target_outcome is not True:
+                return None if target_outcome is False else "Indeterminate"
+        if type(children) is not tuple:
+            children = children.candidates(attributes)
+        if records is None:
+            decisions = (self._evaluate_policy_set(child, attributes) if type(child[0]) is PolicySet
+                         else self._evaluate_compiled_policy(child, attributes) if type(child[0]) is not PolicyReference
+                         else self._evaluate_child(child, attributes) for child in children)
+        else:
+            decisions = self._recorded_decisions(children, attributes, records)
+        return self._combine_policy_decisions(policy_set.policy_combining_alg, decisions)
+    
+    def _recorded_decisions(self, children, attributes, records):
+        for child in children:
+            consumed = []
+            try:
+                child = self._resolve(child)
+            except PolicyReferenceError as e:
+                logger.debug(f"Policy reference is Indeterminate: {e}")
+                records.append((child[0], "Indeterminate", consumed))
+                yield "Indeterminate"
                 continue
-                
-            found_applicable_rule = True
-            
-            # Check rule condition
-            if self._evaluate_condition(rule, attributes):
-                logger.info(f"Rule {rule_id} evaluates to {effect}")
-                if effect == "Permit":
-                    return "Permit"
-        
-        return "Deny" if found_applicable_rule else "NotApplicable"
+            decision = self._evaluate_child(child, attributes, consumed)
+            records.append((child[0], decision, consumed))
+            yield decision
     
-    def _evaluate_first_applicable(self, policy, attributes):
+    def _evaluate_child(self, child, attributes, records=None):
+        """Decision of a compiled policy, policy set or policy reference"""
+        if type(child[0]) is PolicyReference:
+            try:
+                child = child[2]()
+            except PolicyReferenceError as e:
+                logger.debug(f"Policy reference is Indeterminate: {e}")
+                return "Indeterminate"
+        if type(child[0]) is PolicySet:
+            return self._evaluate_policy_set(child, attributes, records)
+        return self._evaluate_compiled_policy(child, attributes, records)
+    
+    def _resolve(self, child):
+        """
+        The compiled entry a policy reference names, compiling it on first
+        use; other entries as they are. Raises PolicyReferenceError.
         """
-        Implementation of first-applicable rule combining algorithm
+        return child[2]() if type(child[0]) is PolicyReference else child
+    
+    def combine_policy_decisions(self, policy_decisions):
         """
-        found_applicable_rule = False
+        Combine the decisions of the policies, in policy order, with the
+        policy set's combining algorithm
         
-        for rule in policy.findall('.//{*}Rule'):
-            rule_id = rule.get('RuleId')
-            effect = rule.get('Effect')
-            
-            # Check if rule applies based on Target
-            if not self._rule_applies(rule, attributes):
-                continue
-                
-            found_applicable_rule = True
-            
-            # Check rule condition
-            if self._evaluate_condition(rule, attributes):
-                logger.info(f"Rule {rule_id} evaluates to {effect}")
-                return effect
+        `policy_decisions` yields one decision per policy, None for a
+        policy whose Target does not match; it is consumed lazily. The
+        decisions are combined as those of the top-level policy set's
+        children, so nested policy sets are combined by the caller.
+        """
+        return self._combine_policy_decisions(self._snapshot.policy_combining_alg, policy_decisions)
+    
+    def _combine_policy_decisions(self, policy_combining_alg, policy_decisions):
+        algorithm = lookup_combining_algorithm(policy_combining_alg)
+        if algorithm is None:
+            return INDETERMINATE
+        return plain_decision(algorithm.combine(policy_decisions))
+    
+    def evaluate_policy(self, policy, attributes):
+        """
+        Evaluate a single compiled Policy of the policy set
         
-        # Default if no rule applies
-        return "NotApplicable" if not found_applicable_rule else "Deny"
+        Returns the policy decision, or None if the policy's Target does
+        not match the request.
+        """
+        return self._evaluate_compiled_policy(self._compiled_policy(policy), attributes)
     
-    def _evaluate_permit_overrides(self, policy, attributes):
+    def _evaluate_compiled_policy(self, compiled, attributes, outcomes=None):
         """
-        Implementation of permit-overrides rule combining algorithm
+        Decision of a compiled policy; the (rule, outcome) pairs the rule
+        combining algorithm consumed are appended to `outcomes` if given
         """
-        found_deny = False
-        found_applicable_rule = False
+        policy, target, rules = compiled
         
-        for rule in policy.findall('.//{*}Rule'):
-            rule_id = rule.get('RuleId')
-            effect = rule.get('Effect')
-            
-            # Check if rule applies based on Target
-            if not self._rule_applies(rule, attributes):
-                continue
-                
-            found_applicable_rule = True
-            
-            # Check rule condition
-            if self._evaluate_condition(rule, attributes):
-                logger.info(f"Rule {rule_id} evaluates to {effect}")
-                if effect == "Permit":
-                    return "Permit"
-                elif effect == "Deny":
-                    found_deny = True
-        
-        if found_deny:
-            return "Deny"
+        # Check if policy applies based on Target
+        target_outcome = self._evaluate_target(policy, target, attributes)
+        if target_outcome is not True:
+            return None if target_outcome is False else "Indeterminate"
         
-        return "NotApplicable" if not found_applicable_rule else "Deny"
+        pairs = ((rule, self._evaluate_rule(rule, rule_target, condition, attributes))
+                 for rule, rule_target, condition in rules)
+        if outcomes is not None:
+            pairs = _recorded(pairs, outcomes)
+        return self.combine_rule_outcomes(policy, pairs)
     
-    def _rule_applies(self, rule, attributes):
+    def evaluate_policy_target(self, policy, attributes):
         """
-        Check if rule applies based on Target
+        Outcome of a policy's Target: True, False or "Indeterminate"
         """
-        target = rule.find('.//{*}Target')
-        
-        # If no Target, the rule applies to all requests
-        if target is None or len(list(target)) == 0:
-            return True
+        return self._evaluate_target(policy, self._compiled_policy(policy)[1], attributes)
+    
+    def evaluate_rule(self, policy, rule_index, attributes):
+        """
+        Outcome of one rule of a policy, as consumed by combine_rule_outcomes
         
-        # Check AnyOf elements
-        any_of_elements = target.findall('.//{*}AnyOf')
-        if not any_of_elements:
-            return True
-            
-        for any_of in any_of_elements:
-            any_match = False
-            
-            # Check AllOf elements (within AnyOf)
-            for all_of in any_of.findall('.//{*}AllOf'):
-                all_match = True
-                
-                # Check Match elements (within AllOf)
-                for match in all_of.findall('.//{*}Match'):
-                    match_id = match.get('MatchId').split(':')[-1]
-                    
-                    # Get attribute value from rule
-                    attr_value_elem = match.find('.//{*}AttributeValue')
-                    rule_value = attr_value_elem.text
-                    
-                    # Get attribute designator
-                    attr_desig = match.find('.//{*}AttributeDesignator')
-                    category = attr_desig.get('Category')
-                    attr_id = attr_desig.get('AttributeId')
-                    
-                    # Get request value
-                    if category in attributes and attr_id in attributes[category]:
-                        request_value = str(attributes[category][attr_id])
-                        
-                        # Perform match based on match type
-                        if match_id == 'string-equal':
-                            if rule_value != request_value:
-                                all_match = False
-                                break
-                        elif match_id == 'boolean-equal':
-                            if str(rule_value).lower() != str(request_value).lower():
-                                all_match = False
-                                break
-                        elif match_id == 'string-regexp-match':
-                            if not re.match(rule_value, request_value):
-                                all_match = False
-                                break
-                    else:
-                        # If attribute doesn't exist, no match
-                        all_match = False
-                        break
-                
-                if all_match:
-                    any_match = True
-                    break
-            
-            if not any_match:
-                return False
+        None if the rule's Target does not match, True or False for the
+        outcome of its Condition, or "Indeterminate".
+        """
+        rule, target, condition = self._compiled_policy(policy)[2][rule_index]
+        return self._evaluate_rule(rule, target, condition, attributes)
+    
+    def combine_rule_outcomes(self, policy, outcomes):
+        """
+        Combine rule outcomes with the policy's rule combining algorithm
         
-        return True
+        `outcomes` yields (rule, outcome) pairs in rule order, as returned
+        by evaluate_rule; it is consumed lazily, so rules after a deciding
+        one need not be evaluated.
+        """
+        algorithm = lookup_combining_algorithm(policy.rule_combining_alg)
+        if algorithm is None or not algorithm.rules:
+            return INDETERMINATE
+        return plain_decision(algorithm.combine(_rule_decisions(outcomes)))
     
-    def _evaluate_condition(self, rule, attributes):
+    def _compiled_policy(self, policy):
         """
-        Evaluate a rule condition
+        Compiled form of a policy of the current snapshot; a policy from an
+        earlier snapshot (held across a reload) is compiled again
         """
-        condition = rule.find('.//{*}Condition')
-        
-        # If no condition, the rule applies
-        if condition is None:
-            return True
-        
-        # Get the Apply function
-        apply_elem = condition.find('.//{*}Apply')
-        if apply_elem is None:
-            return True
-        
-        return self._evaluate_apply(apply_elem, attributes)
+        compiled = self._snapshot.compiled_by_id.get(id(policy))
+        if compiled is not None and compiled[0] is policy:
+            return compiled
+        return self._compile_policy(policy)
     
-    def _evaluate_apply(self, apply_elem, attributes):
+    def _compile_policy(self, policy):
         """
-        Evaluate an Apply element in a condition
+        Compiled form of a policy: (policy, target, ((rule, target, condition), ...))
+        
+        Targets and conditions are compiled by xacml_functions into
+        evaluators once per policy; None stands for an empty target or a
+        missing condition. Constructs the function library does not
+        support are logged and evaluate to Indeterminate.
         """
-        function_id = apply_elem.get('FunctionId').split(':')[-1]
+        algorithm = lookup_combining_algorithm(policy.rule_combining_alg)
+        if algorithm is None or not algorithm.rules:
+            logger.warning(f"{policy.policy_id}: unsupported rule combining algorithm {policy.rule_combining_alg}, "
+                           f"the policy evaluates to Indeterminate")
+        rules = []
+        for rule in policy.rules:
+            where = f"{policy.policy_id}/{rule.rule_id}"
+            target = self._compile(compile_target, rule.target, where)
+            condition = self._compile(compile_condition, rule.condition, where) \
+                if rule.condition is not None else None
+            rules.append((rule, target, condition))
         
-        # Handle different XACML functions
-        if function_id == 'and':
-            # Evaluate all child Apply elements, return true if all are true
-            for child_apply in apply_elem.findall('.//{*}Apply'):
-                if child_apply.getparent() == apply_elem:  # Only direct children
-                    if not self._evaluate_apply(child_apply, attributes):
-                        return False
+        return (policy, self._compile(compile_target, policy.target, policy.policy_id), tuple(rules))
+    
+    def _compile_result_expressions(self, node, where):
+        """Compiled Obligation and Advice expressions of a rule, policy or policy set"""
+        compiled = []
+        for expression in node.obligations + node.advice:
+            directive_id, applies_to, assignments = expression
+            compiled.append((isinstance(expression, ObligationExpression), directive_id, applies_to,
+                             tuple((assignment.attribute_id,
+                                    self._compile(compile_expression, assignment.expression,
+                                                  f"{where}/{directive_id}"))
+                                   for assignment in assignments)))
+        return tuple(compiled)
+    
+    def _compile(self, compile_function, node, where):
+        try:
+            return compile_function(node)
+        except FunctionCompileError as e:
+            logger.warning(f"{where}: {e}")
+            message = str(e)
+            
+            def unsupported(attributes):
+                raise Indeterminate(message)
+            return unsupported
+    
+    def _evaluate_target(self, policy, target, attributes):
+        if target is None:
             return True
-            
-        elif function_id == 'or':
-            # Evaluate all child Apply elements, return true if any is true
-            for child_apply in apply_elem.findall('.//{*}Apply'):
-                if child_apply.getparent() == apply_elem:  # Only direct children
-                    if self._evaluate_apply(child_apply, attributes):
-                        return True
-            return False
-            
-        elif function_id == 'boolean-equal':
-            # Get the two children
-            children = list(apply_elem)
-            attr_value_elem = None
-            attr_desig = None
-            
-            for child in children:
-                if child.tag.endswith('AttributeValue'):
-                    attr_value_elem = child
-                elif child.tag.endswith('AttributeDesignator'):
-                    attr_desig = child
-            
-            if attr_value_elem is not None and attr_desig is not None:
-                policy_value = attr_value_elem.text.lower() == 'true'
-                category = attr_desig.get('Category')
-                attr_id = attr_desig.get('AttributeId')
-                
-                # Get request value
-                if category in attributes and attr_id in attributes[category]:
-                    request_value = attributes[category][attr_id]
-                    return policy_value == request_value
-            
-            return False
-            
-        elif function_id == 'string-equal':
-            # Get the two children
-            children = list(apply_elem)
-            attr_value_elem = None
-            attr_desig = None
-            
-            for child in children:
-                if child.tag.endswith('AttributeValue'):
-                    attr_value_elem = child
-                elif child.tag.endswith('AttributeDesignator'):
-                    attr_desig = child
-            
-            if attr_value_elem is not None and attr_desig is not None:
-                policy_value = attr_value_elem.text
-                category = attr_desig.get('Category')
-                attr_id = attr_desig.get('AttributeId')
-                
-                # Get request value
-                if category in attributes and attr_id in attributes[category]:
-                    request_value = attributes[category][attr_id]
-                    return policy_value == str(request_value)
-            
-            return False
-            
-        elif function_id in ['double-less-than', 'integer-less-than']:
-            # Get the two children
-            children = list(apply_elem)
-            
-            # Get attribute designator and value
-            attr_desig = None
-            attr_value = None
-            
-            for child in children:
-                if child.tag.endswith('AttributeDesignator'):
-                    attr_desig = child
-                elif child.tag.endswith('AttributeValue'):
-                    attr_value = child
-            
-            if attr_desig is not None and attr_value is not None:
-                category = attr_desig.get('Category')
-                attr_id = attr_desig.get('AttributeId')
-                policy_value = float(attr_value.text)
-                
-                # Get request value
-                if category in attributes and attr_id in attributes[category]:
-                    request_value = float(attributes[category][attr_id])
-                    return request_value < policy_value
-            
-            return False
-            
-        elif function_id in ['double-greater-than', 'integer-greater-than']:
-            # Get the two children
-            children = list(apply_elem)
-            
-            # Get attribute designator and value
-            attr_desig = None
-            attr_value = None
-            
-            for child in children:
-                if child.tag.endswith('AttributeDesignator'):
-                    attr_desig = child
-                elif child.tag.endswith('AttributeValue'):
-                    attr_value = child
-            
-            if attr_desig is not None and attr_value is not None:
-                category = attr_desig.get('Category')
-                attr_id = attr_desig.get('AttributeId')
-                policy_value = float(attr_value.text)
-                
-                # Get request value
-                if category in attributes and attr_id in attributes[category]:
-                    request_value = float(attributes[category][attr_id])
-                    return request_value > policy_value
-            
-            return False
-            
-        elif function_id in ['double-less-than-or-equal', 'integer-less-than-or-equal']:
-            # Get the two children
-            children = list(apply_elem)
-            
-            # Get attribute designator and value
-            attr_desig = None
-            attr_value = None
-            
-            for child in children:
-                if child.tag.endswith('AttributeDesignator'):
-                    attr_desig = child
-                elif child.tag.endswith('AttributeValue'):
-                    attr_value = child
-            
-            if attr_desig is not None and attr_value is not None:
-                category = attr_desig.get('Category')
-                attr_id = attr_desig.get('AttributeId')
-                policy_value = float(attr_value.text)
-                
-                # Get request value
-                if category in attributes and attr_id in attributes[category]:
-                    request_value = float(attributes[category][attr_id])
-                    return request_value <= policy_value
-            
-            return False
-            
-        elif function_id in ['double-greater-than-or-equal', 'integer-greater-than-or-equal']:
-            # Get the two children
-            children = list(apply_elem)
-            
-            # Get attribute designator and value
-            attr_desig = None
-            attr_value = None
-            
-            for child in children:
-                if child.tag.endswith('AttributeDesignator'):
-                    attr_desig = child
-                elif child.tag.endswith('AttributeValue'):
-                    attr_value = child
-            
-            if attr_desig is not None and attr_value is not None:
-                category = attr_desig.get('Category')
-                attr_id = attr_desig.get('AttributeId')
-                policy_value = float(attr_value.text)
-                
-                # Get request value
-                if category in attributes and attr_id in attributes[category]:
-                    request_value = float(attributes[category][attr_id])
-                    return request_value >= policy_value
-            
-            return False
+        try:
+            return target(attributes)
+        except Indeterminate as e:
+            where = policy.policy_set_id if type(policy) is PolicySet else policy.policy_id
+            logger.debug(f"Target of {where} is Indeterminate: {e}")
+            return "Indeterminate"
+    
+    def _evaluate_rule(self, rule, target, condition, attributes):
+        """
+        Evaluate one compiled rule
         
-        # Default to false for unsupported functions
-        logger.warning(f"Unsupported function: {function_id}")
-        return False
+        Returns None if the rule's Target does not match, True or False for
+        the outcome of its Condition, or "Indeterminate".
+        """
+        try:
+            if target is not None and not target(attributes):
+                return None
+            return condition is None or condition(attributes)
+        except Indeterminate as e:
+            logger.debug(f"Rule {rule.rule_id} is Indeterminate: {e}")
+            return "Indeterminate"
     
-    def _create_response(self, decision):
+    def _create_response(self, decision, obligations=(), advice=()):
         """
-        Create a XACML response with the given decision
+        Create a XACML response with the given decision, Obligations and Advice
         """
         root = ET.Element("Response", xmlns="urn:oasis:names:tc:xacml:3.0:core:schema:wd-17")
         result = ET.SubElement(root, "Result")
@@ -572,9 +856,60 @@ class FileBasedPDP:
         decision_elem = ET.SubElement(result, "Decision")
         decision_elem.text = decision
         
+        self._add_directives(result, "Obligations", "Obligation", "ObligationId", obligations)
+        self._add_directives(result, "AssociatedAdvice", "Advice", "AdviceId", advice)
+        
         # Convert to string
         return ET.tostring(root, encoding='utf8', method='xml').decode()
 
+    def _add_directives(self, result, container_tag, tag, id_attribute, directives):
+        if not directives:
+            return
+        container = ET.SubElement(result, container_tag)
+        for directive in directives:
+            elem = ET.SubElement(container, tag, {id_attribute: directive.id})
+            for attribute_id, value in directive.attributes.items():
+                for item in value if type(value) is tuple else (value,):
+                    data_type = _RESPONSE_DATA_TYPES.get(type(item), 'string')
+                    assignment = ET.SubElement(elem, "AttributeAssignment", AttributeId=attribute_id,
+                                               DataType=f"http://www.w3.org/2001/XMLSchema#{data_type}")
+                    assignment.text = str(item).lower() if type(item) is bool else str(item)
+
+def _rule_decisions(outcomes):
+    """XACML decisions of rules from their (rule, outcome) pairs"""
+    for rule, outcome in outcomes:
+        if outcome is True:
+            yield rule.effect
+        elif outcome is None or outcome is False:
+            yield None
+        else:
+            yield INDETERMINATE_P if rule.effect == PERMIT else INDETERMINATE_D
+
+def _selectivity_order(evaluators, requests):
+    """
+    Indexes of (evaluate, stops) pairs, the one that most often returns a
+    value `stops` accepts per nanosecond first; (None, None) never stops
+    """
+    scores = []
+    for evaluate, stops in evaluators:
+        if evaluate is None:
+            scores.append(0.0)
+            continue
+        stopped = 0
+        start = perf_counter_ns()
+        for attributes in requests:
+            if stops(evaluate(attributes)):
+                stopped += 1
+        scores.append(stopped / max(perf_counter_ns() - start, 1))
+    # sorted() is stable, so ties keep the policy's order
+    return sorted(range(len(evaluators)), key=lambda index: -scores[index])
+
+def _recorded(pairs, record):
+    """Pass (rule, outcome) pairs through, appending each to `record`"""
+    for pair in pairs:
+        record.append(pair)
+        yield pair
+
 # Test the PDP
 if __name__ == "__main__":
     # Example policy file
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+
+"""
+Flight-plan evaluation: the FAA rules checked along a waypoint trajectory
+
+A FlightPlan is the static part of a DroneOperation (drone, pilot) plus
+one column per field that changes along the route (altitude, speed,
+airspace class, time of day, ...). Each rule in DIRECT_RULES is
+evaluated over whole columns at once: rules that read only static fields
+are evaluated once, the others once per distinct combination of the
+values they read, and the outcomes are broadcast back into a per-rule
+violation mask over the waypoints.
+
+Segment i runs from waypoint i to waypoint i + 1. Every rule is a
+threshold test, so with values varying linearly along a segment a
+segment violates a rule exactly when one of its endpoints does. A plan
+with a single waypoint (or no varying fields at all) has one segment
+that starts and ends at that waypoint.
+"""
+
+import csv
+import sys
+import json
+import time
+import random
+import argparse
+from array import array
+from collections import namedtuple
+from dataclasses import asdict
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+from direct_faa_rules import DIRECT_RULES
+from drone_operation import FIELD_TYPES, DroneOperation
+from incremental_evaluation import coerce_field
+
+
+def _column(name: str, values: Sequence) -> Sequence:
+    """Store a column compactly: doubles in an array, booleans in a bytearray"""
+    field_type = FIELD_TYPES[name]
+    if field_type in (float, "float"):
+        return array('d', (float(v) for v in values))
+    if field_type in (bool, "bool"):
+        return bytearray(_to_bool(v) for v in values)
+    return [str(v) for v in values]
+
+
+def _to_bool(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "1", "yes")
+    return bool(value)
+
+
+class FlightPlan:
+    """
+    A route of waypoints for one drone and pilot
+
+    `columns` maps DroneOperation field names to per-waypoint values; all
+    other fields take their value from `base_operation`.
+    """
+
+    def __init__(self, base_operation: DroneOperation, columns: Dict[str, Sequence]):
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"Waypoint columns have different lengths: {sorted(lengths)}")
+        unknown = set(columns) - set(FIELD_TYPES)
+        if unknown:
+            raise ValueError(f"Unknown waypoint fields: {sorted(unknown)}")
+        self.base_operation = base_operation
+        self.columns = {name: _column(name, values) for name, values in columns.items()}
+        self.waypoint_count = lengths.pop() if lengths else 1
+
+    @property
+    def segment_count(self) -> int:
+        return max(self.waypoint_count - 1, 1)
+
+    @classmethod
+    def from_waypoints(cls, base_operation: DroneOperation, waypoints: List[Dict[str, Any]]) -> "FlightPlan":
+        """
+        Build a plan from waypoint dicts; a field missing from a waypoint
+        keeps the previous waypoint's value (or the base operation's)
+        """
+        names = [name for name in FIELD_TYPES if any(name in waypoint for waypoint in waypoints)]
+        columns = {name: [] for name in names}
+        for name in names:
+            value = getattr(base_operation, name)
+            for waypoint in waypoints:
+                value = waypoint.get(name, value)
+                columns[name].append(value)
+        return cls(base_operation, columns)
+
+    @classmethod
+    def from_csv(cls, base_operation: DroneOperation, path: str) -> "FlightPlan":
+        """Build a plan from a CSV file with one DroneOperation field per column"""
+        with open(path, newline='') as f:
+            rows = list(csv.DictReader(f))
+        waypoints = [{name: value for name, value in row.items() if name in FIELD_TYPES and value != ''}
+                     for row in rows]
+        return cls.from_waypoints(base_operation, waypoints)
+
+    @classmethod
+    def from_request(cls, operation: Dict[str, Any], waypoints: List[Dict[str, Any]]) -> "FlightPlan":
+        """
+        Build a plan from JSON data: the static fields in `operation`, any
+        required field it lacks taken from the first waypoint
+
+        Raises KeyError for an unknown field and ValueError for a value
+        that does not convert or a plan with no waypoints.
+        """
+        if not waypoints:
+            raise ValueError("A flight plan needs at least one waypoint")
+        values = {name: coerce_field(name, value) for name, value in dict(waypoints[0], **operation).items()}
+        try:
+            base_operation = DroneOperation(**values)
+        except TypeError as e:
+            raise ValueError(str(e))
+        waypoints = [{name: coerce_field(name, value) for name, value in waypoint.items()} for waypoint in waypoints]
+        return cls.from_waypoints(base_operation, waypoints)
+
+    def waypoint(self, index: int) -> DroneOperation:
+        """Full operation at one waypoint"""
+        values = asdict(self.base_operation)
+        for name, column in self.columns.items():
+            value = column[index]
+            values[name] = bool(value) if FIELD_TYPES[name] in (bool, "bool") else value
+        return DroneOperation(**values)
+
+
+class ViolationInterval(NamedTuple):
+    """A maximal run of consecutive segments violating one rule"""
+    rule_id: str
+    first_segment: int
+    last_segment: int
+    message: str  # violation message at the first violating waypoint of the run
+
+
+class FlightPlanResult(NamedTuple):
+    segment_count: int
+    first_violation: Optional[int]  # first violating segment, None if the plan complies
+    first_violation_rules: List[str]
+    first_violation_details: List[str]
+    intervals: List[ViolationInterval]  # ordered by first segment, then rule order
+    evaluated_checks: int  # rule checks actually run, after deduplication
+
+    @property
+    def compliant(self) -> bool:
+        return self.first_violation is None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "status": "APPROVED" if self.compliant else "DENIED",
+            "segment_count": self.segment_count,
+            "first_violation": None if self.compliant else {
+                "segment": self.first_violation,
+                "rules": self.first_violation_rules,
+                "details": self.first_violation_details,
+            },
+            "violation_intervals": [interval._asdict() for interval in self.intervals],
+        }
+
+
+def _rule_outcomes(plan: FlightPlan, rule, counter: List[int]) -> List[Optional[str]]:
+    """Violation message (or None) of one rule at every waypoint"""
+    row_type = namedtuple('Row', rule.fields)
+    varying = [name for name in rule.fields if name in plan.columns]
+    if not varying:
+        counter[0] += 1
+        outcome = rule.check(row_type(*(getattr(plan.base_operation, name) for name in rule.fields)))
+        return [outcome] * plan.waypoint_count
+
+    # One column per rule field, static fields broadcast
+    columns = [plan.columns[name] if name in plan.columns else [getattr(plan.base_operation, name)] * plan.waypoint_count
+               for name in rule.fields]
+    memo = {}
+    outcomes = []
+    for key in zip(*columns):
+        outcome = memo.get(key, memo)
+        if outcome is memo:
+            outcome = memo[key] = rule.check(row_type(*key))
+        outcomes.append(outcome)
+    counter[0] += len(memo)
+    return outcomes
+
+
+def evaluate_flight_plan(plan: FlightPlan) -> FlightPlanResult:
+    """Check every segment of a flight plan against DIRECT_RULES"""
+    segments = plan.segment_count
+    counter = [0]
+    first_violation = None
+    first_rules = []
+    first_details = []
+    intervals = []
+
+    for rule in DIRECT_RULES:
+        outcomes = _rule_outcomes(plan, rule, counter)
+        # Segment i violates the rule if waypoint i or i + 1 does; a lone
+        # waypoint is its own segment
+        mask = bytes(outcome is not None for outcome in outcomes)
+        segment_mask = bytes(a | b for a, b in zip(mask, mask[1:] or mask))
+
+        start = segment_mask.find(1)
+        if start < 0:
+            continue
+        if first_violation is None or start < first_violation:
+            first_violation, first_rules, first_details = start, [], []
+        if start == first_violation:
+            first_rules.append(rule.rule_id)
+            first_details.append(outcomes[start] if outcomes[start] is not None else outcomes[start + 1])
+
+        while start >= 0:
+            end = segment_mask.find(0, start)
+            end = segments if end < 0 else end
+            message = outcomes[start] if outcomes[start] is not None else outcomes[start + 1]
+            intervals.append(ViolationInterval(rule.rule_id, start, end - 1, message))
+            start = segment_mask.find(1, end)
+
+    rule_order = {rule.rule_id: index for index, rule in enumerate(DIRECT_RULES)}
+    intervals.sort(key=lambda interval: (interval.first_segment, rule_order[interval.rule_id]))
+    return FlightPlanResult(segments, first_violation, first_rules, first_details, intervals, counter[0])
+
+
+def survey_route(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Synthetic survey route: an altitude/speed random walk crossing airspace boundaries"""
+    rng = random.Random(seed)
+    altitude, speed = 200.0, 40.0
+    airspace = "G"
+    waypoints = []
+    for i in range(count):
+        altitude = min(max(altitude + rng.gauss(0.0, 8.0), 50.0), 480.0)
+        speed = min(max(speed + rng.gauss(0.0, 2.0), 10.0), 100.0)
+        if rng.random() < 0.01:
+            airspace = rng.choice(["G", "G", "E", "D"])
+        waypoints.append({
+            "operating_altitude": round(altitude, 1),
+            "operating_speed": round(speed, 1),
+            "airspace_class": airspace,
+            "time_of_day": "day" if i < count * 0.9 else "civil_twilight",
+        })
+    return waypoints
+
+
+def main():
+    from differential_check import BASELINE_OPERATION
+
+    parser = argparse.ArgumentParser(description='Evaluate a flight plan against the FAA rules')
+    parser.add_argument('plan', nargs='?', type=str,
+                        help='Waypoints as a JSON list of objects or a CSV file, one DroneOperation field per key')
+    parser.add_argument('--operation', type=str,
+                        help='JSON file with the static DroneOperation fields (default: a compliant Category2 operation)')
+    parser.add_argument('--benchmark', type=int, default=0, help='Evaluate a synthetic route of this many waypoints')
+    parser.add_argument('--limit', type=int, default=20, help='Maximum violation intervals to print')
+
+    args = parser.parse_args()
+
+    operation = BASELINE_OPERATION
+    if args.operation:
+        with open(args.operation) as f:
+            operation = DroneOperation(**dict(asdict(BASELINE_OPERATION), **json.load(f)))
+
+    if args.benchmark:
+        plan = FlightPlan.from_waypoints(operation, survey_route(args.benchmark))
+    elif args.plan and args.plan.endswith('.csv'):
+        plan = FlightPlan.from_csv(operation, args.plan)
+    elif args.plan:
+        with open(args.plan) as f:
+            plan = FlightPlan.from_waypoints(operation, json.load(f))
+    else:
+        parser.print_help()
+        sys.exit(2)
+
+    start = time.perf_counter()
+    result = evaluate_flight_plan(plan)
+    elapsed = time.perf_counter() - start
+
+    print(f"{plan.waypoint_count} waypoints, {result.segment_count} segments evaluated in {elapsed * 1000:.1f} ms "
+          f"({result.evaluated_checks} rule checks)")
+    if result.compliant:
+        print("Flight plan complies with FAA regulations")
+        return
+    print(f"First violation at segment {result.first_violation}:")
+    for detail in result.first_violation_details:
+        print(f"  - {detail}")
+    print(f"\nViolation intervals: {len(result.intervals)} (showing {min(args.limit, len(result.intervals))})")
+    for interval in result.intervals[:args.limit]:
+        print(f"  segments {interval.first_segment}-{interval.last_segment} {interval.rule_id}: {interval.message}")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+"""
+Incremental what-if evaluation for the FAA rules API
+
+A full evaluation returns a result handle. Follow-up requests send the
+handle and only the fields that changed; the rules that read those
+fields (RULE_DEPENDENCIES in direct_faa_rules.py) are re-run and all
+other rule outcomes are reused from the handle's evaluation. Each
+follow-up returns a new handle, so earlier what-if states stay valid
+until they age out of the bounded cache.
+"""
+
+import uuid
+import threading
+from collections import OrderedDict
+from dataclasses import replace
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from direct_faa_rules import FAADroneRulesEvaluator
+from drone_operation import FIELD_TYPES, DroneOperation
+
+DEFAULT_MAX_HANDLES = 10000
+
+
+class UnknownHandleError(KeyError):
+    """Raised for a result handle that never existed or has expired"""
+
+
+class _Evaluation(NamedTuple):
+    operation: DroneOperation
+    outcomes: List[Optional[str]]
+
+
+def coerce_field(name: str, value: Any) -> Any:
+    """
+    Convert a JSON/form value to the type of a DroneOperation field
+
+    Raises KeyError for an unknown field and ValueError for a value that
+    does not convert.
+    """
+    field_type = FIELD_TYPES[name]
+    if field_type in (bool, "bool"):
+        if isinstance(value, str):
+            if value.lower() not in ("true", "false"):
+                raise ValueError(f"{name} must be true or false, got {value!r}")
+            return value.lower() == "true"
+        return bool(value)
+    if field_type in (float, "float"):
+        return float(value)
+    return str(value)
+
+
+class IncrementalEvaluator:
+    """
+    Evaluates operations and keeps their rule outcomes behind handles
+
+    Thread-safe; at most `max_handles` evaluations are kept, least
+    recently used first out.
+    """
+
+    def __init__(self, evaluator: FAADroneRulesEvaluator = None, max_handles: int = DEFAULT_MAX_HANDLES):
+        self.evaluator = evaluator or FAADroneRulesEvaluator()
+        self.max_handles = max_handles
+        self._evaluations: "OrderedDict[str, _Evaluation]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _store(self, evaluation: _Evaluation) -> str:
+        handle = uuid.uuid4().hex
+        with self._lock:
+            self._evaluations[handle] = evaluation
+            while len(self._evaluations) > self.max_handles:
+                self._evaluations.popitem(last=False)
+        return handle
+
+    def evaluate(self, operation: DroneOperation) -> Dict[str, Any]:
+        """
+        Evaluate every rule; the result has a "handle" for evaluate_changes
+        """
+        outcomes = self.evaluator.evaluate_rules(operation)
+        result = self.evaluator.result_from_outcomes(outcomes)
+        result["handle"] = self._store(_Evaluation(operation, outcomes))
+        return result
+
+    def evaluation(self, handle: str) -> Tuple[DroneOperation, List[Optional[str]]]:
+        """
+        (operation, rule outcomes) behind a handle; raises UnknownHandleError
+        """
+        with self._lock:
+            evaluation = self._evaluations.get(handle)
+        if evaluation is None:
+            raise UnknownHandleError(handle)
+        return evaluation
+
+    def evaluate_changes(self, handle: str, changes: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Re-evaluate a previous result with some fields changed
+
+        Only the rules depending on the changed fields are re-run; their
+        ids are listed in the result's "reevaluated_rules". Raises
+        UnknownHandleError for an unknown or expired handle, KeyError for
+        an unknown field and ValueError for a value of the wrong type.
+        """
+        with self._lock:
+            previous = self._evaluations.get(handle)
+            if previous is not None:
+                self._evaluations.move_to_end(handle)
+        if previous is None:
+            raise UnknownHandleError(handle)
+
+        values = {name: coerce_field(name, value) for name, value in changes.items()}
+        changed = [name for name, value in values.items() if getattr(previous.operation, name) != value]
+        operation = replace(previous.operation, **values) if changed else previous.operation
+
+        outcomes, reevaluated = self.evaluator.reevaluate_rules(operation, previous.outcomes, changed)
+        result = self.evaluator.result_from_outcomes(outcomes)
+        result["handle"] = self._store(_Evaluation(operation, outcomes))
+        result["reevaluated_rules"] = reevaluated
+        return result
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+
+"""
+Partial evaluation of a compiled policy for requests sharing known attributes
+
+Registered airframes send the same drone attributes (category, weight,
+Remote ID, lighting, certificates) with every flight. specialize_policy_set
+takes the compiled policy (policy_compiler.py) and those known attribute
+values and returns a residual PolicySet in which
+
+- designators of known attributes are replaced by their values and the
+  Apply expressions that became constant are folded (and, or and not
+  short-circuit on constant arguments),
+- Target Matches on known attributes are decided, so rules and policies
+  whose Target can no longer match are dropped,
+- rules whose Condition became False are dropped, as every combining
+  algorithm skips them, and so are policies that became NotApplicable,
+- rules and policies before or after one whose decision the combining
+  algorithm can no longer change are dropped.
+
+For any request containing the known values, the residual policy decides
+exactly as the original one does, as evaluated by FileBasedPDP. A known
+attribute is left in place when its value cannot be folded (a bag, or a
+value its Match or function rejects); `unresolved_attributes` lists them.
+
+FileBasedPDP.specialize builds a PDP over the residual policy and
+SpecializationCache keeps one per airframe.
+"""
+
+import os
+import json
+import argparse
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from drone_attributes import OPERATION_ATTRIBUTES
+from incremental_evaluation import coerce_field
+from policy_compiler import (Apply, AttributeDesignator, AttributeValue, Policy, PolicyReference, PolicySet,
+                             iter_expressions, short_id)
+from combining_algorithms import lookup_combining_algorithm, plain_decision
+from xacml_functions import (CONVERTERS, FunctionCompileError, Indeterminate, compile_expression, compile_match)
+
+# DroneOperation fields fixed per airframe
+AIRFRAME_FIELDS = [
+    "drone_category",
+    "drone_weight",
+    "has_anti_collision_lighting",
+    "has_remote_id",
+    "has_airworthiness_certificate",
+    "complies_with_kinetic_energy_limit",
+    "has_exposed_rotating_parts",
+]
+
+DEFAULT_MAX_SPECIALIZATIONS = 1024
+FIRST_APPLICABLE = "urn:oasis:names:tc:xacml:1.0:policy-combining-algorithm:first-applicable"
+DEFAULT_POLICY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../policies/FAADroneRules.xml")
+
+_ATTRIBUTES = {field_name: (category, attribute_id)
+               for field_name, category, attribute_id, _ in OPERATION_ATTRIBUTES}
+
+# Python type of a folded value -> XML Schema data type of its literal
+_LITERAL_TYPES = {bool: 'boolean', float: 'double', int: 'integer', str: 'string'}
+
+
+def known_attributes(operation, field_names: Iterable[str] = AIRFRAME_FIELDS) -> Dict[str, Dict[str, Any]]:
+    """Request attributes {category: {attribute_id: value}} of some DroneOperation fields"""
+    attributes: Dict[str, Dict[str, Any]] = {}
+    for field_name in field_names:
+        category, attribute_id = _ATTRIBUTES[field_name]
+        attributes.setdefault(category, {})[attribute_id] = getattr(operation, field_name)
+    return attributes
+
+
+def _known_value(designator: AttributeDesignator, known: Dict[str, Dict[str, Any]]):
+    """The known single value of a designator, or `known` itself if it cannot be substituted"""
+    value = known.get(designator.category, {}).get(designator.attribute_id, known)
+    if value is known or type(value) in (list, tuple):
+        return known
+    try:
+        CONVERTERS[designator.data_type](value)
+    except (KeyError, ValueError, TypeError, ArithmeticError):
+        return known
+    return value
+
+
+def _constant_boolean(expression) -> Optional[bool]:
+    if isinstance(expression, AttributeValue) and type(expression.value) is bool:
+        return expression.value
+    return None
+
+
+def specialize_expression(expression, known: Dict[str, Dict[str, Any]]):
+    """An expression with the known attributes substituted and constants folded"""
+    if isinstance(expression, AttributeDesignator):
+        value = _known_value(expression, known)
+        return expression if value is known else AttributeValue(expression.data_type, value)
+    if not isinstance(expression, Apply):
+        return expression
+
+    arguments = tuple(specialize_expression(argument, known) for argument in expression.arguments)
+    name = short_id(expression.function_id)
+    if name in ('and', 'or'):
+        # and is False as soon as one argument is, whatever the others
+        # (even Indeterminate) are; or likewise with True
+        deciding = name == 'or'
+        remaining = []
+        for argument in arguments:
+            value = _constant_boolean(argument)
+            if value is deciding:
+                return AttributeValue('boolean', deciding)
+            if value is None:
+                remaining.append(argument)
+        if not remaining:
+            return AttributeValue('boolean', not deciding)
+        return Apply(expression.function_id, tuple(remaining))
+
+    specialized = Apply(expression.function_id, arguments)
+    if all(isinstance(argument, AttributeValue) for argument in arguments):
+        try:
+            evaluator = compile_expression(specialized)
+        except FunctionCompileError:
+            return specialized
+        literal_type = _LITERAL_TYPES.get(type(getattr(evaluator, 'constant', None)))
+        if literal_type is not None:
+            return AttributeValue(literal_type, evaluator.constant)
+    return specialized
+
+
+def _specialize_match(match, known: Dict[str, Dict[str, Any]]):
+    """True or False for a decided Match, else the Match"""
+    value = _known_value(match.designator, known)
+    if value is known:
+        return match
+    try:
+        return bool(compile_match(match)({match.designator.category: {match.designator.attribute_id: value}}))
+    except (Indeterminate, FunctionCompileError):
+        return match
+
+
+def specialize_target(target: tuple, known: Dict[str, Dict[str, Any]]) -> Optional[tuple]:
+    """
+    The residual of a Target: () if it matches every request with the
+    known values, None if it matches none
+    """
+    any_ofs = []
+    for any_of in target:
+        all_ofs = []
+        for all_of in any_of:
+            matches = []
+            for match in all_of:
+                outcome = _specialize_match(match, known)
+                if outcome is False:
+                    break
+                if outcome is not True:
+                    matches.append(outcome)
+            else:
+                if not matches:
+                    # An AllOf of decided Matches: the AnyOf matches
+                    break
+                all_ofs.append(tuple(matches))
+        else:
+            if not all_ofs:
+                return None
+            any_ofs.append(tuple(all_ofs))
+    return tuple(any_ofs)
+
+
+def _specialize_result_expressions(node, known: Dict[str, Dict[str, Any]]):
+    """A rule, policy or policy set with its Obligation and Advice expressions specialized"""
+    if not node.obligations and not node.advice:
+        return node
+
+    def specialize(expressions):
+        return tuple(expression._replace(assignments=tuple(
+            assignment._replace(expression=specialize_expression(assignment.expression, known))
+            for assignment in expression.assignments)) for expression in expressions)
+    return node._replace(obligations=specialize(node.obligations), advice=specialize(node.advice))
+
+
+def _has_result_expressions(nodes) -> bool:
+    return any(node.obligations or node.advice for node in nodes)
+
+
+def _has_nested_result_expressions(nodes) -> bool:
+    """Whether policies or policy sets, or anything in them, may have Obligations or Advice"""
+    return any(isinstance(node, PolicyReference) or node.obligations or node.advice
+               or _has_nested_result_expressions(node.policies if isinstance(node, PolicySet) else node.rules)
+               for node in nodes)
+
+
+def _always_applies(rule) -> bool:
+    return not rule.target and (rule.condition is None or _constant_boolean(rule.condition) is True)
+
+
+def specialize_policy(policy: Policy, known: Dict[str, Dict[str, Any]]) -> Optional[Policy]:
+    """The residual of a Policy, None if its Target cannot match"""
+    target = specialize_target(policy.target, known)
+    if target is None:
+        return None
+    algorithm = lookup_combining_algorithm(policy.rule_combining_alg)
+    rules = []
+    for rule in policy.rules:
+        rule_target = specialize_target(rule.target, known)
+        if rule_target is None:
+            # Never applicable: skipped by every combining algorithm
+            continue
+        condition = specialize_expression(rule.condition, known) if rule.condition is not None else None
+        if _constant_boolean(condition) is True:
+            condition = None
+        rule = _specialize_result_expressions(rule._replace(target=rule_target, condition=condition), known)
+        if not rule.target and _constant_boolean(condition) is False and not _has_result_expressions((rule,)):
+            # NotApplicable whatever the request, unless its Obligations or
+            # Advice go with the decision it failed to make
+            continue
+        if algorithm is not None and _always_applies(rule):
+            if algorithm.name == 'first-applicable':
+                # The rules after it are never reached
+                rules.append(rule)
+                break
+            if rule.effect == algorithm.stops_on:
+                # Whatever the other rules yield, this one decides; earlier
+                # ones stay if their Obligations or Advice may go with it
+                rules = (rules if _has_result_expressions(rules) else []) + [rule]
+                break
+        rules.append(rule)
+    return _specialize_result_expressions(policy._replace(target=target, rules=tuple(rules)), known)
+
+
+def _constant_decision(node) -> Optional[str]:
+    """The decision of a residual policy or policy set that no longer depends on the request"""
+    if isinstance(node, PolicyReference) or node.target:
+        return None
+    if isinstance(node, PolicySet):
+        algorithm = lookup_combining_algorithm(node.policy_combining_alg)
+        decisions = [_constant_decision(child) for child in node.policies]
+        if algorithm is None or None in decisions:
+            return None
+    else:
+        algorithm = lookup_combining_algorithm(node.rule_combining_alg)
+        if algorithm is None or not algorithm.rules or not all(_always_applies(rule) for rule in node.rules):
+            return None
+        decisions = [rule.effect for rule in node.rules]
+    return plain_decision(algorithm.combine(decisions))
+
+
+def _specialize_policy_set(policy_set: PolicySet, known: Dict[str, Dict[str, Any]]) -> Optional[PolicySet]:
+    target = specialize_target(policy_set.target, known)
+    if target is None:
+        return None
+    algorithm = lookup_combining_algorithm(policy_set.policy_combining_alg)
+    policies = []
+    for child in policy_set.policies:
+        if isinstance(child, PolicyReference):
+            # Not resolved here (FileBasedPDP.specialize inlines them first)
+            policies.append(child)
+            continue
+        if isinstance(child, PolicySet):
+            residual = _specialize_policy_set(child, known)
+        else:
+            residual = specialize_policy(child, known)
+        if residual is None:
+            continue
+        decision = _constant_decision(residual)
+        if algorithm is None or decision is None:
+            policies.append(residual)
+            continue
+        if decision == "NotApplicable" and algorithm.name != 'only-one-applicable':
+            # Skipped by every other combining algorithm, and a policy that
+            # is NotApplicable has no Obligations or Advice to return
+            continue
+        if decision == algorithm.stops_on:
+            # Whatever the other policies decide, this one overrides them;
+            # earlier ones stay if their Obligations or Advice may go with it
+            policies = (policies if _has_nested_result_expressions(policies) else []) + [residual]
+            break
+        policies.append(residual)
+        if algorithm.name == 'first-applicable':
+            break
+    return _specialize_result_expressions(policy_set._replace(target=target, policies=tuple(policies)), known)
+
+
+def specialize_policy_set(policy_set: PolicySet, known: Dict[str, Dict[str, Any]]) -> PolicySet:
+    """
+    The residual of a PolicySet for requests with the `known` attribute
+    values; nested policy sets are specialized in place
+    """
+    residual = _specialize_policy_set(policy_set, known)
+    if residual is None:
+        # The policy set never applies: an empty one is NotApplicable
+        return PolicySet(policy_set.policy_set_id, FIRST_APPLICABLE, (), ())
+    return residual
+
+
+def referenced_attributes(policy_set: PolicySet) -> Set[Tuple[str, str]]:
+    """(category, attribute_id) of every attribute a policy set reads"""
+    keys = set()
+    targets = [policy_set.target]
+    expressions = []
+    nodes = [policy_set]
+    for entry in policy_set.policies:
+        if isinstance(entry, PolicySet):
+            keys.update(referenced_attributes(entry))
+            continue
+        if isinstance(entry, PolicyReference):
+            continue
+        targets.extend([entry.target] + [rule.target for rule in entry.rules])
+        expressions.extend(rule.condition for rule in entry.rules if rule.condition is not None)
+        nodes.extend((entry,) + entry.rules)
+    for target in targets:
+        keys.update(match.designator.key for any_of in target for all_of in any_of for match in all_of)
+    for node in nodes:
+        expressions.extend(assignment.expression for expression in node.obligations + node.advice
+                           for assignment in expression.assignments)
+    for expression in expressions:
+        keys.update(sub.key for sub in iter_expressions(expression) if isinstance(sub, AttributeDesignator))
+    return keys
+
+
+def unresolved_attributes(residual: PolicySet, known: Dict[str, Dict[str, Any]]) -> Set[Tuple[str, str]]:
+    """Known attributes the residual policy still reads"""
+    return {(category, attribute_id) for category, attribute_id in referenced_attributes(residual)
+            if attribute_id in known.get(category, {})}
+
+
+class SpecializationCache:
+    """
+    Specialized PDPs per airframe, least recently used first out
+
+    An entry is rebuilt when the airframe's known attributes differ from
+    the ones it was built for or the PDP has reloaded its policy.
+    Thread-safe.
+    """
+
+    def __init__(self, pdp, max_entries: int = DEFAULT_MAX_SPECIALIZATIONS):
+        self.pdp = pdp
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Any, Tuple[Any, Dict[str, Dict[str, Any]], Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def specialized(self, airframe_id: Any, known: Dict[str, Dict[str, Any]]):
+        """The PDP specialized for an airframe with `known` attributes"""
+        snapshot = self.pdp.snapshot
+        with self._lock:
+            entry = self._entries.get(airframe_id)
+            if entry is not None and entry[1] == known and entry[2] is snapshot:
+                self._entries.move_to_end(airframe_id)
+                return entry[0]
+
+        specialized = self.pdp.specialize(known)
+        with self._lock:
+            self.builds += 1
+            self._entries[airframe_id] = (specialized, known, snapshot)
+            self._entries.move_to_end(airframe_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return specialized
+
+    def evaluate_attributes(self, airframe_id: Any, known: Dict[str, Dict[str, Any]],
+                            attributes: Dict[str, Dict[str, Any]]) -> str:
+        """
+        Decision for a request of an airframe; `attributes` may leave out
+        the known ones
+        """
+        specialized = self.specialized(airframe_id, known)
+        if specialized.unresolved_attributes:
+            attributes = {category: dict(known.get(category, {}), **attributes.get(category, {}))
+                          for category in set(known) | set(attributes)}
+        return specialized.evaluate_attributes(attributes)
+
+    def invalidate(self, airframe_id: Any = None):
+        """Drop one airframe's specialization, or all of them"""
+        with self._lock:
+            if airframe_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(airframe_id, None)
+
+
+def main():
+    # Imported here: file_based_pdp imports this module
+    from file_based_pdp import FileBasedPDP
+
+    parser = argparse.ArgumentParser(description='Show the residual policy for an airframe profile')
+    parser.add_argument('profile', type=str, help='JSON file with the fixed DroneOperation fields')
+    parser.add_argument('--policy-file', type=str, default=DEFAULT_POLICY_FILE, help='Path to the XACML policy file')
+    args = parser.parse_args()
+
+    with open(args.profile) as f:
+        profile = {name: coerce_field(name, value) for name, value in json.load(f).items()}
+    known: Dict[str, Dict[str, Any]] = {}
+    for name, value in profile.items():
+        category, attribute_id = _ATTRIBUTES[name]
+        known.setdefault(category, {})[attribute_id] = value
+
+    pdp = FileBasedPDP(args.policy_file)
+    specialized = pdp.specialize(known)
+    print(f"{len(specialized.policies)} of {len(pdp.policies)} policies, "
+          f"{sum(len(p.rules) for p in specialized.policies)} of {sum(len(p.rules) for p in pdp.policies)} rules left")
+    for policy in specialized.policies:
+        print(f"  {policy.policy_id}")
+        for rule in policy.rules:
+            print(f"    {rule.rule_id} ({rule.effect}{', always applies' if _always_applies(rule) else ''})")
+    for category, attribute_id in sorted(specialized.unresolved_attributes):
+        print(f"Not folded: {attribute_id}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+
+"""
+Static analysis of a compiled policy: unreachable and shadowed rules,
+conflicting policy decisions and uncovered regions
+
+    python policy_analysis.py ../policies/FAADroneRules.xml
+
+Attributes are discretized into the equivalence classes the policy can
+tell apart, as for the decision table (decision_table.py): booleans into
+true/false, numbers into the intervals between the thresholds they are
+compared against, strings into the groups of values that satisfy the
+same tests. The full product of all classes (some 16 million cells for
+FAADroneRules.xml) is never enumerated:
+
+- each policy is evaluated once per combination of the classes of the
+  attributes it references itself (a few hundred at most), and the cells
+  where each rule applies and where its condition holds are kept as
+  bitmasks, so subsumption and coverage are bitwise operations;
+- two policies conflict in the cells of their joint attribute space
+  where one permits and the other denies; those are counted per value
+  of the attributes the two share, never enumerated;
+- the policy set is uncovered where no policy Target matches, which
+  depends only on the attributes the Targets reference.
+
+Every rule and policy is evaluated with FileBasedPDP itself, so findings
+follow the decisions it makes. Requests are assumed to carry every
+attribute the policy references, as requests built from a DroneOperation
+do. Findings describe their cells as regions: for each constrained
+attribute the class it is restricted to, attributes left out are
+unconstrained.
+"""
+
+import sys
+import json
+import time
+import argparse
+import itertools
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from decision_table import OTHER_STRING, AttributeAxis, PolicyAnalysisError, discretize_policies
+from file_based_pdp import FileBasedPDP
+from policy_compiler import short_id
+
+UNREACHABLE = "unreachable"
+SHADOWED = "shadowed"
+CONFLICT = "conflict"
+UNCOVERED = "uncovered"
+FINDING_KINDS = (UNREACHABLE, SHADOWED, CONFLICT, UNCOVERED)
+
+DEFAULT_MAX_REGIONS = 5
+
+
+class Finding(NamedTuple):
+    """One problem found in a policy"""
+    kind: str  # one of FINDING_KINDS
+    subject: str  # "policy", "policy/rule" or "policy vs policy"
+    message: str
+    # Regions the finding applies to: {attribute id: class description}
+    regions: Tuple[Dict[str, str], ...] = ()
+    # Number of cells (class combinations) affected, of `total` in the
+    # attribute space the finding was measured in
+    cells: int = 0
+    total: int = 0
+
+
+def describe_class(axis: AttributeAxis, cls: int) -> str:
+    """Condition on an attribute that selects one of its classes, e.g. "> 0.55" or "in {B, C, D}" """
+    if axis.data_type == 'boolean':
+        return "= true" if axis.representatives[cls] else "= false"
+
+    if axis.data_type in ('double', 'integer'):
+        # Runs of consecutive fine intervals: 2i is the gap below threshold
+        # i, 2i + 1 the threshold itself
+        thresholds = axis.thresholds
+        fine = [i for i, fine_cls in enumerate(axis.fine_to_class) if fine_cls == cls]
+        runs = []
+        for index in fine:
+            if runs and runs[-1][1] == index - 1:
+                runs[-1][1] = index
+            else:
+                runs.append([index, index])
+        parts = []
+        for first, last in runs:
+            low = None if first == 0 else (thresholds[(first - 1) // 2], first % 2 == 1)
+            high = None if last == len(axis.fine_to_class) - 1 else (thresholds[last // 2], last % 2 == 1)
+            if low is None and high is None:
+                parts.append("any")
+            elif low is None:
+                parts.append(f"{'<=' if high[1] else '<'} {high[0]:g}")
+            elif high is None:
+                parts.append(f"{'>=' if low[1] else '>'} {low[0]:g}")
+            elif first == last and first % 2 == 1:
+                parts.append(f"= {low[0]:g}")
+            else:
+                parts.append(f"in {'[' if low[1] else '('}{low[0]:g}, {high[0]:g}{']' if high[1] else ')'}")
+        return " or ".join(parts)
+
+    values = sorted(value for value, value_cls in axis.value_classes.items()
+                    if value_cls == cls and value != OTHER_STRING)
+    if axis.value_classes.get(OTHER_STRING) == cls:
+        named = sorted(value for value, value_cls in axis.value_classes.items()
+                       if value_cls != cls and value != OTHER_STRING)
+        if not values:
+            return f"not in {{{', '.join(named)}}}" if len(named) > 1 else f"!= {named[0]}"
+        return f"in {{{', '.join(values)}}} or any other value"
+    return f"in {{{', '.join(values)}}}" if len(values) > 1 else f"= {values[0]}"
+
+
+def format_region(region: Dict[str, str]) -> str:
+    if not region:
+        return "any request"
+    return ", ".join(f"{attribute_id} {condition}" for attribute_id, condition in region.items())
+
+
+def merge_cells(axes: Sequence[AttributeAxis], cells: Iterable[tuple]) -> List[tuple]:
+    """
+    Merge cells (one class index per axis) into fewer cubes, with None
+    for an axis every class of which is included
+    """
+    cubes = set(cells)
+    merged_any = True
+    while merged_any:
+        merged_any = False
+        for i, axis in enumerate(axes):
+            groups = {}
+            for cube in cubes:
+                groups.setdefault(cube[:i] + cube[i + 1:], set()).add(cube[i])
+            cubes = set()
+            for rest, classes in groups.items():
+                if None in classes or len(classes) == axis.class_count:
+                    merged_any = merged_any or len(classes) > 1
+                    cubes.add(rest[:i] + (None,) + rest[i:])
+                else:
+                    cubes.update(rest[:i] + (cls,) + rest[i:] for cls in classes)
+    return sorted(cubes, key=lambda cube: tuple(-1 if cls is None else cls for cls in cube))
+
+
+def _regions(axes: Sequence[AttributeAxis], cells: Iterable[tuple]) -> Tuple[Dict[str, str], ...]:
+    return tuple({axis.attribute_id: describe_class(axis, cls) for axis, cls in zip(axes, cube) if cls is not None}
+                 for cube in merge_cells(axes, cells))
+
+
+def _request(axes: Sequence[AttributeAxis], cell: tuple) -> Dict[str, Dict[str, Any]]:
+    attributes = {}
+    for axis, cls in zip(axes, cell):
+        attributes.setdefault(axis.category, {})[axis.attribute_id] = axis.representatives[cls]
+    return attributes
+
+
+def _mask(flags: Iterable[bool]) -> int:
+    return sum(1 << i for i, flag in enumerate(flags) if flag)
+
+
+def _indices(mask: int) -> List[int]:
+    return [i for i in range(mask.bit_length()) if mask >> i & 1]
+
+
+class PolicySpace:
+    """
+    One policy evaluated on every combination of the classes of the
+    attributes it references
+
+    `cells[i]` is the class combination of cell i. Bit i of `target` is
+    set if the policy's Target matches in cell i, of `applicable[r]` if
+    rule r's Target matches there and of `true[r]` if rule r also yields
+    its effect there. `decisions[i]` is the policy decision, None where
+    its Target does not match.
+    """
+
+    def __init__(self, pdp, policy, axes: List[AttributeAxis]):
+        self.policy = policy
+        self.axes = axes
+        self.cells = list(itertools.product(*[range(axis.class_count) for axis in axes]))
+        requests = [_request(axes, cell) for cell in self.cells]
+
+        self.target = _mask(pdp.evaluate_policy_target(policy, request) is True for request in requests)
+        self.outcomes = [[pdp.evaluate_rule(policy, r, request) for request in requests]
+                         for r in range(len(policy.rules))]
+        self.applicable = [_mask(outcome is not None for outcome in outcomes) for outcomes in self.outcomes]
+        self.true = [_mask(outcome is True for outcome in outcomes) for outcomes in self.outcomes]
+        self.decisions = [self.decide(pdp, i) if self.target >> i & 1 else None for i in range(len(self.cells))]
+
+    def decide(self, pdp, cell: int, without: Optional[int] = None) -> str:
+        """Policy decision in a cell where its Target matches, optionally with one rule removed"""
+        return pdp.combine_rule_outcomes(self.policy, ((rule, self.outcomes[r][cell])
+                                                       for r, rule in enumerate(self.policy.rules) if r != without))
+
+    def region_cells(self, mask: int) -> List[tuple]:
+        return [self.cells[i] for i in _indices(mask)]
+
+
+def _rule_findings(pdp, space: PolicySpace) -> List[Finding]:
+    findings = []
+    policy = space.policy
+    first_applicable = short_id(policy.rule_combining_alg or "") == 'first-applicable'
+    for r, rule in enumerate(policy.rules):
+        where = f"{policy.policy_id}/{rule.rule_id}"
+        applicable = space.applicable[r] & space.target
+        true = space.true[r] & space.target
+        if not applicable:
+            findings.append(Finding(UNREACHABLE, where, "Target never matches where the policy applies"))
+            continue
+        if not true:
+            findings.append(Finding(UNREACHABLE, where, f"Condition is never true, the rule never yields {rule.effect}",
+                                    _regions(space.axes, space.region_cells(applicable)), 0, len(space.cells)))
+            continue
+        if any(space.decide(pdp, i, without=r) != space.decisions[i] for i in _indices(space.target)):
+            continue
+
+        # Removing the rule changes no decision: say which rules decide in its place
+        if first_applicable:
+            others = [o for o in range(r) if space.true[o] & true]
+        else:
+            others = [o for o, other in enumerate(policy.rules)
+                      if o != r and other.effect == rule.effect and space.true[o] & true]
+        subsuming = [o for o in others if not true & ~space.true[o]]
+        if subsuming:
+            reason = (f"subsumed by {policy.rules[subsuming[0]].rule_id}, which "
+                      f"{'comes first and applies' if first_applicable else f'yields {rule.effect}'} "
+                      f"wherever this rule yields {rule.effect}")
+        elif others:
+            reason = f"{rule.effect} wherever it applies is already decided by " \
+                     f"{', '.join(policy.rules[o].rule_id for o in others)}"
+        else:
+            reason = f"the rule's {rule.effect} matches the policy's default decision wherever it applies"
+        findings.append(Finding(SHADOWED, where, f"Never changes the policy decision: {reason}",
+                                _regions(space.axes, space.region_cells(true)),
+                                bin(true).count("1"), len(space.cells)))
+    return findings
+
+
+def _policy_findings(pdp, space: PolicySpace) -> List[Finding]:
+    policy_id = space.policy.policy_id
+    if not space.target:
+        return [Finding(UNREACHABLE, policy_id, "Target never matches")]
+    findings = []
+    unmatched = [i for i in _indices(space.target) if space.decisions[i] == "NotApplicable"]
+    if unmatched:
+        findings.append(Finding(UNCOVERED, policy_id, "Target matches but no rule applies, the policy is NotApplicable",
+                                _regions(space.axes, [space.cells[i] for i in unmatched]),
+                                len(unmatched), len(space.cells)))
+    return findings + _rule_findings(pdp, space)
+
+
+def _conflict_findings(pdp, first: PolicySpace, second: PolicySpace) -> List[Finding]:
+    """Cells of the joint space of two policies where one permits and the other denies"""
+    first_keys = [axis.key for axis in first.axes]
+    second_keys = [axis.key for axis in second.axes]
+    shared = [key for key in first_keys if key in second_keys]
+    axes = first.axes + [axis for axis in second.axes if axis.key not in first_keys]
+    total = 1
+    for axis in axes:
+        total *= axis.class_count
+
+    def by_shared_classes(space: PolicySpace, keys: List[Tuple[str, str]]) -> Dict[tuple, Dict[str, List[int]]]:
+        positions = [keys.index(key) for key in shared]
+        groups = {}
+        for i, decision in enumerate(space.decisions):
+            if decision in ("Permit", "Deny"):
+                projection = tuple(space.cells[i][p] for p in positions)
+                groups.setdefault(projection, {}).setdefault(decision, []).append(i)
+        return groups
+
+    first_groups = by_shared_classes(first, first_keys)
+    second_groups = by_shared_classes(second, second_keys)
+    second_only = [second_keys.index(axis.key) for axis in axes[len(first_keys):]]
+
+    findings = []
+    for first_decision, second_decision in (("Permit", "Deny"), ("Deny", "Permit")):
+        cells = 0
+        cubes = []
+        for projection, decisions in first_groups.items():
+            first_cells = decisions.get(first_decision, ())
+            second_cells = second_groups.get(projection, {}).get(second_decision, ())
+            if not first_cells or not second_cells:
+                continue
+            cells += len(first_cells) * len(second_cells)
+            # Merge each side on its own, then join them; the shared
+            # attributes have the same classes on both sides
+            second_cubes = merge_cells(second.axes, [second.cells[i] for i in second_cells])
+            for first_cube in merge_cells(first.axes, [first.cells[i] for i in first_cells]):
+                cubes.extend(first_cube + tuple(cube[p] for p in second_only) for cube in second_cubes)
+        if not cells:
+            continue
+        decision = pdp.combine_policy_decisions(iter((first_decision, second_decision)))
+        loser = first.policy.policy_id if decision == second_decision else second.policy.policy_id
+        findings.append(Finding(
+            CONFLICT, f"{first.policy.policy_id} vs {second.policy.policy_id}",
+            f"{first.policy.policy_id} decides {first_decision} and {second.policy.policy_id} decides "
+            f"{second_decision}; {pdp.snapshot.policy_combining_alg} makes it {decision}, overriding {loser}",
+            tuple({axis.attribute_id: describe_class(axis, cls) for axis, cls in zip(axes, cube) if cls is not None}
+                  for cube in merge_cells(axes, cubes)),
+            cells, total))
+    return findings
+
+
+def _coverage_findings(pdp, policies, axes_by_key) -> List[Finding]:
+    """Cells where no policy Target matches, so the policy set is NotApplicable"""
+    if any(not policy.target for policy in policies):
+        return []
+    keys = []
+    for policy in policies:
+        for any_of in policy.target:
+            for all_of in any_of:
+                for match in all_of:
+                    if match.designator.key not in keys:
+                        keys.append(match.designator.key)
+    axes = [axes_by_key[key] for key in keys]
+    cells = list(itertools.product(*[range(axis.class_count) for axis in axes]))
+    uncovered = [cell for cell in cells
+                 if not any(pdp.evaluate_policy_target(policy, _request(axes, cell)) is True for policy in policies)]
+    if not uncovered:
+        return []
+    return [Finding(UNCOVERED, pdp.policy_set.policy_set_id or "<PolicySet>",
+                    "No policy Target matches, the policy set is NotApplicable",
+                    _regions(axes, uncovered), len(uncovered), len(cells))]
+
+
+def analyze_policy(pdp) -> List[Finding]:
+    """
+    Findings for the policy a FileBasedPDP currently evaluates
+
+    Raises PolicyAnalysisError for a policy whose attributes cannot be
+    discretized (see decision_table.policy_predicates), or that has a
+    PolicySet Target or nested PolicySets.
+    """
+    if pdp.policy_set.target or len(pdp.snapshot.compiled) != len(pdp.policy_set.policies):
+        raise PolicyAnalysisError("PolicySet targets and nested PolicySets are not supported")
+    policies = pdp.policies
+    predicates_per_policy, axes_by_key = discretize_policies(policies)
+    spaces = [PolicySpace(pdp, policy, [axes_by_key[key] for key in predicates])
+              for policy, predicates in zip(policies, predicates_per_policy)]
+
+    findings = []
+    for space in spaces:
+        findings.extend(_policy_findings(pdp, space))
+    for first, second in itertools.combinations(spaces, 2):
+        findings.extend(_conflict_findings(pdp, first, second))
+    findings.extend(_coverage_findings(pdp, policies, axes_by_key))
+    return sorted(findings, key=lambda finding: FINDING_KINDS.index(finding.kind))
+
+
+def format_finding(finding: Finding, max_regions: int = DEFAULT_MAX_REGIONS) -> List[str]:
+    """Report lines for one finding"""
+    share = f" ({finding.cells} of {finding.total} classes)" if finding.cells else ""
+    lines = [f"{finding.kind}: {finding.subject}: {finding.message}{share}"]
+    for region in finding.regions[:max_regions]:
+        lines.append(f"    where {format_region(region)}")
+    if len(finding.regions) > max_regions:
+        lines.append(f"    ... and {len(finding.regions) - max_regions} more regions")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report unreachable and shadowed rules, conflicts and gaps in a policy')
+    parser.add_argument('policy_file', type=str, help='XACML policy file or compiled artifact')
+    parser.add_argument('--json', action='store_true', help='Print the findings as JSON')
+    parser.add_argument('--max-regions', type=int, default=DEFAULT_MAX_REGIONS, help='Regions shown per finding')
+    parser.add_argument('--kind', choices=FINDING_KINDS, action='append', help='Only report these kinds of findings')
+
+    args = parser.parse_args()
+
+    pdp = FileBasedPDP(args.policy_file)
+    start = time.perf_counter()
+    try:
+        findings = analyze_policy(pdp)
+    except PolicyAnalysisError as e:
+        print(f"error: {e}", file=sys.stderr)
+        sys.exit(2)
+    elapsed = time.perf_counter() - start
+    if args.kind:
+        findings = [finding for finding in findings if finding.kind in args.kind]
+
+    if args.json:
+        print(json.dumps([finding._asdict() for finding in findings], indent=2))
+        return
+    for finding in findings:
+        print("\n".join(format_finding(finding, args.max_regions)))
+    print(f"{len(findings)} finding(s) in {elapsed * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
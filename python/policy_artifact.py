@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+"""
+Versioned, checksummed binary artifact for compiled policies
+
+Layout (little-endian):
+    8 bytes   magic b"FAAPOLC\\0"
+    2 bytes   format version
+    2 bytes   reserved
+    4 bytes   payload length
+    32 bytes  SHA-256 of the payload
+    payload   pickled (metadata dict, compiled policy tree)
+
+The compiled tree (see policy_compiler.py) is made of NamedTuples, which
+pickle rebuilds in C without any XML parsing. Unpickling is restricted to
+those node types, so an artifact cannot reference any other class.
+"""
+
+import io
+import os
+import struct
+import pickle
+import hashlib
+from typing import Any, Dict, Tuple
+
+from policy_compiler import (AdviceExpression, Apply, AttributeAssignmentExpression, AttributeDesignator,
+                             AttributeValue, Function, Match, ObligationExpression, Policy, PolicyReference,
+                             PolicySet, Rule)
+
+ARTIFACT_MAGIC = b"FAAPOLC\0"
+ARTIFACT_VERSION = 2
+ARTIFACT_HEADER = struct.Struct("<8sHHI32s")
+
+PICKLE_PROTOCOL = 5
+
+NODE_TYPES = (PolicySet, Policy, Rule, Match, Apply, AttributeValue, AttributeDesignator, Function,
+              ObligationExpression, AdviceExpression, AttributeAssignmentExpression, PolicyReference)
+
+
+class PolicyArtifactError(Exception):
+    """Raised when an artifact is malformed, corrupted or of another version"""
+
+
+class _PolicyUnpickler(pickle.Unpickler):
+    """Unpickler that only resolves the compiled policy node types"""
+
+    _allowed = {(node_type.__module__, node_type.__name__): node_type for node_type in NODE_TYPES}
+
+    def find_class(self, module, name):
+        try:
+            return self._allowed[(module, name)]
+        except KeyError:
+            raise PolicyArtifactError(f"Artifact references a disallowed type {module}.{name}")
+
+
+def dump_artifact(policy_set: PolicySet, metadata: Dict[str, Any] = None) -> bytes:
+    """Serialize a compiled policy set into artifact bytes"""
+    payload = pickle.dumps((metadata or {}, policy_set), PICKLE_PROTOCOL)
+    header = ARTIFACT_HEADER.pack(ARTIFACT_MAGIC, ARTIFACT_VERSION, 0, len(payload),
+                                  hashlib.sha256(payload).digest())
+    return header + payload
+
+
+def load_artifact(data: bytes) -> Tuple[PolicySet, Dict[str, Any]]:
+    """
+    Deserialize artifact bytes into (compiled policy set, metadata)
+
+    Raises PolicyArtifactError on a bad magic number, an unsupported
+    version, a truncated payload or a checksum mismatch.
+    """
+    if len(data) < ARTIFACT_HEADER.size:
+        raise PolicyArtifactError("Artifact is truncated")
+    magic, version, _, length, digest = ARTIFACT_HEADER.unpack_from(data, 0)
+    if magic != ARTIFACT_MAGIC:
+        raise PolicyArtifactError("Not a compiled policy artifact")
+    if version != ARTIFACT_VERSION:
+        raise PolicyArtifactError(f"Unsupported artifact version {version} (expected {ARTIFACT_VERSION})")
+
+    payload = data[ARTIFACT_HEADER.size:ARTIFACT_HEADER.size + length]
+    if len(payload) != length:
+        raise PolicyArtifactError("Artifact is truncated")
+    if hashlib.sha256(payload).digest() != digest:
+        raise PolicyArtifactError("Artifact checksum mismatch")
+
+    try:
+        metadata, policy_set = _PolicyUnpickler(io.BytesIO(payload)).load()
+    except (pickle.UnpicklingError, EOFError, ValueError, TypeError) as e:
+        raise PolicyArtifactError(f"Malformed artifact payload: {e}")
+    if not isinstance(metadata, dict) or not isinstance(policy_set, (PolicySet, Policy)):
+        raise PolicyArtifactError("Malformed artifact payload: not a (metadata, policy) pair")
+    return policy_set, metadata
+
+
+def is_artifact(path: str) -> bool:
+    """Whether a file starts with the artifact magic number"""
+    with open(path, 'rb') as f:
+        return f.read(len(ARTIFACT_MAGIC)) == ARTIFACT_MAGIC
+
+
+def read_artifact(path: str) -> Tuple[PolicySet, Dict[str, Any]]:
+    """Load a compiled policy artifact file"""
+    with open(path, 'rb') as f:
+        return load_artifact(f.read())
+
+
+def write_artifact(path: str, policy_set: PolicySet, metadata: Dict[str, Any] = None):
+    """
+    Write a compiled policy artifact file
+
+    The artifact is written and fsynced under a temporary name in the same
+    directory, then renamed over `path`, so a PDP starting meanwhile reads
+    either the old artifact or the new one, never a partial file.
+    """
+    data = dump_artifact(policy_set, metadata)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
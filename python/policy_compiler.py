@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+
+"""
+Compiles a XACML policy file into an immutable tree of plain Python tuples
+
+The compiled form mirrors the XACML structure (PolicySet, Policy, Rule,
+Target, Condition expressions) with attribute values already converted to
+Python types, so tools that analyze or evaluate the policy do not have to
+walk the XML again.
+"""
+
+import xml.etree.ElementTree as ET
+from typing import Any, NamedTuple, Optional, Tuple, Union
+
+
+class PolicyCompileError(Exception):
+    """Raised when a policy cannot be compiled"""
+
+
+class AttributeValue(NamedTuple):
+    """A literal value in a Match or Apply"""
+    data_type: str  # short XML Schema type name, e.g. 'boolean', 'double'
+    value: Any
+
+
+class AttributeDesignator(NamedTuple):
+    """A reference to a request attribute"""
+    category: str
+    attribute_id: str
+    data_type: str
+    must_be_present: bool
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return (self.category, self.attribute_id)
+
+
+class Apply(NamedTuple):
+    """A function application inside a Condition"""
+    function_id: str
+    arguments: tuple
+
+
+class Function(NamedTuple):
+    """A function passed as an argument to a higher-order function"""
+    function_id: str
+
+
+class Match(NamedTuple):
+    """A Match inside a Target's AllOf"""
+    function_id: str
+    value: AttributeValue
+    designator: AttributeDesignator
+
+
+class AttributeAssignmentExpression(NamedTuple):
+    """An attribute of an Obligation or Advice, computed from an expression"""
+    attribute_id: str
+    category: Optional[str]
+    expression: Union[Apply, AttributeValue, AttributeDesignator]
+
+
+class ObligationExpression(NamedTuple):
+    obligation_id: str
+    fulfill_on: str  # 'Permit' or 'Deny'
+    assignments: Tuple[AttributeAssignmentExpression, ...]
+
+
+class AdviceExpression(NamedTuple):
+    advice_id: str
+    applies_to: str  # 'Permit' or 'Deny'
+    assignments: Tuple[AttributeAssignmentExpression, ...]
+
+
+class Rule(NamedTuple):
+    rule_id: str
+    effect: str
+    target: tuple  # tuple of AnyOf, each a tuple of AllOf, each a tuple of Match
+    condition: Optional[Union[Apply, AttributeValue, AttributeDesignator]]
+    obligations: Tuple[ObligationExpression, ...] = ()
+    advice: Tuple[AdviceExpression, ...] = ()
+
+
+class Policy(NamedTuple):
+    policy_id: str
+    rule_combining_alg: str
+    target: tuple
+    rules: Tuple[Rule, ...]
+    obligations: Tuple[ObligationExpression, ...] = ()
+    advice: Tuple[AdviceExpression, ...] = ()
+
+
+class PolicyReference(NamedTuple):
+    """A PolicyIdReference or PolicySetIdReference, resolved by a policy directory"""
+    reference_id: str
+    is_policy_set: bool
+
+
+class PolicySet(NamedTuple):
+    policy_set_id: str
+    policy_combining_alg: str
+    target: tuple
+    policies: tuple  # Policy, nested PolicySet and PolicyReference entries, in document order
+    obligations: Tuple[ObligationExpression, ...] = ()
+    advice: Tuple[AdviceExpression, ...] = ()
+
+
+def local_name(tag: str) -> str:
+    """Strip the XML namespace from an element tag"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def short_id(identifier: str) -> str:
+    """Last component of a XACML URN, e.g. 'string-equal'"""
+    return identifier.split(':')[-1]
+
+
+def convert_value(text: str, data_type: str) -> Any:
+    """Convert AttributeValue text to a Python value, as FileBasedPDP does"""
+    text = (text or "").strip()
+    if data_type == 'boolean':
+        return text.lower() == 'true'
+    if data_type in ('integer', 'double'):
+        return float(text)
+    return text
+
+
+def _data_type(elem: ET.Element) -> str:
+    return (elem.get('DataType') or 'string').split('#')[-1]
+
+
+def _compile_value(elem: ET.Element) -> AttributeValue:
+    data_type = _data_type(elem)
+    try:
+        return AttributeValue(data_type, convert_value(elem.text, data_type))
+    except ValueError:
+        raise PolicyCompileError(f"Invalid {data_type} value: {elem.text!r}")
+
+
+def _compile_designator(elem: ET.Element) -> AttributeDesignator:
+    return AttributeDesignator(
+        category=elem.get('Category'),
+        attribute_id=elem.get('AttributeId'),
+        data_type=_data_type(elem),
+        must_be_present=(elem.get('MustBePresent', 'false').lower() == 'true')
+    )
+
+
+def _compile_expression(elem: ET.Element):
+    name = local_name(elem.tag)
+    if name == 'Apply':
+        return Apply(elem.get('FunctionId'), tuple(_compile_expression(child) for child in elem
+                                                   if local_name(child.tag) != 'Description'))
+    if name == 'AttributeValue':
+        return _compile_value(elem)
+    if name == 'AttributeDesignator':
+        return _compile_designator(elem)
+    if name == 'Function':
+        return Function(elem.get('FunctionId'))
+    raise PolicyCompileError(f"Unsupported expression element: {name}")
+
+
+def _compile_target(elem: Optional[ET.Element]) -> tuple:
+    if elem is None:
+        return ()
+    any_ofs = []
+    for any_of in elem.findall('{*}AnyOf'):
+        all_ofs = []
+        for all_of in any_of.findall('{*}AllOf'):
+            matches = []
+            for match in all_of.findall('{*}Match'):
+                value_elem = match.find('{*}AttributeValue')
+                desig_elem = match.find('{*}AttributeDesignator')
+                if value_elem is None or desig_elem is None:
+                    raise PolicyCompileError("Match requires an AttributeValue and an AttributeDesignator")
+                matches.append(Match(match.get('MatchId'), _compile_value(value_elem),
+                                     _compile_designator(desig_elem)))
+            all_ofs.append(tuple(matches))
+        any_ofs.append(tuple(all_ofs))
+    return tuple(any_ofs)
+
+
+def _compile_assignments(elem: ET.Element) -> Tuple[AttributeAssignmentExpression, ...]:
+    assignments = []
+    for assignment in elem.findall('{*}AttributeAssignmentExpression'):
+        expressions = [child for child in assignment if local_name(child.tag) != 'Description']
+        if len(expressions) != 1:
+            raise PolicyCompileError(f"AttributeAssignmentExpression {assignment.get('AttributeId')} "
+                                     f"must contain one expression")
+        assignments.append(AttributeAssignmentExpression(assignment.get('AttributeId'), assignment.get('Category'),
+                                                         _compile_expression(expressions[0])))
+    return tuple(assignments)
+
+
+def _compile_obligations(elem: ET.Element) -> Tuple[ObligationExpression, ...]:
+    container = elem.find('{*}ObligationExpressions')
+    if container is None:
+        return ()
+    return tuple(ObligationExpression(expression.get('ObligationId'), expression.get('FulfillOn'),
+                                      _compile_assignments(expression))
+                 for expression in container.findall('{*}ObligationExpression'))
+
+
+def _compile_advice(elem: ET.Element) -> Tuple[AdviceExpression, ...]:
+    container = elem.find('{*}AdviceExpressions')
+    if container is None:
+        return ()
+    return tuple(AdviceExpression(expression.get('AdviceId'), expression.get('AppliesTo'),
+                                  _compile_assignments(expression))
+                 for expression in container.findall('{*}AdviceExpression'))
+
+
+def _compile_rule(elem: ET.Element) -> Rule:
+    condition = None
+    condition_elem = elem.find('{*}Condition')
+    if condition_elem is not None:
+        expressions = [child for child in condition_elem if local_name(child.tag) != 'Description']
+        if len(expressions) != 1:
+            raise PolicyCompileError(f"Condition of rule {elem.get('RuleId')} must contain one expression")
+        condition = _compile_expression(expressions[0])
+    return Rule(
+        rule_id=elem.get('RuleId'),
+        effect=elem.get('Effect'),
+        target=_compile_target(elem.find('{*}Target')),
+        condition=condition,
+        obligations=_compile_obligations(elem),
+        advice=_compile_advice(elem)
+    )
+
+
+def _compile_policy(elem: ET.Element) -> Policy:
+    return Policy(
+        policy_id=elem.get('PolicyId'),
+        rule_combining_alg=elem.get('RuleCombiningAlgId'),
+        target=_compile_target(elem.find('{*}Target')),
+        rules=tuple(_compile_rule(rule) for rule in elem.findall('{*}Rule')),
+        obligations=_compile_obligations(elem),
+        advice=_compile_advice(elem)
+    )
+
+
+def _compile_policy_set(elem: ET.Element) -> PolicySet:
+    policies = []
+    for child in elem:
+        name = local_name(child.tag)
+        if name == 'Policy':
+            policies.append(_compile_policy(child))
+        elif name == 'PolicySet':
+            policies.append(_compile_policy_set(child))
+        elif name in ('PolicyIdReference', 'PolicySetIdReference'):
+            reference_id = (child.text or "").strip()
+            if not reference_id:
+                raise PolicyCompileError(f"Empty {name} in PolicySet {elem.get('PolicySetId')}")
+            policies.append(PolicyReference(reference_id, name == 'PolicySetIdReference'))
+    return PolicySet(
+        policy_set_id=elem.get('PolicySetId'),
+        policy_combining_alg=elem.get('PolicyCombiningAlgId'),
+        target=_compile_target(elem.find('{*}Target')),
+        policies=tuple(policies),
+        obligations=_compile_obligations(elem),
+        advice=_compile_advice(elem)
+    )
+
+
+def compile_policy(source) -> PolicySet:
+    """
+    Compile a XACML PolicySet
+
+    `source` is a file path or an already parsed root Element.
+    """
+    root = ET.parse(source).getroot() if isinstance(source, str) else source
+    if local_name(root.tag) != 'PolicySet':
+        raise PolicyCompileError(f"Expected a PolicySet root element, found {local_name(root.tag)}")
+    return _compile_policy_set(root)
+
+
+def compile_policy_document(source) -> Union[Policy, PolicySet]:
+    """
+    Compile a XACML document whose root is a Policy or a PolicySet
+
+    `source` is a file path or an already parsed root Element.
+    """
+    root = ET.parse(source).getroot() if isinstance(source, str) else source
+    name = local_name(root.tag)
+    if name == 'Policy':
+        return _compile_policy(root)
+    if name == 'PolicySet':
+        return _compile_policy_set(root)
+    raise PolicyCompileError(f"Expected a Policy or PolicySet root element, found {name}")
+
+
+def read_policy_header(path: str) -> Tuple[bool, str, tuple]:
+    """
+    (is_policy_set, PolicyId or PolicySetId, compiled Target) of a policy
+    document, parsing no further than its Target
+    """
+    root = None
+    depth = 0
+    for event, elem in ET.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if root is None:
+                root = elem
+                if local_name(root.tag) not in ('Policy', 'PolicySet'):
+                    raise PolicyCompileError(f"Expected a Policy or PolicySet root element, "
+                                             f"found {local_name(root.tag)}")
+            elif depth == 2 and local_name(elem.tag) not in ('Description', 'PolicyIssuer', 'PolicyDefaults',
+                                                              'PolicySetDefaults', 'Target'):
+                # The Target, if any, comes before everything else
+                break
+            continue
+        depth -= 1
+        if depth == 1 and local_name(elem.tag) == 'Target':
+            return _header(root, _compile_target(elem))
+    if root is None:
+        raise PolicyCompileError(f"{path} has no root element")
+    return _header(root, ())
+
+
+def _header(root: ET.Element, target: tuple) -> Tuple[bool, str, tuple]:
+    is_policy_set = local_name(root.tag) == 'PolicySet'
+    return is_policy_set, root.get('PolicySetId' if is_policy_set else 'PolicyId'), target
+
+
+def iter_policies(policy_set: PolicySet):
+    """Yield every Policy of a policy set, descending into nested PolicySets"""
+    for entry in policy_set.policies:
+        if isinstance(entry, PolicySet):
+            yield from iter_policies(entry)
+        elif isinstance(entry, Policy):
+            yield entry
+
+
+def iter_expressions(expression):
+    """Yield an expression and all its nested sub-expressions"""
+    yield expression
+    if isinstance(expression, Apply):
+        for argument in expression.arguments:
+            yield from iter_expressions(argument)
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+
+"""
+A directory of XACML policies, loaded lazily
+
+    python policy_directory.py ../pdp/policies
+    python policy_directory.py overlays/ --root-policy urn:example:root
+
+Like Balana's FileBasedPolicyFinderModule (BALANA_CONFIG_DIR), every
+*.xml file of the directory, including its subdirectories, holds one
+top-level Policy or PolicySet. Opening a directory only reads each file's
+root element and Target; a document is compiled the first time it is
+evaluated, either as a top-level policy or through a PolicyIdReference or
+PolicySetIdReference. References are resolved by id among all the
+documents of the directory. Version, EarliestVersion and LatestVersion
+are not matched, so ids must be unique.
+
+Without a root policy, the top-level documents are combined like
+Balana's finder does, with deny-overrides by default. A TargetIndex then
+selects, per request, only the documents whose Target can match it, so
+per-state or per-municipality overlays are neither compiled nor
+evaluated for requests outside their area. With a root policy, only that
+PolicySet is top level and the other documents are reached through
+references.
+
+FileBasedPDP opens a PolicyDirectory when its policy file is a directory.
+"""
+
+import os
+import logging
+import argparse
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from policy_compiler import (PolicyCompileError, PolicyReference, PolicySet, compile_policy_document,
+                             read_policy_header, short_id)
+
+DENY_OVERRIDES = "urn:oasis:names:tc:xacml:3.0:policy-combining-algorithm:deny-overrides"
+
+logger = logging.getLogger(__name__)
+
+
+class PolicyReferenceError(LookupError):
+    """Raised when a policy reference cannot be resolved"""
+
+
+class _Document:
+    __slots__ = ("path", "is_policy_set", "policy_id", "target")
+
+    def __init__(self, path: str, is_policy_set: bool, policy_id: str, target: tuple):
+        self.path = path
+        self.is_policy_set = is_policy_set
+        self.policy_id = policy_id
+        self.target = target
+
+
+def _references(node) -> Set[str]:
+    """Ids referenced from a compiled Policy or PolicySet, not following the references"""
+    ids = set()
+    if isinstance(node, PolicySet):
+        for child in node.policies:
+            if isinstance(child, PolicyReference):
+                ids.add(child.reference_id)
+            else:
+                ids.update(_references(child))
+    return ids
+
+
+def _index_key(target: tuple) -> Optional[Tuple[Tuple[str, str], Set[str]]]:
+    """
+    (attribute key, values) when a Target can only match requests whose
+    string attribute equals one of the values, else None
+    """
+    for any_of in target:
+        key = None
+        values = set()
+        for all_of in any_of:
+            equality = [match for match in all_of
+                        if short_id(match.function_id or "") == 'string-equal' and type(match.value.value) is str]
+            if not equality or (key is not None and equality[0].designator.key != key):
+                break
+            key = equality[0].designator.key
+            values.add(equality[0].value.value)
+        else:
+            if key is not None:
+                return key, values
+    return None
+
+
+class TargetIndex:
+    """
+    The children of a policy set, indexed by the string equality Matches
+    of their Targets
+
+    candidates() returns, in policy order, the children whose Target can
+    match a request; the others' Targets would not match, which every
+    combining algorithm treats alike, so leaving them out does not change
+    the decision. Requests without a single string value for an indexed
+    attribute get every child indexed on it.
+    """
+
+    def __init__(self, children: tuple, targets: List[tuple]):
+        self.children = children
+        self._unindexed: List[int] = []
+        # attribute key -> ({value: [position]}, [every position indexed on it])
+        self._index: Dict[Tuple[str, str], Tuple[Dict[str, List[int]], List[int]]] = {}
+        for position, target in enumerate(targets):
+            indexed = _index_key(target)
+            if indexed is None:
+                self._unindexed.append(position)
+                continue
+            key, values = indexed
+            by_value, positions = self._index.setdefault(key, ({}, []))
+            positions.append(position)
+            for value in values:
+                by_value.setdefault(value, []).append(position)
+
+    def __len__(self):
+        return len(self.children)
+
+    def candidates(self, attributes: Dict[str, Dict[str, Any]]) -> tuple:
+        """The children whose Target may match a request, in policy order"""
+        positions = list(self._unindexed)
+        for (category, attribute_id), (by_value, indexed) in self._index.items():
+            value = attributes.get(category, {}).get(attribute_id)
+            if type(value) is str:
+                positions.extend(by_value.get(value, ()))
+            else:
+                positions.extend(indexed)
+        children = self.children
+        return tuple(children[position] for position in sorted(positions))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"children": len(self.children), "unindexed": len(self._unindexed),
+                "indexed": {attribute_id: len(positions) for (_, attribute_id), (_, positions) in self._index.items()}}
+
+
+class PolicyDirectory:
+    """
+    The policy documents of a directory, compiled on first use
+
+    Thread-safe: a document is compiled once however many threads
+    resolve it at the same time.
+    """
+
+    def __init__(self, path: str, root_policy_id: str = None, policy_combining_alg: str = DENY_OVERRIDES):
+        self.path = path
+        self.root_policy_id = root_policy_id
+        self.policy_combining_alg = policy_combining_alg
+        self._documents: Dict[str, _Document] = {}
+        # Documents in file name order, which is the top-level evaluation order
+        self._order: List[_Document] = []
+        self._loaded: Dict[str, Any] = {}
+        self._errors: Dict[str, PolicyReferenceError] = {}
+        self._references: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+        for directory, subdirectories, files in os.walk(path):
+            subdirectories.sort()
+            for name in sorted(files):
+                if not name.endswith(".xml"):
+                    continue
+                file_path = os.path.join(directory, name)
+                try:
+                    is_policy_set, policy_id, target = read_policy_header(file_path)
+                except (OSError, SyntaxError, PolicyCompileError) as e:
+                    # SyntaxError covers ElementTree's ParseError
+                    raise PolicyCompileError(f"{file_path}: {e}")
+                if not policy_id:
+                    raise PolicyCompileError(f"{file_path}: missing {'PolicySetId' if is_policy_set else 'PolicyId'}")
+                if policy_id in self._documents:
+                    raise PolicyCompileError(f"{file_path}: {policy_id} is also defined in "
+                                             f"{self._documents[policy_id].path}")
+                document = _Document(file_path, is_policy_set, policy_id, target)
+                self._documents[policy_id] = document
+                self._order.append(document)
+        if root_policy_id is not None and root_policy_id not in self._documents:
+            raise PolicyCompileError(f"Root policy {root_policy_id} is not in {path}")
+
+    def __len__(self):
+        return len(self._documents)
+
+    @property
+    def loaded(self) -> Set[str]:
+        """Ids of the documents compiled so far"""
+        return set(self._loaded)
+
+    def root_policy_set(self) -> PolicySet:
+        """
+        The top-level PolicySet: the root policy, or a PolicySet named after
+        the directory that references every document
+        """
+        if self.root_policy_id is not None:
+            root = self.load(PolicyReference(self.root_policy_id, True))
+            if not isinstance(root, PolicySet):
+                raise PolicyCompileError(f"Root policy {self.root_policy_id} is not a PolicySet")
+            return root
+        return PolicySet(os.path.basename(os.path.normpath(self.path)), self.policy_combining_alg, (),
+                         tuple(PolicyReference(document.policy_id, document.is_policy_set)
+                               for document in self._order))
+
+    def target_index(self, policy_set: PolicySet, children: tuple) -> Optional[TargetIndex]:
+        """
+        A TargetIndex over the compiled children of the top-level policy
+        set, if it is the one root_policy_set() made
+        """
+        if self.root_policy_id is not None or policy_set.policies != tuple(
+                PolicyReference(document.policy_id, document.is_policy_set) for document in self._order):
+            return None
+        return TargetIndex(children, [document.target for document in self._order])
+
+    def load(self, reference: PolicyReference):
+        """
+        The compiled Policy or PolicySet a reference names
+
+        Raises PolicyReferenceError if there is no such document, it is of
+        the other kind, it does not compile or it references itself
+        through other documents.
+        """
+        policy_id = reference.reference_id
+        node = self._loaded.get(policy_id)
+        if node is None:
+            with self._lock:
+                node = self._loaded.get(policy_id)
+                if node is None:
+                    if policy_id in self._errors:
+                        raise self._errors[policy_id]
+                    try:
+                        node = self._compile(policy_id)
+                    except PolicyReferenceError as e:
+                        # Logged once; later resolutions raise the same error
+                        logger.warning(f"Cannot resolve policy reference {policy_id}: {e}")
+                        self._errors[policy_id] = e
+                        raise
+        if isinstance(node, PolicySet) != reference.is_policy_set:
+            raise PolicyReferenceError(f"{policy_id} is not a {'PolicySet' if reference.is_policy_set else 'Policy'}")
+        return node
+
+    def _compile(self, policy_id: str):
+        document = self._documents.get(policy_id)
+        if document is None:
+            raise PolicyReferenceError(f"No policy {policy_id} in {self.path}")
+        try:
+            node = compile_policy_document(document.path)
+        except (OSError, PolicyCompileError) as e:
+            raise PolicyReferenceError(f"{document.path}: {e}")
+        references = _references(node)
+        cycle = self._cycle(policy_id, references)
+        if cycle:
+            raise PolicyReferenceError(f"Circular policy reference: {' -> '.join(cycle)}")
+        self._references[policy_id] = references
+        self._loaded[policy_id] = node
+        return node
+
+    def _cycle(self, policy_id: str, references: Set[str]) -> Optional[List[str]]:
+        """
+        A chain of references from policy_id back to itself through the
+        documents loaded so far; a cycle is found when its last document
+        is loaded, as all the others are then loaded already
+        """
+        stack = [(reference, [policy_id, reference]) for reference in sorted(references)]
+        seen = set()
+        while stack:
+            current, chain = stack.pop()
+            if current == policy_id:
+                return chain
+            if current in seen:
+                continue
+            seen.add(current)
+            stack.extend((reference, chain + [reference]) for reference in sorted(self._references.get(current, ())))
+        return None
+
+    def inline(self, policy_set: PolicySet) -> PolicySet:
+        """
+        A policy set with every reference replaced by the document it
+        names, loading all of them; for tools that need the whole policy
+        """
+        def resolve(node, chain):
+            if isinstance(node, PolicyReference):
+                if node.reference_id in chain:
+                    raise PolicyReferenceError(f"Circular policy reference: "
+                                               f"{' -> '.join(chain + (node.reference_id,))}")
+                return resolve(self.load(node), chain + (node.reference_id,))
+            if isinstance(node, PolicySet):
+                return node._replace(policies=tuple(resolve(child, chain) for child in node.policies))
+            return node
+        return resolve(policy_set, ())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='List the documents of a policy directory and its target index')
+    parser.add_argument('directory', type=str, help='Directory of XACML policy files')
+    parser.add_argument('--root-policy', type=str, default=None, help='PolicySetId of the top-level PolicySet')
+    args = parser.parse_args()
+
+    directory = PolicyDirectory(args.directory, args.root_policy)
+    policy_set = directory.root_policy_set()
+    print(f"{len(directory)} policy documents, top level: {policy_set.policy_set_id} "
+          f"[{short_id(policy_set.policy_combining_alg or '')}]")
+    index = directory.target_index(policy_set, tuple(policy_set.policies))
+    if index is not None:
+        stats = index.stats()
+        print(f"  {stats['unindexed']} evaluated for every request")
+        for attribute_id, count in sorted(stats["indexed"].items()):
+            print(f"  {count} indexed by {attribute_id}")
+    try:
+        directory.inline(policy_set)
+    except PolicyReferenceError as e:
+        print(f"Unresolved: {e}")
+
+
+if __name__ == "__main__":
+    main()
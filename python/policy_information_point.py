@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+"""
+Policy Information Point: attributes fetched on demand from local stores
+
+An AttributeFinder provides some attributes of one category, looked up
+by a key attribute of the request (a pilot or aircraft id, say). The
+PolicyInformationPoint wraps request attributes so that a designator
+reading an attribute the request lacks calls the finder for it. Only
+attributes the compiled policy actually reads on the evaluation path are
+fetched.
+
+Requests resolved together with resolve_batch share lookups: the first
+request that needs a finder fetches that finder's attributes for every
+request in the batch in one find_many call. Finder results, including
+"no record", are cached per finder and key for the finder's TTL.
+"""
+
+import csv
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from xacml_functions import Indeterminate
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 300.0  # seconds
+DEFAULT_MAX_ENTRIES = 100000
+SQLITE_CHUNK = 500  # keys per query, below SQLite's host parameter limit
+
+
+def convert_value(value: Any, data_type: str) -> Any:
+    """Convert a stored value to the Python type FileBasedPDP uses for `data_type`"""
+    if data_type == 'boolean':
+        if isinstance(value, str):
+            return value.strip().lower() in ('true', '1', 'yes')
+        return bool(value)
+    if data_type in ('integer', 'double'):
+        return float(value)
+    return str(value)
+
+
+class AttributeFinder:
+    """
+    Base class of attribute finders
+
+    Provides `columns` ({attribute_id: (column, data_type)}) in `category`
+    for requests that carry the attribute `key` ((category, attribute_id)).
+    `name` identifies the finder in logs and must be unique within a PIP.
+    Subclasses implement find_many.
+    """
+
+    def __init__(self, category: str, columns: Dict[str, Tuple[str, str]], key: Tuple[str, str],
+                 ttl: float = DEFAULT_TTL, name: str = None):
+        self.category = category
+        self.columns = columns
+        self.key = key
+        self.ttl = ttl
+        self.name = name or f"{type(self).__name__}({key[1]})"
+
+    def find_many(self, keys: List[Any]) -> Dict[Any, Dict[str, Any]]:
+        """
+        Attributes for each key that has a record: {key: {attribute_id: value}}
+        """
+        raise NotImplementedError
+
+    def _record(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        return {attribute_id: convert_value(row[column], data_type)
+                for attribute_id, (column, data_type) in self.columns.items()
+                if row.get(column) not in (None, '')}
+
+
+class SQLiteAttributeFinder(AttributeFinder):
+    """Attributes from the columns of one SQLite table, keyed by `key_column`"""
+
+    def __init__(self, database: str, table: str, key_column: str, category: str,
+                 columns: Dict[str, Tuple[str, str]], key: Tuple[str, str], **kwargs):
+        kwargs.setdefault('name', f"{type(self).__name__}({database}:{table}.{key_column})")
+        super().__init__(category, columns, key, **kwargs)
+        self.database = database
+        self.table = table
+        self.key_column = key_column
+        self._local = threading.local()
+        selected = [key_column] + sorted({column for column, _ in columns.values()})
+        self._select = f"SELECT {', '.join(selected)} FROM {table} WHERE {key_column} IN "
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = sqlite3.connect(self.database)
+            connection.row_factory = sqlite3.Row
+        return connection
+
+    def find_many(self, keys: List[Any]) -> Dict[Any, Dict[str, Any]]:
+        connection = self._connection()
+        records = {}
+        for start in range(0, len(keys), SQLITE_CHUNK):
+            chunk = keys[start:start + SQLITE_CHUNK]
+            query = self._select + f"({', '.join('?' * len(chunk))})"
+            for row in connection.execute(query, chunk):
+                records[row[self.key_column]] = self._record(dict(row))
+        return records
+
+
+class CSVAttributeFinder(AttributeFinder):
+    """Attributes from a CSV file with a header row, read once at construction"""
+
+    def __init__(self, path: str, key_column: str, category: str,
+                 columns: Dict[str, Tuple[str, str]], key: Tuple[str, str], **kwargs):
+        kwargs.setdefault('name', f"{type(self).__name__}({path}:{key_column})")
+        super().__init__(category, columns, key, **kwargs)
+        with open(path, newline='') as f:
+            self.records = {row[key_column]: self._record(row) for row in csv.DictReader(f)}
+
+    def find_many(self, keys: List[Any]) -> Dict[Any, Dict[str, Any]]:
+        return {key: self.records[str(key)] for key in keys if str(key) in self.records}
+
+
+def _request_key(attributes: Dict[str, Dict[str, Any]], key: Tuple[str, str]) -> Optional[Any]:
+    category, attribute_id = key
+    value = dict.get(attributes, category, {}).get(attribute_id)
+    if type(value) in (list, tuple):
+        value = value[0] if len(value) == 1 else None
+    return value
+
+
+class _Batch:
+    """Requests resolved together, with the finder results fetched for them"""
+
+    def __init__(self, pip: "PolicyInformationPoint", requests: List[Dict[str, Dict[str, Any]]]):
+        self.pip = pip
+        self.requests = requests
+        self.results: Dict[AttributeFinder, Dict[Any, Dict[str, Any]]] = {}
+
+    def find(self, finder: AttributeFinder, key: Any) -> Dict[str, Any]:
+        results = self.results.get(finder)
+        if results is None:
+            keys = {_request_key(request, finder.key) for request in self.requests}
+            keys.discard(None)
+            results = self.results[finder] = self.pip.fetch(finder, list(keys))
+        return results.get(key, {})
+
+
+class _ResolvingCategory(dict):
+    """One category of request attributes; missing attributes go to the PIP"""
+
+    def __init__(self, values, category: str, request: "ResolvedAttributes"):
+        super().__init__(values)
+        self._category = category
+        self._request = request
+
+    def __missing__(self, attribute_id):
+        value = self._request.find(self._category, attribute_id)
+        self[attribute_id] = value
+        return value
+
+
+class ResolvedAttributes(dict):
+    """
+    {category: {attribute_id: value}} request attributes that fetch
+    missing attributes from the PIP; raises KeyError when no finder has one
+    """
+
+    def __init__(self, attributes: Dict[str, Dict[str, Any]], batch: _Batch):
+        super().__init__((category, _ResolvingCategory(values, category, self))
+                         for category, values in attributes.items())
+        self._attributes = attributes
+        self._batch = batch
+
+    def __missing__(self, category):
+        if category not in self._batch.pip.categories:
+            raise KeyError(category)
+        values = self[category] = _ResolvingCategory({}, category, self)
+        return values
+
+    def find(self, category: str, attribute_id: str) -> Any:
+        finder = self._batch.pip.finder(category, attribute_id)
+        if finder is None:
+            raise KeyError(attribute_id)
+        key = _request_key(self._attributes, finder.key)
+        if key is None:
+            raise KeyError(attribute_id)
+        try:
+            record = self._batch.find(finder, key)
+        except Exception as e:
+            logger.error(f"{finder.name} failed: {e}")
+            raise Indeterminate(f"Lookup of {attribute_id} failed: {e}")
+        return record[attribute_id]
+
+
+class PolicyInformationPoint:
+    """
+    Registry of attribute finders with a shared TTL cache
+
+    Thread-safe once all finders are registered.
+    """
+
+    def __init__(self, finders: Iterable[AttributeFinder] = (), max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._finders: Dict[Tuple[str, str], AttributeFinder] = {}
+        self.categories = set()
+        self._names: Dict[str, AttributeFinder] = {}
+        # Keyed by the finder object: names are for people, not for lookups
+        self._cache: "OrderedDict[Tuple[AttributeFinder, Any], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.lookups = 0  # find_many calls
+        self.cache_hits = 0
+        for finder in finders:
+            self.register(finder)
+
+    def register(self, finder: AttributeFinder):
+        """
+        Add a finder; raises ValueError if another finder has the same name
+        or provides one of its attributes
+        """
+        if finder.name in self._names:
+            raise ValueError(f"A finder named {finder.name} is already registered")
+        for attribute_id in finder.columns:
+            other = self._finders.get((finder.category, attribute_id))
+            if other is not None:
+                raise ValueError(f"{attribute_id} is already provided by {other.name}")
+        for attribute_id in finder.columns:
+            self._finders[(finder.category, attribute_id)] = finder
+        self._names[finder.name] = finder
+        self.categories.add(finder.category)
+
+    def finder(self, category: str, attribute_id: str) -> Optional[AttributeFinder]:
+        return self._finders.get((category, attribute_id))
+
+    def resolve(self, attributes: Dict[str, Dict[str, Any]]) -> ResolvedAttributes:
+        """Wrap one request's attributes for evaluation"""
+        return ResolvedAttributes(attributes, _Batch(self, [attributes]))
+
+    def resolve_batch(self, requests: List[Dict[str, Dict[str, Any]]]) -> List[ResolvedAttributes]:
+        """Wrap several requests so each finder is queried at most once for all of them"""
+        batch = _Batch(self, requests)
+        return [ResolvedAttributes(attributes, batch) for attributes in requests]
+
+    def fetch(self, finder: AttributeFinder, keys: List[Any]) -> Dict[Any, Dict[str, Any]]:
+        """Records for `keys` from the cache, querying the finder once for the rest"""
+        now = time.monotonic()
+        results = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                cached = self._cache.get((finder, key))
+                if cached is not None and cached[0] > now:
+                    self._cache.move_to_end((finder, key))
+                    results[key] = cached[1]
+                    self.cache_hits += 1
+                else:
+                    missing.append(key)
+        if not missing:
+            return results
+
+        found = finder.find_many(missing)
+        expires = now + finder.ttl
+        with self._lock:
+            self.lookups += 1
+            for key in missing:
+                record = results[key] = found.get(key, {})
+                self._cache[(finder, key)] = (expires, record)
+                self._cache.move_to_end((finder, key))
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return results
+
+    def invalidate(self, finder: AttributeFinder = None):
+        """Drop cached records of one finder, or of all finders"""
+        with self._lock:
+            if finder is None:
+                self._cache.clear()
+            else:
+                for cache_key in [k for k in self._cache if k[0] is finder]:
+                    del self._cache[cache_key]
@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+
+"""
+Streaming compliance monitor for live drone telemetry
+
+Each drone is registered with its flight's DroneOperation; telemetry
+frames then update individual fields (operating_altitude,
+operating_speed, flight_visibility, ...) at high rate. For every drone
+the monitor keeps the request attributes, the outcome of every rule and
+the decision of every policy, and on each frame re-evaluates only the
+rules and policy targets that reference an attribute the frame changed,
+so an altitude-only frame touches only the altitude rules. Only changes
+in the overall decision are reported, as ComplianceTransition records.
+
+Frames can come from any iterator, an asyncio stream or a local socket
+speaking newline-delimited JSON:
+
+    {"drone_id": "N123", "timestamp": 12.5, "operating_altitude": 410.0}
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+from dataclasses import asdict
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from drone_operation import DroneOperation
+from drone_attributes import OPERATION_ATTRIBUTES, operation_to_attributes
+from file_based_pdp import FileBasedPDP
+from policy_compiler import AttributeDesignator, iter_expressions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLICY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../policies/FAADroneRules.xml")
+
+
+class TelemetryFrame(NamedTuple):
+    """One telemetry sample: new values for some DroneOperation fields"""
+    drone_id: str
+    timestamp: float
+    values: Dict[str, Any]
+
+
+class ComplianceTransition(NamedTuple):
+    """A change in a drone's overall decision"""
+    drone_id: str
+    timestamp: float
+    previous_decision: Optional[str]  # None when the drone is first registered
+    decision: str
+    changed_fields: Tuple[str, ...]   # fields of the frame that caused the change
+    changed_rules: Tuple[str, ...]    # "policy/rule" ids whose outcome changed
+
+    @property
+    def compliant(self) -> bool:
+        return self.decision == "Permit"
+
+
+def frame_from_dict(data: Dict[str, Any]) -> TelemetryFrame:
+    """Build a frame from a decoded JSON object with drone_id, timestamp and field values"""
+    values = dict(data)
+    try:
+        drone_id = str(values.pop("drone_id"))
+    except KeyError:
+        raise ValueError("Telemetry frame without drone_id")
+    timestamp = float(values.pop("timestamp", time.time()))
+    return TelemetryFrame(drone_id, timestamp, values)
+
+
+def _target_keys(target: tuple) -> set:
+    return {match.designator.key for any_of in target for all_of in any_of for match in all_of}
+
+
+def _condition_keys(condition) -> set:
+    return {expression.key for expression in iter_expressions(condition)
+            if isinstance(expression, AttributeDesignator)}
+
+
+class _DroneState:
+    __slots__ = ("attributes", "policy_targets", "rule_outcomes", "policy_decisions", "decision")
+
+    def __init__(self, attributes, policy_targets, rule_outcomes, policy_decisions, decision):
+        self.attributes = attributes
+        self.policy_targets = policy_targets
+        self.rule_outcomes = rule_outcomes
+        self.policy_decisions = policy_decisions
+        self.decision = decision
+
+
+class TelemetryMonitor:
+    """
+    Incremental per-drone evaluation of telemetry against the FAA policy
+    """
+
+    def __init__(self, pdp: FileBasedPDP, default_operation: DroneOperation = None):
+        """
+        `default_operation` is used for drones that send telemetry without
+        having been registered; without it such frames raise KeyError.
+        Raises ValueError for a policy set with a Target or nested policy
+        sets, which are not evaluated incrementally.
+        """
+        if pdp.policy_set.target or len(pdp.policies) != len(pdp.policy_set.policies):
+            raise ValueError("Policy set Targets and nested policy sets are not supported")
+        self.pdp = pdp
+        self.default_operation = default_operation
+        self.drones: Dict[str, _DroneState] = {}
+
+        # DroneOperation field -> (category, attribute id, converter)
+        self.fields = {}
+        for field_name, category, attr_id, data_type in OPERATION_ATTRIBUTES:
+            convert = float if data_type == "double" else (bool if data_type == "boolean" else str)
+            self.fields[field_name] = (category, attr_id, convert)
+
+        # Attribute -> policies whose target and (policy, rule) pairs whose
+        # target or condition reference it
+        self.target_dependents: Dict[Tuple[str, str], List[int]] = {}
+        self.rule_dependents: Dict[Tuple[str, str], List[Tuple[int, int]]] = {}
+        for policy_index, policy in enumerate(pdp.policies):
+            for key in _target_keys(policy.target):
+                self.target_dependents.setdefault(key, []).append(policy_index)
+            for rule_index, rule in enumerate(policy.rules):
+                keys = _target_keys(rule.target)
+                if rule.condition is not None:
+                    keys |= _condition_keys(rule.condition)
+                for key in keys:
+                    self.rule_dependents.setdefault(key, []).append((policy_index, rule_index))
+
+        self.frames_processed = 0
+        self.rules_evaluated = 0
+
+    def dependencies(self, field_name: str) -> List[str]:
+        """Policy targets and "policy/rule" ids re-evaluated when a field changes"""
+        category, attr_id, _ = self.fields[field_name]
+        policies = self.pdp.policies
+        return ([f"{policies[p].policy_id} (target)" for p in self.target_dependents.get((category, attr_id), [])] +
+                [f"{policies[p].policy_id}/{policies[p].rules[r].rule_id}"
+                 for p, r in self.rule_dependents.get((category, attr_id), [])])
+
+    def register(self, drone_id: str, operation: DroneOperation, timestamp: float = None) -> ComplianceTransition:
+        """
+        Start (or restart) monitoring a drone from a full operation
+
+        Evaluates every rule once and returns the initial decision as a
+        transition from None.
+        """
+        pdp = self.pdp
+        attributes = operation_to_attributes(operation)
+        policy_targets = [pdp.evaluate_policy_target(policy, attributes) for policy in pdp.policies]
+        rule_outcomes = [[pdp.evaluate_rule(policy, i, attributes) for i in range(len(policy.rules))]
+                         for policy in pdp.policies]
+        self.rules_evaluated += sum(len(outcomes) for outcomes in rule_outcomes)
+        policy_decisions = [self._policy_decision(i, policy_targets[i], rule_outcomes[i])
+                            for i in range(len(pdp.policies))]
+        decision = pdp.combine_policy_decisions(policy_decisions)
+        self.drones[drone_id] = _DroneState(attributes, policy_targets, rule_outcomes, policy_decisions, decision)
+        return ComplianceTransition(drone_id, time.time() if timestamp is None else timestamp,
+                                    None, decision, (), ())
+
+    def unregister(self, drone_id: str):
+        """Stop monitoring a drone"""
+        self.drones.pop(drone_id, None)
+
+    def decision(self, drone_id: str) -> str:
+        """Current overall decision for a drone"""
+        return self.drones[drone_id].decision
+
+    def _policy_decision(self, policy_index: int, target_outcome, outcomes: List) -> Optional[str]:
+        if target_outcome is not True:
+            return None if target_outcome is False else "Indeterminate"
+        policy = self.pdp.policies[policy_index]
+        return self.pdp.combine_rule_outcomes(policy, zip(policy.rules, outcomes))
+
+    def update(self, drone_id: str, values: Dict[str, Any], timestamp: float = None) -> Optional[ComplianceTransition]:
+        """
+        Apply new field values for a drone
+
+        Returns a ComplianceTransition if the drone's decision changed,
+        otherwise None. Raises KeyError for an unknown field, or for an
+        unregistered drone when the monitor has no default operation, and
+        ValueError or TypeError for a value that does not convert; the
+        drone's state is then left as it was.
+        """
+        self.frames_processed += 1
+        # Every value is converted before any is applied, so a rejected
+        # frame changes nothing
+        converted = []
+        for field_name, value in values.items():
+            try:
+                category, attr_id, convert = self.fields[field_name]
+            except KeyError:
+                raise KeyError(f"Unknown telemetry field {field_name}")
+            converted.append((field_name, category, attr_id, convert(value)))
+
+        state = self.drones.get(drone_id)
+        if state is None:
+            if self.default_operation is None:
+                raise KeyError(f"Drone {drone_id} is not registered")
+            self.register(drone_id, self.default_operation, timestamp)
+            state = self.drones[drone_id]
+
+        attributes = state.attributes
+        changed_keys = []
+        changed_fields = []
+        for field_name, category, attr_id, value in converted:
+            if attributes[category][attr_id] != value:
+                attributes[category][attr_id] = value
+                changed_keys.append((category, attr_id))
+                changed_fields.append(field_name)
+        if not changed_keys:
+            return None
+
+        pdp = self.pdp
+        policies = pdp.policies
+        dirty_policies = set()
+        changed_rules = []
+        for key in changed_keys:
+            for policy_index in self.target_dependents.get(key, ()):
+                outcome = pdp.evaluate_policy_target(policies[policy_index], attributes)
+                if outcome != state.policy_targets[policy_index]:
+                    state.policy_targets[policy_index] = outcome
+                    dirty_policies.add(policy_index)
+            for policy_index, rule_index in self.rule_dependents.get(key, ()):
+                outcome = pdp.evaluate_rule(policies[policy_index], rule_index, attributes)
+                self.rules_evaluated += 1
+                outcomes = state.rule_outcomes[policy_index]
+                if outcome != outcomes[rule_index]:
+                    outcomes[rule_index] = outcome
+                    dirty_policies.add(policy_index)
+                    changed_rules.append((policy_index, rule_index))
+        if not dirty_policies:
+            return None
+
+        decisions_changed = False
+        for policy_index in dirty_policies:
+            decision = self._policy_decision(policy_index, state.policy_targets[policy_index],
+                                             state.rule_outcomes[policy_index])
+            if decision != state.policy_decisions[policy_index]:
+                state.policy_decisions[policy_index] = decision
+                decisions_changed = True
+        if not decisions_changed:
+            return None
+
+        decision = pdp.combine_policy_decisions(state.policy_decisions)
+        previous_decision = state.decision
+        if decision == previous_decision:
+            return None
+        state.decision = decision
+        return ComplianceTransition(
+            drone_id, time.time() if timestamp is None else timestamp, previous_decision, decision,
+            tuple(changed_fields),
+            tuple(f"{policies[p].policy_id}/{policies[p].rules[r].rule_id}" for p, r in changed_rules))
+
+    def process(self, frames: Iterable[TelemetryFrame]) -> Iterator[ComplianceTransition]:
+        """Consume frames from an iterator, yielding compliance transitions"""
+        update = self.update
+        for frame in frames:
+            transition = update(frame.drone_id, frame.values, frame.timestamp)
+            if transition is not None:
+                yield transition
+
+    async def process_async(self, frames: AsyncIterator[TelemetryFrame]) -> AsyncIterator[ComplianceTransition]:
+        """Consume frames from an asynchronous iterator, yielding compliance transitions"""
+        async for frame in frames:
+            transition = self.update(frame.drone_id, frame.values, frame.timestamp)
+            if transition is not None:
+                yield transition
+
+    async def process_stream(self, reader: asyncio.StreamReader,
+                             on_transition: Callable[[ComplianceTransition], Any]):
+        """
+        Consume newline-delimited JSON frames from an asyncio stream
+
+        Malformed frames are logged and skipped.
+        """
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            try:
+                frame = frame_from_dict(json.loads(line))
+                transition = self.update(frame.drone_id, frame.values, frame.timestamp)
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning(f"Skipping telemetry frame: {e}")
+                continue
+            if transition is not None:
+                result = on_transition(transition)
+                if asyncio.iscoroutine(result):
+                    await result
+
+    async def serve(self, path: str = None, host: str = "127.0.0.1", port: int = 0,
+                    on_transition: Callable[[ComplianceTransition], Any] = None) -> asyncio.AbstractServer:
+        """
+        Accept telemetry on a local socket: a Unix socket at `path` if
+        given, otherwise TCP on host:port
+
+        Transitions are written back to the sending connection as JSON
+        lines, and passed to `on_transition` if given.
+        """
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            async def emit(transition: ComplianceTransition):
+                writer.write(json.dumps(transition._asdict()).encode('utf-8') + b"\n")
+                if on_transition is not None:
+                    result = on_transition(transition)
+                    if asyncio.iscoroutine(result):
+                        await result
+                await writer.drain()
+            try:
+                await self.process_stream(reader, emit)
+            finally:
+                writer.close()
+
+        if path:
+            server = await asyncio.start_unix_server(handle, path=path)
+        else:
+            server = await asyncio.start_server(handle, host=host, port=port)
+        logger.info(f"Telemetry monitor listening on {path or server.sockets[0].getsockname()}")
+        return server
+
+
+def simulate_frames(drone_ids: List[str], count: int, seed: int = 0) -> Iterator[TelemetryFrame]:
+    """
+    Synthetic 10 Hz telemetry: random walks of altitude and speed with
+    occasional visibility samples, round-robin over the drones
+    """
+    rng = random.Random(seed)
+    altitude = {drone_id: rng.uniform(100.0, 380.0) for drone_id in drone_ids}
+    speed = {drone_id: rng.uniform(20.0, 80.0) for drone_id in drone_ids}
+    for i in range(count):
+        drone_id = drone_ids[i % len(drone_ids)]
+        timestamp = i // len(drone_ids) * 0.1
+        altitude[drone_id] = max(0.0, altitude[drone_id] + rng.gauss(0.0, 5.0))
+        speed[drone_id] = max(0.0, speed[drone_id] + rng.gauss(0.0, 1.0))
+        if i % 3 == 0:
+            values = {"operating_altitude": round(altitude[drone_id], 1)}
+        elif i % 3 == 1:
+            values = {"operating_speed": round(speed[drone_id], 1)}
+        else:
+            values = {"flight_visibility": round(rng.uniform(2.5, 6.0), 1)}
+        yield TelemetryFrame(drone_id, timestamp, values)
+
+
+def main():
+    from differential_check import BASELINE_OPERATION
+
+    parser = argparse.ArgumentParser(description='Monitor drone telemetry for FAA compliance transitions')
+    parser.add_argument('--policy-file', type=str, default=DEFAULT_POLICY_FILE, help='Path to the XACML policy file')
+    parser.add_argument('--operation', type=str,
+                        help='JSON file with the DroneOperation fields every drone starts from '
+                             '(default: a compliant Category2 operation)')
+    parser.add_argument('--replay', type=str, help='Newline-delimited JSON telemetry file to process')
+    parser.add_argument('--socket', type=str, help='Serve telemetry on this Unix socket path')
+    parser.add_argument('--port', type=int, help='Serve telemetry on this localhost TCP port')
+    parser.add_argument('--benchmark', type=int, default=0, help='Process this many synthetic frames')
+    parser.add_argument('--drones', type=int, default=200, help='Number of simulated drones for --benchmark')
+
+    args = parser.parse_args()
+
+    logging.getLogger("file_based_pdp").setLevel(logging.WARNING)
+    operation = BASELINE_OPERATION
+    if args.operation:
+        with open(args.operation) as f:
+            operation = DroneOperation(**dict(asdict(BASELINE_OPERATION), **json.load(f)))
+
+    monitor = TelemetryMonitor(FileBasedPDP(args.policy_file), default_operation=operation)
+
+    if args.benchmark:
+        drone_ids = [f"drone-{i:04d}" for i in range(args.drones)]
+        for drone_id in drone_ids:
+            monitor.register(drone_id, operation, 0.0)
+        frames = list(simulate_frames(drone_ids, args.benchmark))
+        rules_before = monitor.rules_evaluated
+        start = time.perf_counter()
+        transitions = sum(1 for _ in monitor.process(frames))
+        elapsed = time.perf_counter() - start
+        print(f"Processed {len(frames)} frames for {len(drone_ids)} drones in {elapsed:.2f}s "
+              f"({len(frames) / elapsed:.0f} frames/s)")
+        print(f"Transitions: {transitions}")
+        print(f"Rules evaluated per frame: {(monitor.rules_evaluated - rules_before) / len(frames):.2f} "
+              f"of {sum(len(policy.rules) for policy in monitor.pdp.policies)}")
+        return
+
+    if args.replay:
+        with open(args.replay) as f:
+            frames = (frame_from_dict(json.loads(line)) for line in f if line.strip())
+            for transition in monitor.process(frames):
+                print(json.dumps(transition._asdict()))
+        return
+
+    if args.socket or args.port:
+        async def run():
+            server = await monitor.serve(path=args.socket, port=args.port or 0,
+                                         on_transition=lambda t: print(json.dumps(t._asdict()), flush=True))
+            async with server:
+                await server.serve_forever()
+        try:
+            asyncio.run(run())
+        except KeyboardInterrupt:
+            pass
+        return
+
+    parser.print_help()
+    sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+
+"""
+Compiled XACML policies per tenant
+
+    python tenant_policies.py tenants/
+    python tenant_policies.py tenants/ --evaluate example_operations.json --max-entries 2
+
+One deployment serves several operators or jurisdictions, each with its
+own policy: the tenant "us-tx" is the policy file tenants/us-tx.xml or
+the policy directory tenants/us-tx/ (see policy_directory.py). A
+TenantPolicyCache compiles a tenant's policy into a FileBasedPDP on its
+first request and keeps the most recently used ones, so memory stays
+bounded however many tenants there are; an evicted tenant is compiled
+again on its next request.
+
+Metrics are kept per tenant across evictions: requests, decisions,
+compilations, evictions and evaluation time. warm_up() compiles the
+tenants with the most requests in a background thread, e.g. after a
+restart or a policy change.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional
+
+from file_based_pdp import FileBasedPDP, Result
+
+DEFAULT_MAX_TENANTS = 16
+
+logger = logging.getLogger(__name__)
+
+
+class UnknownTenantError(LookupError):
+    """Raised for a tenant without a policy"""
+
+
+class TenantMetrics:
+    """Counters of one tenant; updated under the cache's lock"""
+    __slots__ = ("requests", "decisions", "loads", "evictions", "load_seconds", "evaluation_seconds")
+
+    def __init__(self):
+        self.requests = 0
+        self.decisions = Counter()
+        self.loads = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+        self.evaluation_seconds = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"requests": self.requests, "decisions": dict(self.decisions), "loads": self.loads,
+                "evictions": self.evictions, "load_seconds": round(self.load_seconds, 6),
+                "mean_evaluation_us": round(self.evaluation_seconds / self.requests * 1e6, 1) if self.requests else None}
+
+
+class TenantPolicyCache:
+    """
+    FileBasedPDPs per tenant, least recently used first out
+
+    Thread-safe: a tenant's policy is compiled once however many threads
+    request it at the same time, and other tenants are served meanwhile.
+    `pdp_options` are passed to every FileBasedPDP (e.g. pip,
+    use_decision_table).
+    """
+
+    def __init__(self, policy_root: str, max_entries: int = DEFAULT_MAX_TENANTS, **pdp_options):
+        if not os.path.isdir(policy_root):
+            raise ValueError(f"Tenant policy root {policy_root} is not a directory")
+        self.policy_root = policy_root
+        self.max_entries = max_entries
+        self.pdp_options = pdp_options
+        self._entries: "OrderedDict[str, FileBasedPDP]" = OrderedDict()
+        self._metrics: Dict[str, TenantMetrics] = {}
+        self._lock = threading.Lock()
+        # tenant -> lock held while its policy is compiled
+        self._loading: Dict[str, threading.Lock] = {}
+
+    def tenants(self) -> List[str]:
+        """Every tenant with a policy under the root"""
+        names = []
+        for name in sorted(os.listdir(self.policy_root)):
+            if os.path.isdir(os.path.join(self.policy_root, name)):
+                names.append(name)
+            elif name.endswith(".xml"):
+                names.append(name[:-len(".xml")])
+        return names
+
+    def policy_path(self, tenant: str) -> str:
+        """The policy file or directory of a tenant; raises UnknownTenantError"""
+        if not tenant or tenant.startswith(".") or os.sep in tenant or (os.altsep and os.altsep in tenant):
+            raise UnknownTenantError(f"Invalid tenant {tenant!r}")
+        for path in (os.path.join(self.policy_root, tenant + ".xml"), os.path.join(self.policy_root, tenant)):
+            if os.path.isfile(path) or os.path.isdir(path):
+                return path
+        raise UnknownTenantError(f"No policy for tenant {tenant!r}")
+
+    @property
+    def loaded(self) -> List[str]:
+        """Tenants whose policy is compiled, least recently used first"""
+        with self._lock:
+            return list(self._entries)
+
+    def pdp(self, tenant: str) -> FileBasedPDP:
+        """The compiled policy of a tenant; raises UnknownTenantError"""
+        with self._lock:
+            pdp = self._entries.get(tenant)
+            if pdp is not None:
+                self._entries.move_to_end(tenant)
+                return pdp
+        path = self.policy_path(tenant)
+        with self._lock:
+            loading = self._loading.setdefault(tenant, threading.Lock())
+        with loading:
+            # Another thread may have compiled it meanwhile
+            with self._lock:
+                pdp = self._entries.get(tenant)
+            if pdp is None:
+                pdp = self._load(tenant, path)
+        return pdp
+
+    def _load(self, tenant: str, path: str) -> FileBasedPDP:
+        start = time.perf_counter()
+        pdp = FileBasedPDP(path, **self.pdp_options)
+        elapsed = time.perf_counter() - start
+        logger.info(f"Compiled policy of tenant {tenant} from {path} in {elapsed * 1000:.1f} ms")
+        with self._lock:
+            metrics = self._metrics.setdefault(tenant, TenantMetrics())
+            metrics.loads += 1
+            metrics.load_seconds += elapsed
+            self._entries[tenant] = pdp
+            self._entries.move_to_end(tenant)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._metrics[evicted].evictions += 1
+                logger.info(f"Evicted policy of tenant {evicted}")
+        return pdp
+
+    def evaluate_result(self, tenant: str, attributes: Dict[str, Dict[str, Any]]) -> Result:
+        """A tenant's decision for request attributes, as FileBasedPDP.evaluate_result"""
+        pdp = self.pdp(tenant)
+        start = time.perf_counter()
+        result = pdp.evaluate_result(attributes)
+        self._record(tenant, result.decision, time.perf_counter() - start)
+        return result
+
+    def explain(self, tenant: str, attributes: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """The trace of a tenant's decision, as FileBasedPDP.explain"""
+        pdp = self.pdp(tenant)
+        start = time.perf_counter()
+        explanation = pdp.explain(attributes)
+        self._record(tenant, explanation["decision"], time.perf_counter() - start)
+        return explanation
+
+    def _record(self, tenant: str, decision: str, elapsed: float):
+        with self._lock:
+            metrics = self._metrics.setdefault(tenant, TenantMetrics())
+            metrics.requests += 1
+            metrics.decisions[decision] += 1
+            metrics.evaluation_seconds += elapsed
+
+    def busiest(self, count: int = None) -> List[str]:
+        """Tenants by number of requests, most first"""
+        with self._lock:
+            ranked = sorted(self._metrics, key=lambda tenant: (-self._metrics[tenant].requests, tenant))
+        return ranked[:count] if count is not None else ranked
+
+    def warm_up(self, tenants: List[str] = None, background: bool = True) -> Optional[threading.Thread]:
+        """
+        Compile the policies of `tenants`, by default the busiest ones that
+        fit in the cache, in a background thread (returned) unless
+        `background` is False
+
+        Tenants without a policy anymore are logged and skipped.
+        """
+        if tenants is None:
+            tenants = self.busiest(self.max_entries)
+        tenants = list(tenants)[:self.max_entries]
+
+        def load():
+            # Least busy first, so the busiest end up most recently used
+            for tenant in reversed(tenants):
+                try:
+                    self.pdp(tenant)
+                except Exception as e:
+                    logger.warning(f"Cannot warm up tenant {tenant}: {e}")
+
+        if not background:
+            load()
+            return None
+        thread = threading.Thread(target=load, name="tenant-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def reload(self, tenant: str = None):
+        """Reload one tenant's compiled policy, or every loaded one, from its files"""
+        with self._lock:
+            pdps = [self._entries[tenant]] if tenant in self._entries else \
+                list(self._entries.values()) if tenant is None else []
+        for pdp in pdps:
+            pdp.reload()
+
+    def invalidate(self, tenant: str = None):
+        """Drop one tenant's compiled policy, or all of them; metrics are kept"""
+        with self._lock:
+            if tenant is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(tenant, None)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Cache size and every tenant's metrics"""
+        with self._lock:
+            return {"max_entries": self.max_entries, "loaded": list(self._entries),
+                    "tenants": {tenant: metrics.to_dict() for tenant, metrics in sorted(self._metrics.items())}}
+
+
+def main():
+    from drone_attributes import operation_to_attributes
+    from batch_runner import parse_operation
+
+    parser = argparse.ArgumentParser(description='Compile and evaluate the policies of every tenant')
+    parser.add_argument('policy_root', type=str, help='Directory with a policy file or directory per tenant')
+    parser.add_argument('--evaluate', type=str, default=None,
+                        help='JSON file with a list of operations as in example_operations.json, '
+                             'evaluated for every tenant')
+    parser.add_argument('--max-entries', type=int, default=DEFAULT_MAX_TENANTS, help='Compiled policies kept')
+    args = parser.parse_args()
+
+    cache = TenantPolicyCache(args.policy_root, args.max_entries)
+    tenants = cache.tenants()
+    if not tenants:
+        print(f"No tenant policies in {args.policy_root}")
+        sys.exit(1)
+    operations = []
+    if args.evaluate:
+        with open(args.evaluate) as f:
+            operations = [parse_operation(item) for item in json.load(f)]
+    for tenant in tenants:
+        try:
+            cache.pdp(tenant)
+        except Exception as e:
+            print(f"{tenant}: {e}")
+            continue
+        for operation in operations:
+            cache.evaluate_result(tenant, operation_to_attributes(operation))
+    print(json.dumps(cache.metrics(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+import math
+import os
+import random
+
+from airspace_index import (COARSE_CELL, FEET_PER_DEGREE, STRUCTURE_RADIUS, AirspaceDataError, AirspaceIndex,
+                            LocationAttributes, locate_operation)
+from differential_check import BASELINE_OPERATION
+
+AIRSPACE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "airspace_example.geojson")
+
+
+def brute_force(index, latitude, longitude, altitude):
+    """Location attributes checked against every feature, without the grid"""
+    return index._resolve((index.volumes, index.structures), latitude, longitude, altitude)
+
+
+def offset(latitude, longitude, feet, bearing):
+    """Point `feet` away in the direction `bearing` (degrees from north)"""
+    dlat = feet * math.cos(math.radians(bearing)) / FEET_PER_DEGREE
+    dlon = feet * math.sin(math.radians(bearing)) / FEET_PER_DEGREE / math.cos(math.radians(latitude))
+    return latitude + dlat, longitude + dlon
+
+
+def test_batch_lookups_match_single_lookups():
+    index = AirspaceIndex.from_geojson(AIRSPACE_FILE, cache_cells=64)
+    rng = random.Random(0)
+    points = [(rng.uniform(32.6, 33.2), rng.uniform(-97.5, -96.7), rng.uniform(0.0, 3000.0)) for _ in range(5000)]
+    # Points around the structures, within and just beyond their radius
+    for structure in index.structures:
+        for _ in range(50):
+            latitude, longitude = offset(structure.latitude, structure.longitude,
+                                         rng.uniform(0.0, 2 * STRUCTURE_RADIUS), rng.uniform(0.0, 360.0))
+            points.append((latitude, longitude, rng.uniform(0.0, 1500.0)))
+
+    results = index.lookup_many(points)
+    assert len(results) == len(points)
+    for point, result in zip(points, results):
+        assert result == index.lookup(*point) == brute_force(index, *point), point
+    assert index.cache_misses > 64 and index.cache_hits > 0
+    assert index.lookup_many([]) == []
+
+
+def test_located_operation():
+    index = AirspaceIndex.from_geojson(AIRSPACE_FILE)
+    rng = random.Random(1)
+    for _ in range(500):
+        latitude, longitude = rng.uniform(32.6, 33.2), rng.uniform(-97.5, -96.7)
+        operation = locate_operation(index, BASELINE_OPERATION, latitude, longitude)
+        expected = index.lookup(latitude, longitude, BASELINE_OPERATION.operating_altitude)
+        assert LocationAttributes(*(getattr(operation, name) for name in LocationAttributes._fields)) == expected
+        assert operation.operating_altitude == BASELINE_OPERATION.operating_altitude
+        assert operation.drone_category == BASELINE_OPERATION.drone_category
+
+
+def test_volumes_and_surface_areas():
+    index = AirspaceIndex.from_geojson(AIRSPACE_FILE)
+    # Class B surface area, with the shelf above 2000 feet around it
+    assert index.lookup(32.9, -97.04, 100.0) == LocationAttributes("B", True, False, 0.0)
+    assert index.lookup(33.05, -97.04, 1000.0) == LocationAttributes("G", False, False, 0.0)
+    assert index.lookup(33.05, -97.04, 2500.0) == LocationAttributes("B", False, False, 0.0)
+    # Class D surface area up to its ceiling
+    assert index.lookup(32.68, -96.85, 100.0) == LocationAttributes("D", True, False, 0.0)
+    assert index.lookup(32.68, -96.85, 3000.0) == LocationAttributes("G", False, False, 0.0)
+    # Class E surface area; above its ceiling the point is in no volume
+    assert index.lookup(33.05, -97.32, 300.0) == LocationAttributes("E", True, False, 0.0)
+    assert index.lookup(33.05, -97.32, 800.0) == LocationAttributes("G", False, False, 0.0)
+    # Inside both the surface area and the shelf: flagged as surface area
+    assert index.lookup(32.9, -97.04, 2500.0) == LocationAttributes("B", True, False, 0.0)
+    # Outside every volume
+    assert index.lookup(32.5, -97.5, 100.0) == LocationAttributes("G", False, False, 0.0)
+
+
+def test_structure_radius():
+    index = AirspaceIndex.from_geojson(AIRSPACE_FILE)
+    for structure in index.structures:
+        for bearing in range(0, 360, 45):
+            inside = offset(structure.latitude, structure.longitude, STRUCTURE_RADIUS - 5, bearing)
+            outside = offset(structure.latitude, structure.longitude, STRUCTURE_RADIUS + 5, bearing)
+            near = index.lookup(*inside, structure.height + 100.0)
+            assert near.is_within_400ft_of_structure and near.operating_altitude_above_structure == 100.0
+            far = index.lookup(*outside, structure.height + 100.0)
+            assert not far.is_within_400ft_of_structure and far.operating_altitude_above_structure == 0.0
+    # The radio tower sits under the Class B shelf
+    assert index.lookup(32.95, -97.2, 2500.0) == LocationAttributes("B", False, True, 1300.0)
+
+
+def test_features_across_coarse_cell_boundaries():
+    index = AirspaceIndex.from_geojson(AIRSPACE_FILE)
+    # The Class B surface area straddles a coarse cell boundary in longitude,
+    # the shelf one in latitude
+    boundary_lon, boundary_lat = -97.0, 33.0
+    assert math.floor(boundary_lon / COARSE_CELL) * COARSE_CELL == boundary_lon
+    for longitude in (boundary_lon - 1e-6, boundary_lon, boundary_lon + 1e-6):
+        assert index.lookup(32.9, longitude, 100.0) == LocationAttributes("B", True, False, 0.0)
+    for latitude in (boundary_lat - 1e-6, boundary_lat, boundary_lat + 1e-6):
+        assert index.lookup(latitude, -97.2, 2500.0).airspace_class == "B"
+
+    # A structure near the corner of four coarse cells is seen from all of them
+    index.add_geojson({"type": "Feature", "properties": {"height": 300},
+                       "geometry": {"type": "Point", "coordinates": [boundary_lon - 1e-5, boundary_lat - 1e-5]}})
+    for bearing in range(0, 360, 30):
+        latitude, longitude = offset(boundary_lat - 1e-5, boundary_lon - 1e-5, STRUCTURE_RADIUS - 5, bearing)
+        location = index.lookup(latitude, longitude, 350.0)
+        assert location.is_within_400ft_of_structure and location.operating_altitude_above_structure == 50.0
+        assert location == brute_force(index, latitude, longitude, 350.0)
+
+    try:
+        index.add_geojson({"type": "Feature", "properties": {"airspace_class": "Z"},
+                           "geometry": {"type": "Polygon", "coordinates": [[[0, 0], [0, 1], [1, 1]]]}})
+        assert False
+    except AirspaceDataError:
+        pass
+
+
+def main():
+    tests = [test_batch_lookups_match_single_lookups, test_located_operation, test_volumes_and_surface_areas,
+             test_structure_radius, test_features_across_coarse_cell_boundaries]
+    for test in tests:
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
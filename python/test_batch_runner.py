@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import random
+import tempfile
+from dataclasses import asdict
+
+from batch_runner import DECISIONS, INVALID, decode, run_file, run_items, split_file, summarize
+from decision_journal import violation_mask
+from differential_check import generate_operation
+from direct_faa_rules import FAADroneRulesEvaluator
+from drone_attributes import operation_to_attributes
+from file_based_pdp import FileBasedPDP
+
+POLICY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "policies", "FAADroneRules.xml")
+
+MALFORMED = ["", "   ", "{not json", "[]", "null", '{"operation": 5}',
+             '{"drone_category": "Category2"}', '{"operation": {"drone_weight": "heavy"}}']
+
+
+def input_items(count, seed=0):
+    """Operation dicts in the accepted shapes, malformed lines mixed in; None for an invalid line"""
+    rng = random.Random(seed)
+    lines, operations = [], []
+    for i in range(count):
+        if rng.random() < 0.05:
+            lines.append(rng.choice(MALFORMED))
+            operations.append(None)
+            continue
+        operation = generate_operation(rng)
+        data = asdict(operation)
+        if i % 3 == 1:
+            data = {"operation": data, "pilot_id": f"P{i}"}
+        elif i % 3 == 2:
+            data["latitude"] = 32.9
+        lines.append(json.dumps(data))
+        operations.append(operation)
+    return lines, operations
+
+
+def expected_codes(operations):
+    evaluator = FAADroneRulesEvaluator()
+    pdp = FileBasedPDP(POLICY_FILE)
+    direct = [INVALID if operation is None else violation_mask(evaluator.evaluate_rules(operation))
+              for operation in operations]
+    decisions = [INVALID if operation is None else
+                 DECISIONS.index(pdp.evaluate_attributes(operation_to_attributes(operation)))
+                 for operation in operations]
+    return direct, decisions
+
+
+def test_file_matches_serial_evaluation():
+    lines, operations = input_items(1000)
+    direct, decisions = expected_codes(operations)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "operations.jsonl")
+        with open(path, "w") as f:
+            f.write("\n".join(lines))  # no newline after the last line
+
+        rows, tasks = split_file(path, 64)
+        assert rows == len(lines) and len(tasks) == -(-rows // 64)
+        assert [task[3] for task in tasks] == list(range(0, rows, 64))
+        assert tasks[0][1] == 0 and tasks[-1][2] == os.path.getsize(path)
+        assert all(a[2] == b[1] for a, b in zip(tasks, tasks[1:]))
+
+        codes = run_file(path, "direct", workers=3, chunk_rows=64)
+        assert list(codes) == direct
+        assert list(run_file(path, "pdp", workers=2, chunk_rows=100, policy_file=POLICY_FILE)) == decisions
+        table = os.path.join(directory, "table.bin")
+        assert list(run_file(path, "pdp", workers=2, chunk_rows=300, policy_file=POLICY_FILE,
+                             decision_table_file=table)) == decisions
+        assert list(run_file(path, "direct", workers=1)) == direct
+
+        empty = os.path.join(directory, "empty.jsonl")
+        open(empty, "w").close()
+        assert split_file(empty) == (0, []) and len(run_file(empty, workers=2)) == 0
+        try:
+            run_file(path, "xacml")
+            assert False
+        except ValueError:
+            pass
+
+    counts = summarize(codes)
+    assert counts["Invalid"] == operations.count(None)
+    assert counts["Permit"] + counts["Deny"] + counts["Invalid"] == len(lines)
+    assert decode(INVALID) == {"decision": "Invalid"} and decode(1, "pdp") == {"decision": "Deny"}
+
+
+def test_items_match_serial_evaluation():
+    lines, operations = input_items(600, seed=1)
+    direct, decisions = expected_codes(operations)
+    # Decoded dicts, DroneOperations themselves, and items that are not operations
+    items = [operation if operation is not None and i % 2 else (None if operation is None else json.loads(line))
+             for i, (line, operation) in enumerate(zip(lines, operations))]
+    assert list(run_items(items, "direct", workers=3, chunk_rows=41)) == direct
+    assert list(run_items(items, "pdp", workers=2, chunk_rows=97, policy_file=POLICY_FILE)) == decisions
+    assert len(run_items([], workers=2)) == 0
+
+
+def main():
+    tests = [test_file_matches_serial_evaluation, test_items_match_serial_evaluation]
+    for test in tests:
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
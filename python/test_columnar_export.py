@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+import os
+import ast
+import json
+import struct
+import random
+import tempfile
+
+from columnar_export import NPY_MAGIC, ColumnStore, Mask, export_journal, read_npy
+from decision_journal import RULE_IDS, DecisionJournal, scan_journal
+from differential_check import generate_operation
+from direct_faa_rules import FAADroneRulesEvaluator
+
+OPERATORS = {"<": float.__lt__, "<=": float.__le__, ">": float.__gt__, ">=": float.__ge__,
+             "==": float.__eq__, "!=": float.__ne__}
+
+
+def write_journal(directory, count, seed=0):
+    rng = random.Random(seed)
+    evaluator = FAADroneRulesEvaluator()
+    with DecisionJournal(directory, batch_size=97) as journal:
+        for i in range(count):
+            operation = generate_operation(rng)
+            journal.append(operation, evaluator.evaluate_rules(operation), drone_id=f"drone-{i % 11}",
+                           timestamp=1000.0 + i)
+
+
+def npy_header(path):
+    with open(path, "rb") as f:
+        assert f.read(len(NPY_MAGIC)) == NPY_MAGIC
+        length = struct.unpack("<H", f.read(2))[0]
+        assert (len(NPY_MAGIC) + 2 + length) % 64 == 0
+        return ast.literal_eval(f.read(length).decode("latin1")), len(NPY_MAGIC) + 2 + length
+
+
+def test_export_matches_the_journal():
+    with tempfile.TemporaryDirectory() as directory:
+        journal, output = os.path.join(directory, "journal"), os.path.join(directory, "columns")
+        write_journal(journal, 1000)
+        records = list(scan_journal(journal))
+        assert export_journal(journal, output, chunk_rows=128) == len(records) == 1000
+
+        # Written in chunks, with the final shape in each header
+        with open(os.path.join(output, "manifest.json")) as f:
+            manifest = json.load(f)
+        assert manifest["rows"] == 1000 and manifest["rules"] == RULE_IDS
+        for name, column in manifest["columns"].items():
+            path = os.path.join(output, f"{name}.npy")
+            header, offset = npy_header(path)
+            assert header == {"descr": column["dtype"], "fortran_order": False, "shape": (1000,)}
+            assert os.path.getsize(path) == offset + 1000 * struct.calcsize(read_npy(path).format)
+
+        store = ColumnStore(output)
+        assert list(store.column("timestamp")) == [record.timestamp for record in records]
+        assert list(store.column("operating_altitude")) == [r.attributes["operating_altitude"] for r in records]
+        categories = manifest["columns"]["time_of_day"]["categories"]
+        assert [categories[code] for code in store.column("time_of_day")] == \
+            [record.attributes["time_of_day"] for record in records]
+
+        # Filters and counts agree with scanning the journal
+        def selected(predicate):
+            return [record for record in records if predicate(record)]
+
+        speed = records[0].attributes["operating_speed"]
+        for conditions, predicate in [
+                ({"time_of_day": "night"}, lambda r: r.attributes["time_of_day"] == "night"),
+                ({"drone_id": "drone-3", "approved": "false"}, lambda r: r.drone_id == "drone-3" and r.violations),
+                ({"time_of_day": "day", "operating_altitude": "> 400", "has_remote_id": "true"},
+                 lambda r: r.attributes["time_of_day"] == "day" and r.attributes["operating_altitude"] > 400
+                 and r.attributes["has_remote_id"]),
+                ({"operating_speed": str(speed)}, lambda r: r.attributes["operating_speed"] == speed),
+                ({}, lambda r: True)]:
+            mask = store.where(conditions)
+            matching = selected(predicate)
+            assert mask.count() == len(matching) > 0, conditions
+            assert store.violation_counts(mask) == {rule_id: sum(rule_id in r.violations for r in matching)
+                                                    for rule_id in RULE_IDS}
+        assert store.violation_counts() == {rule_id: sum(1 for _ in scan_journal(journal, rule_id=rule_id))
+                                            for rule_id in RULE_IDS}
+
+        for op, compare in OPERATORS.items():
+            for value in (0.0, 400.0, 1e9):
+                expected = sum(compare(r.attributes["operating_altitude"], value) for r in records)
+                assert store.compare("operating_altitude", op, value).count() == expected, (op, value)
+        assert store.equals("drone_weight", records[0].attributes["drone_weight"]).count() == \
+            len(selected(lambda r: r.attributes["drone_weight"] == records[0].attributes["drone_weight"]))
+
+        # A value missing from a column's categories selects nothing
+        assert store.equals("drone_id", "drone-99").count() == 0
+        assert store.where({"airspace_class": "Z", "approved": "true"}).count() == 0
+        try:
+            store.column("no_such_column")
+            assert False
+        except KeyError:
+            pass
+
+
+def test_masks():
+    flags = [random.Random(0).random() < 0.5 for _ in range(333)]
+    other = [random.Random(1).random() < 0.3 for _ in range(333)]
+    a, b = Mask(bytes(flags)), Mask(bytes(other))
+    assert a.rows == 333 and a.count() == sum(flags)
+    assert (a & b).count() == sum(x and y for x, y in zip(flags, other))
+    assert (a | b).count() == sum(x or y for x, y in zip(flags, other))
+    assert (~a).count() == 333 - sum(flags) and (~~a).bits == a.bits
+    assert (~Mask(b"")).count() == 0 and Mask(0, 5).count() == 0
+
+
+def test_empty_export():
+    with tempfile.TemporaryDirectory() as directory:
+        journal, output = os.path.join(directory, "journal"), os.path.join(directory, "columns")
+        write_journal(journal, 10)
+        assert export_journal(journal, output, start=5000.0) == 0
+        store = ColumnStore(output)
+        assert store.rows == 0 and len(store.column("timestamp")) == 0
+        assert npy_header(os.path.join(output, "timestamp.npy"))[0]["shape"] == (0,)
+        assert store.where({"time_of_day": "day", "operating_altitude": "> 400"}).count() == 0
+        assert store.violation_counts() == store.violation_counts(store.all()) == {rule_id: 0 for rule_id in RULE_IDS}
+
+
+def main():
+    tests = [test_export_matches_the_journal, test_masks, test_empty_export]
+    for test in tests:
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+import os
+import random
+
+from combining_algorithms import lookup_combining_algorithm
+from differential_check import generate_operation
+from drone_attributes import operation_to_attributes
+from file_based_pdp import FileBasedPDP
+from policy_compiler import AttributeValue, Policy, PolicySet, Rule
+
+POLICY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "policies", "FAADroneRules.xml")
+ALGORITHM = "urn:oasis:names:tc:xacml:3.0:rule-combining-algorithm:"
+POLICY_ALGORITHM = "urn:oasis:names:tc:xacml:1.0:policy-combining-algorithm:"
+
+FALSE = AttributeValue("boolean", False)
+
+
+def rule(rule_id, effect, condition=None):
+    return Rule(rule_id, effect, (), condition)
+
+
+def policy(algorithm, *rules):
+    return Policy("p", ALGORITHM + algorithm, (), rules)
+
+
+def decide(pdp, node):
+    policy_set = node if isinstance(node, PolicySet) else PolicySet("set", POLICY_ALGORITHM + "first-applicable",
+                                                                     (), (node,))
+    return pdp._with_snapshot(pdp._build_snapshot(policy_set)).evaluate_attributes({})
+
+
+def test_algorithm_semantics():
+    pdp = FileBasedPDP(POLICY_FILE)
+    # A condition on an attribute that must be present, Indeterminate for an empty request
+    missing = pdp.policies[-1].rules[0].condition
+    permit, deny = rule("permit", "Permit"), rule("deny", "Deny")
+    false_permit, false_deny = rule("false-permit", "Permit", FALSE), rule("false-deny", "Deny", FALSE)
+    error_permit, error_deny = rule("error-permit", "Permit", missing), rule("error-deny", "Deny", missing)
+
+    cases = [
+        # A rule whose Condition is false is NotApplicable
+        ("deny-overrides", (false_deny, permit), "Permit"),
+        ("deny-overrides", (permit, deny), "Deny"),
+        ("deny-overrides", (false_permit,), "NotApplicable"),
+        ("deny-overrides", (error_deny, permit), "Indeterminate"),
+        ("deny-overrides", (error_permit, deny), "Deny"),
+        ("deny-overrides", (error_permit,), "Indeterminate"),
+        ("permit-overrides", (deny, permit), "Permit"),
+        ("permit-overrides", (error_permit, deny), "Indeterminate"),
+        ("permit-overrides", (error_deny, permit), "Permit"),
+        ("permit-overrides", (false_deny,), "NotApplicable"),
+        ("ordered-deny-overrides", (permit, error_permit), "Permit"),
+        ("first-applicable", (false_deny, permit, deny), "Permit"),
+        ("first-applicable", (error_deny, permit), "Indeterminate"),
+        ("deny-unless-permit", (false_permit, error_permit), "Deny"),
+        ("deny-unless-permit", (deny, permit), "Permit"),
+        ("permit-unless-deny", (false_deny, error_deny), "Permit"),
+        ("permit-unless-deny", (permit, deny), "Deny"),
+        ("only-one-applicable", (permit,), "Indeterminate"),  # not a rule combining algorithm
+        ("no-such-algorithm", (permit,), "Indeterminate"),
+    ]
+    for algorithm, rules, expected in cases:
+        assert decide(pdp, policy(algorithm, *rules)) == expected, (algorithm, [r.rule_id for r in rules])
+
+    # Policy sets: a policy whose Target matches is applicable to
+    # only-one-applicable even when it is NotApplicable
+    not_applicable = policy("deny-overrides", false_deny)
+    for algorithm, policies, expected in [
+        ("only-one-applicable", (policy("first-applicable", permit),), "Permit"),
+        ("only-one-applicable", (not_applicable, policy("first-applicable", permit)), "Indeterminate"),
+        ("deny-unless-permit", (not_applicable,), "Deny"),
+        ("permit-unless-deny", (policy("deny-overrides", error_deny),), "Permit"),
+        # A policy's Indeterminate counts as Indeterminate{DP}
+        ("permit-overrides", (policy("deny-overrides", error_deny), policy("first-applicable", deny)),
+         "Indeterminate"),
+    ]:
+        assert decide(pdp, PolicySet("set", POLICY_ALGORITHM + algorithm, (), policies)) == expected, algorithm
+
+    # Evaluation stops once the decision cannot change
+    policy_set = PolicySet("set", POLICY_ALGORITHM + "first-applicable", (),
+                           (policy("deny-overrides", deny, error_permit),))
+    explanation = pdp._with_snapshot(pdp._build_snapshot(policy_set)).explain({})
+    assert explanation["decision"] == "Deny"
+    assert [rule["evaluated"] for rule in explanation["policies"][0]["rules"]] == [True, False]
+
+
+def test_nested_policy_sets():
+    pdp = FileBasedPDP(POLICY_FILE)
+    night = pdp.policies[0]
+    permit = policy("first-applicable", rule("permit", "Permit"))
+    deny = policy("first-applicable", rule("deny", "Deny"))
+    # A nested set with the Target of the night policy: only at night
+    nested = PolicySet("nested", POLICY_ALGORITHM + "deny-overrides", night.target, (permit, deny))
+    policy_set = PolicySet("root", POLICY_ALGORITHM + "first-applicable", (), (nested, permit))
+    nested_pdp = pdp._with_snapshot(pdp._build_snapshot(policy_set))
+
+    environment = "urn:oasis:names:tc:xacml:3.0:attribute-category:environment"
+    assert nested_pdp.evaluate_attributes({environment: {"time-of-day": "night"}}) == "Deny"
+    assert nested_pdp.evaluate_attributes({environment: {"time-of-day": "day"}}) == "Permit"
+    explanation = nested_pdp.explain({environment: {"time-of-day": "night"}})
+    assert explanation["policies"][0]["policy_set_id"] == "nested"
+    assert explanation["policies"][0]["decision"] == "Deny"
+    assert not explanation["policies"][1]["evaluated"]
+
+
+def test_optimize_order_keeps_decisions():
+    pdp = FileBasedPDP(POLICY_FILE)
+    policy_set = pdp.policy_set._replace(policy_combining_alg=POLICY_ALGORITHM + "permit-overrides")
+    pdp = pdp._with_snapshot(pdp._build_snapshot(policy_set))
+    rng = random.Random(0)
+    requests = [operation_to_attributes(generate_operation(rng)) for _ in range(2000)]
+    expected = [pdp.evaluate_attributes(attributes) for attributes in requests]
+
+    reordered = pdp.optimize_order(requests[:500])
+    assert pdp.policy_set is reordered
+    assert sorted(p.policy_id for p in reordered.policies) == sorted(p.policy_id for p in policy_set.policies)
+    assert [pdp.evaluate_attributes(attributes) for attributes in requests] == expected
+    for original in policy_set.policies:
+        policy = next(p for p in reordered.policies if p.policy_id == original.policy_id)
+        assert sorted(policy.rules) == sorted(original.rules)
+    # Ordered algorithms keep their order
+    first_applicable = next(p for p in reordered.policies if p.policy_id == "operation-over-people-policy")
+    assert first_applicable.rules == policy_set.policies[1].rules
+    assert lookup_combining_algorithm(first_applicable.rule_combining_alg).ordered
+
+
+def main():
+    tests = [test_algorithm_semantics, test_nested_policy_sets, test_optimize_order_keeps_decisions]
+    for test in tests:
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+import os
+import errno
+import random
+import tempfile
+import threading
+
+from decision_journal import (OPEN_SUFFIX, RULE_IDS, SEALED_SUFFIX, DecisionJournal, _read_blocks, scan_journal,
+                              violation_mask)
+from differential_check import generate_operation
+from direct_faa_rules import FAADroneRulesEvaluator
+
+
+def decisions(count, seed=0):
+    """(operation, outcomes, drone id, timestamp) of random evaluations, one per second"""
+    rng = random.Random(seed)
+    evaluator = FAADroneRulesEvaluator()
+    result = []
+    for i in range(count):
+        operation = generate_operation(rng)
+        result.append((operation, evaluator.evaluate_rules(operation), f"drone-{i % 7}", 1000.0 + i))
+    return result
+
+
+def append_all(journal, entries):
+    for operation, outcomes, drone_id, timestamp in entries:
+        journal.append(operation, outcomes, drone_id=drone_id, timestamp=timestamp)
+
+
+def assert_records(records, entries):
+    assert len(records) == len(entries)
+    for record, (operation, outcomes, drone_id, timestamp) in zip(records, entries):
+        assert (record.timestamp, record.drone_id, record.operation) == (timestamp, drone_id, operation)
+        assert violation_mask(outcomes) == sum(1 << RULE_IDS.index(rule) for rule in record.violations)
+
+
+def segment_files(directory, suffix):
+    return sorted(name for name in os.listdir(directory) if name.endswith(suffix))
+
+
+def test_group_commit():
+    entries = decisions(251)
+    with tempfile.TemporaryDirectory() as directory:
+        journal = DecisionJournal(directory, flush_interval=60.0, batch_size=100)
+        append_all(journal, entries[:-1])
+        operation, outcomes, drone_id, timestamp = entries[-1]
+        journal.append(operation, outcomes, drone_id=drone_id, timestamp=timestamp, wait=True)
+        # Durable once append(wait=True) returns, in a few blocks rather than one per record
+        assert_records(list(journal.scan()), entries)
+        path = os.path.join(directory, segment_files(directory, OPEN_SUFFIX)[0])
+        assert len(list(_read_blocks(path))) <= len(entries) // 50
+        journal.close()
+        assert segment_files(directory, OPEN_SUFFIX) == []
+        assert_records(list(scan_journal(directory)), entries)
+        try:
+            journal.append(operation, outcomes)
+            assert False
+        except ValueError:
+            pass
+
+
+def test_rotation_and_sealing():
+    entries = decisions(600)
+    with tempfile.TemporaryDirectory() as directory:
+        with DecisionJournal(directory, max_segment_bytes=8192) as journal:
+            for start in range(0, 400, 50):
+                append_all(journal, entries[start:start + 50])
+                journal.flush()
+        sealed = segment_files(directory, SEALED_SUFFIX)
+        assert len(sealed) > 2 and segment_files(directory, OPEN_SUFFIX) == []
+        assert_records(list(scan_journal(directory)), entries[:400])
+
+        # A reopened journal adds segments after the sealed ones
+        with DecisionJournal(directory) as journal:
+            append_all(journal, entries[400:])
+        assert_records(list(scan_journal(directory)), entries)
+        assert_records(list(scan_journal(directory, start=1100.0, end=1350.5)), entries[100:351])
+
+
+def test_torn_tail_recovered():
+    entries = decisions(300)
+    with tempfile.TemporaryDirectory() as directory:
+        journal = DecisionJournal(directory, flush_interval=60.0)
+        append_all(journal, entries[:200])
+        journal.flush()
+        append_all(journal, entries[200:])
+        journal.flush()
+        path = os.path.join(directory, segment_files(directory, OPEN_SUFFIX)[0])
+        with open(path, "rb") as f:
+            data = f.read()
+        # A crash in the middle of writing the second block, before close()
+        with open(path, "wb") as f:
+            f.write(data[:-100])
+
+        with DecisionJournal(directory) as reopened:
+            assert segment_files(directory, OPEN_SUFFIX) == []
+            assert_records(list(reopened.scan()), entries[:200])
+        # Garbage after the last block is cut off too
+        with open(os.path.join(directory, "journal-999999999999999" + OPEN_SUFFIX), "wb") as f:
+            f.write(data + b"\0" * 40)
+        DecisionJournal(directory).close()
+        assert_records(list(scan_journal(directory)), entries[:200] + entries)
+
+
+def test_scan_filters():
+    entries = decisions(2000)
+    with tempfile.TemporaryDirectory() as directory:
+        with DecisionJournal(directory, batch_size=128, max_segment_bytes=64 * 1024) as journal:
+            append_all(journal, entries)
+
+        def expected(start=None, end=None, drone_id=None, rule_id=None, approved=None):
+            rule = None if rule_id is None else RULE_IDS.index(rule_id)
+            return [entry for entry in entries
+                    if (start is None or entry[3] >= start) and (end is None or entry[3] < end)
+                    and (drone_id is None or entry[2] == drone_id)
+                    and (rule is None or entry[1][rule] is not None)
+                    and (approved is None or approved == all(outcome is None for outcome in entry[1]))]
+
+        for filters in [{}, {"start": 1500.0}, {"end": 1200.0}, {"start": 1300.0, "end": 1301.0},
+                        {"start": 5000.0}, {"drone_id": "drone-3"}, {"drone_id": "nobody"},
+                        {"approved": True}, {"approved": False}, {"rule_id": RULE_IDS[0]},
+                        {"rule_id": RULE_IDS[-1], "drone_id": "drone-1", "start": 1250.0, "end": 1900.0}]:
+            assert_records(list(scan_journal(directory, **filters)), expected(**filters))
+        assert list(scan_journal(directory, rule_id="no-such-rule")) == []
+
+
+def test_write_failure_reaches_callers():
+    entries = decisions(20)
+    with tempfile.TemporaryDirectory() as directory:
+        journal = DecisionJournal(directory, flush_interval=60.0)
+        append_all(journal, entries[:10])
+        journal.flush()
+
+        def full_disk(entries):
+            raise OSError(errno.ENOSPC, "No space left on device")
+        journal._write = full_disk
+
+        errors = []
+
+        def append_and_wait():
+            operation, outcomes, drone_id, timestamp = entries[10]
+            try:
+                journal.append(operation, outcomes, drone_id=drone_id, timestamp=timestamp, wait=True)
+            except OSError as e:
+                errors.append(e)
+        waiter = threading.Thread(target=append_and_wait)
+        waiter.start()
+        waiter.join(10)
+        assert not waiter.is_alive() and errors[0].errno == errno.ENOSPC
+
+        for call in [lambda: append_all(journal, entries[11:]), journal.flush, journal.close]:
+            try:
+                call()
+                assert False
+            except OSError as e:
+                assert e.errno == errno.ENOSPC
+        # The durable records survive and are sealed on the next startup
+        assert len(segment_files(directory, OPEN_SUFFIX)) == 1
+        DecisionJournal(directory).close()
+        assert_records(list(scan_journal(directory)), entries[:10])
+
+
+def main():
+    tests = [test_group_commit, test_rotation_and_sealing, test_torn_tail_recovered, test_scan_filters,
+             test_write_failure_reaches_callers]
+    for test in tests:
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
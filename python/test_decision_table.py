@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+import os
+import random
+import tempfile
+
+import decision_table
+import file_based_pdp
+from decision_table import (TABLE_FILE_HEADER, build_decision_table, load_decision_table, policy_checksum,
+                            save_decision_table)
+from differential_check import generate_operation
+from drone_attributes import ENVIRONMENT_CATEGORY, operation_to_attributes
+from file_based_pdp import FileBasedPDP
+
+POLICY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "policies", "FAADroneRules.xml")
+XMLNS = 'xmlns="urn:oasis:names:tc:xacml:3.0:core:schema:wd-17"'
+
+
+def sample_requests(count, seed=0):
+    rng = random.Random(seed)
+    return [operation_to_attributes(generate_operation(rng)) for _ in range(count)]
+
+
+def assert_rejected(path, checksum=None):
+    try:
+        load_decision_table(path, checksum)
+    except ValueError:
+        return
+    raise AssertionError(f"{path} loaded")
+
+
+def test_table_decides_like_the_interpreter():
+    pdp = FileBasedPDP(POLICY_FILE)
+    table = build_decision_table(pdp.policy_set, pdp)
+    rng = random.Random(0)
+    for _ in range(5000):
+        operation = generate_operation(rng)
+        attributes = operation_to_attributes(operation)
+        expected = pdp.evaluate_attributes(attributes)
+        assert table.decide(attributes) == expected, operation
+        assert table.decide_operation(operation) == expected, operation
+
+
+def test_values_outside_the_table_fall_back():
+    pdp = FileBasedPDP(POLICY_FILE)
+    with_table = FileBasedPDP(POLICY_FILE, use_decision_table=True)
+    rng = random.Random(1)
+    for airspace_class in ["G", "Z", "CB", ["B", "G"], ("C",), 7, None]:
+        attributes = operation_to_attributes(generate_operation(rng))
+        attributes[ENVIRONMENT_CATEGORY]["airspace-class"] = airspace_class
+        assert with_table.evaluate_attributes(attributes) == pdp.evaluate_attributes(attributes), airspace_class
+    attributes = operation_to_attributes(generate_operation(rng))
+    del attributes[ENVIRONMENT_CATEGORY]["airspace-class"]
+    assert with_table.evaluate_attributes(attributes) == pdp.evaluate_attributes(attributes)
+
+
+def test_results_with_advice_use_the_table():
+    pdp = FileBasedPDP(POLICY_FILE)
+    with_table = FileBasedPDP(POLICY_FILE, use_decision_table=True)
+    walked = []
+    evaluate_policy_set = with_table._evaluate_policy_set
+    with_table._evaluate_policy_set = lambda *args: walked.append(1) or evaluate_policy_set(*args)
+    decisions = []
+    for attributes in sample_requests(2000, seed=2):
+        result = with_table.evaluate_result(attributes)
+        assert result == pdp.evaluate_result(attributes), attributes
+        decisions.append(result.decision)
+    # The policy's Advice all applies to Deny; only those requests walk it
+    assert "Permit" in decisions and len(walked) == decisions.count("Deny") > 0
+
+
+def test_table_file_round_trip_and_rebuild():
+    pdp = FileBasedPDP(POLICY_FILE)
+    requests = sample_requests(500)
+    expected = [pdp.evaluate_attributes(attributes) for attributes in requests]
+    checksum = policy_checksum(POLICY_FILE)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "table.bin")
+        save_decision_table(build_decision_table(pdp.policy_set, pdp), path, checksum)
+        loaded = load_decision_table(path, checksum)
+        assert [loaded.decide(attributes) for attributes in requests] == expected
+        assert_rejected(path, "0" * 64)
+
+        # Stale, corrupt, short and empty files are rebuilt
+        for content in [None, b"", b"FAADTBL\0", b"not a decision table" * 10,
+                        TABLE_FILE_HEADER.pack(b"FAADTBL\0", 99, 0, 0, 0, 0)]:
+            if content is None:
+                save_decision_table(loaded, path, "0" * 64)
+            else:
+                with open(path, "wb") as f:
+                    f.write(content)
+                assert_rejected(path)
+            with_file = FileBasedPDP(POLICY_FILE, decision_table_file=path)
+            assert with_file.decision_table is not None
+            assert [with_file.evaluate_attributes(attributes) for attributes in requests] == expected
+            load_decision_table(path, checksum)
+
+        # A new engine version alone makes the table stale
+        version = decision_table.TABLE_ENGINE_VERSION
+        try:
+            decision_table.TABLE_ENGINE_VERSION = version + 1
+            assert policy_checksum(POLICY_FILE) != checksum
+            assert_rejected(path, policy_checksum(POLICY_FILE))
+        finally:
+            decision_table.TABLE_ENGINE_VERSION = version
+
+
+def test_mapped_table_defers_compiling():
+    pdp = FileBasedPDP(POLICY_FILE)
+    requests = sample_requests(300, seed=2)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "table.bin")
+        FileBasedPDP(POLICY_FILE, decision_table_file=path)
+
+        compiled = []
+        compile_policy = file_based_pdp.compile_policy
+        file_based_pdp.compile_policy = lambda *args: compiled.append(args) or compile_policy(*args)
+        try:
+            worker = FileBasedPDP(POLICY_FILE, decision_table_file=path)
+            assert worker.decision_table is not None
+            assert worker.evaluate_batch(requests) == [pdp.evaluate_attributes(a) for a in requests]
+            assert compiled == []
+
+            # The first request outside the table compiles the policy, once
+            outside = operation_to_attributes(generate_operation(random.Random(3)))
+            del outside[ENVIRONMENT_CATEGORY]["airspace-class"]
+            assert worker.evaluate_attributes(outside) == pdp.evaluate_attributes(outside)
+            assert worker.evaluate_attributes(outside) == pdp.evaluate_attributes(outside)
+            assert len(compiled) == 1 and worker.decision_table is not None
+            assert worker.policy_set == pdp.policy_set
+        finally:
+            file_based_pdp.compile_policy = compile_policy
+
+
+def test_table_file_for_a_policy_directory():
+    policy = """<Policy {xmlns} PolicyId="{id}"
+        RuleCombiningAlgId="urn:oasis:names:tc:xacml:3.0:rule-combining-algorithm:first-applicable">
+        <Target><AnyOf><AllOf><Match MatchId="urn:oasis:names:tc:xacml:1.0:function:string-equal">
+            <AttributeValue DataType="http://www.w3.org/2001/XMLSchema#string">{value}</AttributeValue>
+            <AttributeDesignator Category="{category}" AttributeId="airspace-class"
+                DataType="http://www.w3.org/2001/XMLSchema#string" MustBePresent="true"/>
+        </Match></AllOf></AnyOf></Target>
+        <Rule RuleId="{id}-rule" Effect="{effect}"/></Policy>"""
+    with tempfile.TemporaryDirectory() as directory:
+        policies = os.path.join(directory, "policies")
+        os.mkdir(policies)
+        for policy_id, value, effect in [("class-b", "B", "Deny"), ("class-g", "G", "Permit")]:
+            with open(os.path.join(policies, f"{policy_id}.xml"), "w") as f:
+                f.write(policy.format(xmlns=XMLNS, id=policy_id, value=value, effect=effect,
+                                      category=ENVIRONMENT_CATEGORY))
+        path = os.path.join(directory, "table.bin")
+        pdp = FileBasedPDP(policies)
+        with_file = FileBasedPDP(policies, decision_table_file=path)
+        checksum = policy_checksum(policies)
+        load_decision_table(path, checksum)
+        for airspace_class in "BCG":
+            attributes = {ENVIRONMENT_CATEGORY: {"airspace-class": airspace_class}}
+            assert with_file.decision_table.decide(attributes) == pdp.evaluate_attributes(attributes)
+
+        # Any change to the directory's files makes the table stale
+        with open(os.path.join(policies, "class-g.xml"), "a") as f:
+            f.write("\n")
+        assert policy_checksum(policies) != checksum
+        assert policy_checksum(policies, "root") != policy_checksum(policies)
+
+
+def main():
+    tests = [test_table_decides_like_the_interpreter, test_values_outside_the_table_fall_back,
+             test_results_with_advice_use_the_table, test_table_file_round_trip_and_rebuild,
+             test_mapped_table_defers_compiling, test_table_file_for_a_policy_directory]
+    for test in tests:
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import sqlite3
+import tempfile
+from dataclasses import replace
+
+from differential_check import BASELINE_OPERATION
+import drone_registry
+from drone_registry import DroneRegistry, UnknownRecordError
+
+PILOTS = [
+    {"pilot_id": "P1", "remote_pilot_certificate": True, "night_training": True},
+    {"pilot_id": "P2", "remote_pilot_certificate": True, "night_training": False},
+    {"pilot_id": "P3", "remote_pilot_certificate": False},
+]
+AIRCRAFT = [
+    {"aircraft_id": "A1", "owner_pilot_id": "P1", "has_remote_id": True, "has_airworthiness_certificate": True},
+    {"aircraft_id": "A2", "has_remote_id": False},
+]
+
+
+def registry(directory):
+    registry = DroneRegistry(os.path.join(directory, "registry.db"))
+    registry.add_pilots(PILOTS)
+    registry.add_aircraft(AIRCRAFT)
+    return registry
+
+
+def assert_unknown(function, *args):
+    try:
+        function(*args)
+    except UnknownRecordError:
+        return
+    raise AssertionError(f"{args} found")
+
+
+def test_lookups():
+    with tempfile.TemporaryDirectory() as directory:
+        pilots_and_aircraft = registry(directory)
+        assert pilots_and_aircraft.lookup("P1", "A1") == {
+            "pilot_has_night_training": True, "remote_pilot_certificate": True,
+            "has_remote_id": True, "has_airworthiness_certificate": True}
+        # Missing flags are stored as false
+        assert pilots_and_aircraft.lookup("P3") == {"pilot_has_night_training": False,
+                                                    "remote_pilot_certificate": False}
+        assert pilots_and_aircraft.lookup(aircraft_id="A2") == {"has_remote_id": False,
+                                                                "has_airworthiness_certificate": False}
+        assert pilots_and_aircraft.lookup() == {}
+
+        ids = [("P1", "A2"), ("P2", None), (None, "A1"), ("P1", "A2")]
+        # One query per table for the batch, then served from the cache
+        pilots_and_aircraft.pip.invalidate()
+        lookups = pilots_and_aircraft.pip.lookups
+        assert pilots_and_aircraft.lookup_many(ids) == [pilots_and_aircraft.lookup(*pair) for pair in ids]
+        assert pilots_and_aircraft.pip.lookups == lookups + 2
+
+        items = [(BASELINE_OPERATION, pilot_id, aircraft_id) for pilot_id, aircraft_id in ids]
+        filled = pilots_and_aircraft.fill_operations(items)
+        assert filled == [pilots_and_aircraft.fill_operation(*item) for item in items]
+        assert filled[0] == replace(BASELINE_OPERATION, pilot_has_night_training=True, remote_pilot_certificate=True,
+                                    has_remote_id=False, has_airworthiness_certificate=False)
+
+        assert_unknown(pilots_and_aircraft.lookup, "P9")
+        assert_unknown(pilots_and_aircraft.lookup, "P1", "A9")
+        assert_unknown(pilots_and_aircraft.lookup_many, [("P1", "A1"), (None, "A9")])
+        assert_unknown(pilots_and_aircraft.fill_operations, [(BASELINE_OPERATION, "P9", None)])
+        try:
+            pilots_and_aircraft.add_pilots([{"night_training": True}])
+            assert False
+        except ValueError:
+            pass
+
+
+def test_writes_invalidate_the_cache():
+    with tempfile.TemporaryDirectory() as directory:
+        pilots_and_aircraft = registry(directory)
+        assert pilots_and_aircraft.lookup("P2", "A2")["pilot_has_night_training"] is False
+        pilots_and_aircraft.add_pilots([{"pilot_id": "P2", "remote_pilot_certificate": True, "night_training": True}])
+        pilots_and_aircraft.add_aircraft([{"aircraft_id": "A2", "has_remote_id": True}])
+        assert pilots_and_aircraft.lookup("P2", "A2") == {
+            "pilot_has_night_training": True, "remote_pilot_certificate": True,
+            "has_remote_id": True, "has_airworthiness_certificate": False}
+        assert_unknown(pilots_and_aircraft.lookup, "P4")
+        pilots_and_aircraft.add_pilots([{"pilot_id": "P4", "remote_pilot_certificate": True}])
+        assert pilots_and_aircraft.lookup("P4")["remote_pilot_certificate"] is True
+
+        # Changes made elsewhere show up once the cached record expires
+        assert pilots_and_aircraft.lookup("P2")["pilot_has_night_training"] is True
+        with sqlite3.connect(pilots_and_aircraft.database) as connection:
+            connection.execute("UPDATE pilots SET night_training = 0 WHERE pilot_id = 'P2'")
+        assert pilots_and_aircraft.lookup("P2")["pilot_has_night_training"] is True
+        pilots_and_aircraft.pip.invalidate()
+        assert pilots_and_aircraft.lookup("P2")["pilot_has_night_training"] is False
+
+
+def test_csv_import_without_optional_columns():
+    with tempfile.TemporaryDirectory() as directory:
+        pilots, database = os.path.join(directory, "pilots.csv"), os.path.join(directory, "registry.db")
+        with open(pilots, "w") as f:
+            f.write("pilot_id,remote_pilot_certificate\nP1,true\nP2,false\n")
+        argv = sys.argv
+        try:
+            sys.argv = ["drone_registry.py", database, "--import-pilots", pilots]
+            drone_registry.main()
+        finally:
+            sys.argv = argv
+        assert DroneRegistry(database).lookup("P1") == {"pilot_has_night_training": False,
+                                                        "remote_pilot_certificate": True}
+
+
+def main():
+    tests = [test_lookups, test_writes_invalidate_the_cache, test_csv_import_without_optional_columns]
+    for test in tests:
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import random
+from dataclasses import replace
+
+from differential_check import generate_operation
+from drone_attributes import operation_to_attributes
+from evaluation_trace import format_explanation
+from file_based_pdp import FileBasedPDP
+from test_obligations import COMPLIANT
+
+POLICY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "policies", "FAADroneRules.xml")
+
+
+def test_explained_decision_is_the_decision():
+    pdp = FileBasedPDP(POLICY_FILE)
+    rng = random.Random(0)
+    for _ in range(500):
+        attributes = operation_to_attributes(generate_operation(rng))
+        explanation = pdp.explain(attributes)
+        assert explanation["decision"] == pdp.evaluate_attributes(attributes)
+        json.dumps(explanation)
+
+        # Policies are evaluated in order until the combining algorithm decides
+        evaluated = [policy["evaluated"] for policy in explanation["policies"]]
+        assert evaluated == sorted(evaluated, reverse=True)
+        for policy in explanation["policies"]:
+            if policy["evaluated"] and policy["decision"] != "NotApplicable":
+                assert policy["decision"] == pdp.evaluate_policy(
+                    next(p for p in pdp.policies if p.policy_id == policy["policy_id"]), attributes)
+
+
+def test_trace_of_denied_operation():
+    pdp = FileBasedPDP(POLICY_FILE)
+    operation = replace(COMPLIANT, operating_speed=95.0, operating_altitude=450.0, flight_visibility=2.0,
+                        distance_from_clouds_vertical=200.0, has_remote_id=False)
+    explanation = pdp.explain(operation_to_attributes(operation))
+    assert explanation["decision"] == "Deny"
+    policies = {policy["policy_id"]: policy for policy in explanation["policies"]}
+
+    night = policies["night-operation-policy"]
+    assert night["decision"] == "NotApplicable" and night["target"]["result"] is False
+    match = night["target"]["any_of"][0][0][0]
+    assert (match["attribute"], match["value"], match["request_value"], match["result"]) == \
+        ("time-of-day", "night", "day", False)
+
+    limits = policies["operating-limitations-policy"]
+    assert [rule["outcome"] for rule in limits["rules"]] == [False] * 4
+    speed = limits["rules"][0]["condition"]
+    assert (speed["expression"], speed["value"]) == ("double-less-than-or-equal", False)
+    assert speed["arguments"] == [
+        {"expression": "operating-speed", "value": [95.0], "elapsed_us": speed["arguments"][0]["elapsed_us"]},
+        {"literal": 87.0}]
+    assert "advice urn:faa:drone:advice:speed-limit: message=\"Speed exceeds 87 knots limit\", " \
+           "operating-speed=95.0" in [line.strip() for line in format_explanation(explanation)]
+
+    # Once a rule permits, deny-unless-permit evaluates no further rules
+    explanation = pdp.explain(operation_to_attributes(replace(operation, operating_speed=50.0)))
+    limits = {policy["policy_id"]: policy for policy in explanation["policies"]}["operating-limitations-policy"]
+    assert [rule["evaluated"] for rule in limits["rules"]] == [True, False, False, False]
+    assert explanation["decision"] == "Permit"
+
+
+def main():
+    tests = [test_explained_decision_is_the_decision, test_trace_of_denied_operation]
+    for test in tests:
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import atexit
+import shutil
+import tempfile
+import importlib
+
+from drone_attributes import operation_to_attributes
+from drone_registry import DroneRegistry
+from file_based_pdp import Directive, FileBasedPDP, Result
+
+# The API reads its configuration from the environment and writes its
+# templates, reports and log into the working directory when imported
+POLICY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "policies", "FAADroneRules.xml")
+
+DIRECTORY = tempfile.mkdtemp(prefix="faa-rules-api-")
+# Registered before the API's own exit handlers, so it runs after them
+atexit.register(shutil.rmtree, DIRECTORY, ignore_errors=True)
+
+COMPLIANT = {
+    "drone_category": "Category2", "drone_weight": "1.5", "has_anti_collision_lighting": "true",
+    "has_remote_id": "true", "time_of_day": "day", "operating_over_people": "false",
+    "operating_altitude": "200", "operating_speed": "35", "airspace_class": "G", "flight_visibility": "5",
+    "distance_from_clouds_horizontal": "2500", "distance_from_clouds_vertical": "600",
+    "complies_with_kinetic_energy_limit": "true",
+}
+
+_api = None
+
+
+def api():
+    """The faa_rules_api module, configured with a registry and a journal in DIRECTORY"""
+    global _api
+    if _api is None:
+        database = os.path.join(DIRECTORY, "registry.db")
+        registry = DroneRegistry(database)
+        registry.add_pilots([{"pilot_id": "4123456", "remote_pilot_certificate": True, "night_training": True},
+                             {"pilot_id": "P-1", "remote_pilot_certificate": True, "night_training": True}])
+        registry.add_aircraft([{"aircraft_id": "98765", "has_remote_id": True},
+                               {"aircraft_id": "40506", "has_remote_id": False}])
+        os.environ["FAA_REGISTRY_DB"] = database
+        os.environ["FAA_JOURNAL_DIR"] = os.path.join(DIRECTORY, "journal")
+        cwd = os.getcwd()
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        os.chdir(DIRECTORY)
+        try:
+            _api = importlib.import_module("faa_rules_api")
+        finally:
+            os.chdir(cwd)
+    return _api
+
+
+def post(path, body):
+    response = api().app.test_client().post(path, json=body)
+    return response.status_code, response.get_json()
+
+
+def test_numeric_registry_ids():
+    for pilot_id in ("P-1", "4123456"):
+        status, result = post("/api/evaluate", dict(COMPLIANT, pilot_id=pilot_id, aircraft_id="98765",
+                                                    drone_id="12345"))
+        assert status == 200 and result["status"] == "APPROVED", result
+    # The registry, not the request, decides has_remote_id
+    status, result = post("/api/evaluate", dict(COMPLIANT, pilot_id="4123456", aircraft_id="40506"))
+    assert status == 200 and result["status"] == "DENIED", result
+
+    status, result = post("/api/evaluate", dict(COMPLIANT, pilot_id="4123457"))
+    assert status == 400 and "'4123457'" in result["message"], result
+
+    body = {"operations": [dict(COMPLIANT, pilot_id="4123456", aircraft_id="98765"),
+                           dict(COMPLIANT, pilot_id="P-1", aircraft_id="40506", drone_id="777")]}
+    status, result = post("/api/evaluate/batch", body)
+    assert status == 200 and [r["status"] for r in result["results"]] == ["APPROVED", "DENIED"], result
+
+    # Journal entries carry the ids as sent
+    journal = api().decision_journal
+    journal.flush()
+    assert [record.drone_id for record in journal.scan()] == ["98765", "98765", "40506", "98765", "40506"]
+
+
+def test_request_body_ids_unchanged():
+    data = dict(COMPLIANT, pilot_id="4123456", tenant="2024", drone_id="0.5")
+    api().operation_from_data(data)
+    assert (data["pilot_id"], data["tenant"], data["drone_id"]) == ("4123456", "2024", "0.5")
+    assert data["drone_weight"] == 1.5 and data["has_remote_id"] is True
+    assert api().registry_ids(data) == ("4123456", None)
+    assert api().request_tenant(data) == "2024"
+
+
+def test_tenant_details_are_messages():
+    # Every limit is broken, so no policy permits
+    data = dict(COMPLIANT, operating_speed="95", operating_altitude="450", flight_visibility="2",
+                distance_from_clouds_vertical="200", has_remote_id="false")
+    result = FileBasedPDP(POLICY_FILE).evaluate_result(operation_to_attributes(api().operation_from_data(data)))
+    response = api().tenant_result("2024", result)
+    assert response["status"] == "DENIED" and response["tenant"] == "2024"
+    assert "Speed exceeds 87 knots limit" in response["details"]
+    assert response["details"] == [directive["attributes"]["message"]
+                                   for directive in response["raw_decision"]["advice"]]
+    # Advice without a message is named by its id
+    unnamed = Result("Deny", advice=(Directive("speed-limit", "FAA-Drone-Rules", None, {}),))
+    assert api().tenant_result("2024", unnamed)["details"] == ["speed-limit"]
+    assert api().tenant_result("2024", Result("Permit"))["details"] == []
+
+
+def main():
+    tests = [test_numeric_registry_ids, test_request_body_ids_unchanged, test_tenant_details_are_messages]
+    for test in tests:
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,46 +3,11 @@
 import os
 import sys
 import xml.etree.ElementTree as ET
-from dataclasses import dataclass
 from typing import Dict, Any, List, Optional
 
 # Import file-based PDP
 from file_based_pdp import FileBasedPDP
-
-@dataclass
-class DroneOperation:
-    """Represents a drone operation with all relevant attributes"""
-    # Drone characteristics
-    drone_category: str  # 'Category1', 'Category2', 'Category3', 'Category4'
-    drone_weight: float  # in pounds
-    has_anti_collision_lighting: bool
-    has_remote_id: bool
-    
-    # Operation details
-    time_of_day: str  # 'day', 'night', 'civil_twilight'
-    operating_over_people: bool
-    operating_altitude: float  # in feet
-    operating_speed: float  # in knots
-    
-    # Environment details
-    airspace_class: str  # 'B', 'C', 'D', 'E', 'G'
-    flight_visibility: float  # in statute miles
-    distance_from_clouds_horizontal: float  # in feet
-    distance_from_clouds_vertical: float  # in feet
-    
-    # Optional parameters (with default values)
-    has_airworthiness_certificate: bool = False
-    complies_with_kinetic_energy_limit: bool = False
-    has_exposed_rotating_parts: bool = False
-    is_within_400ft_of_structure: bool = False
-    operating_altitude_above_structure: float = 0.0  # in feet
-    is_airport_surface_area: bool = False
-    is_restricted_access_area: bool = False
-    people_are_participants: bool = False
-    people_under_cover: bool = False
-    pilot_has_night_training: bool = False
-    has_atc_authorization: bool = False
-    remote_pilot_certificate: bool = False
+from drone_operation import DroneOperation
 
 
 class FileBasedPDPWrapper:
@@ -134,9 +99,18 @@ class FileBasedPDPWrapper:
         
         return {
             "decision": decision,
-            "obligations": [],
-            "advice": []
+            "obligations": self._parse_directives(result, "Obligations/{*}Obligation", "ObligationId"),
+            "advice": self._parse_directives(result, "AssociatedAdvice/{*}Advice", "AdviceId")
         }
+    
+    def _parse_directives(self, result: ET.Element, path: str, id_attribute: str) -> List[Dict[str, Any]]:
+        """Parse Obligation or Advice elements into dicts of id and attributes"""
+        directives = []
+        for elem in result.findall("{*}" + path):
+            attributes = {assignment.get("AttributeId"): assignment.text
+                          for assignment in elem.findall("{*}AttributeAssignment")}
+            directives.append({"id": elem.get(id_attribute), "attributes": attributes})
+        return directives
 
 
 class FAADroneRulesEvaluator:
@@ -165,43 +139,16 @@ class FAADroneRulesEvaluator:
         else:
             status = "DENIED"
             
-            # Check for specific conditions that might have caused the denial
-            if operation.time_of_day == "night" and not operation.pilot_has_night_training:
-                details.append("Night operation requires pilot night training")
-            
-            if operation.time_of_day == "night" and not operation.has_anti_collision_lighting:
-                details.append("Night operation requires anti-collision lighting")
-            
-            if operation.operating_over_people and not any([
-                operation.people_are_participants,
-                operation.people_under_cover,
-                operation.drone_weight < 0.55,
-                (operation.drone_category == "Category2" and operation.complies_with_kinetic_energy_limit),
-                (operation.drone_category == "Category3" and operation.is_restricted_access_area),
-                (operation.drone_category == "Category4" and operation.has_airworthiness_certificate)
-            ]):
-                details.append("Operation over people does not meet any exemption criteria")
-            
-            if operation.airspace_class in ['B', 'C', 'D'] and not operation.has_atc_authorization:
-                details.append(f"Operation in Class {operation.airspace_class} airspace requires ATC authorization")
-            
-            if operation.operating_speed > 87:
-                details.append(f"Speed exceeds 87 knots limit (current: {operation.operating_speed} knots)")
-            
-            if operation.operating_altitude > 400 and not operation.is_within_400ft_of_structure:
-                details.append(f"Altitude exceeds 400 feet limit (current: {operation.operating_altitude} feet)")
-            
-            if operation.flight_visibility < 3:
-                details.append(f"Visibility below 3 statute miles (current: {operation.flight_visibility} miles)")
-            
-            if operation.distance_from_clouds_horizontal < 2000:
-                details.append(f"Horizontal distance from clouds below 2000 feet (current: {operation.distance_from_clouds_horizontal} feet)")
-            
-            if operation.distance_from_clouds_vertical < 500:
-                details.append(f"Vertical distance from clouds below 500 feet (current: {operation.distance_from_clouds_vertical} feet)")
-            
-            if not operation.has_remote_id:
-                details.append("Drone lacks required Remote ID capability")
+            # The policy's Advice says which requirements were not met
+            for advice in result["advice"]:
+                attributes = dict(advice["attributes"])
+                message = attributes.pop("message", None)
+                if message is None:
+                    continue
+                if attributes:
+                    values = ", ".join(f"{name}: {value}" for name, value in attributes.items())
+                    message = f"{message} ({values})"
+                details.append(message)
             
             # If no specific details were found, add a generic message
             if not details:
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import random
+from dataclasses import asdict, replace
+
+from differential_check import BASELINE_OPERATION, generate_operation
+from direct_faa_rules import DIRECT_RULES, FAADroneRulesEvaluator
+from flight_plan import FlightPlan, evaluate_flight_plan, survey_route
+
+
+def violating_waypoints(plan):
+    """Per-waypoint rule outcomes from a full evaluation of each waypoint"""
+    evaluator = FAADroneRulesEvaluator()
+    return [evaluator.evaluate_rules(plan.waypoint(i)) for i in range(plan.waypoint_count)]
+
+
+def test_single_waypoint_plans_are_evaluated():
+    high = FlightPlan.from_waypoints(BASELINE_OPERATION, [{"operating_altitude": 900.0}])
+    assert high.waypoint_count == 1 and high.segment_count == 1
+    result = evaluate_flight_plan(high)
+    assert result.to_dict()["status"] == "DENIED"
+    assert result.first_violation == 0 and result.intervals[0][1:3] == (0, 0)
+    assert evaluate_flight_plan(FlightPlan.from_waypoints(BASELINE_OPERATION, [{"operating_altitude": 200.0}])).compliant
+
+    plan = FlightPlan.from_request({"operating_speed": 35.0}, [dict(asdict(BASELINE_OPERATION), operating_altitude=900.0)])
+    assert not evaluate_flight_plan(plan).compliant
+    try:
+        FlightPlan.from_request({}, [])
+        assert False
+    except ValueError:
+        pass
+
+
+def test_constant_plans_use_the_base_operation():
+    assert evaluate_flight_plan(FlightPlan(BASELINE_OPERATION, {})).compliant
+    rng = random.Random(0)
+    evaluator = FAADroneRulesEvaluator()
+    for _ in range(200):
+        operation = generate_operation(rng)
+        expected = evaluator.evaluate_rules(operation)
+        result = evaluate_flight_plan(FlightPlan(operation, {}))
+        assert result.segment_count == 1
+        assert result.first_violation_details == [outcome for outcome in expected if outcome is not None]
+        assert result.compliant == all(outcome is None for outcome in expected)
+
+
+def test_segments_match_waypoint_evaluation():
+    for count, seed in [(2, 0), (50, 1), (400, 2)]:
+        rng = random.Random(seed)
+        waypoints = survey_route(count, seed)
+        for waypoint in waypoints:
+            if rng.random() < 0.05:
+                waypoint["operating_altitude"] = 450.0
+        plan = FlightPlan.from_waypoints(replace(BASELINE_OPERATION, flight_visibility=2.5), waypoints)
+        outcomes = violating_waypoints(plan)
+        result = evaluate_flight_plan(plan)
+        assert result.segment_count == count - 1
+
+        expected = []
+        for index, rule in enumerate(DIRECT_RULES):
+            violated = [outcomes[i][index] is not None or outcomes[i + 1][index] is not None
+                        for i in range(count - 1)]
+            segment = 0
+            while segment < count - 1:
+                if not violated[segment]:
+                    segment += 1
+                    continue
+                end = segment
+                while end + 1 < count - 1 and violated[end + 1]:
+                    end += 1
+                expected.append((rule.rule_id, segment, end))
+                segment = end + 1
+        assert sorted((i.rule_id, i.first_segment, i.last_segment) for i in result.intervals) == sorted(expected)
+        first = min((segment for _, segment, _ in expected), default=None)
+        assert result.first_violation == first
+        assert sorted(result.first_violation_rules) == sorted(r for r, segment, _ in expected if segment == first)
+
+
+def main():
+    tests = [test_single_waypoint_plans_are_evaluated, test_constant_plans_use_the_base_operation,
+             test_segments_match_waypoint_evaluation]
+    for test in tests:
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
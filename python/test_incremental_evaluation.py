@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+import random
+from dataclasses import fields, replace
+
+from differential_check import generate_operation
+from direct_faa_rules import DIRECT_RULES, RULE_DEPENDENCIES, FAADroneRulesEvaluator
+from drone_operation import DroneOperation
+from incremental_evaluation import IncrementalEvaluator, UnknownHandleError
+
+FIELDS = [field.name for field in fields(DroneOperation)]
+
+
+class _Recorder:
+    """Stands in for a DroneOperation and records the fields a check reads"""
+
+    def __init__(self, operation):
+        self._operation = operation
+        self.read = set()
+
+    def __getattr__(self, name):
+        self.read.add(name)
+        return getattr(self._operation, name)
+
+
+def test_rule_fields_cover_what_checks_read():
+    rng = random.Random(0)
+    for _ in range(3000):
+        operation = generate_operation(rng)
+        for rule in DIRECT_RULES:
+            recorder = _Recorder(operation)
+            rule.check(recorder)
+            assert recorder.read <= set(rule.fields), (rule.rule_id, recorder.read - set(rule.fields))
+    assert set(RULE_DEPENDENCIES) <= set(FIELDS)
+
+
+def test_changes_match_full_evaluation():
+    evaluator = FAADroneRulesEvaluator()
+    incremental = IncrementalEvaluator(evaluator)
+    rng = random.Random(1)
+    for _ in range(300):
+        operation = generate_operation(rng)
+        handle = incremental.evaluate(operation)["handle"]
+        # Every field on its own, then several at once
+        other = generate_operation(rng)
+        changes = [{name: getattr(other, name)} for name in FIELDS]
+        changes.append({name: getattr(other, name) for name in rng.sample(FIELDS, 5)})
+        for change in changes:
+            result = incremental.evaluate_changes(handle, change)
+            changed_operation = replace(operation, **change)
+            expected = evaluator.result_from_outcomes(evaluator.evaluate_rules(changed_operation))
+            assert {key: result[key] for key in expected} == expected, change
+            assert incremental.evaluation(result["handle"]) == (changed_operation,
+                                                                evaluator.evaluate_rules(changed_operation))
+
+    try:
+        incremental.evaluate_changes("no-such-handle", {"operating_speed": 10.0})
+        assert False
+    except UnknownHandleError:
+        pass
+
+
+def main():
+    tests = [test_rule_fields_cover_what_checks_read, test_changes_match_full_evaluation]
+    for test in tests:
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
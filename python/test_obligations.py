@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import os
+import xml.etree.ElementTree as ET
+from dataclasses import replace
+
+from drone_attributes import operation_to_attributes
+from drone_operation import DroneOperation
+from file_based_pdp import FileBasedPDP
+from policy_artifact import dump_artifact, load_artifact
+from policy_compiler import AttributeAssignmentExpression, AttributeDesignator, ObligationExpression
+
+POLICY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "policies", "FAADroneRules.xml")
+ADVICE = "urn:faa:drone:advice:"
+ENVIRONMENT = "urn:oasis:names:tc:xacml:3.0:attribute-category:environment"
+
+COMPLIANT = DroneOperation(
+    pilot_has_night_training=True, remote_pilot_certificate=True,
+    drone_category="Category1", drone_weight=0.4, has_anti_collision_lighting=True, has_remote_id=True,
+    has_airworthiness_certificate=False, complies_with_kinetic_energy_limit=False,
+    has_exposed_rotating_parts=False, people_are_participants=False, people_under_cover=False,
+    is_restricted_access_area=False, operating_over_people=False, operating_speed=50.0,
+    operating_altitude=300.0, operating_altitude_above_structure=0.0, has_atc_authorization=True,
+    time_of_day="day", airspace_class="G", is_airport_surface_area=False, flight_visibility=5.0,
+    distance_from_clouds_horizontal=3000.0, distance_from_clouds_vertical=1000.0,
+    is_within_400ft_of_structure=False)
+
+
+def test_advice_of_failed_requirements():
+    pdp = FileBasedPDP(POLICY_FILE)
+    assert pdp.evaluate_result(operation_to_attributes(COMPLIANT)) == ("Permit", (), ())
+
+    # Any policy that permits overrides the others, so every limit is broken
+    operation = replace(COMPLIANT, operating_speed=95.0, operating_altitude=450.0, flight_visibility=2.0,
+                        distance_from_clouds_vertical=200.0, has_remote_id=False)
+    result = pdp.evaluate_result(operation_to_attributes(operation))
+    assert result.decision == "Deny" and not result.obligations
+    advice = {directive.id[len(ADVICE):]: directive for directive in result.advice}
+    assert set(advice) == {"speed-limit", "altitude-limit", "visibility", "cloud-distance", "remote-id"}
+    assert advice["speed-limit"].rule_id == "Speed-Limit"
+    assert advice["speed-limit"].attributes == {"message": "Speed exceeds 87 knots limit", "operating-speed": 95.0}
+
+    # The response carries the same advice
+    response = ET.fromstring(pdp._create_response(*result))
+    assert response.find(".//{*}Decision").text == "Deny"
+    assignments = response.findall(f".//{{*}}Advice[@AdviceId='{ADVICE}speed-limit']/{{*}}AttributeAssignment")
+    assert [(a.get("AttributeId"), a.text) for a in assignments] == [
+        ("message", "Speed exceeds 87 knots limit"), ("operating-speed", "95.0")]
+
+
+def test_obligations():
+    pdp = FileBasedPDP(POLICY_FILE)
+    obligation = ObligationExpression("log-airspace", "Permit", (AttributeAssignmentExpression(
+        "airspace-class", None, AttributeDesignator(ENVIRONMENT, "airspace-class", "string", True)),))
+    policy_set = pdp.policy_set._replace(obligations=(obligation,))
+
+    # Obligations survive the compiled artifact
+    policy_set = load_artifact(dump_artifact(policy_set))[0]
+    assert policy_set.obligations == (obligation,)
+    pdp = pdp._with_snapshot(pdp._build_snapshot(policy_set))
+
+    attributes = operation_to_attributes(COMPLIANT)
+    result = pdp.evaluate_result(attributes)
+    assert result.decision == "Permit"
+    assert [(directive.id, directive.attributes) for directive in result.obligations] == [
+        ("log-airspace", {"airspace-class": "G"})]
+
+    # An obligation that cannot be fulfilled makes the decision Indeterminate
+    del attributes[ENVIRONMENT]["airspace-class"]
+    assert pdp.evaluate_result(attributes).decision == "Indeterminate"
+
+
+def main():
+    tests = [test_advice_of_failed_requirements, test_obligations]
+    for test in tests:
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
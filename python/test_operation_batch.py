@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+import random
+import pickle
+from dataclasses import replace
+
+from decision_journal import violation_mask
+from differential_check import generate_operation
+from direct_faa_rules import FAADroneRulesEvaluator
+from drone_operation import OperationBatch
+
+
+def random_operations(count, seed=0):
+    rng = random.Random(seed)
+    return [generate_operation(rng) for _ in range(count)]
+
+
+def test_round_trip():
+    operations = random_operations(1001)
+    batch = OperationBatch()
+    # Uneven chunks exercise appending into a partly filled bit byte
+    for start, end in ((0, 3), (3, 500), (500, 501), (501, 1001)):
+        batch.extend(operations[start:end])
+    assert len(batch) == len(operations)
+    assert batch.to_operations() == operations
+    assert [batch[i] for i in (0, 7, 8, 500, -1)] == [operations[i] for i in (0, 7, 8, 500, -1)]
+    assert list(batch.column("operating_altitude")) == [op.operating_altitude for op in operations]
+    assert batch.column("has_remote_id") == bytes(op.has_remote_id for op in operations)
+    assert batch.nbytes < 80 * len(operations)
+
+
+def test_operation_is_slotted():
+    operation = random_operations(1)[0]
+    assert not hasattr(operation, "__dict__")
+    assert pickle.loads(pickle.dumps(operation)) == operation
+    assert replace(operation, operating_speed=90.0).operating_speed == 90.0
+
+
+def test_evaluate_batch_matches_per_operation():
+    operations = random_operations(2000, seed=1)
+    evaluator = FAADroneRulesEvaluator()
+    masks = evaluator.evaluate_batch(OperationBatch.from_operations(operations))
+    assert list(masks) == [violation_mask(evaluator.evaluate_rules(op)) for op in operations]
+    assert len(evaluator.evaluate_batch(OperationBatch())) == 0
+
+
+def main():
+    tests = [test_round_trip, test_operation_is_slotted, test_evaluate_batch_matches_per_operation]
+    for test in tests:
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import os
+import random
+from dataclasses import replace
+
+from differential_check import generate_operation
+from drone_attributes import operation_to_attributes
+from file_based_pdp import FileBasedPDP
+from partial_evaluation import AIRFRAME_FIELDS, SpecializationCache, known_attributes
+from policy_compiler import PolicySet
+
+POLICY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "policies", "FAADroneRules.xml")
+ALGORITHM = "urn:oasis:names:tc:xacml:1.0:policy-combining-algorithm:"
+RULE_COMBINING_ALGS = [None, "deny-unless-permit", "permit-unless-deny", "first-applicable", "permit-overrides",
+                       "ordered-permit-overrides", "deny-overrides", "ordered-deny-overrides"]
+POLICY_COMBINING_ALGS = RULE_COMBINING_ALGS[1:] + ["only-one-applicable"]
+
+
+def with_algorithms(pdp, policy_alg, rule_alg, nested=False):
+    """
+    The PDP's policy with other combining algorithms; if `nested`, its
+    last three policies in a nested policy set with the Target of the
+    second one
+    """
+    policies = tuple(policy._replace(rule_combining_alg=ALGORITHM + rule_alg) if rule_alg else policy
+                     for policy in pdp.policy_set.policies)
+    if nested:
+        policies = policies[:2] + (PolicySet("nested", ALGORITHM + "deny-unless-permit",
+                                             policies[1].target, policies[2:]),)
+    policy_set = pdp.policy_set._replace(policy_combining_alg=ALGORITHM + policy_alg, policies=policies)
+    return pdp._with_snapshot(pdp._build_snapshot(policy_set))
+
+
+def test_residual_decides_like_the_policy():
+    rng = random.Random(0)
+    pdp = FileBasedPDP(POLICY_FILE)
+    profiles = [generate_operation(rng) for _ in range(12)]
+    for policy_alg in POLICY_COMBINING_ALGS:
+        for rule_alg in RULE_COMBINING_ALGS:
+            original = with_algorithms(pdp, policy_alg, rule_alg, nested=rule_alg == "deny-overrides")
+            for profile in profiles:
+                known = known_attributes(profile)
+                specialized = original.specialize(known)
+                assert not specialized.unresolved_attributes
+                for _ in range(30):
+                    operation = replace(generate_operation(rng),
+                                        **{name: getattr(profile, name) for name in AIRFRAME_FIELDS})
+                    attributes = operation_to_attributes(operation)
+                    dynamic = {category: {attribute_id: value for attribute_id, value in values.items()
+                                          if attribute_id not in known.get(category, {})}
+                               for category, values in attributes.items()}
+                    expected = original.evaluate_attributes(attributes)
+                    assert specialized.evaluate_attributes(attributes) == expected, (policy_alg, rule_alg)
+                    assert specialized.evaluate_attributes(dynamic) == expected, (policy_alg, rule_alg)
+                    # including the Advice that goes with the decision
+                    expected_result = original.evaluate_result(attributes)
+                    assert specialized.evaluate_result(dynamic) == expected_result, (policy_alg, rule_alg)
+
+
+def test_cache_per_airframe():
+    rng = random.Random(1)
+    pdp = FileBasedPDP(POLICY_FILE)
+    cache = SpecializationCache(pdp, max_entries=2)
+    profile = generate_operation(rng)
+    known = known_attributes(profile)
+    first = cache.specialized("N1", known)
+    assert cache.specialized("N1", known) is first
+    cache.specialized("N2", known)
+    cache.specialized("N3", known)
+    assert cache.specialized("N1", known) is not first  # evicted
+    assert cache.builds == 4
+
+    # A changed profile or a reloaded policy builds a new specialization
+    changed = known_attributes(replace(profile, has_remote_id=not profile.has_remote_id))
+    assert cache.specialized("N1", changed) is not cache.specialized("N1", known)
+    pdp.reload()
+    builds = cache.builds
+    cache.specialized("N1", known)
+    assert cache.builds == builds + 1
+
+
+def main():
+    tests = [test_residual_decides_like_the_policy, test_cache_per_airframe]
+    for test in tests:
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
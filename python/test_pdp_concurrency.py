@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+"""
+Concurrent evaluation against one shared FileBasedPDP
+
+The tests check that decisions made from many threads, while the policy
+is being reloaded, equal the single-threaded ones. main() also measures
+throughput per thread count; evaluation only scales with threads on a
+free-threaded (no GIL) Python build.
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+
+from differential_check import generate_operation
+from drone_attributes import operation_to_attributes
+from file_based_pdp import FileBasedPDP
+
+POLICY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "policies", "FAADroneRules.xml")
+
+
+def random_requests(count, seed=0):
+    rng = random.Random(seed)
+    return [operation_to_attributes(generate_operation(rng)) for _ in range(count)]
+
+
+def run_threads(threads, target):
+    errors = []
+
+    def run(index):
+        try:
+            target(index)
+        except BaseException as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    if errors:
+        raise errors[0]
+
+
+def test_threads_match_single_threaded():
+    pdp = FileBasedPDP(POLICY_FILE)
+    requests = random_requests(400)
+    expected = [pdp.evaluate_attributes(attributes) for attributes in requests]
+    results = {}
+    done = threading.Event()
+
+    def evaluate(index):
+        if index == 0:
+            # Swap in fresh snapshots while the others evaluate
+            while not done.is_set():
+                pdp.reload()
+            return
+        order = list(range(len(requests)))
+        random.Random(index).shuffle(order)
+        decisions = [None] * len(requests)
+        for i in order:
+            decisions[i] = pdp.evaluate_attributes(requests[i])
+        results[index] = decisions
+        if len(results) == 7:
+            done.set()
+
+    run_threads(8, evaluate)
+    for decisions in results.values():
+        assert decisions == expected
+
+
+def test_policy_held_across_reload():
+    pdp = FileBasedPDP(POLICY_FILE)
+    attributes = random_requests(1, seed=1)[0]
+    policy = pdp.policies[0]
+    expected = pdp.evaluate_policy(policy, attributes)
+    snapshot = pdp.snapshot
+    pdp.reload()
+    assert pdp.snapshot is not snapshot
+    assert pdp.policies[0] is not policy
+    assert pdp.evaluate_policy(policy, attributes) == expected
+
+
+def throughput(pdp, requests, threads, seconds):
+    """Decisions per second of `threads` threads evaluating for `seconds`"""
+    counts = [0] * threads
+    deadline = time.perf_counter() + seconds
+
+    def evaluate(index):
+        evaluate_attributes = pdp.evaluate_attributes
+        count = 0
+        while time.perf_counter() < deadline:
+            for attributes in requests:
+                evaluate_attributes(attributes)
+            count += len(requests)
+        counts[index] = count
+
+    start = time.perf_counter()
+    run_threads(threads, evaluate)
+    return sum(counts) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrency tests and thread scaling of FileBasedPDP')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8], help='Thread counts to measure')
+    parser.add_argument('--seconds', type=float, default=2.0, help='Measurement time per thread count')
+    parser.add_argument('--policy', type=str, default=POLICY_FILE, help='XACML policy file')
+    args = parser.parse_args()
+
+    tests = [test_threads_match_single_threaded, test_policy_held_across_reload]
+    for test in tests:
+        test()
+        print(f"{test.__name__}: ok")
+
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(f"Python {sys.version.split()[0]}, GIL {'enabled' if gil else 'disabled'}, {os.cpu_count()} CPUs")
+    pdp = FileBasedPDP(args.policy)
+    requests = random_requests(200)
+    baseline = None
+    for threads in args.threads:
+        rate = throughput(pdp, requests, threads, args.seconds)
+        baseline = baseline or rate
+        print(f"{threads:3} threads: {rate:10.0f} decisions/s ({rate / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,8 @@
 import requests
 import xml.etree.ElementTree as ET
-from dataclasses import dataclass
 
-@dataclass
-class DroneOperation:
-    # [Same DroneOperation class from direct_faa_rules.py]
-    # Copy the entire class definition from there
-    pass
+from drone_operation import DroneOperation
+
 
 def create_xacml_request(operation):
     # Create XACML request XML
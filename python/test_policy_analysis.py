@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import os
+import random
+
+from decision_table import discretize_policies
+from differential_check import generate_operation
+from drone_attributes import operation_to_attributes
+from file_based_pdp import FileBasedPDP
+from policy_analysis import CONFLICT, SHADOWED, UNCOVERED, UNREACHABLE, analyze_policy, describe_class
+
+POLICY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "policies", "FAADroneRules.xml")
+
+
+def with_policies(pdp, policies):
+    return pdp._with_snapshot(pdp._build_snapshot(pdp.policy_set._replace(policies=tuple(policies))))
+
+
+def in_region(region, axes_by_id, attributes):
+    for attribute_id, condition in region.items():
+        axis = axes_by_id[attribute_id]
+        if describe_class(axis, axis.classify(attributes[axis.category][attribute_id])) != condition:
+            return False
+    return True
+
+
+def test_faa_policy_findings():
+    findings = analyze_policy(FileBasedPDP(POLICY_FILE))
+    shadowed = {finding.subject: finding for finding in findings if finding.kind == SHADOWED}
+    knowledge = shadowed["night-operation-policy/Night-Operation-Knowledge-Requirement"]
+    assert "Night-Operation-Lighting-Requirement" in knowledge.message
+    assert not [finding for finding in findings if finding.kind in (UNREACHABLE, UNCOVERED)]
+
+    # The remote ID policy's Permit overrides the night policy's Deny
+    conflicts = [finding for finding in findings
+                 if finding.subject == "night-operation-policy vs remote-id-policy" and "overriding night" in finding.message]
+    assert len(conflicts) == 1 and conflicts[0].cells == 2
+    assert conflicts[0].regions == ({"time-of-day": "= night", "has-anti-collision-lighting": "= false",
+                                     "has-remote-id": "= true"},)
+
+
+def test_findings_match_evaluation():
+    pdp = FileBasedPDP(POLICY_FILE)
+    findings = analyze_policy(pdp)
+    _, axes_by_key = discretize_policies(pdp.policies)
+    axes_by_id = {key[1]: axis for key, axis in axes_by_key.items()}
+    policies = {policy.policy_id: policy for policy in pdp.policies}
+    rng = random.Random(0)
+    requests = [operation_to_attributes(generate_operation(rng)) for _ in range(2000)]
+
+    for finding in findings:
+        if finding.kind == SHADOWED:
+            # Removing a shadowed rule changes no decision
+            policy_id, rule_id = finding.subject.split("/")
+            policy = policies[policy_id]
+            reduced = policy._replace(rules=tuple(rule for rule in policy.rules if rule.rule_id != rule_id))
+            without = with_policies(pdp, [reduced])
+            for attributes in requests:
+                assert without.evaluate_policy(reduced, attributes) == pdp.evaluate_policy(policy, attributes)
+        elif finding.kind == CONFLICT:
+            # A request is in a conflict's regions exactly when the two policies decide as it says
+            first, second = (policies[policy_id] for policy_id in finding.subject.split(" vs "))
+            decisions = (finding.message.split(" decides ")[1].split()[0],
+                         finding.message.split(" decides ")[2].split(";")[0])
+            for attributes in requests:
+                conflicting = (pdp.evaluate_policy(first, attributes), pdp.evaluate_policy(second, attributes)) == decisions
+                assert conflicting == any(in_region(region, axes_by_id, attributes) for region in finding.regions)
+
+
+def test_unreachable_and_uncovered():
+    pdp = FileBasedPDP(POLICY_FILE)
+    night = pdp.policies[0]
+    match = night.target[0][0][0]
+    day_match = match._replace(value=match.value._replace(value="day"))
+    day_target = (((day_match,),),)
+    daytime_rule = night.rules[1]._replace(rule_id="Daytime-Rule", target=day_target)
+    policy = night._replace(rules=night.rules + (daytime_rule,))
+
+    findings = {(finding.kind, finding.subject): finding for finding in analyze_policy(with_policies(pdp, [policy]))}
+    assert (UNREACHABLE, "night-operation-policy/Daytime-Rule") in findings
+    uncovered = findings[(UNCOVERED, pdp.policy_set.policy_set_id)]
+    assert uncovered.regions == ({"time-of-day": "= day"}, {"time-of-day": "not in {day, night}"})
+
+
+def main():
+    tests = [test_faa_policy_findings, test_findings_match_evaluation, test_unreachable_and_uncovered]
+    for test in tests:
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import os
+import pickle
+import random
+import struct
+import hashlib
+import tempfile
+
+from compile_policy import validate_policy
+from differential_check import generate_operation
+from drone_attributes import operation_to_attributes
+from file_based_pdp import FileBasedPDP
+from policy_artifact import (ARTIFACT_HEADER, ARTIFACT_MAGIC, ARTIFACT_VERSION, PICKLE_PROTOCOL, PolicyArtifactError,
+                             dump_artifact, load_artifact, read_artifact, write_artifact)
+from policy_compiler import compile_policy
+
+POLICY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "policies", "FAADroneRules.xml")
+
+
+def assert_rejected(data, reason):
+    try:
+        load_artifact(data)
+    except PolicyArtifactError as e:
+        assert reason in str(e), e
+        return
+    raise AssertionError(f"artifact loaded, expected: {reason}")
+
+
+def with_payload(payload, version=ARTIFACT_VERSION):
+    """An artifact with a valid header and checksum around any payload"""
+    return ARTIFACT_HEADER.pack(ARTIFACT_MAGIC, version, 0, len(payload), hashlib.sha256(payload).digest()) + payload
+
+
+def test_round_trip_decides_alike():
+    policy_set = compile_policy(POLICY_FILE)
+    errors, _ = validate_policy(policy_set)
+    assert not errors
+    loaded, metadata = load_artifact(dump_artifact(policy_set, {"source": "FAADroneRules.xml"}))
+    assert loaded == policy_set and metadata == {"source": "FAADroneRules.xml"}
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "FAADroneRules.xpc")
+        write_artifact(path, policy_set)
+        from_xml, from_artifact = FileBasedPDP(POLICY_FILE), FileBasedPDP(path)
+        rng = random.Random(0)
+        for _ in range(1000):
+            attributes = operation_to_attributes(generate_operation(rng))
+            assert from_artifact.evaluate_result(attributes) == from_xml.evaluate_result(attributes)
+
+        # Rewriting replaces the file whole: a reader that opened the old
+        # artifact still reads all of it, and no temporary file is left
+        with open(path, "rb") as old:
+            write_artifact(path, policy_set, {"version": 2})
+            assert load_artifact(old.read())[1] == {}
+        assert read_artifact(path)[1] == {"version": 2}
+        assert os.listdir(directory) == ["FAADroneRules.xpc"]
+        # A failed write leaves nothing behind
+        target = os.path.join(directory, "taken")
+        os.mkdir(target)
+        try:
+            write_artifact(target, policy_set)
+            assert False
+        except OSError:
+            pass
+        assert sorted(os.listdir(directory)) == ["FAADroneRules.xpc", "taken"]
+
+
+def test_damaged_artifacts_rejected():
+    data = dump_artifact(compile_policy(POLICY_FILE))
+    payload_start = ARTIFACT_HEADER.size
+
+    assert_rejected(data[:ARTIFACT_HEADER.size - 1], "truncated")
+    assert_rejected(data[:-1], "truncated")
+    assert_rejected(b"NOTAPOLC" + data[8:], "Not a compiled policy artifact")
+    tampered = bytearray(data)
+    tampered[payload_start + len(data[payload_start:]) // 2] ^= 0x01
+    assert_rejected(bytes(tampered), "checksum mismatch")
+
+    # A wrong version is rejected before the payload is read
+    header = bytearray(data[:ARTIFACT_HEADER.size])
+    struct.pack_into("<H", header, len(ARTIFACT_MAGIC), ARTIFACT_VERSION + 1)
+    assert_rejected(bytes(header) + data[ARTIFACT_HEADER.size:], "Unsupported artifact version")
+    assert_rejected(with_payload(data[payload_start:], ARTIFACT_VERSION - 1), "Unsupported artifact version")
+
+    for payload in [b"\x80\x05not a pickle", pickle.dumps(5), pickle.dumps(({}, "policy")), pickle.dumps(([], None))]:
+        assert_rejected(with_payload(payload), "Malformed artifact payload")
+
+
+def test_disallowed_globals_not_unpickled():
+    class Exploit:
+        def __reduce__(self):
+            return (os.system, ("echo unpickled",))
+
+    for payload in [pickle.dumps(({}, Exploit()), PICKLE_PROTOCOL),
+                    pickle.dumps(({}, random.Random()), PICKLE_PROTOCOL),
+                    pickle.dumps(({"when": object()}, None), PICKLE_PROTOCOL)]:
+        assert_rejected(with_payload(payload), "disallowed type")
+
+
+def main():
+    tests = [test_round_trip_decides_alike, test_damaged_artifacts_rejected, test_disallowed_globals_not_unpickled]
+    for test in tests:
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
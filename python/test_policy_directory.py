@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+import os
+import random
+import tempfile
+
+from differential_check import generate_operation
+from drone_attributes import operation_to_attributes
+from file_based_pdp import FileBasedPDP
+
+POLICY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pdp", "policies")
+POLICY_FILE = os.path.join(POLICY_DIR, "FAADroneRules.xml")
+ENVIRONMENT = "urn:oasis:names:tc:xacml:3.0:attribute-category:environment"
+XMLNS = 'xmlns="urn:oasis:names:tc:xacml:3.0:core:schema:wd-17"'
+
+
+def target(attribute_id, value):
+    return f"""<Target><AnyOf><AllOf>
+        <Match MatchId="urn:oasis:names:tc:xacml:1.0:function:string-equal">
+            <AttributeValue DataType="http://www.w3.org/2001/XMLSchema#string">{value}</AttributeValue>
+            <AttributeDesignator Category="{ENVIRONMENT}" AttributeId="{attribute_id}"
+                DataType="http://www.w3.org/2001/XMLSchema#string" MustBePresent="false"/>
+        </Match></AllOf></AnyOf></Target>"""
+
+
+def policy(policy_id, effect, policy_target=""):
+    return f"""<Policy {XMLNS} PolicyId="{policy_id}"
+        RuleCombiningAlgId="urn:oasis:names:tc:xacml:3.0:rule-combining-algorithm:first-applicable">
+        {policy_target}<Rule RuleId="{policy_id}-rule" Effect="{effect}"/></Policy>"""
+
+
+def policy_set(policy_set_id, references, policy_set_target=""):
+    return f"""<PolicySet {XMLNS} PolicySetId="{policy_set_id}"
+        PolicyCombiningAlgId="urn:oasis:names:tc:xacml:1.0:policy-combining-algorithm:first-applicable">
+        {policy_set_target}{references}</PolicySet>"""
+
+
+def write(directory, files):
+    for name, content in files.items():
+        with open(os.path.join(directory, name), "w") as f:
+            f.write(content)
+
+
+def environment(**values):
+    return {ENVIRONMENT: {name.replace("_", "-"): value for name, value in values.items()}}
+
+
+def test_directory_decides_like_the_file():
+    by_file = FileBasedPDP(POLICY_FILE)
+    by_directory = FileBasedPDP(POLICY_DIR)
+    rng = random.Random(0)
+    for _ in range(500):
+        attributes = operation_to_attributes(generate_operation(rng))
+        assert by_directory.evaluate_result(attributes) == by_file.evaluate_result(attributes)
+
+
+def test_overlays_indexed_by_target():
+    with tempfile.TemporaryDirectory() as directory:
+        write(directory, {
+            "base.xml": policy("base", "Permit"),
+            "overlay-b.xml": policy("overlay-b", "Deny", target("airspace-class", "B")),
+            "overlay-c.xml": policy("overlay-c", "Deny", target("airspace-class", "C")),
+        })
+        pdp = FileBasedPDP(directory)
+        loaded = pdp.snapshot.directory.loaded
+        assert pdp.evaluate_attributes(environment(airspace_class="G")) == "Permit"
+        # Only the documents the index selected were compiled
+        assert pdp.snapshot.directory.loaded == loaded | {"base"}
+        assert pdp.evaluate_attributes(environment(airspace_class="B")) == "Deny"
+        assert pdp.snapshot.directory.loaded == loaded | {"base", "overlay-b"}
+        # Without the attribute every overlay is a candidate
+        assert pdp.evaluate_attributes({}) == "Permit"
+        assert pdp.snapshot.directory.loaded == loaded | {"base", "overlay-b", "overlay-c"}
+
+
+def test_references_resolved_on_first_use():
+    with tempfile.TemporaryDirectory() as directory:
+        write(directory, {
+            "root.xml": policy_set("root", "<PolicySetIdReference>night-rules</PolicySetIdReference>"
+                                           "<PolicyIdReference>default</PolicyIdReference>"),
+            "night.xml": policy_set("night-rules", "<PolicyIdReference>night-deny</PolicyIdReference>",
+                                    target("time-of-day", "night")),
+            "night-deny.xml": policy("night-deny", "Deny"),
+            "default.xml": policy("default", "Permit"),
+            "cycle-a.xml": policy_set("cycle-a", "<PolicySetIdReference>cycle-b</PolicySetIdReference>"),
+            "cycle-b.xml": policy_set("cycle-b", "<PolicySetIdReference>cycle-a</PolicySetIdReference>"),
+            "missing.xml": policy_set("missing", "<PolicyIdReference>nowhere</PolicyIdReference>"),
+        })
+        pdp = FileBasedPDP(directory, root_policy_id="root")
+        assert pdp.snapshot.directory.loaded == {"root"}
+        assert pdp.evaluate_attributes(environment(time_of_day="day")) == "Permit"
+        assert pdp.snapshot.directory.loaded == {"root", "night-rules", "default"}
+        assert pdp.evaluate_attributes(environment(time_of_day="night")) == "Deny"
+        assert "night-deny" in pdp.snapshot.directory.loaded
+
+        explanation = pdp.explain(environment(time_of_day="night"))
+        night, default = explanation["policies"]
+        assert (night["policy_set_id"], night["decision"]) == ("night-rules", "Deny")
+        assert night["policies"][0]["policy_id"] == "night-deny"
+        # A reference that was not evaluated is not resolved for the trace
+        assert default == {"reference": "default", "evaluated": False}
+
+        # Circular and unresolvable references are Indeterminate
+        assert FileBasedPDP(directory, root_policy_id="cycle-a").evaluate_attributes({}) == "Indeterminate"
+        assert FileBasedPDP(directory, root_policy_id="missing").evaluate_attributes({}) == "Indeterminate"
+
+
+def main():
+    tests = [test_directory_decides_like_the_file, test_overlays_indexed_by_target,
+             test_references_resolved_on_first_use]
+    for test in tests:
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
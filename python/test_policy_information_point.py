@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+import os
+import random
+import sqlite3
+import tempfile
+
+from differential_check import generate_operation
+from drone_attributes import PILOT_ID_ATTRIBUTE, SUBJECT_CATEGORY, operation_to_attributes
+from file_based_pdp import FileBasedPDP
+from policy_information_point import CSVAttributeFinder, PolicyInformationPoint, SQLiteAttributeFinder
+
+POLICY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "policies", "FAADroneRules.xml")
+
+PILOT_COLUMNS = {
+    "has-completed-night-training": ("night_training", "boolean"),
+    "has-remote-pilot-certificate": ("remote_pilot_certificate", "boolean"),
+}
+
+
+def pilot_requests(count, seed=0):
+    """Full requests, and the same requests with the pilot attributes replaced by a pilot id"""
+    rng = random.Random(seed)
+    full, keyed, pilots = [], [], {}
+    for i in range(count):
+        attributes = operation_to_attributes(generate_operation(rng))
+        full.append(attributes)
+        subject = attributes[SUBJECT_CATEGORY]
+        pilot_id = f"P{i % 50}"
+        pilots.setdefault(pilot_id, (subject["has-completed-night-training"],
+                                     subject["has-remote-pilot-certificate"]))
+        subject["has-completed-night-training"], subject["has-remote-pilot-certificate"] = pilots[pilot_id]
+        keyed.append({category: dict(values) for category, values in attributes.items()})
+        keyed[-1][SUBJECT_CATEGORY] = {PILOT_ID_ATTRIBUTE[1]: pilot_id}
+    return full, keyed, pilots
+
+
+def sqlite_finder(directory, pilots):
+    database = os.path.join(directory, "pilots.db")
+    connection = sqlite3.connect(database)
+    connection.execute("CREATE TABLE pilots (pilot_id TEXT PRIMARY KEY, night_training INTEGER, "
+                       "remote_pilot_certificate INTEGER)")
+    connection.executemany("INSERT INTO pilots VALUES (?, ?, ?)",
+                           [(pilot_id, *values) for pilot_id, values in pilots.items()])
+    connection.commit()
+    connection.close()
+    return SQLiteAttributeFinder(database, "pilots", "pilot_id", SUBJECT_CATEGORY, PILOT_COLUMNS, PILOT_ID_ATTRIBUTE)
+
+
+def test_batch_matches_full_requests():
+    full, keyed, pilots = pilot_requests(300)
+    with tempfile.TemporaryDirectory() as directory:
+        pip = PolicyInformationPoint([sqlite_finder(directory, pilots)])
+        pdp = FileBasedPDP(POLICY_FILE, pip=pip)
+        expected = [pdp.evaluate_attributes(attributes) for attributes in full]
+        assert pdp.evaluate_batch(keyed) == expected
+        assert pip.lookups == 1
+
+        # Cached for the finder's TTL
+        assert [pdp.evaluate_attributes(attributes) for attributes in keyed] == expected
+        assert pip.lookups == 1
+
+
+def test_only_needed_attributes_are_fetched():
+    _, keyed, pilots = pilot_requests(1)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "pilots.csv")
+        with open(path, "w") as f:
+            f.write("pilot_id,night_training,remote_pilot_certificate\n")
+            for pilot_id, (night, certificate) in pilots.items():
+                f.write(f"{pilot_id},{str(night).lower()},{str(certificate).lower()}\n")
+        pip = PolicyInformationPoint([CSVAttributeFinder(path, "pilot_id", SUBJECT_CATEGORY, PILOT_COLUMNS,
+                                                         PILOT_ID_ATTRIBUTE)])
+        attributes = pip.resolve(keyed[0])
+        assert pip.lookups == 0
+        assert attributes[SUBJECT_CATEGORY]["has-remote-pilot-certificate"] == pilots["P0"][1]
+        assert pip.lookups == 1
+
+        # No record, or no key in the request: the attribute is missing
+        for subject in ({PILOT_ID_ATTRIBUTE[1]: "unknown"}, {}):
+            attributes = pip.resolve({SUBJECT_CATEGORY: subject})
+            try:
+                attributes[SUBJECT_CATEGORY]["has-remote-pilot-certificate"]
+            except KeyError:
+                continue
+            raise AssertionError(f"{subject} resolved")
+
+
+def test_finders_on_the_same_key_kept_apart():
+    with tempfile.TemporaryDirectory() as directory:
+        finders = []
+        for column, value in [("night_training", "true"), ("remote_pilot_certificate", "false")]:
+            path = os.path.join(directory, f"{column}.csv")
+            with open(path, "w") as f:
+                f.write(f"pilot_id,{column}\nP0,{value}\n")
+            attribute_id = next(a for a, (c, _) in PILOT_COLUMNS.items() if c == column)
+            finders.append(CSVAttributeFinder(path, "pilot_id", SUBJECT_CATEGORY,
+                                              {attribute_id: PILOT_COLUMNS[attribute_id]}, PILOT_ID_ATTRIBUTE))
+        assert finders[0].name != finders[1].name
+        pip = PolicyInformationPoint(finders)
+        for attributes in [pip.resolve({SUBJECT_CATEGORY: {PILOT_ID_ATTRIBUTE[1]: "P0"}}),
+                           pip.resolve_batch([{SUBJECT_CATEGORY: {PILOT_ID_ATTRIBUTE[1]: "P0"}}])[0]]:
+            assert attributes[SUBJECT_CATEGORY]["has-completed-night-training"] is True
+            assert attributes[SUBJECT_CATEGORY]["has-remote-pilot-certificate"] is False
+        assert pip.lookups == 2 and pip.cache_hits == 2
+
+        pip.invalidate(finders[0])
+        attributes = pip.resolve({SUBJECT_CATEGORY: {PILOT_ID_ATTRIBUTE[1]: "P0"}})
+        assert attributes[SUBJECT_CATEGORY]["has-remote-pilot-certificate"] is False
+        assert pip.lookups == 2
+        assert attributes[SUBJECT_CATEGORY]["has-completed-night-training"] is True
+        assert pip.lookups == 3
+
+        # Names must be unique, even for finders of different attributes
+        path = os.path.join(directory, "night_training.csv")
+        duplicate = CSVAttributeFinder(path, "pilot_id", "other-category", {"x": ("night_training", "boolean")},
+                                       PILOT_ID_ATTRIBUTE, name=finders[0].name)
+        try:
+            pip.register(duplicate)
+            assert False
+        except ValueError:
+            pass
+
+
+def main():
+    tests = [test_batch_matches_full_requests, test_only_needed_attributes_are_fetched,
+             test_finders_on_the_same_key_kept_apart]
+    for test in tests:
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+import os
+import random
+from dataclasses import replace
+
+from differential_check import generate_operation
+from drone_operation import DroneOperation
+from file_based_pdp import FileBasedPDP
+from telemetry_monitor import TelemetryMonitor
+
+POLICY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "policies", "FAADroneRules.xml")
+
+COMPLIANT = DroneOperation(
+    drone_category="Category2", drone_weight=1.5, has_anti_collision_lighting=True, has_remote_id=True,
+    time_of_day="day", operating_over_people=False, operating_altitude=200.0, operating_speed=35.0,
+    airspace_class="G", flight_visibility=5.0, distance_from_clouds_horizontal=2500.0,
+    distance_from_clouds_vertical=600.0, complies_with_kinetic_energy_limit=True,
+    remote_pilot_certificate=True)
+
+
+def assert_state_is_fresh(monitor, drone_id, operation):
+    """The incremental state equals a full evaluation of the same operation"""
+    fresh = TelemetryMonitor(monitor.pdp)
+    fresh.register(drone_id, operation)
+    state, expected = monitor.drones[drone_id], fresh.drones[drone_id]
+    assert state.attributes == expected.attributes
+    assert state.policy_targets == expected.policy_targets
+    assert state.rule_outcomes == expected.rule_outcomes
+    assert state.policy_decisions == expected.policy_decisions
+    assert state.decision == expected.decision
+
+
+def test_transitions():
+    monitor = TelemetryMonitor(FileBasedPDP(POLICY_FILE))
+    # The policy set is permit-overrides: with these limits exceeded only
+    # the visibility rule keeps the operation permitted
+    operation = replace(COMPLIANT, has_remote_id=False, operating_speed=100.0, operating_altitude=900.0,
+                        distance_from_clouds_vertical=100.0)
+    initial = monitor.register("N1", operation, timestamp=0.0)
+    assert (initial.previous_decision, initial.decision) == (None, "Permit")
+
+    assert monitor.update("N1", {"flight_visibility": 4.0}, 1.0) is None
+    transition = monitor.update("N1", {"flight_visibility": 2.0}, 2.0)
+    assert (transition.previous_decision, transition.decision, transition.timestamp) == ("Permit", "Deny", 2.0)
+    assert transition.changed_fields == ("flight_visibility",)
+    assert transition.changed_rules == ("operating-limitations-policy/Visibility-Requirement",)
+    assert not transition.compliant
+    # Unchanged values are not re-evaluated
+    evaluated = monitor.rules_evaluated
+    assert monitor.update("N1", {"flight_visibility": 2.0}) is None
+    assert monitor.rules_evaluated == evaluated
+    transition = monitor.update("N1", {"flight_visibility": 3.0, "operating_speed": 40.0}, 3.0)
+    assert transition.decision == "Permit" and transition.changed_fields == ("flight_visibility", "operating_speed")
+    assert_state_is_fresh(monitor, "N1", replace(operation, flight_visibility=3.0, operating_speed=40.0))
+
+    # Random frames keep the state equal to a full evaluation
+    rng = random.Random(0)
+    operation = generate_operation(rng)
+    monitor.register("N2", operation)
+    for _ in range(300):
+        changed = generate_operation(rng)
+        fields = rng.sample(sorted(monitor.fields), rng.randint(1, 4))
+        monitor.update("N2", {name: getattr(changed, name) for name in fields})
+        operation = replace(operation, **{name: getattr(changed, name) for name in fields})
+        assert_state_is_fresh(monitor, "N2", operation)
+
+
+def test_rejected_frames_change_nothing():
+    monitor = TelemetryMonitor(FileBasedPDP(POLICY_FILE))
+    operation = replace(COMPLIANT, has_remote_id=False, operating_speed=100.0, operating_altitude=900.0,
+                        distance_from_clouds_vertical=100.0)
+    monitor.register("N1", operation)
+    for values, error in [({"flight_visibility": 2.0, "no_such_field": 1}, KeyError),
+                          ({"flight_visibility": 2.0, "operating_speed": "fast"}, ValueError),
+                          ({"flight_visibility": 2.0, "operating_altitude": None}, TypeError)]:
+        try:
+            monitor.update("N1", values)
+            assert False, values
+        except error:
+            pass
+        assert_state_is_fresh(monitor, "N1", operation)
+    # The next valid frame is evaluated against the unchanged state
+    assert monitor.update("N1", {"flight_visibility": 2.0}).decision == "Deny"
+
+    # Unregistered drones are rejected, or start from the default operation
+    try:
+        monitor.update("N9", {"flight_visibility": 2.0})
+        assert False
+    except KeyError:
+        pass
+    with_default = TelemetryMonitor(monitor.pdp, default_operation=operation)
+    try:
+        with_default.update("N9", {"operating_speed": "fast"})
+        assert False
+    except ValueError:
+        pass
+    assert "N9" not in with_default.drones
+    assert with_default.update("N9", {"flight_visibility": 2.0}).decision == "Deny"
+
+
+def main():
+    tests = [test_transitions, test_rejected_frames_change_nothing]
+    for test in tests:
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import tempfile
+import threading
+
+from drone_attributes import operation_to_attributes
+from drone_operation import DroneOperation
+from tenant_policies import TenantPolicyCache, UnknownTenantError
+
+POLICY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "policies", "FAADroneRules.xml")
+XMLNS = 'xmlns="urn:oasis:names:tc:xacml:3.0:core:schema:wd-17"'
+
+DENY_ALL = f"""<Policy {XMLNS} PolicyId="deny-all"
+    RuleCombiningAlgId="urn:oasis:names:tc:xacml:3.0:rule-combining-algorithm:first-applicable">
+    <Rule RuleId="deny" Effect="Deny"/></Policy>"""
+
+COMPLIANT = operation_to_attributes(DroneOperation(
+    drone_category="Category2", drone_weight=1.5, has_anti_collision_lighting=True, has_remote_id=True,
+    time_of_day="day", operating_over_people=False, operating_altitude=200, operating_speed=35,
+    airspace_class="G", flight_visibility=5, distance_from_clouds_horizontal=2500,
+    distance_from_clouds_vertical=600, complies_with_kinetic_energy_limit=True,
+    remote_pilot_certificate=True))
+
+
+def tenant_root(directory):
+    shutil.copy(POLICY_FILE, os.path.join(directory, "us-faa.xml"))
+    os.mkdir(os.path.join(directory, "closed"))
+    with open(os.path.join(directory, "closed", "deny-all.xml"), "w") as f:
+        f.write(DENY_ALL)
+    for name in ("a", "b", "c"):
+        shutil.copy(POLICY_FILE, os.path.join(directory, f"{name}.xml"))
+    return directory
+
+
+def test_routes_by_tenant():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = TenantPolicyCache(tenant_root(directory))
+        assert cache.tenants() == ["a", "b", "c", "closed", "us-faa"]
+        assert cache.evaluate_result("us-faa", COMPLIANT).decision == "Permit"
+        assert cache.evaluate_result("closed", COMPLIANT).decision == "Deny"
+        assert cache.explain("closed", COMPLIANT)["decision"] == "Deny"
+        for tenant in ("nowhere", "../closed", ""):
+            try:
+                cache.pdp(tenant)
+                assert False, tenant
+            except UnknownTenantError:
+                pass
+        metrics = cache.metrics()["tenants"]
+        assert metrics["closed"]["requests"] == 2 and metrics["closed"]["decisions"] == {"Deny": 2}
+        assert metrics["us-faa"]["loads"] == 1
+
+
+def test_bounded_and_warmed_up():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = TenantPolicyCache(tenant_root(directory), max_entries=2)
+        for tenant in ["a", "a", "a", "b", "b", "c"]:
+            cache.evaluate_result(tenant, COMPLIANT)
+        assert cache.loaded == ["b", "c"]
+        assert cache.metrics()["tenants"]["a"]["evictions"] == 1
+
+        cache.invalidate()
+        assert cache.busiest() == ["a", "b", "c"]
+        cache.warm_up().join()
+        # The busiest tenant ends up most recently used
+        assert cache.loaded == ["b", "a"]
+        assert cache.metrics()["tenants"]["a"]["loads"] == 2
+
+
+def test_compiled_once_under_contention():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = TenantPolicyCache(tenant_root(directory))
+        pdps = []
+        threads = [threading.Thread(target=lambda: pdps.append(cache.pdp("us-faa"))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len({id(pdp) for pdp in pdps}) == 1
+        assert cache.metrics()["tenants"]["us-faa"]["loads"] == 1
+
+
+def main():
+    tests = [test_routes_by_tenant, test_bounded_and_warmed_up, test_compiled_once_under_contention]
+    for test in tests:
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+import os
+from datetime import datetime, timezone
+
+from differential_check import BASELINE_OPERATION
+from weather_provider import (FEET_PER_STATUTE_MILE, METERS_PER_STATUTE_MILE, NO_CLOUDS, MetarFileSource,
+                              MetarParseError, OperationSchedule, WeatherProvider, WeatherUnavailable, load_stations,
+                              parse_metar, weather_fields)
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+METAR_FILE = os.path.join(DIRECTORY, "metar_example.txt")
+STATIONS_FILE = os.path.join(DIRECTORY, "stations_example.csv")
+REFERENCE = datetime(2025, 6, 14, 18, 0, tzinfo=timezone.utc)
+
+
+def utc(hour, minute=0):
+    return datetime(2025, 6, 14, hour, minute, tzinfo=timezone.utc)
+
+
+def provider():
+    return WeatherProvider(MetarFileSource(METAR_FILE), load_stations(STATIONS_FILE))
+
+
+def test_parse_reports():
+    source = MetarFileSource(METAR_FILE)
+    fort_worth = source.observations("KFTW", utc(0), utc(23))
+    assert [observation.time for observation in fort_worth] == [utc(12, 53), utc(13, 53)]
+    assert fort_worth[0].visibility == 2.5 and fort_worth[0].layers == (("OVC", 600.0),)
+    assert fort_worth[1].visibility == 4.0 and fort_worth[1].layers == (("BKN", 900.0),)
+    alliance = source.observations("KAFW", utc(12), utc(13))[0]
+    assert alliance.visibility == 10.0 and alliance.layers == ()  # P6SM
+    love_field = source.observations("KDAL", utc(12), utc(13))[0]
+    assert love_field.layers == (("BKN", 1200.0), ("OVC", 2500.0))
+
+    for report, visibility in [("KXYZ 141253Z 00000KT 1/4SM FG VV002 12/12 A2992", 0.25),
+                               ("KXYZ 141253Z 00000KT M1/4SM FG VV001 12/12 A2992", 0.25),
+                               ("KXYZ 141253Z 00000KT 1 3/4SM BR OVC004 12/12 A2992", 1.75),
+                               ("KXYZ 141253Z 00000KT P6SM SKC 20/10 A2992 RMK 2SM", 10.0),
+                               ("EGLL 141250Z 24008KT 9999 FEW030 20/12 Q1015", 9999 / METERS_PER_STATUTE_MILE),
+                               ("EGLL 141250Z 24008KT 0800 FG VV001 12/12 Q1015", 800 / METERS_PER_STATUTE_MILE),
+                               ("EGLL 141250Z 24008KT CAVOK 20/12 Q1015", 10000 / METERS_PER_STATUTE_MILE),
+                               ("SPECI KXYZ 141253Z 00000KT FEW010 12/12 A2992", None)]:
+        assert parse_metar(report, REFERENCE).visibility == visibility, report
+
+    # The day of month is placed in the reference month or the one before
+    assert parse_metar("KXYZ 301200Z 10SM CLR", datetime(2025, 7, 1, tzinfo=timezone.utc)).time == \
+        datetime(2025, 6, 30, 12, 0, tzinfo=timezone.utc)
+    for report in ["", "KDFW", "kdfw 141253Z 10SM", "KDFW 1412Z 10SM", "2025/06/14 12:53"]:
+        try:
+            parse_metar(report, REFERENCE)
+            assert False, report
+        except MetarParseError:
+            pass
+
+
+def test_cloud_distances():
+    love_field = parse_metar("KDAL 141253Z 16010KT 7SM BKN012 OVC025 24/21 A2991", REFERENCE)
+    assert weather_fields(love_field, 300.0) == {"flight_visibility": 7.0,
+                                                 "distance_from_clouds_horizontal": 7 * FEET_PER_STATUTE_MILE,
+                                                 "distance_from_clouds_vertical": 900.0}
+    # At or above a broken ceiling
+    for altitude in (1200.0, 1500.0):
+        fields = weather_fields(love_field, altitude)
+        assert fields["distance_from_clouds_horizontal"] == fields["distance_from_clouds_vertical"] == 0.0
+
+    # Scattered and few layers are no ceiling
+    scattered = parse_metar("KDFW 141253Z 17012KT 10SM FEW040 SCT250 26/19 A2992", REFERENCE)
+    assert weather_fields(scattered, 5000.0)["distance_from_clouds_vertical"] == 1000.0
+    assert weather_fields(scattered, 5000.0)["distance_from_clouds_horizontal"] == 10 * FEET_PER_STATUTE_MILE
+
+    fog = parse_metar("KXYZ 141253Z 00000KT 1/4SM FG VV002 12/12 A2992", REFERENCE)
+    assert weather_fields(fog, 100.0)["distance_from_clouds_vertical"] == 100.0
+    assert weather_fields(fog, 200.0)["distance_from_clouds_vertical"] == 0.0
+    clear = parse_metar("KAFW 141253Z 17009KT P6SM SKC 27/18 A2992", REFERENCE)
+    assert weather_fields(clear, 400.0)["distance_from_clouds_vertical"] == NO_CLOUDS
+    assert weather_fields(parse_metar("KXYZ 141253Z FEW010", REFERENCE), 100.0)["flight_visibility"] == 0.0
+
+
+def test_observation_age():
+    weather = provider()
+    latitude, longitude = 32.82, -97.36  # Fort Worth Meacham
+    assert weather.nearest_station(latitude, longitude) == "KFTW"
+    assert weather.weather(latitude, longitude, 200.0, utc(13, 30))["flight_visibility"] == 2.5
+    assert weather.weather(latitude, longitude, 200.0, utc(13, 53))["flight_visibility"] == 4.0
+    assert weather.weather(latitude, longitude, 200.0, "2025-06-14T15:53:00Z")["flight_visibility"] == 4.0
+    for when in (utc(15, 54), utc(12, 52)):
+        try:
+            weather.weather(latitude, longitude, 200.0, when)
+            assert False, when
+        except WeatherUnavailable:
+            pass
+    try:
+        weather.weather(35.0, -100.0, 200.0, utc(13, 30))
+        assert False
+    except WeatherUnavailable:
+        pass
+
+    # One source query per station and hour
+    lookups = weather.lookups
+    for minute in range(0, 60, 5):
+        weather.weather(latitude + minute / 10000, longitude, 200.0, utc(14, minute))
+    assert weather.lookups == lookups + 1
+
+    filled = weather.fill_operation(BASELINE_OPERATION, latitude, longitude, utc(14))
+    assert (filled.flight_visibility, filled.distance_from_clouds_vertical) == (4.0, 700.0)
+    assert filled.operating_altitude == BASELINE_OPERATION.operating_altitude
+
+
+def test_schedule_follows_new_observations():
+    schedule = OperationSchedule(provider())
+    fort_worth, love_field = (32.82, -97.36), (32.85, -96.85)
+    assert schedule.add("now", BASELINE_OPERATION, *fort_worth, utc(14, 30)).result["status"] == "APPROVED"
+    assert schedule.add("earlier", BASELINE_OPERATION, *fort_worth, utc(14, 0)).result["status"] == "APPROVED"
+    assert schedule.add("elsewhere", BASELINE_OPERATION, *love_field, utc(14, 30)).result["status"] == "APPROVED"
+    later = schedule.add("later", BASELINE_OPERATION, *fort_worth, utc(16, 0))
+    assert (later.previous_status, later.result["status"]) == (None, "UNAVAILABLE")
+
+    # A special report of fog affects the station's operations from its time on
+    speci = parse_metar("SPECI KFTW 141410Z 18003KT 1SM BR OVC004 22/21 A2993", REFERENCE)
+    reevaluations = {reevaluation.operation_id: reevaluation for reevaluation in schedule.observe(speci)}
+    assert sorted(reevaluations) == ["later", "now"]
+    assert reevaluations["now"].changed and reevaluations["now"].result["status"] == "DENIED"
+    assert reevaluations["later"].result["status"] == "DENIED"
+    # Beyond max_age of the new observation, and before it: not re-evaluated
+    assert schedule.add("last", BASELINE_OPERATION, *fort_worth, utc(16, 30)).result["status"] == "UNAVAILABLE"
+    assert "last" not in {reevaluation.operation_id for reevaluation in schedule.observe(speci)}
+    assert schedule.provider.observation("KFTW", utc(14, 30)) == speci
+
+    # Observations already seen change nothing
+    assert not any(reevaluation.changed for reevaluation in schedule.observe(speci))
+    schedule.remove("now")
+    assert [reevaluation.operation_id for reevaluation in schedule.observe(speci)] == ["later"]
+
+
+def main():
+    tests = [test_parse_reports, test_cloud_distances, test_observation_age, test_schedule_follows_new_observations]
+    for test in tests:
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+from policy_compiler import Apply, AttributeDesignator, AttributeValue, Function, Match
+import re
+
+from xacml_functions import (Indeterminate, FunctionCompileError, compile_condition, compile_expression, compile_match,
+                             compile_regexp)
+
+FUNCTION = "urn:oasis:names:tc:xacml:1.0:function:"
+RESOURCE = "urn:oasis:names:tc:xacml:3.0:attribute-category:resource"
+
+
+def apply(name, *arguments):
+    return Apply(FUNCTION + name, arguments)
+
+
+def value(data_type, literal):
+    return AttributeValue(data_type, literal)
+
+
+def designator(attribute_id, data_type='string', must_be_present=False):
+    return AttributeDesignator(RESOURCE, attribute_id, data_type, must_be_present)
+
+
+def request(**values):
+    return {RESOURCE: {name.replace('_', '-'): v for name, v in values.items()}}
+
+
+def is_indeterminate(evaluator, attributes):
+    try:
+        evaluator(attributes)
+    except Indeterminate:
+        return True
+    return False
+
+
+def test_comparisons_and_regexp():
+    below_limit = compile_condition(apply('double-less-than-or-equal', designator('altitude', 'double'),
+                                          value('double', 400.0)))
+    assert below_limit(request(altitude=400.0))
+    assert not below_limit(request(altitude=400.01))
+
+    # Previously unsupported in Conditions
+    controlled = compile_condition(apply('string-regexp-match', value('string', '[BCD]'),
+                                         designator('airspace-class')))
+    assert controlled(request(airspace_class="C"))
+    assert not controlled(request(airspace_class="G"))
+
+
+def test_regexp_specialization():
+    # Character classes become set membership and literals substring tests,
+    # with the semantics of re.search
+    values = ["B", "G", "", "BX", "xB", "B\n", "\nB", "BB", "b", "ABC", "xABCy", "a-c"]
+    for pattern in ["[BCD]", "^[BCD]$", "ABC", "[B]\n", "B|C", "a.c", ""]:
+        test = compile_regexp(pattern)
+        for v in values:
+            assert test(v) == (re.search(pattern, v) is not None), (pattern, v)
+
+    match = compile_match(Match(FUNCTION + 'string-regexp-match', value('string', '[ABCDE]'),
+                                designator('airspace-class')))
+    assert match(request(airspace_class=["G", "E"]))
+    assert not match(request(airspace_class="G"))
+    # An invalid pattern is Indeterminate when evaluated, as before
+    invalid = compile_match(Match(FUNCTION + 'string-regexp-match', value('string', '[B'), designator('airspace-class')))
+    assert is_indeterminate(invalid, request(airspace_class="B"))
+    # Patterns that are not literals are compiled on first use
+    dynamic = compile_condition(apply('string-regexp-match', designator('pattern'), designator('airspace-class')))
+    assert dynamic(request(pattern="^[BC]$", airspace_class="C"))
+    assert not dynamic(request(pattern="^[BC]$", airspace_class="CC"))
+
+
+def test_logical_functions():
+    true, false = value('boolean', True), value('boolean', False)
+    assert compile_condition(apply('not', false))({})
+    assert compile_condition(apply('n-of', value('integer', 2.0), true, false, true))({})
+    assert not compile_condition(apply('n-of', value('integer', 3.0), true, false, true))({})
+
+    # A False argument decides and/or regardless of an Indeterminate one
+    missing = apply('boolean-equal', true, designator('missing', 'boolean', must_be_present=True))
+    assert not compile_condition(apply('and', missing, false))({})
+    assert compile_condition(apply('or', missing, true))({})
+    assert is_indeterminate(compile_condition(apply('and', missing, true)), {})
+
+
+def test_bag_functions():
+    classes = designator('airspace-class')
+    attributes = request(airspace_class=["B", "C"])
+    assert compile_expression(apply('string-bag-size', classes))(attributes) == 2
+    assert compile_condition(apply('string-is-in', value('string', 'C'), classes))(attributes)
+    assert compile_condition(apply('string-at-least-one-member-of', classes,
+                                   apply('string-bag', value('string', 'D'), value('string', 'B'))))(attributes)
+
+    # one-and-only, and single-value functions given a designator, need exactly one value
+    one = compile_expression(apply('string-one-and-only', classes))
+    assert one(request(airspace_class="G")) == "G"
+    assert is_indeterminate(one, attributes)
+    assert is_indeterminate(one, {})
+
+
+def test_higher_order_functions():
+    classes = designator('airspace-class')
+    equal = Function(FUNCTION + 'string-equal')
+    attributes = request(airspace_class=["B", "G"])
+    assert compile_condition(apply('any-of', equal, value('string', 'G'), classes))(attributes)
+    assert not compile_condition(apply('all-of', equal, value('string', 'G'), classes))(attributes)
+    assert compile_expression(apply('map', Function(FUNCTION + 'string-normalize-to-lower-case'),
+                                    classes))(attributes) == ("b", "g")
+
+
+def test_errors():
+    divide = compile_expression(apply('double-divide', value('double', 1.0), designator('speed', 'double')))
+    assert is_indeterminate(divide, request(speed=0.0))
+
+    match = compile_match(Match(FUNCTION + 'string-equal', value('string', 'day'), designator('time-of-day')))
+    assert match(request(time_of_day=["night", "day"]))
+    assert not match({})
+
+    for unsupported in (apply('no-such-function'), apply('double-less-than', value('double', 1.0))):
+        try:
+            compile_expression(unsupported)
+        except FunctionCompileError:
+            continue
+        raise AssertionError(f"{unsupported} compiled")
+
+
+def main():
+    tests = [test_comparisons_and_regexp, test_regexp_specialization, test_logical_functions, test_bag_functions,
+             test_higher_order_functions, test_errors]
+    for test in tests:
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
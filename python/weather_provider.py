@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+
+"""
+Weather provider: visibility and cloud clearance from METAR observations
+
+Derives flight_visibility, distance_from_clouds_horizontal and
+distance_from_clouds_vertical for a location, altitude and time from the
+nearest reporting station's latest observation, instead of having them
+entered by hand.
+
+Observations come from local METAR files or a local stand-in service and
+are cached per station and time bucket (an hour by default), so any
+number of operations near one station within one hour share one lookup.
+OperationSchedule re-evaluates every scheduled operation served by a
+station when a new observation for it arrives.
+
+METAR reports no horizontal distance from clouds. Below the ceiling it
+is estimated as the flight visibility; at or above a broken/overcast
+base (or in a vertical-visibility obscuration) both cloud distances are 0.
+"""
+
+import re
+import csv
+import sys
+import json
+import math
+import time
+import bisect
+import argparse
+import threading
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from direct_faa_rules import FAADroneRulesEvaluator
+from drone_operation import DroneOperation
+
+FEET_PER_STATUTE_MILE = 5280.0
+METERS_PER_STATUTE_MILE = 1609.344
+NO_CLOUDS = 100000.0  # feet, vertical cloud distance when no layer is reported
+DEFAULT_BUCKET = 3600  # seconds
+DEFAULT_MAX_AGE = timedelta(hours=2)
+DEFAULT_STATION_RANGE = 30.0  # nautical miles
+DEFAULT_CACHE_BUCKETS = 10000
+CEILING_COVERAGES = ("BKN", "OVC", "VV")
+
+WEATHER_FIELDS = ("flight_visibility", "distance_from_clouds_horizontal", "distance_from_clouds_vertical")
+
+
+class WeatherUnavailable(LookupError):
+    """Raised when no station is in range or it has no recent observation"""
+
+
+class MetarParseError(ValueError):
+    """Raised for text that is not a METAR/SPECI report"""
+
+
+class Observation(NamedTuple):
+    station: str
+    time: datetime  # UTC
+    visibility: Optional[float]  # statute miles, None if not reported
+    layers: Tuple[Tuple[str, float], ...]  # (coverage, base in feet above ground), lowest first
+    raw: str
+
+
+_STATION = re.compile(r"^[A-Z][A-Z0-9]{3}$")
+_TIME = re.compile(r"^(\d{2})(\d{2})(\d{2})Z$")
+_VISIBILITY = re.compile(r"^([MP])?(?:(\d+)/(\d+)|(\d+))SM$")
+_METRIC_VISIBILITY = re.compile(r"^(\d{4})(?:NDV)?$")
+_LAYER = re.compile(r"^(FEW|SCT|BKN|OVC|VV)(\d{3})")
+_DATE_LINE = re.compile(r"^(\d{4})[/-](\d{2})[/-](\d{2})[ T](\d{2}):(\d{2})")
+
+
+def _resolve_time(day: int, hour: int, minute: int, reference: datetime) -> datetime:
+    """The date with this day of month closest to (and not a day after) `reference`"""
+    year, month = reference.year, reference.month
+    for _ in range(3):
+        try:
+            candidate = datetime(year, month, day, hour, minute, tzinfo=timezone.utc)
+        except ValueError:
+            candidate = None
+        if candidate is not None and candidate <= reference + timedelta(days=1):
+            return candidate
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    raise MetarParseError(f"Day {day} does not fit near {reference:%Y-%m}")
+
+
+def parse_metar(text: str, reference: datetime = None) -> Observation:
+    """
+    Parse a METAR/SPECI report
+
+    The report's day/hour/minute group is placed in the month of
+    `reference` (default now) or the one before.
+    """
+    reference = reference or datetime.now(timezone.utc)
+    tokens = text.split()
+    while tokens and tokens[0] in ("METAR", "SPECI"):
+        tokens = tokens[1:]
+    if len(tokens) < 2 or not _STATION.match(tokens[0]) or not _TIME.match(tokens[1]):
+        raise MetarParseError(f"Not a METAR report: {text!r}")
+    station = tokens[0]
+    day, hour, minute = (int(group) for group in _TIME.match(tokens[1]).groups())
+
+    visibility = None
+    layers = []
+    whole_miles = None
+    for token in tokens[2:]:
+        if token == "RMK":
+            break
+        if token.isdigit() and len(token) == 1:
+            whole_miles = float(token)  # "1 1/2SM"
+            continue
+        match = _VISIBILITY.match(token)
+        if match:
+            prefix, numerator, denominator, miles = match.groups()
+            value = float(miles) if miles else float(numerator) / float(denominator)
+            visibility = value + (whole_miles or 0.0)
+            if prefix == "P":
+                visibility = max(visibility, 10.0)
+        elif token == "CAVOK":
+            visibility = max(visibility or 0.0, 10000 / METERS_PER_STATUTE_MILE)
+        elif visibility is None and _METRIC_VISIBILITY.match(token) and not layers:
+            visibility = int(token[:4]) / METERS_PER_STATUTE_MILE
+        else:
+            match = _LAYER.match(token)
+            if match:
+                layers.append((match.group(1), int(match.group(2)) * 100.0))
+        whole_miles = None
+
+    layers.sort(key=lambda layer: layer[1])
+    return Observation(station, _resolve_time(day, hour, minute, reference), visibility, tuple(layers), text.strip())
+
+
+def parse_metar_text(text: str, reference: datetime = None) -> List[Observation]:
+    """
+    Parse a file of METAR reports, one per line
+
+    A "YYYY/MM/DD HH:MM" line (as in NOAA cycle files) sets the reference
+    date of the reports after it; lines that are not reports are skipped.
+    """
+    observations = []
+    for line in text.splitlines():
+        line = line.strip()
+        date = _DATE_LINE.match(line)
+        if date:
+            reference = datetime(*map(int, date.groups()), tzinfo=timezone.utc)
+            continue
+        try:
+            observations.append(parse_metar(line, reference))
+        except MetarParseError:
+            continue
+    return observations
+
+
+def weather_fields(observation: Observation, altitude: float) -> Dict[str, float]:
+    """Visibility and cloud distances for a drone at `altitude` feet above ground"""
+    visibility = observation.visibility if observation.visibility is not None else 0.0
+    horizontal = visibility * FEET_PER_STATUTE_MILE
+    vertical = NO_CLOUDS
+    for coverage, base in observation.layers:
+        if altitude >= base and coverage in CEILING_COVERAGES:
+            # In or above a ceiling
+            horizontal = vertical = 0.0
+            break
+        vertical = min(vertical, abs(base - altitude))
+    return {
+        "flight_visibility": visibility,
+        "distance_from_clouds_horizontal": horizontal,
+        "distance_from_clouds_vertical": vertical,
+    }
+
+
+class MetarFileSource:
+    """Observations read once from local METAR files"""
+
+    def __init__(self, *paths: str, reference: datetime = None):
+        self._observations: Dict[str, List[Observation]] = {}
+        for path in paths:
+            with open(path) as f:
+                for observation in parse_metar_text(f.read(), reference):
+                    self._observations.setdefault(observation.station, []).append(observation)
+        for observations in self._observations.values():
+            observations.sort(key=lambda observation: observation.time)
+
+    def observations(self, station: str, start: datetime, end: datetime) -> List[Observation]:
+        """Observations of a station with start <= time < end, oldest first"""
+        observations = self._observations.get(station, [])
+        times = [observation.time for observation in observations]
+        return observations[bisect.bisect_left(times, start):bisect.bisect_left(times, end)]
+
+    def add(self, observation: Observation):
+        """Add a newly received observation"""
+        observations = self._observations.setdefault(observation.station, [])
+        if observation not in observations:
+            observations.append(observation)
+            observations.sort(key=lambda observation: observation.time)
+
+
+class MetarServiceSource:
+    """
+    Observations from a local HTTP stand-in service
+
+    GET <url>?ids=<station>&start=<ISO 8601>&end=<ISO 8601> returns raw
+    METAR reports, one per line, in the same format as the files.
+    """
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+
+    def observations(self, station: str, start: datetime, end: datetime) -> List[Observation]:
+        query = urllib.parse.urlencode({"ids": station, "start": start.isoformat(), "end": end.isoformat()})
+        with urllib.request.urlopen(f"{self.url}?{query}", timeout=self.timeout) as response:
+            text = response.read().decode()
+        return sorted((observation for observation in parse_metar_text(text, end)
+                       if observation.station == station and start <= observation.time < end),
+                      key=lambda observation: observation.time)
+
+
+def load_stations(path: str) -> Dict[str, Tuple[float, float]]:
+    """Station locations from a CSV file with station, latitude, longitude columns"""
+    with open(path, newline='') as f:
+        return {row["station"]: (float(row["latitude"]), float(row["longitude"])) for row in csv.DictReader(f)}
+
+
+def _distance_nm(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in nautical miles"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * math.asin(math.sqrt(a)) * 3440.065
+
+
+def _utc(when) -> datetime:
+    if isinstance(when, (int, float)):
+        return datetime.fromtimestamp(when, timezone.utc)
+    if isinstance(when, str):
+        when = datetime.fromisoformat(when.replace("Z", "+00:00"))
+    return when if when.tzinfo is not None else when.replace(tzinfo=timezone.utc)
+
+
+class WeatherProvider:
+    """
+    Weather fields for (latitude, longitude, altitude, time)
+
+    `source` has an observations(station, start, end) method;
+    `stations` maps station ids to (latitude, longitude). Thread-safe.
+    """
+
+    def __init__(self, source, stations: Dict[str, Tuple[float, float]],
+                 bucket_seconds: int = DEFAULT_BUCKET, max_age: timedelta = DEFAULT_MAX_AGE,
+                 station_range: float = DEFAULT_STATION_RANGE, cache_buckets: int = DEFAULT_CACHE_BUCKETS):
+        self.source = source
+        self.stations = stations
+        self.bucket_seconds = bucket_seconds
+        self.max_age = max_age
+        self.station_range = station_range
+        self.cache_buckets = cache_buckets
+        self._buckets: "OrderedDict[Tuple[str, int], List[Observation]]" = OrderedDict()
+        self._nearest: Dict[Tuple[float, float], Optional[str]] = {}
+        self._lock = threading.Lock()
+        self.lookups = 0  # source queries
+
+    def nearest_station(self, latitude: float, longitude: float) -> Optional[str]:
+        """Nearest station within station_range, cached per 0.01 degree cell"""
+        cell = (round(latitude, 2), round(longitude, 2))
+        if cell not in self._nearest:
+            distance, station = min(((_distance_nm(latitude, longitude, *location), station)
+                                     for station, location in self.stations.items()), default=(math.inf, None))
+            self._nearest[cell] = station if distance <= self.station_range else None
+        return self._nearest[cell]
+
+    def _bucket(self, when: datetime) -> int:
+        return int(when.timestamp() // self.bucket_seconds)
+
+    def _bucket_observations(self, station: str, bucket: int) -> List[Observation]:
+        """Observations that can be current during the bucket, from the cache or one source query"""
+        key = (station, bucket)
+        with self._lock:
+            observations = self._buckets.get(key)
+            if observations is not None:
+                self._buckets.move_to_end(key)
+                return observations
+
+        end = datetime.fromtimestamp((bucket + 1) * self.bucket_seconds, timezone.utc)
+        start = datetime.fromtimestamp(bucket * self.bucket_seconds, timezone.utc) - self.max_age
+        observations = self.source.observations(station, start, end)
+        with self._lock:
+            self.lookups += 1
+            self._buckets[key] = observations
+            while len(self._buckets) > self.cache_buckets:
+                self._buckets.popitem(last=False)
+        return observations
+
+    def observation(self, station: str, when) -> Observation:
+        """Latest observation of the station at or before `when`, at most max_age old"""
+        when = _utc(when)
+        observations = self._bucket_observations(station, self._bucket(when))
+        index = bisect.bisect_right([observation.time for observation in observations], when)
+        if index == 0 or when - observations[index - 1].time > self.max_age:
+            raise WeatherUnavailable(f"No observation of {station} within {self.max_age} before {when:%Y-%m-%d %H:%MZ}")
+        return observations[index - 1]
+
+    def weather(self, latitude: float, longitude: float, altitude: float, when) -> Dict[str, float]:
+        """Weather fields of a DroneOperation at this location, altitude and time"""
+        station = self.nearest_station(latitude, longitude)
+        if station is None:
+            raise WeatherUnavailable(f"No station within {self.station_range} NM of {latitude}, {longitude}")
+        return weather_fields(self.observation(station, when), altitude)
+
+    def fill_operation(self, operation: DroneOperation, latitude: float, longitude: float, when) -> DroneOperation:
+        """Copy of a DroneOperation with its weather fields derived"""
+        return replace(operation, **self.weather(latitude, longitude, operation.operating_altitude, when))
+
+    def ingest(self, observation: Observation):
+        """
+        Add a new observation to the source (if it keeps observations) and
+        to every cached bucket it can be current in
+        """
+        if hasattr(self.source, "add"):
+            self.source.add(observation)
+        first = self._bucket(observation.time)
+        last = self._bucket(observation.time + self.max_age)
+        with self._lock:
+            for bucket in range(first, last + 1):
+                observations = self._buckets.get((observation.station, bucket))
+                if observations is not None and observation not in observations:
+                    observations = sorted(observations + [observation], key=lambda o: o.time)
+                    self._buckets[(observation.station, bucket)] = observations
+
+
+class ScheduledOperation(NamedTuple):
+    operation_id: str
+    operation: DroneOperation
+    latitude: float
+    longitude: float
+    time: datetime
+    station: Optional[str]
+
+
+class Reevaluation(NamedTuple):
+    operation_id: str
+    previous_status: Optional[str]  # None if the operation could not be evaluated before
+    result: Dict[str, Any]
+
+    @property
+    def changed(self) -> bool:
+        return self.previous_status != self.result["status"]
+
+
+class OperationSchedule:
+    """
+    Scheduled operations kept evaluated against the latest weather
+
+    Operations are grouped by nearest station; observe() re-evaluates the
+    group of the observation's station in bulk.
+    """
+
+    def __init__(self, provider: WeatherProvider, evaluator: FAADroneRulesEvaluator = None):
+        self.provider = provider
+        self.evaluator = evaluator or FAADroneRulesEvaluator()
+        self._by_station: Dict[Optional[str], Dict[str, ScheduledOperation]] = {}
+        self._status: Dict[str, Optional[str]] = {}
+
+    def add(self, operation_id: str, operation: DroneOperation, latitude: float, longitude: float,
+            when) -> Reevaluation:
+        """Schedule an operation and evaluate it with the current weather"""
+        self.remove(operation_id)
+        scheduled = ScheduledOperation(operation_id, operation, latitude, longitude, _utc(when),
+                                       self.provider.nearest_station(latitude, longitude))
+        self._by_station.setdefault(scheduled.station, {})[operation_id] = scheduled
+        self._status[operation_id] = None
+        return self._evaluate(scheduled)
+
+    def remove(self, operation_id: str):
+        self._status.pop(operation_id, None)
+        for operations in self._by_station.values():
+            operations.pop(operation_id, None)
+
+    def _evaluate(self, scheduled: ScheduledOperation) -> Reevaluation:
+        previous = self._status.get(scheduled.operation_id)
+        try:
+            operation = self.provider.fill_operation(scheduled.operation, scheduled.latitude,
+                                                     scheduled.longitude, scheduled.time)
+            result = self.evaluator.evaluate_operation(operation)
+        except WeatherUnavailable as e:
+            result = {"status": "UNAVAILABLE", "details": [str(e)]}
+        self._status[scheduled.operation_id] = result["status"]
+        return Reevaluation(scheduled.operation_id, previous, result)
+
+    def observe(self, observation: Observation) -> List[Reevaluation]:
+        """
+        Ingest a new observation and re-evaluate the station's scheduled
+        operations it can affect (those at or after its time, within max_age)
+        """
+        self.provider.ingest(observation)
+        horizon = observation.time + self.provider.max_age
+        return [self._evaluate(scheduled)
+                for scheduled in list(self._by_station.get(observation.station, {}).values())
+                if observation.time <= scheduled.time <= horizon]
+
+
+def main():
+    from differential_check import BASELINE_OPERATION
+
+    parser = argparse.ArgumentParser(description='Derive visibility and cloud clearance from METAR observations')
+    parser.add_argument('--stations', type=str, required=True, help='CSV file with station, latitude, longitude')
+    parser.add_argument('--metar', type=str, nargs='*', default=[], help='Files of METAR reports')
+    parser.add_argument('--service', type=str, help='URL of a local METAR service instead of files')
+    parser.add_argument('--lat', type=float, required=True, help='Latitude')
+    parser.add_argument('--lon', type=float, required=True, help='Longitude')
+    parser.add_argument('--alt', type=float, default=BASELINE_OPERATION.operating_altitude,
+                        help='Altitude above ground in feet')
+    parser.add_argument('--time', type=str, help='ISO 8601 time (default: now)')
+    parser.add_argument('--benchmark', type=int, default=0,
+                        help='Time this many lookups for random points and times near the given one')
+
+    args = parser.parse_args()
+
+    source = MetarServiceSource(args.service) if args.service else MetarFileSource(*args.metar)
+    provider = WeatherProvider(source, load_stations(args.stations))
+    when = _utc(args.time) if args.time else datetime.now(timezone.utc)
+
+    try:
+        station = provider.nearest_station(args.lat, args.lon)
+        fields = provider.weather(args.lat, args.lon, args.alt, when)
+        print(f"Station {station}: {provider.observation(station, when).raw}")
+        print(json.dumps(fields, indent=2))
+        print(FAADroneRulesEvaluator().evaluate_operation(replace(BASELINE_OPERATION, operating_altitude=args.alt,
+                                                                  **fields))["status"])
+    except WeatherUnavailable as e:
+        print(f"Weather unavailable: {e}")
+        sys.exit(1)
+
+    if args.benchmark:
+        import random
+        rng = random.Random(0)
+        points = [(args.lat + rng.uniform(-0.1, 0.1), args.lon + rng.uniform(-0.1, 0.1),
+                   rng.uniform(0, 400), when - timedelta(minutes=rng.uniform(0, 60)))
+                  for _ in range(args.benchmark)]
+        lookups = provider.lookups
+        start = time.perf_counter()
+        for point in points:
+            try:
+                provider.weather(*point)
+            except WeatherUnavailable:
+                pass
+        elapsed = time.perf_counter() - start
+        print(f"{args.benchmark} lookups in {elapsed * 1000:.1f} ms, {provider.lookups - lookups} source queries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,749 @@
+#!/usr/bin/env python3
+
+"""
+XACML 3.0 function library for FileBasedPDP
+
+Functions are registered by their short identifier (the last component of
+the FunctionId URN, e.g. 'double-less-than') together with the data type
+of each argument. Condition expressions and target Matches are compiled
+once, when the policy is loaded, into nested Python closures, so
+evaluating a request does no dispatch on function names at all.
+
+Values follow XACML bag semantics: an AttributeDesignator evaluates to a
+bag (a tuple of values) and a literal to a single value. A function that
+takes a single value also accepts a one-element bag in its place, which
+is how the FAA policies compare designators directly. Errors such as a
+missing MustBePresent attribute, a bag of the wrong size, a malformed
+value or a division by zero raise Indeterminate, which and/or/n-of and
+the higher-order functions resolve as the XACML specification requires.
+"""
+
+import re
+import math
+import base64
+import operator
+import itertools
+from functools import lru_cache, partial
+from datetime import date, datetime, time
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+from policy_compiler import Apply, AttributeDesignator, AttributeValue, Function, short_id
+
+
+class Indeterminate(Exception):
+    """Raised when an expression evaluates to Indeterminate"""
+
+
+class FunctionCompileError(Exception):
+    """Raised when an expression uses an unknown function or invalid arguments"""
+
+
+# How a function takes its arguments
+EAGER = 'eager'                # arguments evaluated and converted to the parameter types
+LAZY = 'lazy'                  # implementation compiles the argument evaluators itself (and, or, n-of)
+HIGHER_ORDER = 'higher-order'  # first argument is a Function, the rest are values or bags
+
+BAG = 'bag:'  # parameter type prefix for bag arguments, e.g. 'bag:string'
+
+
+class XacmlFunction(NamedTuple):
+    name: str
+    implementation: Callable
+    params: Tuple[str, ...]  # data type per argument, BAG-prefixed for bags
+    rest: Optional[str]      # data type of any further arguments, None if fixed arity
+    kind: str
+    # Given a literal first argument, returns a one-argument callable
+    # equivalent to implementation(literal, value), built once at compile
+    # time; None if the function has none
+    specialize: Optional[Callable] = None
+
+
+FUNCTIONS: Dict[str, XacmlFunction] = {}
+
+# Exceptions that make a function call Indeterminate
+_CALL_ERRORS = (ValueError, TypeError, ArithmeticError, IndexError, re.error)
+
+
+def register_function(name: str, implementation: Callable, params=(), rest: str = None, kind: str = EAGER,
+                      specialize: Callable = None):
+    """Add a function to the library, or replace one, under its short identifier"""
+    FUNCTIONS[name] = XacmlFunction(name, implementation, tuple(params), rest, kind, specialize)
+
+
+# --- Data types --------------------------------------------------------------
+
+def _to_boolean(value) -> bool:
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text in ('true', '1'):
+            return True
+        if text in ('false', '0'):
+            return False
+        raise ValueError(f"Invalid boolean {value!r}")
+    return bool(value)
+
+
+def _to_integer(value) -> int:
+    if isinstance(value, str):
+        return int(value.strip())
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError(f"Invalid integer {value!r}")
+    return int(value)
+
+
+def _temporal(value_type):
+    def convert(value):
+        if type(value) is value_type:
+            return value
+        return value_type.fromisoformat(str(value).strip())
+    return convert
+
+
+def _hex_binary(value) -> bytes:
+    return value if isinstance(value, bytes) else bytes.fromhex(str(value).strip())
+
+
+def _base64_binary(value) -> bytes:
+    return value if isinstance(value, bytes) else base64.b64decode(str(value).strip(), validate=True)
+
+
+CONVERTERS = {
+    'string': str,
+    'anyURI': str,
+    'boolean': _to_boolean,
+    'integer': _to_integer,
+    'double': float,
+    'date': _temporal(date),
+    'time': _temporal(time),
+    'dateTime': _temporal(datetime),
+    'hexBinary': _hex_binary,
+    'base64Binary': _base64_binary,
+}
+
+PRIMITIVE_TYPES = tuple(CONVERTERS)
+ORDERED_TYPES = ('string', 'integer', 'double', 'date', 'time', 'dateTime')
+
+
+def _converter(param: str) -> Callable:
+    return CONVERTERS[param[len(BAG):] if param.startswith(BAG) else param]
+
+
+# --- Bags ----------------------------------------------------------------------
+
+def _single(value):
+    """Unwrap a one-element bag; single values pass through"""
+    if type(value) is tuple:
+        if len(value) != 1:
+            raise Indeterminate(f"Expected a single value, got a bag of {len(value)}")
+        return value[0]
+    return value
+
+
+def _bag(value) -> tuple:
+    return value if type(value) is tuple else (value,)
+
+
+def _boolean(value) -> bool:
+    value = _single(value)
+    if value is True or value is False:
+        return value
+    raise Indeterminate(f"Expected a boolean, got {value!r}")
+
+
+def _unique(values) -> tuple:
+    result = []
+    for value in values:
+        if value not in result:
+            result.append(value)
+    return tuple(result)
+
+
+def _one_and_only(bag):
+    if len(bag) != 1:
+        raise Indeterminate(f"one-and-only on a bag of {len(bag)} values")
+    return bag[0]
+
+
+# Regular expressions that are a single character class, e.g. "[BCD]", and
+# one anchored to the whole value, e.g. "^[BCD]$"
+SIMPLE_CHARACTER_CLASS = re.compile(r'\[([A-Za-z0-9]+)\]\Z')
+_ANCHORED_CHARACTER_CLASS = re.compile(r'\^\[([A-Za-z0-9]+)\]\$\Z')
+_REGEXP_METACHARACTERS = frozenset('.^$*+?{}[]\\|()')
+
+
+def compile_regexp(pattern: str) -> Callable[[str], bool]:
+    """
+    A test equivalent to regexp_match(pattern, value)
+
+    A single character class becomes a set membership test and a pattern
+    without metacharacters a substring test; any other pattern is
+    compiled once. Raises re.error for an invalid pattern.
+    """
+    match = SIMPLE_CHARACTER_CLASS.match(pattern)
+    if match:
+        characters = frozenset(match.group(1))
+        return lambda value: not characters.isdisjoint(value)
+    match = _ANCHORED_CHARACTER_CLASS.match(pattern)
+    if match:
+        characters = frozenset(match.group(1))
+        # $ also matches before a final newline
+        return lambda value: value in characters or (len(value) == 2 and value[1] == '\n' and value[0] in characters)
+    if _REGEXP_METACHARACTERS.isdisjoint(pattern):
+        return lambda value: pattern in value
+    search = re.compile(pattern).search
+    return lambda value: search(value) is not None
+
+
+# Patterns that are not literals in the policy, e.g. from an attribute;
+# kept apart from the re module's cache, which other code can evict
+_cached_regexp = lru_cache(maxsize=256)(compile_regexp)
+
+
+def regexp_match(pattern: str, value: str) -> bool:
+    """XACML regexp-match: the pattern matches anywhere in the value"""
+    return _cached_regexp(pattern)(value)
+
+
+# --- Function implementations --------------------------------------------------
+
+def _integer_divide(a, b):
+    quotient = abs(a) // abs(b)
+    return quotient if (a < 0) == (b < 0) else -quotient
+
+
+def _integer_mod(a, b):
+    return int(math.fmod(a, b))
+
+
+def _substring(value, begin, end):
+    if begin < 0 or begin > len(value) or (end != -1 and (end < begin or end > len(value))):
+        raise ValueError(f"Substring bounds ({begin}, {end}) out of range for length {len(value)}")
+    return value[begin:] if end == -1 else value[begin:end]
+
+
+def _time_in_range(value, lower, upper):
+    if lower <= upper:
+        return lower <= value <= upper
+    # The range spans midnight
+    return value >= lower or value <= upper
+
+
+def _string_from(value_type):
+    def convert(value):
+        if value_type == 'boolean':
+            return 'true' if value else 'false'
+        if value_type == 'double':
+            return repr(float(value))
+        return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+    return convert
+
+
+for _type in PRIMITIVE_TYPES:
+    _bag_type = BAG + _type
+    register_function(f'{_type}-equal', operator.eq, (_type, _type))
+    register_function(f'{_type}-one-and-only', _one_and_only, (_bag_type,))
+    register_function(f'{_type}-bag-size', len, (_bag_type,))
+    register_function(f'{_type}-is-in', lambda value, bag: value in bag, (_type, _bag_type))
+    register_function(f'{_type}-bag', lambda *values: values, (), rest=_type)
+    register_function(f'{_type}-intersection', lambda a, b: _unique(x for x in a if x in b),
+                      (_bag_type, _bag_type))
+    register_function(f'{_type}-at-least-one-member-of', lambda a, b: any(x in b for x in a),
+                      (_bag_type, _bag_type))
+    register_function(f'{_type}-union', lambda *bags: _unique(itertools.chain(*bags)),
+                      (_bag_type, _bag_type), rest=_bag_type)
+    register_function(f'{_type}-subset', lambda a, b: all(x in b for x in a), (_bag_type, _bag_type))
+    register_function(f'{_type}-set-equals', lambda a, b: all(x in b for x in a) and all(x in a for x in b),
+                      (_bag_type, _bag_type))
+    if _type != 'string':
+        register_function(f'{_type}-from-string', CONVERTERS[_type], ('string',))
+        register_function(f'string-from-{_type}', _string_from(_type), (_type,))
+
+for _type in ORDERED_TYPES:
+    register_function(f'{_type}-greater-than', operator.gt, (_type, _type))
+    register_function(f'{_type}-greater-than-or-equal', operator.ge, (_type, _type))
+    register_function(f'{_type}-less-than', operator.lt, (_type, _type))
+    register_function(f'{_type}-less-than-or-equal', operator.le, (_type, _type))
+
+for _type in ('integer', 'double'):
+    register_function(f'{_type}-add', lambda *values: sum(values), (_type, _type), rest=_type)
+    register_function(f'{_type}-multiply', lambda *values: math.prod(values), (_type, _type), rest=_type)
+    register_function(f'{_type}-subtract', operator.sub, (_type, _type))
+    register_function(f'{_type}-abs', abs, (_type,))
+register_function('integer-divide', _integer_divide, ('integer', 'integer'))
+register_function('integer-mod', _integer_mod, ('integer', 'integer'))
+register_function('double-divide', operator.truediv, ('double', 'double'))
+register_function('round', lambda value: float(round(value)), ('double',))
+register_function('floor', lambda value: float(math.floor(value)), ('double',))
+register_function('double-to-integer', math.trunc, ('double',))
+register_function('integer-to-double', float, ('integer',))
+
+register_function('string-equal-ignore-case', lambda a, b: a.lower() == b.lower(), ('string', 'string'))
+register_function('string-normalize-space', str.strip, ('string',))
+register_function('string-normalize-to-lower-case', str.lower, ('string',))
+register_function('string-concatenate', lambda *values: ''.join(values), ('string', 'string'), rest='string')
+for _type in ('string', 'anyURI'):
+    # XACML puts the fragment first: string-starts-with(prefix, value)
+    register_function(f'{_type}-starts-with', lambda prefix, value: value.startswith(prefix), ('string', _type))
+    register_function(f'{_type}-ends-with', lambda suffix, value: value.endswith(suffix), ('string', _type))
+    register_function(f'{_type}-contains', lambda part, value: part in value, ('string', _type))
+    register_function(f'{_type}-substring', _substring, (_type, 'integer', 'integer'))
+    register_function(f'{_type}-regexp-match', regexp_match, ('string', _type), specialize=compile_regexp)
+register_function('time-in-range', _time_in_range, ('time', 'time', 'time'))
+
+register_function('not', operator.not_, ('boolean',))
+
+
+# --- Logical functions ----------------------------------------------------------
+
+def _compile_and(evaluators):
+    def evaluate(attributes):
+        indeterminate = None
+        for argument in evaluators:
+            try:
+                if not _boolean(argument(attributes)):
+                    return False
+            except Indeterminate as e:
+                indeterminate = e
+        if indeterminate is not None:
+            raise indeterminate
+        return True
+    return evaluate
+
+
+def _compile_or(evaluators):
+    def evaluate(attributes):
+        indeterminate = None
+        for argument in evaluators:
+            try:
+                if _boolean(argument(attributes)):
+                    return True
+            except Indeterminate as e:
+                indeterminate = e
+        if indeterminate is not None:
+            raise indeterminate
+        return False
+    return evaluate
+
+
+def _compile_n_of(evaluators):
+    if not evaluators:
+        raise FunctionCompileError("n-of needs at least one argument")
+    count_argument, arguments = evaluators[0], evaluators[1:]
+
+    def evaluate(attributes):
+        try:
+            required = _to_integer(_single(count_argument(attributes)))
+        except _CALL_ERRORS as e:
+            raise Indeterminate(f"n-of: {e}") from e
+        if required > len(arguments):
+            raise Indeterminate(f"n-of needs {required} of only {len(arguments)} arguments")
+        true_count = 0
+        indeterminate_count = 0
+        indeterminate = None
+        remaining = len(arguments)
+        for argument in arguments:
+            if true_count >= required:
+                return True
+            remaining -= 1
+            try:
+                if _boolean(argument(attributes)):
+                    true_count += 1
+            except Indeterminate as e:
+                # An Indeterminate argument might have been True
+                indeterminate_count += 1
+                indeterminate = e
+            if true_count + indeterminate_count + remaining < required:
+                return False
+        if true_count >= required:
+            return True
+        raise indeterminate
+    return evaluate
+
+
+register_function('and', _compile_and, kind=LAZY)
+register_function('or', _compile_or, kind=LAZY)
+register_function('n-of', _compile_n_of, kind=LAZY)
+
+
+# --- Higher-order functions ----------------------------------------------------
+
+def _any_true(calls) -> bool:
+    indeterminate = None
+    for call in calls:
+        try:
+            if call():
+                return True
+        except Indeterminate as e:
+            indeterminate = e
+    if indeterminate is not None:
+        raise indeterminate
+    return False
+
+
+def _all_true(calls) -> bool:
+    indeterminate = None
+    for call in calls:
+        try:
+            if not call():
+                return False
+        except Indeterminate as e:
+            indeterminate = e
+    if indeterminate is not None:
+        raise indeterminate
+    return True
+
+
+def _any_of(call, values):
+    *fixed, bag = values
+    fixed = [_single(value) for value in fixed]
+    return _any_true(lambda x=x: _boolean(call(*fixed, x)) for x in _bag(bag))
+
+
+def _all_of(call, values):
+    *fixed, bag = values
+    fixed = [_single(value) for value in fixed]
+    return _all_true(lambda x=x: _boolean(call(*fixed, x)) for x in _bag(bag))
+
+
+def _any_of_any(call, values):
+    return _any_true(lambda args=args: _boolean(call(*args))
+                     for args in itertools.product(*[_bag(value) for value in values]))
+
+
+def _all_of_any(call, values):
+    first, second = values
+    return _all_true(lambda x=x: _any_true(lambda y=y: _boolean(call(x, y)) for y in _bag(second))
+                     for x in _bag(first))
+
+
+def _any_of_all(call, values):
+    first, second = values
+    return _any_true(lambda x=x: _all_true(lambda y=y: _boolean(call(x, y)) for y in _bag(second))
+                     for x in _bag(first))
+
+
+def _all_of_all(call, values):
+    first, second = values
+    return _all_true(lambda x=x: _all_true(lambda y=y: _boolean(call(x, y)) for y in _bag(second))
+                     for x in _bag(first))
+
+
+def _map(call, values):
+    *fixed, bag = values
+    fixed = [_single(value) for value in fixed]
+    return tuple(call(*fixed, x) for x in _bag(bag))
+
+
+register_function('any-of', _any_of, kind=HIGHER_ORDER)
+register_function('all-of', _all_of, kind=HIGHER_ORDER)
+register_function('any-of-any', _any_of_any, kind=HIGHER_ORDER)
+register_function('all-of-any', _all_of_any, kind=HIGHER_ORDER)
+register_function('any-of-all', _any_of_all, kind=HIGHER_ORDER)
+register_function('all-of-all', _all_of_all, kind=HIGHER_ORDER)
+register_function('map', _map, kind=HIGHER_ORDER)
+
+# Minimum number of non-Function arguments of each higher-order function
+_HIGHER_ORDER_ARITY = {'any-of': (2, None), 'all-of': (2, None), 'any-of-any': (1, None),
+                       'all-of-any': (2, 2), 'any-of-all': (2, 2), 'all-of-all': (2, 2), 'map': (1, None)}
+
+
+# --- Compilation ------------------------------------------------------------------
+
+def lookup_function(function_id: str) -> XacmlFunction:
+    """Registered function for a FunctionId or MatchId URN"""
+    function = FUNCTIONS.get(short_id(function_id or ""))
+    if function is None:
+        raise FunctionCompileError(f"Unsupported function: {function_id}")
+    return function
+
+
+def _param_types(function: XacmlFunction, count: int) -> Tuple[str, ...]:
+    params = function.params
+    if count < len(params) or (count > len(params) and function.rest is None):
+        expected = f"{len(params)}" if function.rest is None else f"at least {len(params)}"
+        raise FunctionCompileError(f"{function.name} takes {expected} arguments, got {count}")
+    return params + (function.rest,) * (count - len(params))
+
+
+def _caller(function: XacmlFunction, count: int) -> Callable:
+    """Call an eager function on already evaluated values, converting them"""
+    if function.kind != EAGER:
+        raise FunctionCompileError(f"{function.name} cannot be passed to a higher-order function")
+    params = _param_types(function, count)
+    converters = [_converter(param) for param in params]
+    bag_params = [param.startswith(BAG) for param in params]
+    implementation = function.implementation
+    name = function.name
+
+    def call(*values):
+        try:
+            return implementation(*[tuple(map(convert, _bag(value))) if is_bag else convert(_single(value))
+                                    for value, convert, is_bag in zip(values, converters, bag_params)])
+        except _CALL_ERRORS as e:
+            raise Indeterminate(f"{name}: {e}") from e
+    return call
+
+
+def _constant(value):
+    def evaluate(attributes):
+        return value
+    evaluate.constant = value
+    return evaluate
+
+
+def _designator_bag(designator: AttributeDesignator, convert: Callable = None):
+    category, attribute_id = designator.key
+    must_be_present = designator.must_be_present
+
+    def evaluate(attributes):
+        try:
+            value = attributes[category][attribute_id]
+        except KeyError:
+            if must_be_present:
+                raise Indeterminate(f"Missing attribute {attribute_id}")
+            return ()
+        values = tuple(value) if type(value) in (list, tuple) else (value,)
+        return tuple(map(convert, values)) if convert is not None else values
+    return evaluate
+
+
+def _designator_value(designator: AttributeDesignator, convert: Callable):
+    # A designator passed where one value is expected: the bag must have one value
+    category, attribute_id = designator.key
+
+    def evaluate(attributes):
+        try:
+            value = attributes[category][attribute_id]
+        except KeyError:
+            raise Indeterminate(f"Missing attribute {attribute_id}")
+        if type(value) in (list, tuple):
+            if len(value) != 1:
+                raise Indeterminate(f"Expected one value for {attribute_id}, got {len(value)}")
+            value = value[0]
+        return convert(value)
+    return evaluate
+
+
+def _specialized(function: XacmlFunction, literal) -> Optional[Callable]:
+    """
+    The function specialized for a literal first argument, None if it has
+    no specialization or the literal is invalid; errors are then left to
+    surface at evaluation time
+    """
+    if function.specialize is None:
+        return None
+    try:
+        return function.specialize(literal)
+    except _CALL_ERRORS:
+        return None
+
+
+def _compile_argument(argument, param: str):
+    """Evaluator for one argument of an eager function, converted to `param`"""
+    convert = _converter(param)
+    is_bag = param.startswith(BAG)
+
+    if isinstance(argument, AttributeValue):
+        try:
+            value = convert(argument.value)
+        except _CALL_ERRORS as e:
+            raise FunctionCompileError(f"Invalid {param} literal {argument.value!r}: {e}")
+        return _constant((value,) if is_bag else value)
+
+    if isinstance(argument, AttributeDesignator):
+        return _designator_bag(argument, convert) if is_bag else _designator_value(argument, convert)
+
+    inner = compile_expression(argument)
+    if is_bag:
+        return lambda attributes: tuple(map(convert, _bag(inner(attributes))))
+    return lambda attributes: convert(_single(inner(attributes)))
+
+
+def _compile_eager(function: XacmlFunction, arguments: tuple):
+    params = _param_types(function, len(arguments))
+    evaluators = [_compile_argument(argument, param) for argument, param in zip(arguments, params)]
+    implementation = function.implementation
+    name = function.name
+
+    def failed(e):
+        return Indeterminate(f"{name}: {e}")
+
+    constants = [getattr(evaluator, 'constant', evaluator) for evaluator in evaluators]
+    if all(hasattr(evaluator, 'constant') for evaluator in evaluators):
+        # Constant folding; errors are left to surface at evaluation time
+        try:
+            return _constant(implementation(*constants))
+        except _CALL_ERRORS:
+            pass
+
+    if len(evaluators) == 1:
+        first, = evaluators
+
+        def evaluate(attributes):
+            try:
+                return implementation(first(attributes))
+            except _CALL_ERRORS as e:
+                raise failed(e) from e
+        return evaluate
+
+    if len(evaluators) == 2:
+        first, second = evaluators
+        if hasattr(second, 'constant'):
+            literal = second.constant
+
+            def evaluate(attributes):
+                try:
+                    return implementation(first(attributes), literal)
+                except _CALL_ERRORS as e:
+                    raise failed(e) from e
+        elif hasattr(first, 'constant'):
+            literal = first.constant
+            test = _specialized(function, literal) or partial(implementation, literal)
+
+            def evaluate(attributes):
+                try:
+                    return test(second(attributes))
+                except _CALL_ERRORS as e:
+                    raise failed(e) from e
+        else:
+            def evaluate(attributes):
+                try:
+                    return implementation(first(attributes), second(attributes))
+                except _CALL_ERRORS as e:
+                    raise failed(e) from e
+        return evaluate
+
+    def evaluate(attributes):
+        try:
+            return implementation(*[argument(attributes) for argument in evaluators])
+        except _CALL_ERRORS as e:
+            raise failed(e) from e
+    return evaluate
+
+
+def _compile_higher_order(function: XacmlFunction, arguments: tuple):
+    if not arguments or not isinstance(arguments[0], Function):
+        raise FunctionCompileError(f"{function.name} needs a Function as its first argument")
+    minimum, maximum = _HIGHER_ORDER_ARITY[function.name]
+    values = arguments[1:]
+    if len(values) < minimum or (maximum is not None and len(values) > maximum):
+        raise FunctionCompileError(f"{function.name} got {len(values)} value arguments")
+
+    call = _caller(lookup_function(arguments[0].function_id),
+                   len(values) if function.name in ('any-of-any', 'any-of', 'all-of', 'map') else 2)
+    evaluators = [compile_expression(value) for value in values]
+    implementation = function.implementation
+
+    def evaluate(attributes):
+        return implementation(call, [argument(attributes) for argument in evaluators])
+    return evaluate
+
+
+def compile_expression(expression) -> Callable[[Dict[str, Dict[str, Any]]], Any]:
+    """
+    Compile a condition expression into an evaluator
+
+    The evaluator takes request attributes ({category: {attribute_id:
+    value}}) and returns the expression's value: a single value, or a
+    tuple for a bag. It raises Indeterminate when the value is
+    Indeterminate. Raises FunctionCompileError for unknown functions and
+    invalid arguments.
+    """
+    if isinstance(expression, AttributeValue):
+        return _constant(expression.value)
+    if isinstance(expression, AttributeDesignator):
+        return _designator_bag(expression)
+    if isinstance(expression, Function):
+        raise FunctionCompileError(f"Function {expression.function_id} outside a higher-order function")
+    if not isinstance(expression, Apply):
+        raise FunctionCompileError(f"Cannot compile {type(expression).__name__}")
+
+    function = lookup_function(expression.function_id)
+    if function.kind == LAZY:
+        return function.implementation([compile_expression(argument) for argument in expression.arguments])
+    if function.kind == HIGHER_ORDER:
+        return _compile_higher_order(function, expression.arguments)
+    return _compile_eager(function, expression.arguments)
+
+
+def compile_condition(expression) -> Callable[[Dict[str, Dict[str, Any]]], bool]:
+    """Compile a rule Condition into an evaluator returning True or False"""
+    inner = compile_expression(expression)
+    if hasattr(inner, 'constant') and _single(inner.constant) in (True, False):
+        value = _single(inner.constant)
+        return lambda attributes: value
+    return lambda attributes: _boolean(inner(attributes))
+
+
+def compile_match(match) -> Callable[[Dict[str, Dict[str, Any]]], bool]:
+    """
+    Compile a target Match into an evaluator returning True or False
+
+    The match function is applied to the literal and each value of the
+    designator's bag; the Match is True if any application is. Functions
+    with a specialization (regexp-match) are specialized for the literal.
+    """
+    function = lookup_function(match.function_id)
+    if function.kind != EAGER or len(function.params) != 2 or any(p.startswith(BAG) for p in function.params):
+        raise FunctionCompileError(f"{function.name} cannot be used in a Match")
+    literal = _compile_argument(match.value, function.params[0]).constant
+    values = _designator_bag(match.designator)
+    convert = _converter(function.params[1])
+    test = _specialized(function, literal) or partial(function.implementation, literal)
+    name = function.name
+
+    def evaluate(attributes):
+        indeterminate = None
+        for value in values(attributes):
+            try:
+                if test(convert(value)):
+                    return True
+            except _CALL_ERRORS as e:
+                indeterminate = Indeterminate(f"{name}: {e}")
+        if indeterminate is not None:
+            raise indeterminate
+        return False
+    return evaluate
+
+
+def compile_target(target: tuple) -> Optional[Callable[[Dict[str, Dict[str, Any]]], bool]]:
+    """
+    Compile a Target into an evaluator returning True or False
+
+    Returns None for an empty target, which matches every request.
+    """
+    if not target:
+        return None
+    any_ofs = tuple(tuple(tuple(compile_match(match) for match in all_of) for all_of in any_of)
+                    for any_of in target)
+
+    def all_of_matches(all_of, attributes):
+        indeterminate = None
+        for match in all_of:
+            try:
+                if not match(attributes):
+                    return False
+            except Indeterminate as e:
+                indeterminate = e
+        if indeterminate is not None:
+            raise indeterminate
+        return True
+
+    def evaluate(attributes):
+        indeterminate = None
+        for any_of in any_ofs:
+            any_of_error = None
+            for all_of in any_of:
+                try:
+                    if all_of_matches(all_of, attributes):
+                        break
+                except Indeterminate as e:
+                    any_of_error = e
+            else:
+                if any_of_error is None:
+                    return False
+                indeterminate = any_of_error
+        if indeterminate is not None:
+            raise indeterminate
+        return True
+    return evaluate